@@ -1,13 +1,18 @@
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from starlette.responses import FileResponse
 from .base import create_app
 from .endpoints import websocket
 from .endpoints import speech
 from .endpoints import health
+from .endpoints import audio
 from .middleware.cors import setup_cors
-import os
+from core.config import settings
+from services.tts_cache import tts_cache, warm_up_tts_cache
+from services.clients import upstream_clients
+from services.session_manager import manager
+from services.container import container
+from services.task_supervisor import task_registry
+import asyncio
 import logging
 
 # 設置日誌
@@ -36,42 +41,45 @@ def init_app() -> FastAPI:
     app.include_router(speech.router, prefix="/api", tags=["speech"])
     app.include_router(health.router, prefix="/api", tags=["system"])
     
-    # 創建音頻目錄（如果不存在）
-    audio_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "audio")
-    os.makedirs(audio_dir, exist_ok=True)
+    # 音頻路由 (/audio-file/ 與 /audio/)，由記憶體音訊儲存提供
+    app.include_router(audio.router, tags=["audio"])
     
-    # 確保音頻目錄有正確的權限
-    try:
-        # 嘗試添加讀取權限
-        os.chmod(audio_dir, 0o755)
-        logger.info(f"設置音頻目錄權限: {audio_dir}")
-    except Exception as e:
-        logger.warning(f"無法設置音頻目錄權限: {e}")
+    @app.on_event("startup")
+    async def build_services():
+        """預先建立共用的服務 (多數已在匯入端點模組時建立，這裡確保全部就緒)"""
+        container.startup()
     
-    # 掛載靜態文件，設置HTML=True以支持瀏覽器訪問
-    app.mount("/audio", StaticFiles(directory=audio_dir, html=True, check_dir=True), name="audio")
+    @app.on_event("startup")
+    async def prewarm_upstream_connections():
+        """在接受第一輪對話前完成上游連線的 DNS 與 TLS 握手 (有總逾時，失敗不影響啟動)"""
+        if settings.UPSTREAM_PREWARM_ENABLED:
+            await upstream_clients.prewarm()
     
-    # 添加簡單的音頻文件訪問路由，作為備選方案
-    @app.get("/audio-file/{filename}")
-    async def get_audio_file(filename: str):
-        filepath = os.path.join(audio_dir, filename)
-        if os.path.exists(filepath):
-            logger.info(f"提供音頻文件: {filepath}")
-            # 擴展 CORS 標頭
-            cors_headers = {
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Methods": "GET, OPTIONS",
-                "Access-Control-Allow-Headers": "Content-Type, Authorization",
-                "Access-Control-Max-Age": "86400", # 24小時缓存預檢請求
-                "Cache-Control": "no-cache", # 避免瀏覽器緩存，確保始終從伺服器獲取最新音頻
-            }
-            return FileResponse(
-                filepath, 
-                media_type="audio/mpeg",
-                headers=cors_headers
-            )
-        else:
-            logger.error(f"音頻文件不存在: {filepath}")
-            return {"error": "音頻文件不存在"}
+    @app.on_event("shutdown")
+    async def cancel_background_tasks():
+        """取消仍在進行的背景任務 (直播房間流程、記憶整合等)"""
+        await task_registry.shutdown()
+    
+    @app.on_event("shutdown")
+    async def close_upstream_clients():
+        await upstream_clients.aclose()
+    
+    @app.on_event("shutdown")
+    async def save_tts_cache_state():
+        """保存 murmur 出現次數，下次啟動時預熱重複出現的 murmur"""
+        await tts_cache.close()
+    
+    @app.on_event("shutdown")
+    async def flush_session_store():
+        """寫入尚未保存的會話狀態"""
+        await manager.store.close()
+    
+    @app.on_event("startup")
+    async def start_tts_warmup():
+        """開啟 TTS 磁碟快取，並在背景預熱，不阻塞服務啟動"""
+        if settings.TTS_CACHE_ENABLED:
+            await tts_cache.open()
+        if settings.TTS_CACHE_ENABLED and settings.TTS_WARMUP_ENABLED:
+            app.state.tts_warmup_task = task_registry.spawn(warm_up_tts_cache(container.tts_service), "tts_warmup")
     
     return app 
\ No newline at end of file
@@ -0,0 +1,112 @@
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse, Response
+from typing import Optional, Tuple
+import logging
+
+from services.audio_store import audio_store
+
+# 設置日誌
+logger = logging.getLogger("audio_api")
+
+# 創建路由
+router = APIRouter()
+
+# 擴展 CORS 標頭
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET, OPTIONS",
+    "Access-Control-Allow-Headers": "Content-Type, Authorization, Range",
+    "Access-Control-Expose-Headers": "Content-Length, Content-Range, Accept-Ranges, ETag",
+    "Access-Control-Max-Age": "86400", # 24小時缓存預檢請求
+}
+
+
+class RangeNotSatisfiable(Exception):
+    """Range 標頭無法滿足 (416)"""
+    pass
+
+
+def parse_range_header(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    解析單一區段的 Range 標頭
+
+    Args:
+        range_header: 例如 "bytes=0-1023"、"bytes=1024-" 或 "bytes=-500"
+        size: 資源總大小
+
+    Returns:
+        (起始, 結束) 的閉區間；沒有或無法解析的標頭返回 None (回應完整內容)
+
+    Raises:
+        RangeNotSatisfiable: 區段超出資源範圍
+    """
+    if not range_header:
+        return None
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        # 不支援的單位或多區段請求，依 RFC 9110 可忽略 Range 回應完整內容
+        return None
+    start_text, _, end_text = spec.strip().partition("-")
+    try:
+        if not start_text:
+            suffix_length = int(end_text)
+            if suffix_length <= 0:
+                raise RangeNotSatisfiable()
+            return max(size - suffix_length, 0), size - 1
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise RangeNotSatisfiable()
+    return start, min(end, size - 1)
+
+
+async def serve_audio(filename: str, request: Request) -> Response:
+    """從音訊儲存提供音訊，支援 ETag 條件請求與 Range 請求"""
+    blob = await audio_store.get(filename)
+    if blob is None:
+        logger.error(f"音頻文件不存在: {filename}")
+        return JSONResponse({"error": "音頻文件不存在"}, status_code=404, headers=CORS_HEADERS)
+
+    headers = dict(CORS_HEADERS)
+    headers["ETag"] = blob.etag
+    headers["Accept-Ranges"] = "bytes"
+    # 檔名唯一且內容不變，可在 TTL 內快取
+    headers["Cache-Control"] = f"private, max-age={int(audio_store.ttl_seconds)}" if audio_store.ttl_seconds > 0 else "private, max-age=86400"
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or blob.etag in [tag.strip() for tag in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and if_range and if_range.strip() != blob.etag:
+        # 客戶端持有的版本已不同，忽略 Range 回應完整內容
+        range_header = None
+
+    size = blob.size
+    try:
+        byte_range = parse_range_header(range_header, size)
+    except RangeNotSatisfiable:
+        headers["Content-Range"] = f"bytes */{size}"
+        return Response(status_code=416, headers=headers)
+
+    if byte_range is None:
+        return Response(content=blob.data, media_type=blob.media_type, headers=headers)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return Response(content=blob.data[start:end + 1], status_code=206, media_type=blob.media_type, headers=headers)
+
+
+@router.get("/audio-file/{filename}")
+async def get_audio_file(filename: str, request: Request):
+    """提供 TTS 生成的音訊"""
+    return await serve_audio(filename, request)
+
+
+@router.get("/audio/{filename}")
+async def get_audio(filename: str, request: Request):
+    """與 /audio-file/ 相同，保留舊的靜態路徑"""
+    return await serve_audio(filename, request)
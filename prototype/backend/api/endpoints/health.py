@@ -1,5 +1,17 @@
 from fastapi import APIRouter
 
+from services.audio_store import audio_store
+from services.clients import upstream_clients
+from services.container import container
+from services.idle_scheduler import murmur_scheduler
+from services.murmur_batcher import murmur_batcher
+from services.session_manager import manager
+from services.single_flight import llm_single_flight
+from services.task_supervisor import task_registry
+from services.tts_cache import tts_cache
+from services.upstream_scheduler import upstream_scheduler
+from utils.ws_codec import codec_stats
+
 router = APIRouter()
 
 @router.get("/health")
@@ -7,4 +19,35 @@ async def health_check():
     """
     健康檢查端點
     """
-    return {"status": "ok"} 
\ No newline at end of file
+    return {"status": "ok"}
+
+@router.get("/metrics")
+async def metrics():
+    """
+    監控指標端點 (快取命中率、音訊儲存用量等)
+    """
+    return {
+        "tts_cache": tts_cache.stats(),
+        "audio_store": audio_store.stats(),
+        "upstream_clients": upstream_clients.stats(),
+        "services": container.stats(),
+        "murmur_scheduler": murmur_scheduler.stats(),
+        "murmur_batcher": murmur_batcher.stats(),
+        "upstream_scheduler": upstream_scheduler.stats(),
+        "llm_single_flight": llm_single_flight.stats(),
+        "sessions": manager.stats(),
+        "background_tasks": task_registry.stats(),
+        "ws_codecs": codec_stats(),
+        "session_store": manager.store.stats()
+    }
+
+@router.get("/sessions")
+async def sessions():
+    """
+    每個 WebSocket 會話的摘要 (閒置時間、歷史長度、估算的記憶體用量)
+    """
+    return {
+        "summary": manager.stats(),
+        "sessions": manager.describe_sessions(),
+        "rooms": manager.describe_rooms()
+    }
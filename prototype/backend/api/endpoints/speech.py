@@ -1,7 +1,6 @@
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Request
-from services.speech_to_text import SpeechToTextService
-from services.text_to_speech import TextToSpeechService
-from services.ai import AIService
+from services.container import container
+from services.ai.session_state import AISessionState
 from core.models import SpeechToTextRequest
 import logging
 import base64
@@ -16,10 +15,10 @@ logger.setLevel(logging.DEBUG)
 # 創建路由
 router = APIRouter()
 
-# 初始化服務
-speech_service = SpeechToTextService()
-tts_service = TextToSpeechService()
-ai_service = AIService()
+# 取得共用的服務實例 (與 WebSocket 端點共用同一組)
+speech_service = container.stt_service
+tts_service = container.tts_service
+ai_service = container.ai_service
 
 # 創建調試目錄
 DEBUG_DIR = "debug_audio"
@@ -83,8 +82,10 @@ async def process_speech_file(request: Request):
             
             # 使用AI服務生成回應
             try:
+                # HTTP 請求沒有會話，使用獨立的角色狀態，避免影響其他用戶
                 response_dict = await ai_service.generate_response(
-                    user_text=transcribed_text 
+                    user_text=transcribed_text,
+                    state=AISessionState()
                 )
                 response = response_dict.get("final_response", "嗯...我好像有點走神了。")
                 logger.info(f"AI回應: '{response}'")
@@ -185,7 +186,8 @@ async def process_speech_base64(request: SpeechToTextRequest):
             # 使用AI服務生成回應
             try:
                 response_dict = await ai_service.generate_response(
-                    user_text=transcribed_text
+                    user_text=transcribed_text,
+                    state=AISessionState()
                 )
                 response = response_dict.get("final_response", "嗯...我好像有點走神了。")
                 
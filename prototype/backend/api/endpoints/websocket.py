@@ -1,60 +1,44 @@
-import json
 import asyncio
-from typing import Dict, List, Set
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
 from fastapi import WebSocket, WebSocketDisconnect
 import random
 import os
 import base64
 import time
-from datetime import datetime, timedelta
 import re
 
-from services.ai import AIService
-from services.text_to_speech import TextToSpeechService
+from services.container import container
+from services.text_to_speech import TTS_RESPONSE_FORMAT
+from services.tts_cache import tts_cache
+from services.speech_pipeline import StreamingSpeechPipeline
+from services.audio_store import audio_store
+from services.idle_scheduler import murmur_scheduler
+from services.murmur_batcher import murmur_batcher, build_context_digest
+from services.upstream_scheduler import upstream_priority, PRIORITY_MURMUR
+from services.session_manager import ConversationSession, manager
+from services.task_supervisor import task_registry
+from utils.audio_frames import build_audio_frame_header, encode_audio_frame
+from utils.audio_timing import AudioFrameScanner
+from utils.ws_codec import PreparedMessage, WebSocketCodec, negotiate_codec
 from core.config import settings
 from utils.logger import logger
 
 # --- 閒置設定 ---
 IDLE_TIMEOUT_SECONDS = 15  # 閒置多少秒後觸發 murmur
-IDLE_CHECK_INTERVAL_SECONDS = 3 # 每隔多少秒檢查一次閒置狀態
 MURMUR_MIN_INTERVAL_SECONDS = 25  # 兩次 murmur 之間的最小間隔
+SPEECH_END_GRACE_SECONDS = 2.0  # 語音結束後至少再等待多久才觸發 murmur
 # MURMUR_MAX_COUNT = 3  # <--- 移除：不再限制連續 murmur 次數
-MAX_HISTORY_LENGTH = 20 # 保存的最大對話歷史輪數（用戶+機器人算一輪）
 # --- 結束 ---
 
-# 建立服務實例
-ai_service = AIService()
-tts_service = TextToSpeechService()
+# 取得共用的服務實例 (整個應用只建立一次)
+ai_service = container.ai_service
+tts_service = container.tts_service
 
-# WebSocket連接管理器
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-
-    def disconnect(self, websocket: WebSocket):
-        # Use a loop to safely remove the websocket instance
-        # This handles cases where the same client might connect multiple times
-        # although ideally, the disconnect logic should prevent duplicates.
-        connections_to_remove = [conn for conn in self.active_connections if conn == websocket]
-        for conn in connections_to_remove:
-            self.active_connections.remove(conn)
-
-    async def send_message(self, message: str, websocket: WebSocket):
-        await websocket.send_text(message)
-
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            await connection.send_text(message)
-
-manager = ConnectionManager()
 
 # --- 特殊值處理，讓自言自語更頻繁 ---
 MURMUR_SIMILARITY_THRESHOLD = 0.6  # 降低相似度閾值，允許更多變化 (原為0.7)
 MURMUR_BUFFER_MAX = 0.6  # 最大緩衝時間（秒）
+SPEAKING_RESET_KEY = "speaking_reset"  # 語音重置計時器的任務鍵：新的計時器取代尚未觸發的舊計時器
 
 # --- 新增：清理輕聲自語前綴的函數 ---
 def clean_murmur_prefix(text: str) -> str:
@@ -78,151 +62,283 @@ def clean_murmur_prefix(text: str) -> str:
     return text
 # --- 結束添加 ---
 
+# --- 每個連線可切換的選項 ---
+def parse_bool_option(value: Any, default: bool = False) -> bool:
+    """將查詢參數或 configure 訊息中的值解析為布林值"""
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+# 音訊傳輸方式：
+#   url    - 保存到音訊儲存，訊息中帶 /audio-file/ URL，客戶端再以 HTTP 取得
+#   binary - 以 WebSocket 二進位幀直接送出 (見 utils/audio_frames.py)，訊息中不帶音訊
+#   stream - 同 binary，但一次性回應與 murmur 的 TTS 音訊一到達就分塊轉送，
+#            結束後以 audio-stream-end 訊息告知總時長
+AUDIO_TRANSPORTS = ("url", "binary", "stream")
+# 以二進位幀傳送音訊的傳輸方式
+BINARY_AUDIO_TRANSPORTS = ("binary", "stream")
+
+def parse_audio_transport(value: Any, default: str = "url") -> str:
+    """解析音訊傳輸方式，無效值回退為 default"""
+    if value is None:
+        return default
+    transport = str(value).strip().lower()
+    if transport not in AUDIO_TRANSPORTS:
+        logger.warning(f"未知的音訊傳輸方式: {value}，使用 {default}")
+        return default
+    return transport
+
+def default_connection_options(websocket: WebSocket) -> Dict[str, Any]:
+    """根據配置與連線 URL 的查詢參數 (例如 /ws?stream=1&audio=binary) 建立連線選項"""
+    query_params = websocket.query_params
+    return {
+        "streaming": parse_bool_option(query_params.get("stream"), settings.WS_STREAMING_DEFAULT),
+        "deferred_keyframes": parse_bool_option(query_params.get("deferred_keyframes"), settings.WS_DEFERRED_KEYFRAMES_DEFAULT),
+        "audio_transport": parse_audio_transport(query_params.get("audio"), parse_audio_transport(settings.WS_AUDIO_TRANSPORT_DEFAULT)),
+    }
+
+def room_connection_options() -> Dict[str, Any]:
+    """直播房間的選項 (所有觀眾共用，使用配置的預設值)"""
+    return {
+        "streaming": settings.WS_STREAMING_DEFAULT,
+        "deferred_keyframes": settings.WS_DEFERRED_KEYFRAMES_DEFAULT,
+        "audio_transport": parse_audio_transport(settings.WS_AUDIO_TRANSPORT_DEFAULT),
+    }
+
+# 靜態訊息只序列化一次 (每種編碼)
+INTERNAL_ERROR_MESSAGE = PreparedMessage({"type": "error", "message": "處理訊息時發生內部錯誤。"})
+AI_UNAVAILABLE_MESSAGE = PreparedMessage({"type": "error", "message": "AI 服務暫時無法回應，請稍後再試。"})
+
+# 回覆的回退文字 (啟動時預熱 TTS 快取)
+TURN_ERROR_RESPONSE = "處理時發生了一點小插曲。"
+MISSING_RESPONSE = "抱歉，我沒有理解您的意思"
+EMPTY_RESPONSE = "抱歉，我好像有點短路了..."
+FALLBACK_RESPONSES = (TURN_ERROR_RESPONSE, MISSING_RESPONSE, EMPTY_RESPONSE)
+
+# 會開始新回合 (並取消上一回合) 的訊息類型
+TURN_MESSAGE_TYPES = ("message", "chat-message")
+
+# 可透過 configure 訊息切換的布林選項
+BOOLEAN_CONNECTION_OPTIONS = ("streaming", "deferred_keyframes")
+
 # WebSocket端點
 async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
-    logger.info(f"WebSocket connection open for client: {websocket.client}")
-    
-    # --- 新增：為此連線創建一個異步鎖 ---   
-    ai_processing_lock = asyncio.Lock()
-    # --- 結束新增 ---
-
-    # --- 新增：結構化對話歷史 ---   
-    conversation_history: List[Dict[str, any]] = []
-    # --- 結束新增 ---
-
-    # 初始化連接狀態
-    logger.info(f"Client connected: {websocket.client}")
-    conversation_history = []
-    last_activity_timestamp = datetime.utcnow()
-    last_murmur_timestamp = None
-    last_speaking_reset_timestamp = None  # 新增：追蹤最後一次重置說話狀態的時間
-    recent_murmurs = set()  # 使用集合以避免重複
-    current_emotion = "neutral"
-    is_speaking = False  # 指示當前是否有語音在播放
-    user_responded = False
-
-    # 記錄當前表情狀態，用於實現平滑過渡
-    # emotion_confidence = 0.0  # 情緒置信度 - 不再需要，由 AIService 決定
-    idle_check_task = None # <--- 新增：閒置檢查任務
-
-    # --- 添加 murmur 狀態追蹤 ---
-    # murmur_count = 0 # <--- 移除：不再需要計數
-    # --- 結束添加 ---
-
-    async def add_to_history(role: str, content: str, is_murmur: bool = False):
-        """安全地添加記錄到對話歷史並進行修剪。"""
-        nonlocal conversation_history
-        history_entry = {"role": role, "content": content}
-        if role == "bot":
-            history_entry["is_murmur"] = is_murmur
-        conversation_history.append(history_entry)
-        # 修剪歷史，只保留最近 MAX_HISTORY_LENGTH * 2 條消息 (約 MAX_HISTORY_LENGTH 輪對話)
-        if len(conversation_history) > MAX_HISTORY_LENGTH * 2:
-            conversation_history = conversation_history[-(MAX_HISTORY_LENGTH * 2):]
+    # 訊息編碼 (JSON 或 MessagePack) 以子協定或 ?codec= 協商，此連線的所有收發都經過 session.channel
+    codec, subprotocol = negotiate_codec(websocket, settings.WS_CODEC_DEFAULT)
+    room_id = websocket.query_params.get("room")
+    if room_id and settings.LIVE_ROOMS_ENABLED:
+        # 直播模式：/ws?room=<id> 以觀眾身分加入房間，共用房間的對話流程
+        await run_spectator(websocket, room_id, codec, subprotocol)
+        return
+
+    # 此連線的所有狀態 (對話歷史、時間戳、播放狀態、連線選項、處理鎖) 都在 session 中
+    # 重新連線的客戶端以 /ws?session=<id> 帶回會話 id，從會話狀態儲存恢復對話歷史
+    requested_session_id = websocket.query_params.get("session")
+    session = await manager.connect(
+        websocket, default_connection_options(websocket), session_id=requested_session_id, codec=codec, subprotocol=subprotocol
+    )
+    logger.info(f"WebSocket connection open for client: {websocket.client} (session {session.session_id}, codec {codec.name})")
+    logger.info(f"Connection options for {websocket.client}: {session.options}")
+    try:
+        await session.outbound.send({"type": "session", "sessionId": session.session_id, "restored": session.session_id == requested_session_id})
+        await run_conversation(session, session.channel.receive)
+    finally:
+        # 安全地斷開連接
+        try:
+            if manager.disconnect(session.session_id) is not None:
+                 logger.info(f"WebSocket connection successfully removed from manager for client {websocket.client}")
+            else:
+                 logger.warning(f"WebSocket for client {websocket.client} was already disconnected or not in manager.")
+        except Exception as cleanup_err:
+             logger.error(f"Error during connection cleanup for {websocket.client}: {cleanup_err}", exc_info=True)
+        logger.info(f"WebSocket connection closed for client {websocket.client}")
+
+
+async def run_spectator(websocket: WebSocket, room_id: str, codec: WebSocketCodec, subprotocol: Optional[str]):
+    """
+    直播房間的觀眾連線：接收房間扇出的訊息，聊天訊息轉交房間的對話流程
+
+    房間的第一位觀眾建立房間並啟動其對話流程，最後一位觀眾離開時關閉房間。
+    後加入的觀眾只補收已序列化的 JSON 訊息 (快照、最近一則機器人訊息與情緒軌跡)；
+    進行中回覆已送出的二進位音訊幀不會補送，從下一則回覆的音訊開始收到。
+    """
+    session = await manager.connect(websocket, room_connection_options(), codec=codec, subprotocol=subprotocol)
+    try:
+        room, created = await manager.join_room(room_id, session, room_connection_options())
+        if created:
+            room.task = task_registry.spawn(run_conversation(room.session, room.next_message, live_room=True), "live_room")
+        logger.info(f"Spectator {websocket.client} joined live room {room_id} ({len(room.spectators)} viewers, codec {codec.name})")
+        await session.outbound.send({"type": "session", "sessionId": session.session_id, "restored": False, "roomId": room_id})
+        # 後加入的觀眾：房間狀態快照，以及最近一則機器人訊息與情緒軌跡 (已序列化)
+        await session.outbound.send(room.snapshot())
+        for prepared in list(room.recent.values()):
+            await session.outbound.send(prepared)
+
+        while True:
+            try:
+                message = await session.channel.receive()
+            except ValueError as decode_err:
+                logger.error(f"Failed to decode message from {websocket.client}: {decode_err}")
+                continue
+            message_type = message.get("type")
+            if message_type in TURN_MESSAGE_TYPES:
+                message["sender"] = session.session_id
+                room.submit(message)
+            elif message_type == "configure":
+                # 房間的選項由所有觀眾共用，不接受個別觀眾切換
+                await session.outbound.send({"type": "configured", "options": room.session.options})
+            else:
+                logger.warning(f"Received unknown message type from spectator: {message_type}")
+    except WebSocketDisconnect:
+        logger.info(f"Spectator {websocket.client} left live room {room_id}")
+    except asyncio.CancelledError:
+        logger.info(f"Spectator task cancelled for {websocket.client}")
+    except Exception as e:
+        logger.error(f"Unexpected error for spectator {websocket.client} in room {room_id}: {e}", exc_info=True)
+    finally:
+        await session.outbound.close()
+        try:
+            await manager.leave_room(room_id, session.session_id)
+        except Exception as leave_err:
+            logger.error(f"Error leaving live room {room_id}: {leave_err}", exc_info=True)
+        manager.disconnect(session.session_id)
+
+
+async def run_conversation(session: ConversationSession, receive: Callable[[], Awaitable[Dict[str, Any]]], live_room: bool = False):
+    """
+    執行一個會話的對話流程 (回合、murmur、語音)，直到 receive() 拋出 WebSocketDisconnect 或任務被取消
+
+    Args:
+        session: 會話；所有訊息經 session.outbound 送出 (一般連線為單一連線的出站佇列，直播房間為扇出到所有觀眾)
+        receive: 取得下一則客戶端訊息
+        live_room: 直播房間模式，觀眾訊息不觸發 barge-in，排隊依序回應
+    """
+    # 訊息只放入出站佇列，由寫入任務送出 (回合流程與會話鎖不等待網路)
+    outbound = session.outbound
+    client_label = session.client or session.session_id
 
     async def reset_speaking_after_duration(duration_seconds: float):
         """在指定的秒數後重置語音播放狀態。"""
-        nonlocal is_speaking, last_activity_timestamp, last_murmur_timestamp, last_speaking_reset_timestamp
         
         # 記錄相關資訊以便調試
-        previous_speaking_state = is_speaking
+        previous_speaking_state = session.is_speaking
         logger.info(f"Starting reset_speaking_after_duration timer for {duration_seconds:.2f} seconds. Current is_speaking: {previous_speaking_state}")
         
         # 等待指定時間
         await asyncio.sleep(duration_seconds)
         
         # 重置語音狀態
-        is_speaking = False
+        session.is_speaking = False
         
         # 更新所有相關時間戳，確保後續操作基於正確的時間
-        current_time = datetime.utcnow()
-        last_activity_timestamp = current_time
-        last_speaking_reset_timestamp = current_time
+        current_time = time.monotonic()
+        session.last_activity = current_time
+        session.last_speaking_reset = current_time
         
         # 無論是什麼類型的語音(murmur或正常回覆)都更新last_murmur_timestamp
         # 這樣可以避免murmur結束後立即觸發下一個murmur
-        last_murmur_timestamp = current_time
+        session.last_murmur = current_time
+        schedule_murmur()
             
         logger.info(f"Reset is_speaking from {previous_speaking_state} to False after {duration_seconds:.2f} seconds and updated all timestamps to current time")
 
-    async def idle_checker():
-        """背景任務，定期檢查閒置狀態並觸發 murmur。"""
-        nonlocal last_activity_timestamp, current_emotion, last_murmur_timestamp, recent_murmurs, user_responded, is_speaking, last_speaking_reset_timestamp
-        while True:
-            await asyncio.sleep(IDLE_CHECK_INTERVAL_SECONDS)
-            try:
-                current_time = datetime.utcnow()
-                idle_duration = current_time - last_activity_timestamp
-
-                # --- 檢查是否應該觸發 murmur ---
-                # 詳細記錄當前的狀態以便診斷
-                current_speaking_state = is_speaking
-                time_since_last_murmur = "N/A" if last_murmur_timestamp is None else f"{(current_time - last_murmur_timestamp).total_seconds():.2f}s"
-                time_since_last_reset = "N/A" if not last_speaking_reset_timestamp else f"{(current_time - last_speaking_reset_timestamp).total_seconds():.2f}s"
-                
-                # 檢查在語音剛結束後是否需要額外等待
-                should_wait_after_speaking = False
-                if last_speaking_reset_timestamp:
-                    time_since_last_reset_seconds = (current_time - last_speaking_reset_timestamp).total_seconds()
-                    should_wait_after_speaking = time_since_last_reset_seconds < 2.0  # 語音結束後等待2秒
-                
-                # 完整的 murmur 觸發條件檢查：
-                # 1. 必須達到閒置閾值
-                # 2. 距離上次 murmur 必須超過最小間隔
-                # 3. 當前不能有其他語音在播放
-                # 4. 語音結束後需要短暫等待
-                murmur_condition_met = (
-                    idle_duration > timedelta(seconds=IDLE_TIMEOUT_SECONDS) and
-                    (last_murmur_timestamp is None or 
-                     current_time - last_murmur_timestamp > timedelta(seconds=MURMUR_MIN_INTERVAL_SECONDS)) and
-                    not is_speaking and
-                    not should_wait_after_speaking
-                )
-                
-                # 記錄詳細的狀態和決策
-                logger.info(
-                    f"Murmur conditions check - idle: {idle_duration.total_seconds():.2f}s, "
-                    f"speaking: {current_speaking_state}, "
-                    f"time since last murmur: {time_since_last_murmur}, "
-                    f"time since last reset: {time_since_last_reset}, "
-                    f"should_wait_after_speaking: {should_wait_after_speaking}, "
-                    f"condition met: {murmur_condition_met}"
-                )
-                
-                # 如果滿足所有條件，嘗試觸發 murmur
-                if murmur_condition_met:
-                    # --- 嘗試獲取鎖，如果鎖已被持有（表示正在處理用戶消息），則等待 ---                   
-                    async with ai_processing_lock:
-                        # 再次檢查閒置時間，避免在等待鎖的過程中用戶剛好發送了消息
-                        if datetime.utcnow() - last_activity_timestamp <= timedelta(seconds=IDLE_TIMEOUT_SECONDS):
-                            logger.info(f"User became active while waiting for lock in idle_checker. Skipping murmur.")
-                            continue # 用户在等待锁期间变得活跃，跳过此次 murmur
-                        
-                        # 再次檢查 is_speaking 狀態，確保在獲取鎖的過程中沒有其他語音開始播放
-                        if is_speaking:
-                            logger.info(f"Speaking state changed to {is_speaking} while waiting for lock. Skipping murmur.")
-                            continue # 語音狀態在等待鎖期間改變，跳過此次 murmur
-                        
-                        # 再次檢查是否已超過最小murmur間隔
-                        current_time = datetime.utcnow()
-                        if last_murmur_timestamp is not None and current_time - last_murmur_timestamp <= timedelta(seconds=MURMUR_MIN_INTERVAL_SECONDS):
-                            logger.info(f"Time since last murmur became less than minimum interval while waiting for lock. Skipping murmur.")
-                            continue
-
-                        logger.info(f"Client {websocket.client} idle timeout reached. Generating murmur...")
-
-                        # 在生成murmur前先標記is_speaking為True，避免多個murmur同時生成
-                        is_speaking = True
-                        logger.info(f"Set is_speaking to True before generating murmur to prevent overlap")
-
-                        # 1. 觸發 Murmur 生成
-                        context_prompt = ""
-                        if recent_murmurs:
-                            context_prompt = f"最近的幾句自言自語: {', '.join(list(recent_murmurs)[-3:])}\n避免重複，但可以適度延續之前的想法或開啟新話題。"
-                        
-                        # <-- 保持原有的 Prompt 邏輯 -->
-                        murmur_prompt = f"""請生成一句角色的內心獨白或自言自語 (murmur)。符合以下條件：
+    def next_murmur_time() -> float:
+        """依目前狀態計算下一次可以觸發 murmur 的時間 (time.monotonic())"""
+        # 1. 必須達到閒置閾值
+        # 2. 距離上次 murmur 必須超過最小間隔
+        # 3. 語音結束後需要短暫等待
+        due = session.last_activity + IDLE_TIMEOUT_SECONDS
+        if session.last_murmur is not None:
+            due = max(due, session.last_murmur + MURMUR_MIN_INTERVAL_SECONDS)
+        if session.last_speaking_reset is not None:
+            due = max(due, session.last_speaking_reset + SPEECH_END_GRACE_SECONDS)
+        return due
+
+    def schedule_murmur(deadline: Optional[float] = None):
+        """向全域排程器登記 (或更新) 此連線下一次檢查 murmur 的時間"""
+        if session.closed:
+            return
+        murmur_scheduler.schedule(session.session_id, deadline if deadline is not None else next_murmur_time(), on_murmur_deadline)
+        if settings.MURMUR_POOL_ENABLED:
+            schedule_murmur_pool_fill()
+
+    def schedule_murmur_pool_fill():
+        """安靜一段時間後在背景補滿 murmur 池"""
+        murmur_scheduler.schedule(pool_fill_key, session.last_activity + settings.MURMUR_POOL_FILL_DELAY_SECONDS, on_murmur_pool_deadline)
+
+    async def on_murmur_pool_deadline():
+        if session.closed:
+            return
+        upstream_priority.set(PRIORITY_MURMUR)
+        if session.lock.locked():
+            # 回合或 murmur 進行中，稍後再試
+            murmur_scheduler.schedule(pool_fill_key, time.monotonic() + settings.MURMUR_POOL_FILL_DELAY_SECONDS, on_murmur_pool_deadline)
+            return
+        session.murmur_pool.fill(lambda: generate_murmur(synthesize=True))
+
+    # murmur 池在全域排程器中的鍵
+    pool_fill_key = (session.session_id, "murmur-pool")
+
+    async def on_murmur_deadline():
+        """截止時間到期時由全域排程器調用：條件仍未滿足就重新登記，否則生成 murmur。"""
+        now = time.monotonic()
+        if session.is_speaking or session.lock.locked():
+            # 語音播放結束與收到訊息時都會重新登記，這裡只是保險，避免排程遺失
+            schedule_murmur(now + IDLE_TIMEOUT_SECONDS)
+            return
+        due = next_murmur_time()
+        if due > now:
+            schedule_murmur(due)
+            return
+        # 此任務中的上游調用 (LLM 與 TTS) 排在用戶回合之後
+        upstream_priority.set(PRIORITY_MURMUR)
+        try:
+            async with session.lock:
+                await run_murmur()
+        except WebSocketDisconnect:
+            logger.info(f"Murmur detected disconnection for {client_label}.")
+            return
+        except Exception as e:
+            logger.error(f"Error generating murmur for {client_label}: {e}", exc_info=True)
+        manager.persist(session)
+        schedule_murmur()
+
+    def is_repetitive_murmur(text: str) -> bool:
+        """與最近的 murmur 重複或高度相似時返回 True"""
+        # 更嚴格的重複檢查 - 不僅檢查完全匹配，還檢查高度相似
+        for existing_murmur in session.recent_murmurs:
+            # 簡單的相似度檢測 - 如果包含或被包含，認為太相似
+            if (text in existing_murmur or 
+                existing_murmur in text or
+                len(text) > 0 and existing_murmur and 
+                (len(set(text.lower()) & set(existing_murmur.lower())) / len(set(text.lower() + existing_murmur.lower())) > MURMUR_SIMILARITY_THRESHOLD)):
+                logger.warning(f"Generated murmur is too similar to existing: New: '{text}', Existing: '{existing_murmur}', skipping...")
+                return True
+
+        if text in session.recent_murmurs:
+            logger.warning(f"Generated murmur is a duplicate: '{text}', skipping...")
+            return True
+        return False
+
+    async def generate_murmur(synthesize: bool) -> Optional[Dict[str, Any]]:
+        """
+        生成一句 murmur 的文字與音訊 (不送出，也不修改會話狀態)
+
+        Args:
+            synthesize: 是否同時合成音訊 (stream 傳輸改在送出後邊合成邊轉送)
+
+        Returns:
+            {"text", "ai_result", "audio_bytes", "audio_codec", "audio_duration"}，失敗或與最近的 murmur 重複時返回 None
+        """
+        # 1. 觸發 Murmur 生成
+        context_prompt = ""
+        if session.recent_murmurs:
+            context_prompt = f"最近的幾句自言自語: {', '.join(list(session.recent_murmurs)[-3:])}\n避免重複，但可以適度延續之前的想法或開啟新話題。"
+
+        # <-- 保持原有的 Prompt 邏輯 -->
+        murmur_prompt = f"""請生成一句角色的內心獨白或自言自語 (murmur)。符合以下條件：
 1. 作為太空站的虛擬主播「星際小可愛」，反映當前情境和心境。
 2. 參考提供的對話歷史(`history`)，特別是最近的互動或你自己的思考。
 3. 內容應自然、簡短（約30-40字內），像是腦海中閃過的念頭。
@@ -232,536 +348,762 @@ async def websocket_endpoint(websocket: WebSocket):
 {context_prompt}
 """
 
-                        # 生成 murmur 並處理結果
-                        # 保持原有的處理邏輯
-                        ai_result = None
-                        ai_murmur_text = None
-                        try:
-                            # --- 傳遞歷史給 AI ---                           
-                            ai_result = await ai_service.generate_response(
-                                system_prompt=murmur_prompt,
-                                history=conversation_history
-                            )
-                            # --- 結束 ---
-
-                            # 以下保持原有邏輯
-                            if not ai_result or "final_response" not in ai_result:
-                                logger.error("AIService failed to generate murmur or returned invalid format.")
-                                continue # 跳過此次 murmur
-
-                            ai_murmur_text = ai_result.get("final_response")
-                            
-                            # 清理可能的前綴
-                            ai_murmur_text = clean_murmur_prefix(ai_murmur_text)
-                            
-                            # 更嚴格的重複檢查 - 不僅檢查完全匹配，還檢查高度相似
-                            skip_due_to_similarity = False
-                            for existing_murmur in recent_murmurs:
-                                # 簡單的相似度檢測 - 如果包含或被包含，認為太相似
-                                if (ai_murmur_text in existing_murmur or 
-                                    existing_murmur in ai_murmur_text or
-                                    len(ai_murmur_text) > 0 and existing_murmur and 
-                                    (len(set(ai_murmur_text.lower()) & set(existing_murmur.lower())) / len(set(ai_murmur_text.lower() + existing_murmur.lower())) > MURMUR_SIMILARITY_THRESHOLD)):
-                                    logger.warning(f"Generated murmur is too similar to existing: New: '{ai_murmur_text}', Existing: '{existing_murmur}', skipping...")
-                                    skip_due_to_similarity = True
-                                    break
-                            
-                            if skip_due_to_similarity:
-                                continue
-                                
-                            if ai_murmur_text in recent_murmurs:
-                                logger.warning(f"Generated murmur is a duplicate: '{ai_murmur_text}', skipping...")
-                                continue
-                            
-                            recent_murmurs.add(ai_murmur_text)
-                            if len(recent_murmurs) > 10:
-                                recent_murmurs.pop()
-                                
-                            murmur_emotion = ai_result.get("emotion", current_emotion)
-                            current_emotion = murmur_emotion
-                            logger.info(f"Generated murmur: '{ai_murmur_text}', Emotion: {current_emotion}")
-
-                            # --- 將生成的 murmur 添加到歷史 ---                           
-                            await add_to_history("bot", ai_murmur_text, is_murmur=True)
-                            # --- 結束 ---                           
-
-                        except Exception as ai_err:
-                            logger.error(f"Error generating murmur from AIService: {ai_err}", exc_info=True)
-                            continue # 發生錯誤，跳過此次 murmur
-
-                        # 2. 轉換為語音
-                        tts_result = None
-                        audio_base64 = None
-                        audio_duration = len(ai_murmur_text) * 0.15 # 預設估算值
-                        logger.info(f"Estimated initial audio duration for murmur: {audio_duration:.2f}s (based on text length)")
-                        try:
-                            if ai_murmur_text:
-                                tts_start_time = time.monotonic()
-                                tts_result = await tts_service.synthesize_speech(ai_murmur_text)
-                                tts_end_time = time.monotonic()
-                                logger.info(f"TTS processing time for murmur: {(tts_end_time - tts_start_time)*1000:.2f}ms")
-                                
-                                if tts_result:
-                                    audio_base64 = tts_result.get("audio")
-                                    audio_duration = tts_result.get("duration", audio_duration)
-                                    logger.info(f"TTS succeeded for murmur, actual duration: {audio_duration:.2f}s")
-                                else:
-                                    logger.warning("TTS returned empty result for murmur")
-                        except Exception as tts_err:
-                            logger.error(f"Error synthesizing speech for murmur: {tts_err}", exc_info=True)
-                            # 即使 TTS 失敗，還是可以發送文字 murmur
-
-                        # 3. 使用 chat-message 格式推送 Murmur
-                        # 創建機器人消息結構
-                        bot_message = {
-                            "id": f"bot-murmur-{int(asyncio.get_event_loop().time() * 1000)}",
-                            "role": "bot",
-                            "content": ai_murmur_text,
-                            "bodyAnimationSequence": ai_result.get("body_animation_sequence"),
-                            "timestamp": None,
-                            "audioUrl": None, # 稍後填充
-                            "isMurmur": True  # 標識這是一個自主生成的 murmur
-                        }
-
-                        # 如果有音頻，保存到文件並設置URL
-                        if audio_base64:
-                            # 生成唯一文件名
-                            audio_filename = f"murmur-{int(asyncio.get_event_loop().time() * 1000)}.mp3"
-                            # 構建保存路徑
-                            backend_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-                            audio_dir = os.path.join(backend_root, "audio")
-                            os.makedirs(audio_dir, exist_ok=True)
-                            audio_filepath = os.path.join(audio_dir, audio_filename)
-
-                            try:
-                                # 解碼並保存音頻
-                                if isinstance(audio_base64, str):
-                                    audio_base64_data = audio_base64.split(",", 1)[1] if "," in audio_base64 else audio_base64
-                                    audio_data = base64.b64decode(audio_base64_data)
-                                    with open(audio_filepath, 'wb') as f:
-                                        f.write(audio_data)
-                                    # 如果成功保存，設置 audioUrl
-                                    if os.path.exists(audio_filepath) and os.path.getsize(audio_filepath) > 0:
-                                        bot_message["audioUrl"] = f"/audio-file/{audio_filename}"
-                                        logger.info(f"Successfully saved murmur audio file: {audio_filepath}")
-                                    else:
-                                        logger.error(f"Failed to save murmur audio file or file is empty: {audio_filepath}")
-                                else:
-                                    logger.error(f"Audio data is not a valid string: {type(audio_base64)}")
-                            except base64.binascii.Error as b64_error:
-                                logger.error(f"Base64 decoding error: {b64_error}")
-                            except Exception as e:
-                                logger.error(f"Error saving murmur audio file: {e}", exc_info=True)
-
-                        # 發送 chat-message 格式的 murmur
-                        await websocket.send_json({
-                            "type": "chat-message",
-                            "message": bot_message
-                        })
-                        logger.info(f"Sent murmur as chat-message to client {websocket.client}")
-
-                        # 如果有情緒關鍵幀，發送 emotionalTrajectory
-                        emotional_keyframes = ai_result.get("emotional_keyframes")
-                        if emotional_keyframes:
-                            trajectory_payload = {
-                                "duration": audio_duration,
-                                "keyframes": emotional_keyframes
-                            }
-                            await websocket.send_json({
-                                "type": "emotionalTrajectory",
-                                "payload": trajectory_payload
-                            })
-                            logger.info(f"已發送 Emotional Trajectory，時長: {audio_duration:.2f}s")
-
-                        # 更新最後一次murmur的時間戳，確保不會立即再次觸發murmur
-                        last_murmur_timestamp = datetime.utcnow()
-                        logger.info(f"Updated last_murmur_timestamp before scheduling reset task")
-
-                        # 告知客戶端語音播放完成，這將重置播放狀態
-                        if audio_duration > 0 and audio_base64:
-                            # 根據語音時長安排一個任務，在語音播放結束後重置 is_speaking
-                            # 添加一些額外時間作為緩衝，隨著音頻時長增加，緩衝也適度增加
-                            buffer_time = min(MURMUR_BUFFER_MAX, 0.3 + audio_duration * 0.03)  # 調整緩衝時間
-                            total_wait_time = audio_duration + buffer_time
-                            
-                            # 創建任務前記錄當前狀態
-                            logger.info(f"Creating reset_speaking_after_duration task: audio_duration={audio_duration:.2f}s, "
-                                       f"buffer_time={buffer_time:.2f}s, total_wait_time={total_wait_time:.2f}s, "
-                                       f"current is_speaking={is_speaking}")
-                            
-                            # 創建異步任務重置語音狀態
-                            reset_task = asyncio.create_task(reset_speaking_after_duration(total_wait_time))
-                            
-                            # 不要在這裡更新last_murmur_timestamp，將在reset_speaking_after_duration函數中更新
-                            # last_murmur_timestamp = datetime.utcnow()
-                        else:
-                            # 如果沒有音頻，立即重置說話狀態
-                            is_speaking = False
-                            
-                            # 即使沒有音頻，也應該更新所有相關時間戳
-                            current_time = datetime.utcnow()
-                            last_activity_timestamp = current_time
-                            last_speaking_reset_timestamp = current_time
-                            last_murmur_timestamp = current_time
-                            
-                            logger.info(f"No audio for response, immediately reset is_speaking to False and updated all timestamps")
-
-                        # 調整活動時間戳，在聊天訊息處理後同步更新
-                        # 確保與音頻播放結束後的重置操作協調一致
-                        last_activity_timestamp = datetime.utcnow()
-
+        try:
+            if settings.MURMUR_BATCH_ENABLED:
+                # 與其他閒置會話合併為一次 LLM 調用 (不經過工具意圖與記憶階段)
+                ai_result = await murmur_batcher.request(
+                    build_context_digest(session.history, session.recent_murmurs, session.current_emotion),
+                    session.ai_state
+                )
+            else:
+                ai_result = await ai_service.generate_response(
+                    system_prompt=murmur_prompt,
+                    history=session.history,
+                    state=session.ai_state
+                )
+        except Exception as ai_err:
+            logger.error(f"Error generating murmur from AIService: {ai_err}", exc_info=True)
+            return None # 發生錯誤，跳過此次 murmur
+
+        if not ai_result or "final_response" not in ai_result:
+            logger.error("AIService failed to generate murmur or returned invalid format.")
+            return None # 跳過此次 murmur
+        if ai_result.get("error"):
+            # 生成失敗 (例如上游繁忙被捨棄) 時的預設回應不適合當作 murmur
+            logger.warning(f"Skipping murmur after AIService error: {ai_result['error']}")
+            return None
+
+        # 清理可能的前綴
+        ai_murmur_text = clean_murmur_prefix(ai_result.get("final_response"))
+        if is_repetitive_murmur(ai_murmur_text):
+            return None
+
+        # 2. 轉換為語音
+        audio_bytes = None
+        audio_codec = "mp3"
+        audio_duration = len(ai_murmur_text) * 0.15 # 預設估算值
+        logger.info(f"Estimated initial audio duration for murmur: {audio_duration:.2f}s (based on text length)")
+        try:
+            if ai_murmur_text and synthesize:
+                tts_start_time = time.monotonic()
+                tts_result = await tts_service.synthesize_speech_bytes(ai_murmur_text)
+                tts_end_time = time.monotonic()
+                logger.info(f"TTS processing time for murmur: {(tts_end_time - tts_start_time)*1000:.2f}ms")
+
+                if tts_result:
+                    audio_bytes = tts_result.get("audio_bytes")
+                    audio_codec = tts_result.get("codec", audio_codec)
+                    audio_duration = tts_result.get("duration", audio_duration)
+                    logger.info(f"TTS succeeded for murmur, actual duration: {audio_duration:.2f}s")
+                else:
+                    logger.warning("TTS returned empty result for murmur")
+        except Exception as tts_err:
+            logger.error(f"Error synthesizing speech for murmur: {tts_err}", exc_info=True)
+            # 即使 TTS 失敗，還是可以發送文字 murmur
+
+        return {
+            "text": ai_murmur_text,
+            "ai_result": ai_result,
+            "audio_bytes": audio_bytes,
+            "audio_codec": audio_codec,
+            "audio_duration": audio_duration,
+        }
+
+    async def run_murmur():
+        """生成並送出一句 murmur (呼叫者須持有 session.lock)。"""
+        # 再次檢查閒置時間，避免在等待鎖的過程中用戶剛好發送了消息
+        if time.monotonic() - session.last_activity <= IDLE_TIMEOUT_SECONDS:
+            logger.info(f"User became active while waiting for lock. Skipping murmur.")
+            return # 用户在等待锁期间变得活跃，跳过此次 murmur
+
+        # 再次檢查 is_speaking 狀態，確保在獲取鎖的過程中沒有其他語音開始播放
+        if session.is_speaking:
+            logger.info(f"Speaking state changed to {session.is_speaking} while waiting for lock. Skipping murmur.")
+            return # 語音狀態在等待鎖期間改變，跳過此次 murmur
+
+        # 再次檢查是否已超過最小murmur間隔
+        current_time = time.monotonic()
+        if session.last_murmur is not None and current_time - session.last_murmur <= MURMUR_MIN_INTERVAL_SECONDS:
+            logger.info(f"Time since last murmur became less than minimum interval while waiting for lock. Skipping murmur.")
+            return
+
+        logger.info(f"Client {client_label} idle timeout reached. Generating murmur...")
+
+        # 在生成murmur前先標記is_speaking為True，避免多個murmur同時生成
+        session.is_speaking = True
+        logger.info(f"Set is_speaking to True before generating murmur to prevent overlap")
+
+        murmur = None
+        if settings.MURMUR_POOL_ENABLED:
+            # 預生成的 murmur 可能在入池後才與新送出的 murmur 變得相似，取出時再檢查一次
+            murmur = session.murmur_pool.take(accept=lambda candidate: not is_repetitive_murmur(candidate["text"]))
+            if murmur is not None:
+                logger.info(f"Using pre-generated murmur for {client_label}")
+        if murmur is None:
+            murmur = await generate_murmur(synthesize=session.options["audio_transport"] != "stream")
+        if murmur is None:
+            return
+
+        ai_result = murmur["ai_result"]
+        ai_murmur_text = murmur["text"]
+        audio_bytes = murmur["audio_bytes"]
+        audio_codec = murmur["audio_codec"]
+        audio_duration = murmur["audio_duration"]
+
+        session.remember_murmur(ai_murmur_text)
+        tts_cache.record_murmur(ai_murmur_text)
+
+        murmur_emotion = ai_result.get("emotion", session.current_emotion)
+        session.current_emotion = murmur_emotion
+        logger.info(f"Generated murmur: '{ai_murmur_text}', Emotion: {session.current_emotion}")
+
+        # --- 將生成的 murmur 添加到歷史 ---                           
+        session.add_to_history("bot", ai_murmur_text, is_murmur=True)
+        # --- 結束 ---                           
+
+        # 3. 使用 chat-message 格式推送 Murmur
+        # 創建機器人消息結構
+        bot_message = {
+            "id": f"bot-murmur-{int(asyncio.get_event_loop().time() * 1000)}",
+            "role": "bot",
+            "content": ai_murmur_text,
+            "bodyAnimationSequence": ai_result.get("body_animation_sequence"),
+            "timestamp": None,
+            "audioUrl": None, # 稍後填充
+            "isMurmur": True  # 標識這是一個自主生成的 murmur
+        }
+
+        # 如果有音頻，保存到文件並設置URL (binary 模式下改為先送出二進位幀)
+        if audio_bytes:
+            # 生成唯一文件名
+            audio_filename = f"murmur-{int(asyncio.get_event_loop().time() * 1000)}.mp3"
+            bot_message["audioUrl"] = await deliver_audio(bot_message["id"], 0, audio_bytes, audio_codec, audio_duration, audio_filename)
+            if bot_message["audioUrl"]:
+                logger.info(f"Successfully saved murmur audio file: {audio_filename}")
+            elif session.options["audio_transport"] in BINARY_AUDIO_TRANSPORTS:
+                # 已合成的音訊 (例如預生成的 murmur) 以單一二進位幀送出
+                bot_message["audioTransport"] = "binary"
+
+        if session.options["audio_transport"] == "stream" and ai_murmur_text and not audio_bytes:
+            bot_message["audioTransport"] = "stream"
+
+        # 發送 chat-message 格式的 murmur
+        await outbound.send({
+            "type": "chat-message",
+            "message": bot_message
+        })
+        logger.info(f"Sent murmur as chat-message to client {client_label}")
+
+        # stream 傳輸：訊息送出後才開始合成，音訊邊合成邊轉送
+        if bot_message.get("audioTransport") == "stream":
+            try:
+                audio_bytes, audio_duration = await stream_speech(bot_message["id"], ai_murmur_text)
             except WebSocketDisconnect:
-                logger.info(f"Idle checker detected disconnection for {websocket.client}. Stopping checker.")
-                break # 連線斷開，退出檢查循環
-            except asyncio.CancelledError:
-                 logger.info(f"Idle checker task cancelled for {websocket.client}.")
-                 break # 捕獲取消錯誤並退出
-            except Exception as e:
-                logger.error(f"Error in idle_checker loop for {websocket.client}: {e}", exc_info=True)
-                await asyncio.sleep(IDLE_CHECK_INTERVAL_SECONDS * 2)
-
-    try:
-        idle_check_task = asyncio.create_task(idle_checker())
-        logger.info(f"Started idle checker task for client {websocket.client}")
-
-        while True:
-            data = await websocket.receive_text()
-            
-            # --- 更新活動時間，並獲取鎖以處理用戶消息 ---           
-            async with ai_processing_lock:
-                last_activity_timestamp = datetime.utcnow() 
-                user_responded = True
-                # murmur_count = 0 # <-- 移除計數重置
-                # --- 鎖定區間開始 ---
-
-                try:
-                    message = json.loads(data)
-                    message_type = message.get("type")
-                    logger.info(f"Received message type '{message_type}' from {websocket.client} while holding lock")
-
-                    if message_type == "message":
-                        user_text = message.get("content")
-                        if not user_text:
-                            logger.warning("Received empty 'message' content.")
-                            continue
-
-                        # 移除獨立的情緒分析器調用
-                        # emotion, confidence = emotion_analyzer.analyze(user_text)
-                        # print(f"分析情緒結果: {emotion}, 置信度: {confidence}")
-                        # if confidence > emotion_confidence:
-                        #     next_emotion = emotion
-                        #     emotion_confidence = confidence
-                        # else:
-                        #     next_emotion = current_emotion
-                        # current_emotion = next_emotion
-
-                        # 生成回復 (包含文字和情緒)
-                        ai_response = ""
-                        response_emotion = current_emotion # 預設為當前情緒
-                        ai_result = None
-                        try:
-                             # 假設 generate_response 返回包含 final_response 和 emotion 的字典
-                            ai_result = await ai_service.generate_response(user_text=user_text)
-                            if ai_result:
-                                ai_response = ai_result.get("final_response", "嗯...我該說些什麼呢？")
-                                response_emotion = ai_result.get("emotion", current_emotion) # 更新情緒
-                                current_emotion = response_emotion # 更新 Websocket 狀態
-                            else:
-                                 logger.error("AIService returned None or empty result for user message.")
-                                 ai_response = "抱歉，我好像沒聽清楚。"
-
-                        except Exception as ai_err:
-                            logger.error(f"Error generating response from AIService: {ai_err}", exc_info=True)
-                            ai_response = "糟糕，我的思緒有點混亂。"
+                raise
+            except Exception as tts_err:
+                logger.error(f"Error streaming speech for murmur: {tts_err}", exc_info=True)
+
+        # 如果有情緒關鍵幀，發送 emotionalTrajectory
+        emotional_keyframes = ai_result.get("emotional_keyframes")
+        if emotional_keyframes:
+            trajectory_payload = {
+                "duration": audio_duration,
+                "keyframes": emotional_keyframes
+            }
+            await outbound.send({
+                "type": "emotionalTrajectory",
+                "payload": trajectory_payload
+            })
+            logger.info(f"已發送 Emotional Trajectory，時長: {audio_duration:.2f}s")
+
+        # 更新最後一次murmur的時間戳，確保不會立即再次觸發murmur
+        session.last_murmur = time.monotonic()
+        logger.info(f"Updated last_murmur_timestamp before scheduling reset task")
+
+        # 告知客戶端語音播放完成，這將重置播放狀態
+        if audio_duration > 0 and audio_bytes:
+            # 根據語音時長安排一個任務，在語音播放結束後重置 is_speaking
+            # 添加一些額外時間作為緩衝，隨著音頻時長增加，緩衝也適度增加
+            buffer_time = min(MURMUR_BUFFER_MAX, 0.3 + audio_duration * 0.03)  # 調整緩衝時間
+            total_wait_time = audio_duration + buffer_time
+
+            # 創建任務前記錄當前狀態
+            logger.info(f"Creating reset_speaking_after_duration task: audio_duration={audio_duration:.2f}s, "
+                       f"buffer_time={buffer_time:.2f}s, total_wait_time={total_wait_time:.2f}s, "
+                       f"current is_speaking={session.is_speaking}")
+
+            # 創建異步任務重置語音狀態 (取代尚未觸發的舊計時器，連線結束時取消)
+            session.tasks.spawn(reset_speaking_after_duration(total_wait_time), "speaking_reset", key=SPEAKING_RESET_KEY)
+
+            # 不要在這裡更新last_murmur_timestamp，將在reset_speaking_after_duration函數中更新
+            # last_murmur_timestamp = time.monotonic()
+        else:
+            # 如果沒有音頻，立即重置說話狀態
+            session.is_speaking = False
+
+            # 即使沒有音頻，也應該更新所有相關時間戳
+            current_time = time.monotonic()
+            session.last_activity = current_time
+            session.last_speaking_reset = current_time
+            session.last_murmur = current_time
+
+            logger.info(f"No audio for response, immediately reset is_speaking to False and updated all timestamps")
+
+        # 調整活動時間戳，在聊天訊息處理後同步更新
+        # 確保與音頻播放結束後的重置操作協調一致
+        session.last_activity = time.monotonic()
+
+    async def deliver_audio(message_id: str, seq: int, audio_bytes: bytes, codec: str, duration: float, audio_filename: str, text: Optional[str] = None, final: bool = True) -> Optional[str]:
+        """
+        依連線的音訊傳輸方式交付音訊
+
+        binary 模式下直接送出二進位幀並返回 None；url 模式下放入音訊儲存並返回 /audio-file/ URL。
+        """
+        if session.options["audio_transport"] in BINARY_AUDIO_TRANSPORTS:
+            header = build_audio_frame_header(message_id, seq, codec, duration, text=text, final=final)
+            await outbound.send_bytes(encode_audio_frame(header, audio_bytes))
+            return None
+        return audio_store.put(audio_bytes, audio_filename)
+
+    async def stream_speech(message_id: str, text: str) -> Tuple[Optional[bytes], float]:
+        """
+        stream 傳輸：TTS 音訊塊一到達就以二進位幀轉送，結束後送出 audio-stream-end 告知總時長
+
+        Returns:
+            (完整音訊 bytes 或 None, 音訊時長)
+        """
+        chunks: List[bytes] = []
+        frame_scanner = AudioFrameScanner()  # 邊轉送邊掃描幀標頭，結束時即得精確時長
+        T_stream_start = time.monotonic()
+        async for chunk in tts_service.synthesize_speech_stream(text):
+            if not chunks:
+                session.is_speaking = True
+                logger.info(f"[Perf] TTS first chunk ({message_id}): {(time.monotonic() - T_stream_start)*1000:.2f} ms", extra={"log_category": "PERFORMANCE"})
+            header = build_audio_frame_header(message_id, 0, TTS_RESPONSE_FORMAT, 0.0, final=False, chunk=len(chunks))
+            await outbound.send_bytes(encode_audio_frame(header, chunk))
+            chunks.append(chunk)
+            frame_scanner.feed(chunk)
+
+        audio_bytes = b"".join(chunks) if chunks else None
+        audio_duration = 0.0
+        if audio_bytes:
+            frame_scanner.finish()
+            audio_duration = frame_scanner.duration if frame_scanner.frames else len(text) * 0.15
+        await outbound.send({
+            "type": "audio-stream-end",
+            "messageId": message_id,
+            "seq": 0,
+            "codec": TTS_RESPONSE_FORMAT,
+            "duration": audio_duration,
+            "byteLength": len(audio_bytes) if audio_bytes else 0,
+            "chunkCount": len(chunks)
+        })
+        logger.info(f"[Perf] TTS stream complete ({message_id}): {len(chunks)} chunks in {(time.monotonic() - T_stream_start)*1000:.2f} ms", extra={"log_category": "PERFORMANCE"})
+        return audio_bytes, audio_duration
+
+    async def send_deferred_animation(message_id: str, keyframe_task: asyncio.Task, audio_duration: float):
+        """等待延遲的關鍵幀分析完成，並以 message id 關聯的 emotionalTrajectory 訊息補送動畫資料。"""
+        try:
+            animation = await keyframe_task
+        except Exception as e:
+            logger.error(f"Deferred keyframe analysis failed for {message_id}: {e}", exc_info=True)
+            return
+        await outbound.send({
+            "type": "emotionalTrajectory",
+            "payload": {
+                "messageId": message_id,
+                "duration": audio_duration,
+                "keyframes": animation.get("emotional_keyframes"),
+                "bodyAnimationSequence": animation.get("body_animation_sequence")
+            }
+        })
+        logger.info(f"已補送延遲的 Emotional Trajectory 與身體動畫 ({message_id})，時長: {audio_duration:.2f}s")
+
+    async def process_streaming_chat_message(user_text: str, T_recv: float):
+        """
+        串流模式處理 chat-message：LLM 的文字增量即時推送給客戶端，
+        每完成一句就送往 TTS，音訊片段按順序以獨立訊息送出。
+        """
+        message_id = f"bot-{int(asyncio.get_event_loop().time() * 1000)}"
+        first_audio_logged = False
+
+        async def on_segment(segment: Dict[str, Any]):
+            nonlocal first_audio_logged
+            audio_url = None
+            if segment["audio"]:
+                audio_url = await deliver_audio(
+                    message_id, segment["seq"], segment["audio"], segment["codec"], segment["duration"],
+                    f"{message_id}-{segment['seq']}.mp3", text=segment["text"], final=False
+                )
+                session.is_speaking = True
+                if not first_audio_logged:
+                    first_audio_logged = True
+                    logger.info(f"[Perf] Time to first audio segment (chat-message): {(time.monotonic() - T_recv)*1000:.2f} ms", extra={"log_category": "PERFORMANCE"})
+                if session.options["audio_transport"] in BINARY_AUDIO_TRANSPORTS:
+                    # 二進位幀的標頭已帶有 seq、text 與 duration，不再另送 JSON
+                    return
+            await outbound.send({
+                "type": "chat-audio-segment",
+                "messageId": message_id,
+                "seq": segment["seq"],
+                "text": segment["text"],
+                "audioUrl": audio_url,
+                "duration": segment["duration"]
+            })
+
+        pipeline = StreamingSpeechPipeline(tts_service, on_segment)
+
+        async def on_text_delta(delta: str):
+            await outbound.send({
+                "type": "chat-delta",
+                "messageId": message_id,
+                "delta": delta
+            })
+            await pipeline.feed(delta)
+
+        await outbound.send({"type": "chat-stream-start", "messageId": message_id})
+
+        defer_keyframes = session.options["deferred_keyframes"]
+        ai_result = None
+        try:
+            ai_result = await ai_service.generate_response(user_text, on_text_delta=on_text_delta, defer_keyframes=defer_keyframes, state=session.ai_state)
+        except asyncio.CancelledError:
+            # 被新的訊息取代：已送往 TTS 的句子一併取消
+            await pipeline.cancel()
+            raise
+        except Exception as e:
+            logger.error(f"Error during streaming AI generation for chat-message: {e}", exc_info=True)
+        if not ai_result:
+            ai_result = {"final_response": TURN_ERROR_RESPONSE}
+
+        bot_response_text = clean_murmur_prefix(ai_result.get("final_response", MISSING_RESPONSE))
+        if pipeline.fed_chars == 0:
+            # LLM 沒有經過串流輸出 (例如錯誤回退訊息)，補送完整文字
+            await on_text_delta(bot_response_text)
+
+        # 延遲模式：關鍵幀分析與剩餘句子的 TTS 同時進行
+        keyframe_task = session.turns.spawn(ai_service.analyze_keyframes(bot_response_text)) if defer_keyframes else None
 
-                        # 提取回應文本和情緒
-                        bot_response_text = ai_result.get("final_response", "抱歉，我沒有理解您的意思")
+        try:
+            segments = await pipeline.finish()
+        except (Exception, asyncio.CancelledError):
+            await pipeline.cancel()
+            if keyframe_task:
+                keyframe_task.cancel()
+            raise
+        audio_duration = sum(segment["duration"] for segment in segments if segment["audio"])
+        has_audio = any(segment["audio"] for segment in segments)
+
+        response_emotion = ai_result.get("emotion", session.current_emotion)
+        session.current_emotion = response_emotion
+        emotional_keyframes = ai_result.get("emotional_keyframes")
+
+        # 最終訊息：完整文字與動畫，音訊已透過 chat-audio-segment 分段送出
+        bot_message = {
+            "id": message_id,
+            "role": "bot",
+            "content": bot_response_text,
+            "bodyAnimationSequence": ai_result.get("body_animation_sequence"),
+            "timestamp": None,
+            "audioUrl": None,
+            "streamed": True,
+            "audioSegmentCount": len(segments)
+        }
+        if session.options["audio_transport"] in BINARY_AUDIO_TRANSPORTS:
+            bot_message["audioTransport"] = session.options["audio_transport"]
+        if keyframe_task:
+            bot_message["animationPending"] = True
+        await outbound.send({
+            "type": "chat-message",
+            "message": bot_message
+        })
+        logger.info(f"[Perf] Total Backend Processing Time (streaming chat-message): {(time.monotonic() - T_recv)*1000:.2f} ms", extra={"log_category": "PERFORMANCE"})
+
+        if emotional_keyframes:
+            await outbound.send({
+                "type": "emotionalTrajectory",
+                "payload": {
+                    "duration": audio_duration,
+                    "keyframes": emotional_keyframes
+                }
+            })
+            logger.info(f"已發送 Emotional Trajectory，時長: {audio_duration:.2f}s")
+
+        if audio_duration > 0 and has_audio:
+            buffer_time = min(MURMUR_BUFFER_MAX, 0.3 + audio_duration * 0.03)
+            session.tasks.spawn(reset_speaking_after_duration(audio_duration + buffer_time), "speaking_reset", key=SPEAKING_RESET_KEY)
+        else:
+            session.is_speaking = False
+            current_time = time.monotonic()
+            session.last_activity = current_time
+            session.last_speaking_reset = current_time
+            session.last_murmur = current_time
+
+        session.last_activity = time.monotonic()
+
+        if keyframe_task:
+            await send_deferred_animation(message_id, keyframe_task, audio_duration)
+
+    async def handle_turn(message: Dict[str, Any], turn_id: int):
+        """
+        處理一個用戶回合 (message / chat-message)
+
+        回合以獨立任務執行，接收迴圈可以繼續讀取訊息；
+        新的用戶訊息到達時，此任務連同其 LLM、工具與 TTS 調用一併被取消。
+        """
+        message_type = message.get("type")
+        # 上一回合已被取消，等待它釋放鎖 (或等待進行中的 murmur 結束)
+        async with session.lock:
+            logger.info(f"Processing turn {turn_id} ('{message_type}') for {client_label}")
+            try:
+                if message_type == "message":
+                    user_text = message.get("content")
+                    if not user_text:
+                        logger.warning("Received empty 'message' content.")
+                        return
+
+                    # 移除獨立的情緒分析器調用
+                    # emotion, confidence = emotion_analyzer.analyze(user_text)
+                    # print(f"分析情緒結果: {emotion}, 置信度: {confidence}")
+                    # if confidence > emotion_confidence:
+                    #     next_emotion = emotion
+                    #     emotion_confidence = confidence
+                    # else:
+                    #     next_emotion = current_emotion
+                    # current_emotion = next_emotion
+
+                    # 生成回復 (包含文字和情緒)
+                    ai_result = None
+                    try:
+                         # 假設 generate_response 返回包含 final_response 和 emotion 的字典
+                        ai_result = await ai_service.generate_response(user_text=user_text, state=session.ai_state)
+                    except Exception as ai_err:
+                        logger.error(f"Error generating response from AIService: {ai_err}", exc_info=True)
+
+                    if not ai_result:
+                        if ai_result is not None:
+                            logger.error("AIService returned an empty result for user message.")
+                        await outbound.send(AI_UNAVAILABLE_MESSAGE)
+                        return
+                    session.current_emotion = ai_result.get("emotion", session.current_emotion) # 更新 Websocket 狀態
+
+                    # 提取回應文本和情緒
+                    bot_response_text = ai_result.get("final_response", MISSING_RESPONSE)
                         
-                        # 清理可能的前綴
-                        bot_response_text = clean_murmur_prefix(bot_response_text)
+                    # 清理可能的前綴
+                    bot_response_text = clean_murmur_prefix(bot_response_text)
                         
-                        # 提取emotion和keyframes
-                        response_emotion = ai_result.get("emotion", current_emotion)
-                        emotional_keyframes = ai_result.get("emotional_keyframes")
-
-                        # 轉換回復為語音
-                        tts_result = await tts_service.synthesize_speech(bot_response_text)
-                        audio_base64 = tts_result.get("audio") if tts_result else None
-                        audio_duration = tts_result.get("duration") if tts_result and "duration" in tts_result else len(bot_response_text) * 0.15
-
-                        # 發送回覆
-                        await websocket.send_json({
-                            "type": "response",
-                            "content": bot_response_text,
-                            "emotion": response_emotion,
-                            "audio": audio_base64,
-                            "hasSpeech": audio_base64 is not None,
-                            "speechDuration": audio_duration,
-                            "characterState": ai_service.character_state
-                        })
-                        logger.info(f"Sent response to client {websocket.client}")
+                    # 提取emotion和keyframes
+                    response_emotion = ai_result.get("emotion", session.current_emotion)
+                    emotional_keyframes = ai_result.get("emotional_keyframes")
+
+                    # 轉換回復為語音
+                    tts_result = await tts_service.synthesize_speech_bytes(bot_response_text)
+                    audio_bytes = tts_result.get("audio_bytes") if tts_result else None
+                    audio_duration = tts_result.get("duration") if tts_result and "duration" in tts_result else len(bot_response_text) * 0.15
+
+                    response_message = {
+                        "type": "response",
+                        "content": bot_response_text,
+                        "emotion": response_emotion,
+                        "audio": None,
+                        "hasSpeech": audio_bytes is not None,
+                        "speechDuration": audio_duration,
+                        "characterState": session.ai_state.character_state
+                    }
+                    if audio_bytes and session.options["audio_transport"] in BINARY_AUDIO_TRANSPORTS:
+                        # 音訊以二進位幀送出，JSON 只帶對應的 messageId
+                        response_message["messageId"] = f"response-{int(asyncio.get_event_loop().time() * 1000)}"
+                        response_message["audioTransport"] = "binary"
+                        header = build_audio_frame_header(response_message["messageId"], 0, tts_result.get("codec", "mp3"), audio_duration)
+                        await outbound.send_bytes(encode_audio_frame(header, audio_bytes))
+                    elif audio_bytes:
+                        response_message["audio"] = base64.b64encode(audio_bytes).decode("utf-8")
+
+                    # 發送回覆
+                    await outbound.send(response_message)
+                    logger.info(f"Sent response to client {client_label}")
+
+                elif message_type == "chat-message":
+                    logger.info(f"收到聊天訊息: {message}")
+                    user_text = message.get("message") # <-- 注意鍵名不同
+                    if not user_text:
+                        logger.warning("Received empty 'chat-message' message content.")
+                        return
+
+                    T_recv = time.monotonic()
+                    logger.info(f"[Perf] T_recv: {T_recv:.4f}", extra={"log_category": "PERFORMANCE"})
+
+                    ai_response = ""
+                    response_emotion = session.current_emotion
+                    ai_result = None
+                    emotional_keyframes = None
+                    body_animation_sequence = None
+                    audio_bytes = None
+                    audio_codec = "mp3"
+                    audio_duration = 0
+                    defer_keyframes = session.options["deferred_keyframes"]
+                    keyframe_task = None
+                    stream_text = None  # stream 傳輸下於 chat-message 送出後才合成的文字
+
+                    # <--- 修改：收到用戶消息，表示用戶已回應 --->
+                    # 設置播放狀態為 False，因為我們將開始一個新的回應
+                    prev_speaking = session.is_speaking
+                    if session.is_speaking:
+                        logger.info(f"Received user message while is_speaking={prev_speaking}, forcefully reset to False")
+                        session.is_speaking = False
+                    else:
+                        logger.info(f"Received user message, is_speaking already False")
+                        
+                    # 記錄用戶已回應，並更新時間戳
+                    session.user_responded = True
+                    session.last_activity = time.monotonic()
+                    # <--- 修改結束 --->
 
-                    elif message_type == "chat-message":
-                        logger.info(f"收到聊天訊息: {message}")
-                        user_text = message.get("message") # <-- 注意鍵名不同
-                        if not user_text:
-                            logger.warning("Received empty 'chat-message' message content.")
-                            continue
+                    if session.options["streaming"]:
+                        await process_streaming_chat_message(user_text, T_recv)
+                        return
 
-                        T_recv = time.monotonic()
-                        logger.info(f"[Perf] T_recv: {T_recv:.4f}", extra={"log_category": "PERFORMANCE"})
+                    try:
+                        T_ai_start = time.monotonic()
+                        logger.info(f"[Perf] T_ai_start: {T_ai_start:.4f}", extra={"log_category": "PERFORMANCE"})
+                        ai_result = await ai_service.generate_response(user_text, defer_keyframes=defer_keyframes, state=session.ai_state)
+                        T_ai_end = time.monotonic()
+                        logger.info(f"[Perf] T_ai_end: {T_ai_end:.4f} (Duration: {(T_ai_end - T_ai_start)*1000:.2f} ms)", extra={"log_category": "PERFORMANCE"})
+
+                        if ai_result:
+                            ai_response = ai_result.get("final_response", EMPTY_RESPONSE)
+                            response_emotion = ai_result.get("emotion", session.current_emotion)
+                            session.current_emotion = response_emotion
+                            emotional_keyframes = ai_result.get("emotional_keyframes")
+                            body_animation_sequence = ai_result.get("body_animation_sequence")
+                            logger.info(f"AI 回應: {ai_response}, Emotion: {session.current_emotion}") # <--- 添加情緒日誌
+                        elif ai_result is not None:
+                            logger.error("AIService returned an empty result for chat-message")
+
+                        # 延遲模式：關鍵幀分析不在關鍵路徑上，與 TTS 同時進行
+                        if defer_keyframes and ai_response:
+                            keyframe_task = session.turns.spawn(ai_service.analyze_keyframes(clean_murmur_prefix(ai_response)))
+
+                        # TTS處理 - 只調用一次 (stream 傳輸則延後到 chat-message 送出後邊合成邊轉送)
+                        if ai_response and session.options["audio_transport"] == "stream":
+                            stream_text = ai_response
+                        elif ai_response:
+                            T_tts_start = time.monotonic()
+                            logger.info(f"[Perf] T_tts_start: {T_tts_start:.4f}", extra={"log_category": "PERFORMANCE"})
+                            tts_result = await tts_service.synthesize_speech_bytes(ai_response)
+                            T_tts_end = time.monotonic()
+                            logger.info(f"[Perf] T_tts_end: {T_tts_end:.4f} (Duration: {(T_tts_end - T_tts_start)*1000:.2f} ms)", extra={"log_category": "PERFORMANCE"})
+                            if tts_result:
+                                audio_bytes = tts_result.get("audio_bytes")
+                                audio_codec = tts_result.get("codec", audio_codec)
+                                audio_duration = tts_result.get("duration", len(ai_response) * 0.15)
+                                # 設置語音正在播放標誌
+                                session.is_speaking = True
+                                logger.info(f"TTS generated successfully, duration: {audio_duration:.2f}s, is_speaking set to True")
+                            else:
+                                logger.warning("TTS returned no result, no audio will be played")
 
-                        ai_response = ""
-                        response_emotion = current_emotion
-                        ai_result = None
+                    except Exception as e:
+                        logger.error(f"Error during AI or TTS for chat-message: {e}", exc_info=True)
+                        ai_response = TURN_ERROR_RESPONSE
+                        # 重置音頻和動畫，避免發送不匹配的數據
+                        audio_bytes = None
                         emotional_keyframes = None
                         body_animation_sequence = None
-                        audio_base64 = None
-                        audio_duration = 0
-
-                        # <--- 修改：收到用戶消息，表示用戶已回應 --->
-                        # 設置播放狀態為 False，因為我們將開始一個新的回應
-                        prev_speaking = is_speaking
-                        if is_speaking:
-                            logger.info(f"Received user message while is_speaking={prev_speaking}, forcefully reset to False")
-                            is_speaking = False
-                        else:
-                            logger.info(f"Received user message, is_speaking already False")
-                        
-                        # 記錄用戶已回應，並更新時間戳
-                        user_responded = True
-                        last_activity_timestamp = datetime.utcnow()
-                        # <--- 修改結束 --->
-
-                        try:
-                            T_ai_start = time.monotonic()
-                            logger.info(f"[Perf] T_ai_start: {T_ai_start:.4f}", extra={"log_category": "PERFORMANCE"})
-                            ai_result = await ai_service.generate_response(user_text)
-                            T_ai_end = time.monotonic()
-                            logger.info(f"[Perf] T_ai_end: {T_ai_end:.4f} (Duration: {(T_ai_end - T_ai_start)*1000:.2f} ms)", extra={"log_category": "PERFORMANCE"})
-
-                            if ai_result:
-                                ai_response = ai_result.get("final_response", "抱歉，我好像有點短路了...")
-                                response_emotion = ai_result.get("emotion", current_emotion)
-                                current_emotion = response_emotion
-                                emotional_keyframes = ai_result.get("emotional_keyframes")
-                                body_animation_sequence = ai_result.get("body_animation_sequence")
-                                logger.info(f"AI 回應: {ai_response}, Emotion: {current_emotion}") # <--- 添加情緒日誌
-                            else:
-                                logger.error("AIService returned None for chat-message")
-                                ai_response = "看來我的迴路有點問題..."
-
-                            # TTS處理 - 只調用一次
-                            if ai_response:
-                                T_tts_start = time.monotonic()
-                                logger.info(f"[Perf] T_tts_start: {T_tts_start:.4f}", extra={"log_category": "PERFORMANCE"})
-                                tts_result = await tts_service.synthesize_speech(ai_response)
-                                T_tts_end = time.monotonic()
-                                logger.info(f"[Perf] T_tts_end: {T_tts_end:.4f} (Duration: {(T_tts_end - T_tts_start)*1000:.2f} ms)", extra={"log_category": "PERFORMANCE"})
-                                if tts_result:
-                                    audio_base64 = tts_result.get("audio")
-                                    audio_duration = tts_result.get("duration", len(ai_response) * 0.15)
-                                    # 設置語音正在播放標誌
-                                    is_speaking = True
-                                    logger.info(f"TTS generated successfully, duration: {audio_duration:.2f}s, is_speaking set to True")
-                                else:
-                                    logger.warning("TTS returned no result, no audio will be played")
-
-                        except Exception as e:
-                            logger.error(f"Error during AI or TTS for chat-message: {e}", exc_info=True)
-                            ai_response = "處理時發生了一點小插曲。"
-                            # 重置音頻和動畫，避免發送不匹配的數據
-                            audio_base64 = None
-                            emotional_keyframes = None
-                            body_animation_sequence = None
-
-                        # 提取回應文本和情緒
-                        bot_response_text = ai_result.get("final_response", "抱歉，我沒有理解您的意思")
-                        
-                        # 清理可能的前綴
-                        bot_response_text = clean_murmur_prefix(bot_response_text)
-                        
-                        # 提取emotion和keyframes
-                        response_emotion = ai_result.get("emotion", current_emotion)
-                        emotional_keyframes = ai_result.get("emotional_keyframes")
-
-                        # 處理murmur類型的回應
-                        if message_type == "murmur":
-                            if not ai_service:
-                                logger.error("AI服務未初始化")
-                                await websocket.send_json({"status": "error", "message": "AI服務未初始化"})
-                                continue
-
-                            text = message.get("content").strip()
-                            ai_response = await ai_service.get_murmur_response(text, system_lang, ws_session_id)
-                            
-                            # 清理回應中的前綴
-                            cleaned_response = clean_murmur_prefix(ai_response)
-                            logger.info(f"Murmur清理前: {ai_response}")
-                            logger.info(f"Murmur清理後: {cleaned_response}")
-                            
-                            # 使用清理後的文本進行TTS
-                            audio_data, sample_rate = await tts_service.synthesize_speech(cleaned_response, system_lang)
-                            audio_duration = len(audio_data) / sample_rate
-                            
-                            # 發送回應
-                            response_data = {
-                                "type": "bot_response",
-                                "content": ai_response,  # 保留原始回應以供顯示
-                                "audio": audio_data.tobytes().hex(),
-                                "sample_rate": sample_rate
-                            }
-                            await websocket.send_json(response_data)
-                            
-                            # 更新murmur時間戳和speaking狀態
-                            logger.info(f"Audio duration: {audio_duration}s")
-                            last_murmur_timestamp = datetime.now()
-                            user_sessions[ws_session_id]['is_speaking'] = True
-                            
-                            # 安排定時器在音頻播放結束後重置speaking狀態
-                            buffer_time = 0.2  # 緩衝時間
-                            reset_time = audio_duration + buffer_time
-                            asyncio.create_task(reset_speaking_after(ws_session_id, reset_time))
-                            
-                            continue
-
-                        # 準備消息體
-                        bot_message = {
-                            "id": f"bot-{int(asyncio.get_event_loop().time() * 1000)}",
-                            "role": "bot",
-                            "content": ai_response,
-                            "bodyAnimationSequence": body_animation_sequence,
-                            "timestamp": None,
-                            "audioUrl": None
+                        stream_text = None
+                        if keyframe_task:
+                            keyframe_task.cancel()
+                            keyframe_task = None
+
+                    if not ai_result:
+                        await outbound.send(AI_UNAVAILABLE_MESSAGE)
+                        return
+
+                    # 準備消息體
+                    bot_message = {
+                        "id": f"bot-{int(asyncio.get_event_loop().time() * 1000)}",
+                        "role": "bot",
+                        "content": ai_response,
+                        "bodyAnimationSequence": body_animation_sequence,
+                        "timestamp": None,
+                        "audioUrl": None
+                    }
+                    if keyframe_task:
+                        bot_message["animationPending"] = True
+
+                    if audio_bytes:
+                        audio_filename = f"{int(asyncio.get_event_loop().time() * 1000)}.mp3"
+                        T_save_start = time.monotonic()
+                        # binary 模式下音訊幀先於 chat-message 送出，客戶端以 message id 對應
+                        bot_message["audioUrl"] = await deliver_audio(bot_message["id"], 0, audio_bytes, audio_codec, audio_duration, audio_filename)
+                        if session.options["audio_transport"] in BINARY_AUDIO_TRANSPORTS:
+                            bot_message["audioTransport"] = "binary"
+                        elif bot_message["audioUrl"]:
+                            T_save_end = time.monotonic()
+                            logger.info(f"[Perf] T_save_end: {T_save_end:.4f} (Duration: {(T_save_end - T_save_start)*1000:.2f} ms)", extra={"log_category": "PERFORMANCE"})
+
+                    if stream_text:
+                        bot_message["audioTransport"] = "stream"
+
+                    T_send_start = time.monotonic()
+                    await outbound.send({
+                        "type": "chat-message",
+                        "message": bot_message
+                    })
+                    T_send_end = time.monotonic()
+                    logger.info(f"[Perf] Total Backend Processing Time (chat-message): {(T_send_end - T_recv)*1000:.2f} ms", extra={"log_category": "PERFORMANCE"})
+
+                    if stream_text:
+                        audio_bytes, audio_duration = await stream_speech(bot_message["id"], stream_text)
+
+                    # 發送情緒軌跡（如果有的話）
+                    if emotional_keyframes:
+                        trajectory_payload = {
+                            "duration": audio_duration,
+                            "keyframes": emotional_keyframes
                         }
-
-                        if audio_base64:
-                            audio_filename = f"{int(asyncio.get_event_loop().time() * 1000)}.mp3"
-                            backend_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-                            audio_dir = os.path.join(backend_root, "audio")
-                            os.makedirs(audio_dir, exist_ok=True)
-                            audio_filepath = os.path.join(audio_dir, audio_filename)
-                            T_save_start = time.monotonic()
-                            try:
-                                if isinstance(audio_base64, str):
-                                    audio_base64_data = audio_base64.split(",", 1)[1] if "," in audio_base64 else audio_base64
-                                    audio_data = base64.b64decode(audio_base64_data)
-                                    with open(audio_filepath, 'wb') as f:
-                                        f.write(audio_data)
-                                    if os.path.exists(audio_filepath) and os.path.getsize(audio_filepath) > 0:
-                                        bot_message["audioUrl"] = f"/audio-file/{audio_filename}"
-                                        T_save_end = time.monotonic()
-                                        logger.info(f"[Perf] T_save_end: {T_save_end:.4f} (Duration: {(T_save_end - T_save_start)*1000:.2f} ms)", extra={"log_category": "PERFORMANCE"})
-                                    else:
-                                        logger.error(f"保存音頻文件失敗: 文件不存在或大小為0 {audio_filepath}")
-                                else:
-                                    logger.error(f"音頻數據不是有效的字符串: {type(audio_base64)}")
-                            except base64.binascii.Error as b64_error:
-                                logger.error(f"Base64 解碼錯誤: {b64_error}")
-                            except Exception as e:
-                                logger.error(f"保存音頻文件時發生未知錯誤: {e}", exc_info=True)
-
-                        T_send_start = time.monotonic()
-                        await websocket.send_json({
-                            "type": "chat-message",
-                            "message": bot_message
+                        await outbound.send({
+                            "type": "emotionalTrajectory",
+                            "payload": trajectory_payload
                         })
-                        T_send_end = time.monotonic()
-                        logger.info(f"[Perf] Total Backend Processing Time (chat-message): {(T_send_end - T_recv)*1000:.2f} ms", extra={"log_category": "PERFORMANCE"})
-
-                        # 發送情緒軌跡（如果有的話）
-                        if emotional_keyframes:
-                            trajectory_payload = {
-                                "duration": audio_duration,
-                                "keyframes": emotional_keyframes
-                            }
-                            await websocket.send_json({
-                                "type": "emotionalTrajectory",
-                                "payload": trajectory_payload
-                            })
-                            logger.info(f"已發送 Emotional Trajectory，時長: {audio_duration:.2f}s")
-                        else:
-                            logger.info("No emotional keyframes available for this response")
-
-                        # 告知客戶端語音播放完成，這將重置播放狀態
-                        if audio_duration > 0 and audio_base64:
-                            # 根據語音時長安排一個任務，在語音播放結束後重置 is_speaking
-                            # 添加一些額外時間作為緩衝，隨著音頻時長增加，緩衝也適度增加
-                            buffer_time = min(MURMUR_BUFFER_MAX, 0.3 + audio_duration * 0.03)  # 調整緩衝時間
-                            total_wait_time = audio_duration + buffer_time
+                        logger.info(f"已發送 Emotional Trajectory，時長: {audio_duration:.2f}s")
+                    else:
+                        logger.info("No emotional keyframes available for this response")
+
+                    # 告知客戶端語音播放完成，這將重置播放狀態
+                    if audio_duration > 0 and audio_bytes:
+                        # 根據語音時長安排一個任務，在語音播放結束後重置 is_speaking
+                        # 添加一些額外時間作為緩衝，隨著音頻時長增加，緩衝也適度增加
+                        buffer_time = min(MURMUR_BUFFER_MAX, 0.3 + audio_duration * 0.03)  # 調整緩衝時間
+                        total_wait_time = audio_duration + buffer_time
                             
-                            # 創建任務前記錄當前狀態
-                            logger.info(f"Creating reset_speaking_after_duration task: audio_duration={audio_duration:.2f}s, "
-                                       f"buffer_time={buffer_time:.2f}s, total_wait_time={total_wait_time:.2f}s, "
-                                       f"current is_speaking={is_speaking}")
+                        # 創建任務前記錄當前狀態
+                        logger.info(f"Creating reset_speaking_after_duration task: audio_duration={audio_duration:.2f}s, "
+                                   f"buffer_time={buffer_time:.2f}s, total_wait_time={total_wait_time:.2f}s, "
+                                   f"current is_speaking={session.is_speaking}")
                             
-                            # 創建異步任務重置語音狀態
-                            reset_task = asyncio.create_task(reset_speaking_after_duration(total_wait_time))
+                        # 創建異步任務重置語音狀態 (屬於會話而非回合：回合結束後仍要觸發，新的計時器取代舊的)
+                        session.tasks.spawn(reset_speaking_after_duration(total_wait_time), "speaking_reset", key=SPEAKING_RESET_KEY)
                             
-                            # 不要在這裡更新last_murmur_timestamp，將在reset_speaking_after_duration函數中更新
-                            # last_murmur_timestamp = datetime.utcnow()
-                        else:
-                            # 如果沒有音頻，立即重置說話狀態
-                            is_speaking = False
+                        # 不要在這裡更新last_murmur_timestamp，將在reset_speaking_after_duration函數中更新
+                        # last_murmur_timestamp = time.monotonic()
+                    else:
+                        # 如果沒有音頻，立即重置說話狀態
+                        session.is_speaking = False
                             
-                            # 即使沒有音頻，也應該更新所有相關時間戳
-                            current_time = datetime.utcnow()
-                            last_activity_timestamp = current_time
-                            last_speaking_reset_timestamp = current_time
-                            last_murmur_timestamp = current_time
+                        # 即使沒有音頻，也應該更新所有相關時間戳
+                        current_time = time.monotonic()
+                        session.last_activity = current_time
+                        session.last_speaking_reset = current_time
+                        session.last_murmur = current_time
                             
-                            logger.info(f"No audio for response, immediately reset is_speaking to False and updated all timestamps")
+                        logger.info(f"No audio for response, immediately reset is_speaking to False and updated all timestamps")
 
-                        # 調整活動時間戳，在聊天訊息處理後同步更新
-                        # 確保與音頻播放結束後的重置操作協調一致
-                        last_activity_timestamp = datetime.utcnow()
+                    # 調整活動時間戳，在聊天訊息處理後同步更新
+                    # 確保與音頻播放結束後的重置操作協調一致
+                    session.last_activity = time.monotonic()
 
-                    else:
-                        logger.warning(f"Received unknown message type: {message_type}")
-
-                except json.JSONDecodeError:
-                    logger.error(f"Failed to decode JSON from message: {data}")
-                except WebSocketDisconnect: # 這個應該不太可能在鎖內部發生，但為了完整性加上
-                    logger.info(f"WebSocket disconnected while processing message inside lock for {websocket.client}")
-                    raise 
-                except Exception as e:
-                    logger.error(f"Error processing WebSocket message inside lock: {e}", exc_info=True)
-                    try:
-                        await websocket.send_json({"type": "error", "message": "處理訊息時發生內部錯誤。"})
-                    except WebSocketDisconnect:
-                        pass
-                # --- 鎖在此處自動釋放 ---
+                    # 回應已送出，再補送延遲分析的動畫資料
+                    if keyframe_task:
+                        await send_deferred_animation(bot_message["id"], keyframe_task, audio_duration)
+
+            except WebSocketDisconnect:
+                # 接收迴圈會自行偵測到斷線並清理
+                logger.info(f"WebSocket disconnected while processing turn {turn_id} for {client_label}")
+            except Exception as e:
+                logger.error(f"Error processing turn {turn_id}: {e}", exc_info=True)
+                try:
+                    await outbound.send(INTERNAL_ERROR_MESSAGE)
+                except WebSocketDisconnect:
+                    pass
+            finally:
+                manager.persist(session)
+
+    async def dispatch_turns():
+        """從入站佇列取出 (合併後的) 用戶訊息，逐一開始回合"""
+        while True:
+            if live_room:
+                # 直播房間依序回應：等目前的回答結束，期間的觀眾留言在下一回合一起聚合
+                await session.turns.wait_current()
+            message = await session.inbound.next_turn()
+            if message.get("coalesced"):
+                logger.info(f"Coalesced {message['coalesced']} '{message.get('type')}' messages into one turn for {client_label}")
+            session.turns.start(lambda turn_id, message=message: handle_turn(message, turn_id))
+
+    # 接收迴圈 (此協程) 只讀取訊息，回合由獨立的分派任務開始
+    session.tasks.spawn(dispatch_turns(), "dispatcher")
+
+    try:
+        # 閒置檢查由全域排程器負責，此連線只登記下一次可以 murmur 的時間
+        schedule_murmur()
+
+        while True:
+            try:
+                message = await receive()
+            except ValueError as decode_err:
+                logger.error(f"Failed to decode message from {client_label}: {decode_err}")
+                continue
+            session.last_activity = time.monotonic()
+            session.user_responded = True
+            message_type = message.get("type")
+            logger.info(f"Received message type '{message_type}' from {client_label}")
+
+            if message_type in TURN_MESSAGE_TYPES:
+                if not live_room:
+                    # barge-in：新的用戶訊息立即取消上一回合與進行中的 murmur；
+                    # 訊息交給分派任務，合併視窗內的後續訊息後才開始新回合
+                    murmur_scheduler.cancel(session.session_id)
+                    session.turns.cancel_current()
+                    # 被取代回合已排隊但尚未送出的文字、音訊幀與動畫軌跡不再送出
+                    session.outbound.purge_turn(session.turns.turn_id)
+                    # 用戶打斷了播放中的語音：立即清除播放狀態，不再等待舊回應的重置計時器
+                    if session.tasks.cancel(SPEAKING_RESET_KEY) or session.is_speaking:
+                        session.is_speaking = False
+                        session.last_speaking_reset = time.monotonic()
+                session.murmur_pool.invalidate()
+                await session.inbound.put(message)
+
+            elif message_type == "configure":
+                # 客戶端切換此連線的選項，例如 {"type": "configure", "options": {"streaming": true}}
+                requested_options = message.get("options") or {}
+                for option_name in BOOLEAN_CONNECTION_OPTIONS:
+                    if option_name in requested_options:
+                        session.options[option_name] = parse_bool_option(requested_options[option_name])
+                if "audio_transport" in requested_options:
+                    session.options["audio_transport"] = parse_audio_transport(requested_options["audio_transport"], session.options["audio_transport"])
+                logger.info(f"Updated connection options for {client_label}: {session.options}")
+                await outbound.send({"type": "configured", "options": session.options})
+
+            else:
+                logger.warning(f"Received unknown message type: {message_type}")
+
+            schedule_murmur()
 
     except WebSocketDisconnect:
-        logger.info(f"WebSocket disconnected for client {websocket.client}")
+        logger.info(f"WebSocket disconnected for client {client_label}")
     except asyncio.CancelledError:
-        logger.info(f"Main websocket task cancelled for {websocket.client}")
+        logger.info(f"Main websocket task cancelled for {client_label}")
         # 不需要再做什麼，finally 會處理清理工作
     except Exception as e:
-        logger.error(f"Unexpected error in websocket_endpoint for {websocket.client}: {e}", exc_info=True)
+        logger.error(f"Unexpected error in websocket_endpoint for {client_label}: {e}", exc_info=True)
     finally:
-        logger.info(f"Cleaning up connection for {websocket.client}")
-        if idle_check_task and not idle_check_task.done():
-            idle_check_task.cancel()
-            try:
-                # 等待任務實際取消完成（可選，但更安全）
-                await asyncio.wait_for(idle_check_task, timeout=1.0) 
-            except asyncio.TimeoutError:
-                logger.warning(f"Idle checker task for {websocket.client} did not cancel within timeout.")
-            except asyncio.CancelledError:
-                pass # 任務已被取消是正常的
-            logger.info(f"Cancelled idle checker task for client {websocket.client}")
+        logger.info(f"Cleaning up connection for {client_label}")
+        # 移除此連線的截止時間，並取消可能正在進行的 murmur
+        session.closed = True
+        murmur_scheduler.cancel(session.session_id)
+        murmur_scheduler.cancel(pool_fill_key)
+        session.murmur_pool.cancel()
+        session.turns.cancel_current()
+        # 取消並等待此會話的所有背景任務 (分派任務、回合、語音重置計時器等)
+        await session.tasks.aclose()
+        await session.outbound.close()
         
-        # 安全地斷開連接
+        # 寫入最後的會話狀態
         try:
-            if websocket in manager.active_connections:
-                 manager.disconnect(websocket)
-                 logger.info(f"WebSocket connection successfully removed from manager for client {websocket.client}")
-            else:
-                 logger.warning(f"WebSocket for client {websocket.client} was already disconnected or not in manager.")
-        except Exception as cleanup_err:
-             logger.error(f"Error during connection cleanup for {websocket.client}: {cleanup_err}", exc_info=True)
-        logger.info(f"WebSocket connection closed for client {websocket.client}")
+            await manager.save(session)
+        except Exception as save_err:
+            logger.error(f"Error saving session state for {client_label}: {save_err}", exc_info=True)
 
 # --- 舊的 emotion_analyzer (需要移除或替換) ---
 # class SimpleEmotionAnalyzer:
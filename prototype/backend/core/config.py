@@ -49,4 +49,134 @@ class Settings:
     TRANSITION_DELAY = 0.08
     TRANSITION_SPEED = 0.3
 
+    # 上游客戶端配置 (OpenAI / Google 共用的連線池，由 services/clients.py 建立)
+    UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))  # 每個上游 HTTP 連線池的連線上限
+    UPSTREAM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_KEEPALIVE_CONNECTIONS", "20"))  # 保持開啟的閒置連線數
+    UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "90"))  # 閒置連線保留秒數
+    UPSTREAM_HTTP2 = os.getenv("UPSTREAM_HTTP2", "true").lower() == "true"  # 安裝 h2 套件時啟用 HTTP/2
+    UPSTREAM_CONNECT_TIMEOUT = 5.0  # 建立連線的逾時 (秒)
+    UPSTREAM_READ_TIMEOUT = 60.0  # 讀取回應的逾時 (秒)
+    UPSTREAM_PREWARM_ENABLED = os.getenv("UPSTREAM_PREWARM_ENABLED", "true").lower() == "true"  # 啟動時預先完成 DNS 與 TLS 握手
+    UPSTREAM_PREWARM_TIMEOUT = 5.0  # 預熱的總逾時 (秒)，逾時不影響服務啟動
+    UPSTREAM_PREWARM_OPENAI_REQUEST = os.getenv("UPSTREAM_PREWARM_OPENAI_REQUEST", "false").lower() == "true"  # 預熱時以 API 金鑰發出 GET /models 完成 TLS 握手，預設只做 DNS 查詢
+
+    # 上游准入控制 (services/upstream_scheduler.py)：每個提供者的並行上限與令牌桶速率 (以每次 LLM/嵌入/語音調用計算)，
+    # 超出時依優先級排隊 (用戶回合 > murmur > 摘要等背景工作)，rate 為 0 表示不限速
+    UPSTREAM_SCHEDULER_ENABLED = os.getenv("UPSTREAM_SCHEDULER_ENABLED", "true").lower() == "true"
+    UPSTREAM_PROVIDER_LIMITS = {
+        "gemini": {
+            "concurrency": int(os.getenv("UPSTREAM_GEMINI_CONCURRENCY", "32")),
+            "rate": float(os.getenv("UPSTREAM_GEMINI_RATE", "0")),  # 每秒調用數
+            "burst": int(os.getenv("UPSTREAM_GEMINI_BURST", "32")),
+        },
+        "openai": {
+            "concurrency": int(os.getenv("UPSTREAM_OPENAI_CONCURRENCY", "32")),
+            "rate": float(os.getenv("UPSTREAM_OPENAI_RATE", "0")),
+            "burst": int(os.getenv("UPSTREAM_OPENAI_BURST", "32")),
+        },
+    }
+    UPSTREAM_QUEUE_MAX = int(os.getenv("UPSTREAM_QUEUE_MAX", "200"))  # 每個提供者的等待佇列上限
+    UPSTREAM_MAX_WAIT_USER_SECONDS = 15.0  # 用戶回合最長等待 (秒)，逾時即捨棄
+    UPSTREAM_MAX_WAIT_MURMUR_SECONDS = 5.0  # murmur 過時即無意義，等待較短
+    UPSTREAM_MAX_WAIT_BACKGROUND_SECONDS = 60.0  # 記憶摘要等背景工作
+
+    # 相同 LLM 請求的合併 (services/single_flight.py)：渲染後提示與模型參數相同的同時請求共用一次上游調用
+    LLM_SINGLE_FLIGHT_ENABLED = os.getenv("LLM_SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+    LLM_SINGLE_FLIGHT_LINGER_SECONDS = float(os.getenv("LLM_SINGLE_FLIGHT_LINGER_SECONDS", "0"))  # 完成後結果保留多久供稍晚的相同請求共用，0 表示只合併進行中的請求
+
+    # 語音服務提供者: "openai" 或 "local" (本地替身，不連網，用於壓力測試)
+    SPEECH_PROVIDER = os.getenv("SPEECH_PROVIDER", "openai")
+    TTS_PROVIDER = os.getenv("TTS_PROVIDER", SPEECH_PROVIDER)
+    STT_PROVIDER = os.getenv("STT_PROVIDER", SPEECH_PROVIDER)
+    # 本地替身配置 (延遲分佈格式見 services/speech_providers/local_provider.py)
+    LOCAL_TTS_LATENCY = os.getenv("LOCAL_TTS_LATENCY", "lognormal:0.8,0.3")
+    LOCAL_STT_LATENCY = os.getenv("LOCAL_STT_LATENCY", "lognormal:0.5,0.3")
+    LOCAL_SPEECH_ERROR_RATE = float(os.getenv("LOCAL_SPEECH_ERROR_RATE", "0"))  # 注入錯誤的比例 (0-1)
+    LOCAL_SPEECH_SEED: Optional[int] = int(os.getenv("LOCAL_SPEECH_SEED")) if os.getenv("LOCAL_SPEECH_SEED") else None  # 固定後延遲與錯誤序列可重現
+    LOCAL_TTS_SECONDS_PER_CHAR = 0.2  # 每個字元對應的音訊秒數
+    LOCAL_TTS_STREAM_FIRST_CHUNK_RATIO = 0.3  # 串流時首塊延遲佔整體延遲的比例
+    LOCAL_STT_TRANSCRIPTS = [
+        "你好，今天太空站的狀況如何？",
+        "你現在在做什麼？",
+        "可以跟我說說地球看起來是什麼樣子嗎？",
+        "你今天心情好嗎？",
+        "太空裡的食物好吃嗎？",
+    ]
+
+    # 預生成 murmur 池 (會話安靜下來後在背景預先生成，閒置閾值一到立即送出)
+    MURMUR_POOL_ENABLED = os.getenv("MURMUR_POOL_ENABLED", "false").lower() == "true"
+    MURMUR_POOL_SIZE = 2  # 每個會話保留的 murmur 數量
+    MURMUR_POOL_MAX_AGE_SECONDS = 180  # 超過此時間的 murmur 不再使用
+    MURMUR_POOL_FILL_DELAY_SECONDS = 4.0  # 最後一次活動後多久開始預生成
+
+    # 跨會話批次生成 murmur (一次 LLM 調用生成多個會話的 murmur，跳過工具意圖與記憶階段)
+    MURMUR_BATCH_ENABLED = os.getenv("MURMUR_BATCH_ENABLED", "false").lower() == "true"
+    MURMUR_BATCH_WINDOW_SECONDS = float(os.getenv("MURMUR_BATCH_WINDOW_SECONDS", "0.5"))  # 收集請求的視窗 (秒)
+    MURMUR_BATCH_MAX_SIZE = 8  # 每次 LLM 調用最多生成的 murmur 數
+
+    # 會話狀態儲存 (對話歷史、最近的 murmur 等)："memory" 只在單一 worker 內保存，
+    # "sqlite" 以檔案在同一台機器的多個 worker 間共用，重新連線可落在任何 worker
+    SESSION_STORE = os.getenv("SESSION_STORE", "memory")
+    SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH", os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "sessions.sqlite3"))
+    SESSION_STORE_FLUSH_INTERVAL = float(os.getenv("SESSION_STORE_FLUSH_INTERVAL", "1.0"))  # 合併寫入的間隔 (秒)
+    SESSION_STORE_TTL_SECONDS = int(os.getenv("SESSION_STORE_TTL_SECONDS", str(24 * 60 * 60)))  # 會話狀態保存時間 (秒)，0 表示不過期
+
+    # 串流回應配置 (LLM 逐字輸出 + 逐句 TTS)
+    WS_STREAMING_DEFAULT = os.getenv("WS_STREAMING_DEFAULT", "false").lower() == "true"  # 新連線預設是否啟用串流模式
+    STREAM_TTS_MIN_SENTENCE_CHARS = 6  # 短於此長度的句子會與下一句合併後再送 TTS
+    STREAM_TTS_MAX_CONCURRENCY = 3  # 同一輪回應中同時進行的 TTS 請求上限
+    WS_DEFERRED_KEYFRAMES_DEFAULT = os.getenv("WS_DEFERRED_KEYFRAMES_DEFAULT", "false").lower() == "true"  # 新連線預設是否將關鍵幀分析移出關鍵路徑
+    WS_AUDIO_TRANSPORT_DEFAULT = os.getenv("WS_AUDIO_TRANSPORT_DEFAULT", "url")  # 音訊傳輸方式: "url" (保存後以 /audio-file/ 提供) 或 "binary" (WebSocket 二進位幀)
+    WS_CODEC_DEFAULT = os.getenv("WS_CODEC_DEFAULT", "json")  # 訊息編碼: "json" (orjson 文字幀) 或 "msgpack" (二進位幀)，客戶端可以子協定或 ?codec= 指定
+
+    # 入站訊息佇列 (接收迴圈與回合處理分離，短時間內連續送出的訊息合併為一個回合)
+    WS_INBOUND_QUEUE_MAX = 32  # 每個會話尚未處理的訊息上限，滿時暫停讀取 WebSocket
+    WS_INBOUND_COALESCE_WINDOW = float(os.getenv("WS_INBOUND_COALESCE_WINDOW", "0.25"))  # 合併視窗 (秒)，0 表示只合併已排隊的訊息
+    WS_INBOUND_COALESCE_MAX_WAIT = 1.0  # 第一則訊息最多等待的時間 (秒)
+    WS_INBOUND_COALESCE_MAX_MESSAGES = 8  # 一個回合最多合併的訊息數
+
+    # 出站佇列 (services/outbound_queue.py)：訊息由每個連線的寫入任務送出，回合流程不等待網路
+    WS_OUTBOUND_QUEUE_MAX = 256  # 每個連線尚未送出的訊息上限，滿時捨棄最低優先級的舊訊息
+    WS_OUTBOUND_HIGH_WATER_BYTES = int(os.getenv("WS_OUTBOUND_HIGH_WATER_BYTES", str(4 * 1024 * 1024)))  # 高水位 (位元組)
+    WS_OUTBOUND_SLOW_CLIENT_SECONDS = float(os.getenv("WS_OUTBOUND_SLOW_CLIENT_SECONDS", "10"))  # 持續高於高水位或單次送出卡住多久後斷線
+
+    # 直播房間 (/ws?room=<id>)：一個房間只執行一個對話流程，訊息扇出給所有觀眾
+    LIVE_ROOMS_ENABLED = os.getenv("LIVE_ROOMS_ENABLED", "true").lower() == "true"
+    LIVE_ROOM_MAX_PENDING_MESSAGES = 100  # 房間尚未處理的觀眾訊息上限，滿時捨棄新訊息
+    LIVE_ROOM_SNAPSHOT_HISTORY = 10  # 後加入的觀眾收到的最近對話則數
+    # 觀眾留言聚合 (services/audience_aggregator.py)：每個回合一次 LLM 調用回應多則留言
+    LIVE_ROOM_AGGREGATION_WINDOW = float(os.getenv("LIVE_ROOM_AGGREGATION_WINDOW", "2.0"))  # 從第一則待處理留言起的聚合視窗 (秒)
+    LIVE_ROOM_AGGREGATION_MODE = os.getenv("LIVE_ROOM_AGGREGATION_MODE", "composite")  # "composite" (綜合留言) 或 "top_n" (只挑出前 N 個問題)
+    LIVE_ROOM_AGGREGATION_TOP_N = int(os.getenv("LIVE_ROOM_AGGREGATION_TOP_N", "3"))  # top_n 模式每回合回應的問題數
+    LIVE_ROOM_COMPOSITE_MAX = 8  # composite 模式每回合最多納入的留言組數
+    LIVE_ROOM_DUPLICATE_THRESHOLD = 0.8  # 視為重複留言的相似度門檻 (字元 bigram)
+
+    # 背景任務監管 (services/task_supervisor.py)
+    TASK_SHUTDOWN_TIMEOUT = 5.0  # 連線或應用結束時等待背景任務取消完成的上限 (秒)
+
+    # 音訊儲存配置 (/audio-file/ 與 /audio/ 提供的 TTS 音訊)
+    AUDIO_STORE_MAX_BYTES = int(os.getenv("AUDIO_STORE_MAX_BYTES", str(64 * 1024 * 1024)))  # 記憶體層總位元組預算
+    AUDIO_STORE_TTL_SECONDS = int(os.getenv("AUDIO_STORE_TTL_SECONDS", "900"))  # 音訊保存時間 (秒)，0 表示不過期
+    AUDIO_STORE_SPILL_DIR: Optional[str] = os.getenv("AUDIO_STORE_SPILL_DIR") or None  # 磁碟溢出目錄，未設定則停用溢出
+    AUDIO_STORE_SPILL_MAX_BYTES = int(os.getenv("AUDIO_STORE_SPILL_MAX_BYTES", str(256 * 1024 * 1024)))  # 磁碟溢出層總位元組預算
+
+    # TTS 快取配置 (以文字與合成參數的雜湊為鍵)
+    TTS_CACHE_ENABLED = os.getenv("TTS_CACHE_ENABLED", "true").lower() == "true"
+    TTS_CACHE_MAX_TEXT_CHARS = 200  # 長於此長度的文字幾乎不會重複，不進入快取
+    TTS_CACHE_MEMORY_MAX_BYTES = int(os.getenv("TTS_CACHE_MEMORY_MAX_BYTES", str(32 * 1024 * 1024)))  # 記憶體層總位元組預算
+    TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "tts_cache"))  # 磁碟層目錄，設為空字串停用
+    TTS_CACHE_DISK_MAX_BYTES = int(os.getenv("TTS_CACHE_DISK_MAX_BYTES", str(256 * 1024 * 1024)))  # 磁碟層總位元組預算
+    # 並行逐句合成：長文字切成句子同時合成，再按順序拼接
+    TTS_PARALLEL_ENABLED = os.getenv("TTS_PARALLEL_ENABLED", "false").lower() == "true"
+    TTS_PARALLEL_MIN_CHARS = 80  # 短於此長度的文字仍以單次請求合成
+    TTS_PARALLEL_MIN_SEGMENT_CHARS = 20  # 短於此長度的句子與下一句合併為同一個片段
+    TTS_PARALLEL_MAX_CONCURRENCY = 4  # 同一段文字同時進行的合成請求上限
+    TTS_STREAM_CHUNK_BYTES = 4096  # 串流合成時每次轉送給客戶端的音訊塊大小
+    TTS_WARMUP_ENABLED = os.getenv("TTS_WARMUP_ENABLED", "true").lower() == "true"  # 啟動時是否預熱固定語句
+    TTS_WARMUP_CONCURRENCY = 2  # 預熱時同時進行的合成數量
+    TTS_WARMUP_PHRASES_FILE: Optional[str] = os.getenv("TTS_WARMUP_PHRASES_FILE")  # 額外的預熱語句檔案 (每行一句)
+    # 額外的預熱語句 (各處的錯誤回退訊息由 tts_cache 直接從其常數收集，不需列在這裡)
+    TTS_WARMUP_PHRASES = []
+    TTS_WARMUP_MURMURS = 20  # 預熱最常重複出現的 murmur 句數 (出現次數記錄於磁碟層目錄，0 表示不預熱)
+
 settings = Settings() 
\ No newline at end of file
@@ -13,4 +13,10 @@ class SpeechServiceException(ServiceException):
 
 class AIServiceException(ServiceException):
     """AI服務異常"""
-    pass 
\ No newline at end of file
+    pass
+
+class UpstreamOverloadedException(ServiceException):
+    """上游調用被准入控制拒絕 (等待佇列已滿或等待逾時)"""
+    def __init__(self, message: str, provider: str):
+        self.provider = provider
+        super().__init__(message, status_code=503)
@@ -0,0 +1,111 @@
+"""
+WebSocket 訊息編碼基準測試
+
+比較 Starlette send_json 使用的標準庫 json、orjson (JSON 編碼) 與 ormsgpack (MessagePack 編碼)
+對典型訊息的編碼耗時與傳輸位元組數。
+
+用法 (於 prototype/backend 目錄)：
+
+    python3 scripts/bench_ws_codec.py [--iterations 20000]
+"""
+
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.ws_codec import CODECS, PreparedMessage  # noqa: E402
+
+EMOTION_TAGS = ["neutral", "happy", "curious", "surprised", "thinking", "excited"]
+ANIMATION_NAMES = ["Idle", "Talking", "Thinking", "Waving", "Nodding", "Excited"]
+
+
+def sample_messages():
+    """典型的出站訊息 (名稱, 訊息)"""
+    keyframes = [{"tag": EMOTION_TAGS[i % len(EMOTION_TAGS)], "proportion": round(i / 11, 3)} for i in range(12)]
+    animation = [{"name": ANIMATION_NAMES[i % len(ANIMATION_NAMES)], "proportion": round(i / 7, 3)} for i in range(8)]
+    reply_text = "哇，今天從太空站的窗戶看出去，地球的雲層特別漂亮！你那邊的天氣怎麼樣呢？" * 2
+    chat_message = {
+        "type": "chat-message",
+        "message": {
+            "id": "bot-1718000000000",
+            "role": "bot",
+            "content": reply_text,
+            "audioUrl": "/api/audio-file/bot-1718000000000.mp3",
+            "emotion": "happy",
+            "emotionalKeyframes": keyframes,
+            "bodyAnimationSequence": animation,
+            "characterState": {"health": 100, "mood": 72, "energy": 78, "task_success": 3, "days_in_space": 12},
+        },
+    }
+    trajectory = {
+        "type": "emotionalTrajectory",
+        "payload": {
+            "messageId": "bot-1718000000000",
+            "duration": 6.84,
+            "keyframes": keyframes,
+            "bodyAnimationSequence": animation,
+        },
+    }
+    delta = {"type": "chat-delta", "messageId": "bot-1718000000000", "delta": "地球的雲層"}
+    # 約 3 秒的 mp3 (48 kbps)，以 base64 內嵌
+    audio_message = {
+        "type": "response",
+        "content": reply_text,
+        "audio": base64.b64encode(os.urandom(18000)).decode("ascii"),
+        "emotionalKeyframes": keyframes,
+    }
+    return [
+        ("chat-message", chat_message),
+        ("emotionalTrajectory", trajectory),
+        ("chat-delta", delta),
+        ("base64 audio", audio_message),
+    ]
+
+
+def stdlib_encode(message):
+    """Starlette WebSocket.send_json 的編碼方式"""
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def bench(encode, message, iterations):
+    """返回 (每次編碼微秒數, 位元組數)"""
+    payload = encode(message)
+    started = time.perf_counter()
+    for _ in range(iterations):
+        encode(message)
+    elapsed = time.perf_counter() - started
+    return elapsed / iterations * 1e6, len(payload)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000, help="每種組合的編碼次數")
+    args = parser.parse_args()
+
+    encoders = [
+        ("json (stdlib)", stdlib_encode),
+        ("json (orjson)", CODECS["json"].encode),
+        ("msgpack", CODECS["msgpack"].encode),
+    ]
+    print(f"{'訊息':<22}{'編碼':<16}{'µs/次':>10}{'bytes':>10}{'相對 stdlib':>14}")
+    for name, message in sample_messages():
+        baseline = None
+        for encoder_name, encode in encoders:
+            micros, size = bench(encode, message, args.iterations)
+            baseline = baseline or (micros, size)
+            ratio = f"{baseline[0] / micros:.1f}x / {size / baseline[1]:.0%}"
+            print(f"{name:<22}{encoder_name:<16}{micros:>10.2f}{size:>10}{ratio:>14}")
+        # 預先序列化的訊息：第一次之後只是取出快取
+        prepared = PreparedMessage(message)
+        micros, size = bench(lambda _: prepared.payload(CODECS["json"]), message, args.iterations)
+        print(f"{name:<22}{'prepared':<16}{micros:>10.2f}{size:>10}{'':>14}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,22 +4,30 @@ AI對話服務模組 - 提供對話生成和記憶功能 (基於 LangGraph 實
 
 import logging
 import google.generativeai as genai
-from typing import Dict, Optional, List, Any
+from typing import Dict, Optional, List, Any, Callable, Awaitable
 from core.config import settings
 from core.exceptions import AIServiceException
-from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
+from services.clients import upstream_clients
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
 
 from .memory_system import MemorySystem
 from .dialogue_graph import DialogueGraph, DEFAULT_NEUTRAL_KEYFRAMES, DEFAULT_ANIMATION_SEQUENCE
+from .session_state import AISessionState
 
 # 配置基本日誌
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# 固定的回退回應 (啟動時預熱 TTS 快取)
+NO_INPUT_RESPONSE = "嗯...發生了什麼事？我好像沒有收到任何訊息。"
+AI_ERROR_RESPONSE = "哎呀，我的系統出了點小問題。太空干擾有時候真的很煩人，你能再說一次嗎？"
+
 class AIService:
     """
     向後兼容的 AI 服務 - 內部使用基於 LangGraph 的新架構，
     但對外提供與舊版相同的介面
+
+    整個應用共用一個實例 (由 services/container.py 建立)；角色狀態與任務記錄
+    屬於各會話的 AISessionState，以 state 參數傳入。未傳入時使用 default_state。
     """
     
     def __init__(self):
@@ -29,39 +37,48 @@ class AIService:
         # 角色名稱
         self.persona_name = "星際小可愛"
         
-        # 創建嵌入模型
-        self.embeddings = GoogleGenerativeAIEmbeddings(
-            model="models/embedding-001", 
-            google_api_key=settings.GOOGLE_API_KEY
-        )
+        # 取得嵌入模型 (全域共用)
+        self.embeddings = upstream_clients.embeddings("models/embedding-001")
         
-        # 創建 LLM
-        self.llm = ChatGoogleGenerativeAI(
+        # 取得 LLM (全域共用，同參數的實例只建立一次)
+        self.llm = upstream_clients.chat_model(
             model=settings.AI_MODEL_NAME,
             temperature=settings.GENERATION_TEMPERATURE,
             top_p=settings.GENERATION_TOP_P, 
             top_k=settings.GENERATION_TOP_K,
-            max_output_tokens=settings.GENERATION_MAX_TOKENS,
-            google_api_key=settings.GOOGLE_API_KEY
+            max_output_tokens=settings.GENERATION_MAX_TOKENS
         )
         
         # 初始化新架構的組件
         self.memory_system = MemorySystem(self.embeddings, self.persona_name)
         self.dialogue_graph = DialogueGraph(self.memory_system, self.llm, self.persona_name)
         
-        # 為了兼容性，保留這些屬性和引用
+        # 為了兼容性，未指定會話時使用的狀態 (character_state 等屬性指向它)
         # self.messages: List[BaseMessage] = []  # <--- 改為從 dialogue_graph 或 history 獲取
-        self.character_state = self.dialogue_graph.initial_character_state.copy()  # 角色狀態
-        self.current_task = None  # 當前任務
-        self.tasks_history = []  # 任務歷史
+        self.default_state = AISessionState()
         
         logging.info("AIService (基於 LangGraph 的兼容模式) 初始化完成")
+
+    @property
+    def character_state(self) -> Dict[str, Any]:
+        return self.default_state.character_state
+
+    @property
+    def current_task(self) -> Optional[str]:
+        return self.default_state.current_task
+
+    @property
+    def tasks_history(self) -> List[Dict[str, Any]]:
+        return self.default_state.tasks_history
         
     async def generate_response(
         self, 
         user_text: Optional[str] = None, 
         system_prompt: Optional[str] = None,
-        history: Optional[List[Dict[str, Any]]] = None # <--- 新增 history 參數
+        history: Optional[List[Dict[str, Any]]] = None, # <--- 新增 history 參數
+        on_text_delta: Optional[Callable[[str], Awaitable[None]]] = None,
+        defer_keyframes: bool = False,
+        state: Optional[AISessionState] = None
     ) -> Dict[str, Any]:
         """
         基於使用者輸入、系統提示或記憶生成AI回應 - 兼容舊版 API，但返回字典
@@ -70,6 +87,10 @@ class AIService:
             user_text: 使用者輸入文本 (與 system_prompt 互斥)
             system_prompt: 系統觸發的提示 (例如用於生成 murmur，與 user_text 互斥)
             history: 包含對話歷史的列表，每個元素是 {'role': str, 'content': str, 'is_murmur': Optional[bool]} 的字典
+            on_text_delta: 串流模式下接收 LLM 文字增量的異步回調 (可選，不提供則一次性生成)
+            defer_keyframes: 為 True 時不等待關鍵幀分析，返回的 emotional_keyframes 和
+                body_animation_sequence 為 None，之後再調用 analyze_keyframes() 取得
+            state: 會話的角色狀態與任務記錄 (可選，預設使用 default_state)
             
         Returns:
             包含 'final_response', 'emotion', 'emotional_keyframes' 和 'body_animation_sequence' 的字典
@@ -80,7 +101,7 @@ class AIService:
         if user_text is None and system_prompt is None:
              logging.warning("generate_response 需要提供 user_text 或 system_prompt")
              return {
-                "final_response": "嗯...發生了什麼事？我好像沒有收到任何訊息。",
+                "final_response": NO_INPUT_RESPONSE,
                 "emotion": "confused",
                 "emotional_keyframes": DEFAULT_NEUTRAL_KEYFRAMES.copy(),
                 "body_animation_sequence": DEFAULT_ANIMATION_SEQUENCE.copy(),
@@ -104,19 +125,24 @@ class AIService:
             # --- 結束構建 messages ---
 
             # 根據是否有 system_prompt 調整傳遞給圖的參數
+            state = state or self.default_state
             graph_input = {
                 "messages": messages, # <--- 使用從 history 構建的 messages
-                "character_state": self.character_state,
-                "current_task": self.current_task,
-                "tasks_history": self.tasks_history
+                "character_state": state.character_state,
+                "current_task": state.current_task,
+                "tasks_history": state.tasks_history
             }
             if system_prompt:
                  graph_input["system_prompt"] = system_prompt
             # 如果有 user_text，它將被圖中的節點處理（例如添加到 messages 中）
             if user_text:
                  graph_input["user_text"] = user_text # 顯式傳遞，即使歷史中已有
+            if on_text_delta:
+                 graph_input["on_text_delta"] = on_text_delta
+            if defer_keyframes:
+                 graph_input["defer_keyframes"] = True
 
-            # 調用 LangGraph 生成回應
+            # 調用 LangGraph 生成回應 (其中每次 LLM 與嵌入調用各自向 upstream_scheduler 取得名額，優先級取自調用流程)
             graph_result: Dict[str, Any] = await self.dialogue_graph.generate_response(**graph_input)
             
             # --- 不再需要從 self 更新 messages，因為 graph 應返回更新後的 ---
@@ -139,61 +165,111 @@ class AIService:
         except Exception as e:
             logging.error(f"生成 AI 回應失敗: {str(e)}", exc_info=True)
             return {
-                "final_response": "哎呀，我的系統出了點小問題。太空干擾有時候真的很煩人，你能再說一次嗎？",
+                "final_response": AI_ERROR_RESPONSE,
                 "emotion": "frustrated",
                 "emotional_keyframes": DEFAULT_NEUTRAL_KEYFRAMES.copy(),
                 "body_animation_sequence": DEFAULT_ANIMATION_SEQUENCE.copy(),
                 "error": str(e)
             }
             
-    def update_character_state(self, updates: Dict[str, Any]) -> None:
+    async def analyze_keyframes(self, response_text: str) -> Dict[str, Any]:
+        """
+        分析回應文字的情緒關鍵幀和身體動畫序列 (用於 defer_keyframes 模式的後續分析)
+        
+        Args:
+            response_text: 已生成的回應文字
+            
+        Returns:
+            包含 'emotional_keyframes' 和 'body_animation_sequence' 的字典
+        """
+        try:
+            result = await self.dialogue_graph.analyze_keyframes(response_text)
+        except Exception as e:
+            logging.error(f"延遲關鍵幀分析失敗: {str(e)}", exc_info=True)
+            result = {}
+        return {
+            "emotional_keyframes": result.get("emotional_keyframes") or DEFAULT_NEUTRAL_KEYFRAMES.copy(),
+            "body_animation_sequence": result.get("body_animation_sequence") or DEFAULT_ANIMATION_SEQUENCE.copy()
+        }
+            
+    async def generate_murmur_batch(
+        self,
+        contexts: List[str],
+        states: Optional[List[Optional[AISessionState]]] = None
+    ) -> List[Optional[Dict[str, Any]]]:
+        """
+        以一次 LLM 調用為多個會話生成 murmur (跳過工具意圖與記憶階段)
+        
+        Args:
+            contexts: 每個會話的情境摘要
+            states: 與 contexts 等長的會話狀態 (可選，缺少的位置使用 default_state)
+            
+        Returns:
+            與 contexts 等長的列表，格式同 generate_response 的返回值；生成失敗的位置為 None
+        """
+        states = list(states or [])
+        states += [None] * (len(contexts) - len(states))
+        character_states = [(state or self.default_state).character_state for state in states[:len(contexts)]]
+        try:
+            return await self.dialogue_graph.generate_murmur_batch(contexts, character_states)
+        except Exception as e:
+            logging.error(f"批次生成 murmur 失敗: {str(e)}", exc_info=True)
+            return [None] * len(contexts)
+            
+    def update_character_state(self, updates: Dict[str, Any], state: Optional[AISessionState] = None) -> None:
         """
         更新角色狀態
         
         Args:
             updates: 要更新的狀態字典
+            state: 會話狀態 (可選，預設使用 default_state)
         """
+        state = state or self.default_state
         # 使用 DialogueGraph 的方法更新狀態
-        self.character_state = self.dialogue_graph.update_character_state(
-            self.character_state, updates
+        state.character_state = self.dialogue_graph.update_character_state(
+            state.character_state, updates
         )
                     
-    def set_current_task(self, task: str) -> None:
+    def set_current_task(self, task: str, state: Optional[AISessionState] = None) -> None:
         """
         設置當前任務
         
         Args:
             task: 任務描述
+            state: 會話狀態 (可選，預設使用 default_state)
         """
+        state = state or self.default_state
         # 記錄被中斷的任務
-        if self.current_task:
-            self.tasks_history.append({
-                "task": self.current_task, 
+        if state.current_task:
+            state.tasks_history.append({
+                "task": state.current_task, 
                 "status": "interrupted",
-                "day": self.character_state["days_in_space"]
+                "day": state.character_state["days_in_space"]
             })
-            logging.info(f"任務 '{self.current_task}' 被新任務中斷")
+            logging.info(f"任務 '{state.current_task}' 被新任務中斷")
             
-        self.current_task = task
+        state.current_task = task
         logging.info(f"設置新任務: {task}")
         
-    def complete_current_task(self, success: bool = True) -> None:
+    def complete_current_task(self, success: bool = True, state: Optional[AISessionState] = None) -> None:
         """
         完成當前任務
         
         Args:
             success: 任務是否成功
+            state: 會話狀態 (可選，預設使用 default_state)
         """
-        if self.current_task:
+        state = state or self.default_state
+        if state.current_task:
             # 記錄任務結果
             status = "success" if success else "failed"
             task_result = {
-                "task": self.current_task,
+                "task": state.current_task,
                 "status": status,
-                "day": self.character_state["days_in_space"]
+                "day": state.character_state["days_in_space"]
             }
-            self.tasks_history.append(task_result)
-            logging.info(f"任務 '{self.current_task}' 完成，狀態: {status}")
+            state.tasks_history.append(task_result)
+            logging.info(f"任務 '{state.current_task}' 完成，狀態: {status}")
             
             # 更新狀態
             mood_change = 5 if success else -5
@@ -207,15 +283,16 @@ class AIService:
             if success:
                 state_updates["task_success"] = "+1"
                 
-            self.update_character_state(state_updates)
+            self.update_character_state(state_updates, state)
             
             # 重置當前任務
-            self.current_task = None
+            state.current_task = None
         else:
             logging.warning("嘗試完成任務，但當前沒有任務。")
             
-    def advance_day(self) -> None:
+    def advance_day(self, state: Optional[AISessionState] = None) -> None:
         """推進一天時間並更新相關狀態"""
+        state = state or self.default_state
         # 基礎狀態變化
         state_updates = {
             "days_in_space": "+1",
@@ -223,8 +300,8 @@ class AIService:
         }
         
         # 如果沒有任務，心情可能稍微下降
-        if not self.current_task:
+        if not state.current_task:
             state_updates["mood"] = "-2"
             
-        self.update_character_state(state_updates)
-        logging.info(f"時間推進到第 {self.character_state['days_in_space']} 天") 
\ No newline at end of file
+        self.update_character_state(state_updates, state)
+        logging.info(f"時間推進到第 {state.character_state['days_in_space']} 天") 
@@ -0,0 +1,74 @@
+"""
+在 LLM 客戶端前加上請求合併 (services/single_flight.py) 與上游准入控制 (services/upstream_scheduler.py)
+
+CoalescingLLM 可直接放進 LangChain 鏈 (prompt | CoalescingLLM | parser)：
+渲染後的完整提示加上模型參數雜湊相同的非串流調用共用一次上游調用。
+串流調用 (astream) 直接交給原本的模型，不合併。
+每次實際發出的上游調用各佔一個准入名額 (串流期間持續佔用)，被合併的等待者不佔名額。
+"""
+
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from langchain_core.runnables import Runnable, RunnableConfig
+
+from services.single_flight import SingleFlight, llm_single_flight, request_key
+from services.upstream_scheduler import upstream_scheduler
+
+# 參與合併鍵的模型參數
+MODEL_PARAMETERS = ("model", "temperature", "top_p", "top_k", "max_output_tokens")
+
+# 已建立的包裝 (模型實例 id, 名稱) -> CoalescingLLM
+_wrappers: Dict[Tuple[int, str], "CoalescingLLM"] = {}
+
+
+def _render(value: Any) -> Any:
+    """把 LLM 的輸入 (PromptValue、字串或訊息列表) 轉為可雜湊的形式"""
+    if hasattr(value, "to_messages"):
+        value = value.to_messages()
+    if isinstance(value, (list, tuple)):
+        return [[getattr(message, "type", None), getattr(message, "content", message)] for message in value]
+    return value
+
+
+class CoalescingLLM(Runnable):
+    """合併相同提示的 LLM 包裝"""
+
+    def __init__(self, llm: Runnable, name: str, flight: Optional[SingleFlight] = None, provider: str = "gemini"):
+        """
+        Args:
+            llm: 聊天模型 (來自 upstream_clients.chat_model)
+            name: 統計用的名稱
+            flight: 使用的合併器，預設為全域共享的 llm_single_flight
+            provider: 准入控制的提供者名稱
+        """
+        self.llm = llm
+        self.name = name
+        self.provider = provider
+        self.flight = flight or llm_single_flight
+        self._parameters = [getattr(llm, parameter, None) for parameter in MODEL_PARAMETERS]
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        return self.llm.invoke(input, config, **kwargs)
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        key = request_key(self._parameters, _render(input), kwargs)
+        return await self.flight.run(self.name, key, lambda: self._upstream_ainvoke(input, config, **kwargs))
+
+    async def _upstream_ainvoke(self, input: Any, config: Optional[RunnableConfig], **kwargs: Any) -> Any:
+        async with upstream_scheduler.slot(self.provider):
+            return await self.llm.ainvoke(input, config, **kwargs)
+
+    async def astream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> AsyncIterator[Any]:
+        async with upstream_scheduler.slot(self.provider):
+            async for chunk in self.llm.astream(input, config, **kwargs):
+                yield chunk
+
+
+def coalescing(llm: Runnable, name: str) -> CoalescingLLM:
+    """取得 llm 的合併包裝，相同模型實例與名稱返回同一個包裝"""
+    key = (id(llm), name)
+    wrapper = _wrappers.get(key)
+    if wrapper is None or wrapper.llm is not llm:
+        wrapper = CoalescingLLM(llm, name)
+        _wrappers[key] = wrapper
+    return wrapper
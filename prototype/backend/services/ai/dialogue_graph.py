@@ -11,7 +11,7 @@ import asyncio
 import json
 import os # 新增：導入 os 模塊
 import time # <--- 導入 time 模組
-from typing import Dict, List, Any, TypedDict, Optional, Tuple
+from typing import Dict, List, Any, TypedDict, Optional, Tuple, Callable, Awaitable
 
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage
 from langchain_core.prompts import PromptTemplate
@@ -20,7 +20,10 @@ from google.generativeai.types import GenerationConfig
 
 from langgraph.graph import StateGraph, END
 
+from services.upstream_scheduler import upstream_scheduler, PRIORITY_MURMUR
+
 from .memory_system import MemorySystem
+from .session_state import INITIAL_CHARACTER_STATE
 from .prompts import DIALOGUE_STYLES, PROMPT_TEMPLATES
 from .graph_nodes.input_processing import preprocess_input_node
 from .graph_nodes.memory_handling import retrieve_memory_node, filter_memory_node, store_memory_node
@@ -391,10 +394,11 @@ async def analyze_keyframes_node(state: DialogueState) -> Dict[str, Any]:
 
     try:
         logging.info("analyze_keyframes_node: 開始調用 LLM 進行情緒關鍵幀和動畫序列分析...")
-        analysis_response = await llm.ainvoke(
-            analysis_prompt,
-            config={"generation_config": generation_config}
-        )
+        async with upstream_scheduler.slot("gemini"):
+            analysis_response = await llm.ainvoke(
+                analysis_prompt,
+                config={"generation_config": generation_config}
+            )
 
         raw_analysis_data = analysis_response.content
         parsed_data = None
@@ -515,13 +519,7 @@ class DialogueGraph:
         self.persona_name = persona_name
         
         # 保存初始角色狀態
-        self.initial_character_state = {
-            "health": 100,
-            "mood": 70,
-            "energy": 80,
-            "task_success": 0,
-            "days_in_space": 1
-        }
+        self.initial_character_state = INITIAL_CHARACTER_STATE.copy()
         
         # 初始化提示模板
         self.prompt_templates = {
@@ -576,10 +574,18 @@ class DialogueGraph:
         # 編譯圖
         self.app = self.graph.compile()
         
+        # 延遲關鍵幀模式：call_llm 後直接進入後處理，關鍵幀由呼叫方另行調用 analyze_keyframes()
+        self.deferred_keyframes_app = self._build_graph(defer_keyframes=True).compile()
+        
         logging.info("增強版 DialogueGraph 初始化完成，已註冊工具")
         
-    def _build_graph(self) -> StateGraph:
-        """構建對話圖"""
+    def _build_graph(self, defer_keyframes: bool = False) -> StateGraph:
+        """
+        構建對話圖
+
+        Args:
+            defer_keyframes: 為 True 時不在圖中執行關鍵幀分析，讓 final_response 在 call_llm 後儘快返回
+        """
         
         # 創建狀態圖
         workflow = StateGraph(DialogueState)
@@ -600,7 +606,8 @@ class DialogueGraph:
         workflow.add_node("select_prompt_and_style", select_prompt_and_style_node)
         workflow.add_node("build_prompt", self._build_prompt_node_wrapper)
         workflow.add_node("call_llm", self._call_llm_node_wrapper)
-        workflow.add_node("analyze_keyframes", self._analyze_keyframes_node_wrapper)
+        if not defer_keyframes:
+            workflow.add_node("analyze_keyframes", self._analyze_keyframes_node_wrapper)
         workflow.add_node("post_process", post_process_node)
         workflow.add_node("store_memory", self._store_memory_node_wrapper)
         
@@ -636,11 +643,12 @@ class DialogueGraph:
             handle_llm_error,
             {
                 "retry": "select_prompt_and_style",
-                "continue": "analyze_keyframes"
+                "continue": "post_process" if defer_keyframes else "analyze_keyframes"
             }
         )
         
-        workflow.add_edge("analyze_keyframes", "post_process")
+        if not defer_keyframes:
+            workflow.add_edge("analyze_keyframes", "post_process")
         workflow.add_edge("post_process", "store_memory")
         workflow.add_edge("store_memory", END)
         
@@ -766,7 +774,9 @@ class DialogueGraph:
         system_prompt: Optional[str] = None,
         current_task: Optional[str] = None,
         tasks_history: Optional[List[Dict]] = None,
-        current_intent: Optional[str] = None
+        current_intent: Optional[str] = None,
+        on_text_delta: Optional[Callable[[str], Awaitable[None]]] = None,
+        defer_keyframes: bool = False
     ) -> Dict[str, Any]:
         """
         異步生成回應 - 調用 LangGraph 圖。
@@ -780,6 +790,9 @@ class DialogueGraph:
             current_task: 當前任務。
             tasks_history: 任務歷史。
             current_intent: (可選) 外部傳入的意圖。
+            on_text_delta: (可選) 串流模式下接收 LLM 文字增量的異步回調。
+            defer_keyframes: (可選) 跳過圖中的關鍵幀分析，返回的 emotional_keyframes
+                和 body_animation_sequence 為 None，需另行調用 analyze_keyframes()。
 
         Returns:
             包含回應和狀態更新的字典。
@@ -851,12 +864,15 @@ class DialogueGraph:
                 "keyframes_schema": keyframes_schema,
                 "animation_sequence_schema": animation_sequence_schema,
                 "dialogue_styles": DIALOGUE_STYLES,
-                "prompt_templates": PROMPT_TEMPLATES
+                "prompt_templates": PROMPT_TEMPLATES,
+                "on_text_delta": on_text_delta
             }
         }
 
+        app = self.deferred_keyframes_app if defer_keyframes else self.app
+
         try:
-            final_state = await self.app.ainvoke(
+            final_state = await app.ainvoke(
                 initial_state,
                 config={"recursion_limit": 15}
             )
@@ -886,6 +902,125 @@ class DialogueGraph:
                 "updated_messages": messages
             }
 
+    async def analyze_keyframes(self, response_text: str) -> Dict[str, Any]:
+        """
+        在圖外單獨分析一段回應文字的情緒關鍵幀和身體動畫序列 (配合 defer_keyframes 使用)
+
+        Args:
+            response_text: 要分析的回應文字
+
+        Returns:
+            包含 'emotional_keyframes' 和 'body_animation_sequence' 的字典
+        """
+        state = {
+            "llm_response_raw": response_text,
+            "_context": {"llm": self.llm}
+        }
+        return await self._analyze_keyframes_node_wrapper(state)
+
+    async def generate_murmur_batch(self, contexts: List[str], character_states: Optional[List[Optional[Dict[str, Any]]]] = None) -> List[Optional[Dict[str, Any]]]:
+        """
+        以一次 LLM 調用為多個會話各生成一句 murmur (含情緒關鍵幀與身體動畫序列)
+
+        murmur 不經過圖：跳過輸入分類、工具意圖偵測與記憶檢索/儲存，
+        每個會話只提供一段情境摘要 (最近的對話與 murmur)。
+
+        Args:
+            contexts: 每個會話的情境摘要，順序即返回結果的順序
+            character_states: 與 contexts 等長的各會話角色狀態 (可選，放進各自的情境中)
+
+        Returns:
+            與 contexts 等長的列表，每個元素為包含 'final_response', 'emotion',
+            'emotional_keyframes', 'body_animation_sequence' 的字典，該會話生成失敗時為 None
+        """
+        if not contexts:
+            return []
+
+        available_actions_desc = ', '.join([f"{name}({ANIMATION_DESCRIPTIONS.get(name, '')})"
+                                            for name in ALLOWED_ANIMATION_NAMES])
+        character_states = list(character_states or [])
+        character_states += [None] * (len(contexts) - len(character_states))
+        context_blocks = "\n\n".join(
+            f"[情境 {index}]\n"
+            + (f"角色狀態: {format_character_state(character_state)}\n" if character_state else "")
+            + (context or '(沒有最近的互動)')
+            for index, (context, character_state) in enumerate(zip(contexts, character_states))
+        )
+
+        batch_prompt = f"""
+你是太空站的虛擬主播「{self.persona_name}」。以下有 {len(contexts)} 個彼此獨立的直播情境，
+請為每個情境各生成一句角色的內心獨白或自言自語 (murmur)。
+
+每句 murmur 必須：
+1. 反映該情境的最近互動或角色自己的思考，自然、簡短（約30-40字內），像是腦海中閃過的念頭。
+2. 不要重複該情境中「最近的自言自語」，各情境之間的 murmur 也不要相同。
+3. 可以是隨機念頭、對周圍環境的觀察、太空相關的想像、未來科技的思考，或是對最近交流的反思。
+4. 嘗試表達不同情緒和語氣，包括好奇、驚訝、思考、期待等。
+5. 符合該情境的「角色狀態」(精力、心情、身體狀況)。
+
+同時為每句 murmur 提供：
+- emotion: 主要情緒，允許的標籤為: {', '.join(ALLOWED_EMOTION_TAGS)}
+- emotional_keyframes: 情緒關鍵幀列表，格式：{json.dumps(keyframes_schema, ensure_ascii=False)}
+- body_animation_sequence: 身體動畫序列 (至少兩種不同的動作)，可用的動作僅限於: {available_actions_desc}
+  格式：{json.dumps(animation_sequence_schema, ensure_ascii=False)}
+兩個序列的第一個關鍵幀 proportion 都為 0.0。
+
+{context_blocks}
+
+請嚴格按照以下 JSON 格式輸出結果，每個情境一個元素，index 對應情境編號：
+{{
+  "murmurs": [
+    {{"index": 0, "text": "...", "emotion": "...", "emotional_keyframes": [...], "body_animation_sequence": [...]}}
+  ]
+}}
+"""
+
+        generation_config = GenerationConfig(
+            response_mime_type='application/json',
+        )
+
+        start_time = time.time()
+        async with upstream_scheduler.slot("gemini", PRIORITY_MURMUR):
+            response = await self.llm.ainvoke(
+                batch_prompt,
+                config={"generation_config": generation_config}
+            )
+        raw_data = response.content
+        parsed_data = None
+        if isinstance(raw_data, str):
+            cleaned_data = raw_data.strip()
+            if cleaned_data.startswith("```json"):
+                cleaned_data = cleaned_data[7:]
+            if cleaned_data.endswith("```"):
+                cleaned_data = cleaned_data[:-3]
+            try:
+                parsed_data = json.loads(cleaned_data.strip())
+            except json.JSONDecodeError as e:
+                logging.error(f"generate_murmur_batch: 無法解析 LLM 返回的 JSON 字符串: {e}\n原始字符串: '{raw_data}'")
+        elif isinstance(raw_data, dict):
+            parsed_data = raw_data
+
+        items = parsed_data.get("murmurs") if isinstance(parsed_data, dict) else parsed_data
+        results: List[Optional[Dict[str, Any]]] = [None] * len(contexts)
+        for position, item in enumerate(items if isinstance(items, list) else []):
+            if not isinstance(item, dict) or not str(item.get("text") or "").strip():
+                continue
+            index = item.get("index", position)
+            if not isinstance(index, int) or not 0 <= index < len(contexts) or results[index] is not None:
+                continue
+            emotion = item.get("emotion")
+            results[index] = {
+                "final_response": str(item["text"]).strip(),
+                "emotion": emotion if emotion in ALLOWED_EMOTION_TAGS else "neutral",
+                "emotional_keyframes": validate_and_fix_keyframes(item.get("emotional_keyframes")),
+                "body_animation_sequence": validate_and_fix_animation_sequence(item.get("body_animation_sequence"))
+            }
+
+        processing_time = (time.time() - start_time) * 1000
+        produced = sum(1 for result in results if result is not None)
+        logging.info(f"DialogueGraph: 批次生成 murmur {produced}/{len(contexts)}。耗時: {processing_time:.2f} ms")
+        return results
+
     def update_character_state(self, character_state: Dict[str, Any], updates: Dict[str, Any]) -> Dict[str, Any]:
         updated_state = character_state.copy()
         changed = False
@@ -8,11 +8,13 @@ import asyncio
 import random
 import re
 import time
-from typing import Dict, List, Any, TypedDict, Optional, Tuple
+from typing import Dict, List, Any, TypedDict, Optional, Tuple, Callable, Awaitable
 
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 
+from services.ai.coalescing_llm import coalescing
+
 # 配置基本日誌
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -23,21 +25,26 @@ async def call_llm_node(state: TypedDict) -> Dict[str, Any]:
     error_count = state["error_count"]
     llm = state.get("_context", {}).get("llm")
     prompt_templates = state.get("_context", {}).get("prompt_templates")
-    
+    on_text_delta = state.get("_context", {}).get("on_text_delta")  # 串流模式下接收文字增量的回調
+
     if not llm or not prompt_templates:
         logging.error("LLM 或提示模板未在上下文中提供")
         return {
-            "llm_response_raw": "抱歉，我的系統似乎出了點問題...",
+            "llm_response_raw": LLM_NOT_FOUND_RESPONSE,
             "error_count": error_count + 1,
             "system_alert": "llm_not_found"
         }
     
     # 選擇提示模板
     prompt_template = prompt_templates.get(prompt_template_key, prompt_templates["standard"])
-    
-    # 構建 LLM 鏈
-    chain = prompt_template | llm | StrOutputParser()
-    
+
+    # 構建 LLM 鏈：ainvoke 時渲染後提示完全相同的同時請求共用一次上游調用，
+    # astream 則直接繞過合併 (兩者同樣經過准入控制)
+    chain = prompt_template | coalescing(llm, "dialogue") | StrOutputParser()
+
+    if on_text_delta:
+        return await _stream_llm_response(chain, prompt_inputs, on_text_delta, error_count)
+
     for attempt in range(2):  # 最多嘗試2次
         try:
             llm_response_raw = await chain.ainvoke(prompt_inputs)
@@ -53,19 +60,62 @@ async def call_llm_node(state: TypedDict) -> Dict[str, Any]:
             if attempt < 1:  # 如果不是最後一次嘗試
                 continue  # 重試
     
-    # 所有嘗試都失敗，返回友好的錯誤消息
-    error_responses = [
-        "哎呀，我的訊號好像不太穩定，你能再說一次嗎？",
-        "嗯... 我的處理器好像卡了一下，可以再問一次嗎？",
-        "太空干擾有點強，我沒聽清楚，麻煩再說一遍！"
-    ]
-    
+    return _all_attempts_failed(error_count)
+
+# 所有嘗試都失敗時的友好錯誤消息
+LLM_ERROR_RESPONSES = [
+    "哎呀，我的訊號好像不太穩定，你能再說一次嗎？",
+    "嗯... 我的處理器好像卡了一下，可以再問一次嗎？",
+    "太空干擾有點強，我沒聽清楚，麻煩再說一遍！"
+]
+# LLM 或提示模板未提供時的回應
+LLM_NOT_FOUND_RESPONSE = "抱歉，我的系統似乎出了點問題..."
+
+def _all_attempts_failed(error_count: int) -> Dict[str, Any]:
+    """所有嘗試都失敗，返回友好的錯誤消息"""
     return {
-        "llm_response_raw": random.choice(error_responses),
+        "llm_response_raw": random.choice(LLM_ERROR_RESPONSES),
         "error_count": error_count + 1,
         "system_alert": "llm_error_all_attempts_failed"
     }
 
+async def _stream_llm_response(chain, prompt_inputs: Dict[str, Any], on_text_delta: Callable[[str], Awaitable[None]], error_count: int) -> Dict[str, Any]:
+    """
+    以串流方式調用 LLM，每收到一段文字就交給 on_text_delta。
+
+    已經送出部分文字後若串流中斷，不再重試 (否則客戶端會收到重複內容)，
+    直接以已收到的部分作為回應。
+    """
+    for attempt in range(2):  # 最多嘗試2次
+        chunks: List[str] = []
+        try:
+            async for chunk in chain.astream(prompt_inputs):
+                if not chunk:
+                    continue
+                chunks.append(chunk)
+                await on_text_delta(chunk)
+            llm_response_raw = "".join(chunks)
+            logging.info(f"LLM 串流調用成功: {len(llm_response_raw)} 字符的回應")
+
+            return {
+                "llm_response_raw": llm_response_raw,
+                "error_count": 0,
+                "system_alert": None
+            }
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"LLM 串流調用失敗 (嘗試 {attempt+1}/2): {e}", exc_info=True)
+            if chunks:
+                logging.warning(f"LLM 串流在輸出 {len(''.join(chunks))} 字符後中斷，使用已收到的部分作為回應")
+                return {
+                    "llm_response_raw": "".join(chunks),
+                    "error_count": 0,
+                    "system_alert": "llm_stream_interrupted"
+                }
+
+    return _all_attempts_failed(error_count)
+
 def handle_llm_error(state: TypedDict) -> str:
     """處理 LLM 調用錯誤的條件路由"""
     if state.get("system_alert") and "llm_error" in state["system_alert"]:
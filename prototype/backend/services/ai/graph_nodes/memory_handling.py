@@ -10,6 +10,8 @@ from typing import Dict, List, Any, TypedDict, Optional
 
 from langchain_core.messages import BaseMessage, AIMessage
 
+from services.task_supervisor import task_registry
+
 # 配置基本日誌
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -138,7 +140,7 @@ async def store_memory_node(state: TypedDict) -> Dict[str, Any]:
             logging.info("對話成功儲存到記憶系統")
             
             # 觸發記憶整合
-            asyncio.create_task(memory_system.async_consolidate_memories())
+            task_registry.spawn(memory_system.async_consolidate_memories(), "memory_consolidation")
         except Exception as e:
             logging.error(f"儲存對話到記憶系統失敗: {e}", exc_info=True)
     else:
@@ -16,8 +16,9 @@ from langchain_core.messages import AIMessage, SystemMessage
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 # ---> 新增導入 <----
-from langchain_google_genai import ChatGoogleGenerativeAI
 from core.config import settings # 假設您的 API Key 在 settings 中
+from services.clients import upstream_clients
+from services.ai.coalescing_llm import coalescing
 # ---> 導入結束 <----
 
 # 配置基本日誌
@@ -54,10 +55,10 @@ async def detect_tool_intent(state: Dict[str, Any]) -> Dict[str, Any]:
 
     # ---> 初始化小型 LLM <----
     try:
-        small_llm = ChatGoogleGenerativeAI(
+        # 從共用註冊表取得，不再每次調用都建立新的客戶端與連線
+        small_llm = upstream_clients.chat_model(
             model="gemini-1.5-flash-8b", # 使用指定的小型模型
-            temperature=0.1, # 意圖檢測任務通常需要較低的溫度以獲得更確定的輸出
-            google_api_key=settings.GOOGLE_API_KEY
+            temperature=0.1 # 意圖檢測任務通常需要較低的溫度以獲得更確定的輸出
         )
     except Exception as e:
         logging.error(f"初始化 Gemini 1.5 Flash 8B 模型失敗: {e}", exc_info=True)
@@ -95,7 +96,8 @@ async def detect_tool_intent(state: Dict[str, Any]) -> Dict[str, Any]:
     history_str = "\n".join([f"{msg.type}: {msg.content}" for msg in messages[-4:]])
 
     # ---> 使用 small_llm <----
-    chain = prompt_template | small_llm | StrOutputParser()
+    # 相同的提示 (例如直播間裡同時送出的相同招呼) 共用一次上游調用
+    chain = prompt_template | coalescing(small_llm, "tool_intent") | StrOutputParser()
 
     try:
         logging.info(f"調用小型 LLM (gemini-1.5-flash-8b) 進行工具意圖檢測...")
@@ -145,10 +147,9 @@ async def parse_tool_parameters(state: Dict[str, Any]) -> Dict[str, Any]:
 
     # ---> 初始化小型 LLM <----
     try:
-        small_llm = ChatGoogleGenerativeAI(
+        small_llm = upstream_clients.chat_model(
             model="gemini-1.5-flash-8b",
-            temperature=0.1, # 參數提取也需要較低溫度
-            google_api_key=settings.GOOGLE_API_KEY
+            temperature=0.1 # 參數提取也需要較低溫度
         )
     except Exception as e:
         logging.error(f"初始化 Gemini 1.5 Flash 8B 模型失敗: {e}", exc_info=True)
@@ -182,7 +183,7 @@ async def parse_tool_parameters(state: Dict[str, Any]) -> Dict[str, Any]:
         )
 
         history_str = "\n".join([f"{msg.type}: {msg.content}" for msg in messages[-4:]])
-        chain = prompt_template | small_llm | StrOutputParser()
+        chain = prompt_template | coalescing(small_llm, "tool_parameters") | StrOutputParser()
 
         try:
             logging.info(f"調用小型 LLM 提取工具 '{potential_tool}' 的參數 '{param_name}'...")
@@ -225,7 +226,7 @@ async def parse_tool_parameters(state: Dict[str, Any]) -> Dict[str, Any]:
             )
             
             history_str = "\n".join([f"{msg.type}: {msg.content}" for msg in messages[-4:]])
-            chain = prompt_template | small_llm | StrOutputParser()
+            chain = prompt_template | coalescing(small_llm, "tool_parameters") | StrOutputParser()
             
             try:
                 logging.info(f"調用小型 LLM 提取工具 '{potential_tool}' 的可選參數 '{param_name}'...")
@@ -292,8 +293,8 @@ async def parse_tool_parameters(state: Dict[str, Any]) -> Dict[str, Any]:
             "請只返回時間範圍或'未指定'，不要添加任何解釋、引號或附加信息。"
         )
         
-        keywords_chain = keywords_prompt | small_llm | StrOutputParser()
-        time_period_chain = time_period_prompt | small_llm | StrOutputParser()
+        keywords_chain = keywords_prompt | coalescing(small_llm, "tool_parameters") | StrOutputParser()
+        time_period_chain = time_period_prompt | coalescing(small_llm, "tool_parameters") | StrOutputParser()
         
         try:
             # 並行執行參數提取任務
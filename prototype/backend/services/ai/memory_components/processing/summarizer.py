@@ -5,6 +5,9 @@ from typing import List, Dict, Any, Optional
 
 from langchain_google_genai import ChatGoogleGenerativeAI
 
+from core.exceptions import UpstreamOverloadedException
+from services.task_supervisor import task_registry
+from services.upstream_scheduler import upstream_scheduler, upstream_priority, PRIORITY_BACKGROUND
 from ..stores import BaseMemoryStore
 
 class ConversationSummarizer:
@@ -50,7 +53,7 @@ class ConversationSummarizer:
         logging.info("觸發記憶整合...")
         if asyncio.get_event_loop().is_running():
             # 如果事件循環在運行，創建異步任務
-            asyncio.create_task(self.async_consolidate_memories())
+            task_registry.spawn(self.async_consolidate_memories(), "memory_consolidation")
         else:
             # 否則同步運行
             self._perform_memory_consolidation()
@@ -70,7 +73,15 @@ class ConversationSummarizer:
                 return
                 
             logging.info("開始異步記憶整合...")
-            await self._async_perform_memory_consolidation()
+            # 背景工作，其下的上游調用優先級低於用戶回合與 murmur
+            token = upstream_priority.set(PRIORITY_BACKGROUND)
+            try:
+                await self._async_perform_memory_consolidation()
+            except UpstreamOverloadedException as e:
+                logging.warning(f"上游繁忙，延後記憶整合: {e}")
+                return
+            finally:
+                upstream_priority.reset(token)
             self.memory_last_consolidated = time.time()
     
     def _perform_memory_consolidation(self):
@@ -124,6 +135,8 @@ class ConversationSummarizer:
             
             logging.info("異步記憶整合完成")
             
+        except UpstreamOverloadedException:
+            raise
         except Exception as e:
             logging.error(f"異步記憶整合失敗: {e}", exc_info=True)
     
@@ -193,7 +206,8 @@ class ConversationSummarizer:
         
         try:
             # 異步調用LLM生成摘要
-            summary = await self.llm.ainvoke(summary_prompt)
+            async with upstream_scheduler.slot("gemini"):
+                summary = await self.llm.ainvoke(summary_prompt)
             summary_text = summary.content
             
             # 存儲摘要到摘要記憶庫
@@ -209,6 +223,8 @@ class ConversationSummarizer:
             
             logging.info(f"生成並存儲了新的對話摘要: {summary_text[:50]}...")
             
+        except UpstreamOverloadedException:
+            raise
         except Exception as e:
             logging.error(f"異步生成摘要失敗: {e}", exc_info=True)
     
@@ -5,6 +5,7 @@ from typing import List, Dict, Any, Optional, Union
 from langchain_chroma import Chroma
 from langchain_core.embeddings import Embeddings
 
+from services.upstream_scheduler import upstream_scheduler
 from .base_store import BaseMemoryStore
 
 class ChromaMemoryStore(BaseMemoryStore):
@@ -129,8 +130,9 @@ class ChromaMemoryStore(BaseMemoryStore):
             if use_mmr:
                 retriever.search_kwargs["fetch_k"] = k * 5
         
-        # 進行異步檢索
-        docs = await retriever.ainvoke(query, **kwargs)
+        # 進行異步檢索 (查詢的嵌入調用佔用一個上游名額)
+        async with upstream_scheduler.slot("gemini"):
+            docs = await retriever.ainvoke(query, **kwargs)
         
         # 將 Document 對象轉換為字典格式
         results = []
@@ -0,0 +1,51 @@
+"""
+每個會話各自的 AI 狀態 (角色狀態、當前任務、任務歷史)
+
+過去這些狀態放在全域共用的 AIService 上，所有用戶共用同一份角色狀態，
+一個用戶觸發的任務與心情變化會影響其他用戶。現在每個會話持有自己的 AISessionState，
+調用 AIService.generate_response 時傳入，並隨會話狀態一起保存。
+"""
+
+import copy
+from typing import Any, Dict, List, Optional
+
+# 新會話的初始角色狀態
+INITIAL_CHARACTER_STATE = {
+    "health": 100,
+    "mood": 70,
+    "energy": 80,
+    "task_success": 0,
+    "days_in_space": 1
+}
+
+
+class AISessionState:
+    """單一會話的角色狀態與任務記錄"""
+
+    __slots__ = ("character_state", "current_task", "tasks_history")
+
+    def __init__(
+        self,
+        character_state: Optional[Dict[str, Any]] = None,
+        current_task: Optional[str] = None,
+        tasks_history: Optional[List[Dict[str, Any]]] = None
+    ):
+        self.character_state: Dict[str, Any] = character_state if character_state is not None else INITIAL_CHARACTER_STATE.copy()
+        self.current_task = current_task
+        self.tasks_history: List[Dict[str, Any]] = tasks_history if tasks_history is not None else []
+
+    def to_dict(self) -> Dict[str, Any]:
+        """可序列化為 JSON 的狀態"""
+        return {
+            "character_state": dict(self.character_state),
+            "current_task": self.current_task,
+            "tasks_history": copy.deepcopy(self.tasks_history),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]) -> "AISessionState":
+        """從 to_dict() 的結果恢復，缺少的欄位使用初始值"""
+        data = data or {}
+        character_state = INITIAL_CHARACTER_STATE.copy()
+        character_state.update(data.get("character_state") or {})
+        return cls(character_state, data.get("current_task"), list(data.get("tasks_history") or []))
@@ -0,0 +1,230 @@
+"""
+直播房間的觀眾留言聚合
+
+觀眾很多時，每則留言各跑一次 DialogueGraph 回合既負擔不起也不好看。房間會話以此取代入站佇列：
+回答進行中收到的留言先累積，下一個回合開始時 (第一則留言起至少等待一個聚合視窗) 一次整理：
+
+1. 去除近似重複的留言 (正規化後的字元 bigram 相似度)，重複的留言併入同一組並記錄附和的觀眾
+2. 依新近程度、相對於最近對話的新穎程度與觀眾多樣性 (附和人數、同一觀眾已被選中的次數) 排序
+3. composite 模式把前幾組合成一則綜合留言；top_n 模式只挑出前 N 個問題
+
+每個回合只調用一次 LLM，「每次 LLM 調用回應的留言數」即為可調整的指標。
+"""
+
+import asyncio
+import logging
+import math
+import re
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+from core.config import settings
+from services.inbound_queue import TURN_TEXT_KEYS
+
+logger = logging.getLogger("audience_aggregator")
+
+# 排序權重
+RECENCY_WEIGHT = 0.3
+NOVELTY_WEIGHT = 0.4
+DIVERSITY_WEIGHT = 0.3
+
+# 計算新穎程度時比較的最近對話則數
+NOVELTY_HISTORY_LENGTH = 10
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def normalize_text(text: str) -> str:
+    """去除空白與標點並轉為小寫，用於比較留言"""
+    return _NON_WORD.sub("", text.lower())
+
+
+def _bigrams(text: str) -> Set[str]:
+    if len(text) < 2:
+        return {text} if text else set()
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def text_similarity(a: str, b: str) -> float:
+    """兩則正規化後留言的相似度 (0-1)：互相包含視為相同，否則為字元 bigram 的 Jaccard 係數"""
+    if not a or not b:
+        return 0.0
+    if a in b or b in a:
+        return 1.0
+    grams_a, grams_b = _bigrams(a), _bigrams(b)
+    return len(grams_a & grams_b) / len(grams_a | grams_b)
+
+
+class _Cluster:
+    """一組近似重複的留言"""
+
+    __slots__ = ("text", "normalized", "senders", "count", "first_sender", "last_at")
+
+    def __init__(self, text: str, normalized: str, sender: Optional[str], received_at: float):
+        self.text = text
+        self.normalized = normalized
+        self.senders: Set[str] = {sender} if sender else set()
+        self.count = 1
+        self.first_sender = sender
+        self.last_at = received_at
+
+
+class AudienceAggregator:
+    """聚合直播房間的觀眾留言 (與 InboundQueue 相同的 put / next_turn 介面)"""
+
+    def __init__(
+        self,
+        recent_history: Callable[[], Iterable[Dict[str, Any]]],
+        window: Optional[float] = None,
+        max_pending: Optional[int] = None,
+        mode: Optional[str] = None,
+        top_n: Optional[int] = None,
+        duplicate_threshold: Optional[float] = None
+    ):
+        """
+        Args:
+            recent_history: 返回房間對話歷史的函數 (用於計算新穎程度)
+            window: 聚合視窗 (秒)，從第一則待處理留言起算
+            max_pending: 待處理留言上限，滿時捨棄最舊的留言
+            mode: "composite" (合成一則綜合留言) 或 "top_n" (只挑出前 N 個問題)
+            top_n: 每個回合最多回應的留言組數
+            duplicate_threshold: 視為重複的相似度門檻
+        """
+        self.recent_history = recent_history
+        self.window = settings.LIVE_ROOM_AGGREGATION_WINDOW if window is None else window
+        self.max_pending = max_pending or settings.LIVE_ROOM_MAX_PENDING_MESSAGES
+        self.mode = (mode or settings.LIVE_ROOM_AGGREGATION_MODE).lower()
+        self.top_n = top_n or settings.LIVE_ROOM_AGGREGATION_TOP_N
+        self.duplicate_threshold = settings.LIVE_ROOM_DUPLICATE_THRESHOLD if duplicate_threshold is None else duplicate_threshold
+        self._pending: List[Dict[str, Any]] = []  # {"text", "sender", "received_at"}
+        self._arrived = asyncio.Event()
+
+        self.received = 0
+        self.dropped = 0
+        self.duplicates = 0
+        self.turns = 0
+        self.answered = 0
+        self.skipped = 0
+        self.max_depth = 0
+
+    def depth(self) -> int:
+        return len(self._pending)
+
+    async def put(self, message: Dict[str, Any]) -> None:
+        """放入一則觀眾留言 (不等待；待處理留言已滿時捨棄最舊的一則)"""
+        text = message.get(TURN_TEXT_KEYS.get(message.get("type"), "message"))
+        if not isinstance(text, str) or not text.strip():
+            return
+        self.received += 1
+        if len(self._pending) >= self.max_pending:
+            self._pending.pop(0)
+            self.dropped += 1
+        self._pending.append({"text": text.strip(), "sender": message.get("sender"), "received_at": time.monotonic()})
+        self.max_depth = max(self.max_depth, len(self._pending))
+        self._arrived.set()
+
+    async def next_turn(self) -> Dict[str, Any]:
+        """等待留言並在聚合視窗結束後，返回一個回合的 chat-message"""
+        while not self._pending:
+            self._arrived.clear()
+            await self._arrived.wait()
+        delay = self._pending[0]["received_at"] + self.window - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        pending, self._pending = self._pending, []
+
+        clusters = self._cluster(pending)
+        limit = self.top_n if self.mode == "top_n" else settings.LIVE_ROOM_COMPOSITE_MAX
+        selected = self._rank(clusters, limit)
+        answered = sum(cluster.count for cluster in selected)
+        self.turns += 1
+        self.answered += answered
+        self.skipped += len(pending) - answered
+        logger.info(f"聚合 {len(pending)} 則留言為 {len(clusters)} 組，本回合回應 {len(selected)} 組 ({answered} 則)")
+
+        return {
+            "type": "chat-message",
+            "message": self._compose(selected, len(pending)),
+            "aggregated": len(pending),
+            "audience": [
+                {"text": cluster.text, "count": cluster.count, "senders": len(cluster.senders)} for cluster in selected
+            ],
+        }
+
+    def _cluster(self, pending: List[Dict[str, Any]]) -> List[_Cluster]:
+        """把近似重複的留言併為一組"""
+        clusters: List[_Cluster] = []
+        for item in pending:
+            normalized = normalize_text(item["text"])
+            for cluster in clusters:
+                if text_similarity(normalized, cluster.normalized) >= self.duplicate_threshold:
+                    cluster.count += 1
+                    if item["sender"]:
+                        cluster.senders.add(item["sender"])
+                    cluster.last_at = item["received_at"]
+                    self.duplicates += 1
+                    break
+            else:
+                clusters.append(_Cluster(item["text"], normalized, item["sender"], item["received_at"]))
+        return clusters
+
+    def _rank(self, clusters: List[_Cluster], limit: int) -> List[_Cluster]:
+        """依新近程度、新穎程度與觀眾多樣性逐一挑選，同一觀眾每被選中一次，其他留言的分數就降低"""
+        if not clusters:
+            return []
+        # 新近程度以最新一則留言為基準，至少以一個聚合視窗為尺度 (同一波湧入的留言幾乎同分)
+        latest = max(cluster.last_at for cluster in clusters)
+        span = max(latest - min(cluster.last_at for cluster in clusters), self.window)
+        history = [
+            normalize_text(entry.get("content") or "")
+            for entry in list(self.recent_history())[-NOVELTY_HISTORY_LENGTH:]
+        ]
+        max_support = math.log1p(max(max(len(cluster.senders), 1) for cluster in clusters))
+        base_scores = {}
+        for cluster in clusters:
+            recency = 1.0 - (latest - cluster.last_at) / span if span > 0 else 1.0
+            novelty = 1.0 - max((text_similarity(cluster.normalized, past) for past in history), default=0.0)
+            support = math.log1p(max(len(cluster.senders), 1)) / max_support if max_support > 0 else 1.0
+            base_scores[id(cluster)] = (RECENCY_WEIGHT * recency + NOVELTY_WEIGHT * novelty, support)
+
+        selected: List[_Cluster] = []
+        picks_by_sender: Dict[Optional[str], int] = {}
+        remaining = list(clusters)
+        while remaining and len(selected) < limit:
+            def score(cluster: _Cluster) -> float:
+                base, support = base_scores[id(cluster)]
+                repeat_penalty = 1.0 / (1 + picks_by_sender.get(cluster.first_sender, 0))
+                return base + DIVERSITY_WEIGHT * support * repeat_penalty
+            best = max(remaining, key=score)
+            remaining.remove(best)
+            selected.append(best)
+            picks_by_sender[best.first_sender] = picks_by_sender.get(best.first_sender, 0) + 1
+        return selected
+
+    def _compose(self, selected: List[_Cluster], total: int) -> str:
+        """組成交給 LLM 的用戶文字"""
+        if total == 1:
+            # 只有一則留言時原樣轉交
+            return selected[0].text
+        if self.mode == "top_n":
+            lines = [f"{index}. {cluster.text}" for index, cluster in enumerate(selected, 1)]
+            return "直播間觀眾的提問：\n" + "\n".join(lines) + "\n請在一次回覆中依序回答這些問題。"
+        lines = [
+            f"- {cluster.text}" + (f" (×{cluster.count})" if cluster.count > 1 else "")
+            for cluster in selected
+        ]
+        return f"直播間觀眾的留言 (共 {total} 則)：\n" + "\n".join(lines) + "\n請以一段自然的回覆回應大家。"
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "depth": self.depth(),
+            "max_depth": self.max_depth,
+            "received": self.received,
+            "dropped": self.dropped,
+            "duplicates": self.duplicates,
+            "turns": self.turns,
+            "answered": self.answered,
+            "skipped": self.skipped,
+            "answered_per_llm_call": round(self.answered / self.turns, 2) if self.turns else 0.0,
+        }
@@ -0,0 +1,289 @@
+"""
+音訊儲存 - 保存 TTS 產生的音訊，供 /audio-file/ 與 /audio/ 路由提供給客戶端。
+
+兩層結構：
+  1. 記憶體 LRU：有總位元組預算與 TTL，剛生成的音訊一律從這裡提供，不碰檔案系統
+  2. 磁碟溢出 (可選)：記憶體超出預算而被淘汰、但尚未過期的音訊，以背景執行緒寫入
+     溢出目錄，同樣受位元組預算與 TTL 限制，長時間運行下磁碟用量保持平穩
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from core.config import settings
+from services.task_supervisor import task_registry
+
+logger = logging.getLogger("audio_store")
+
+# 溢出檔案的副檔名，啟動時只清理此類檔案
+SPILL_FILE_SUFFIX = ".spill"
+# 兩次過期清掃之間的最小間隔 (秒)
+SWEEP_INTERVAL_SECONDS = 30
+
+
+class AudioBlob:
+    """一段已保存的音訊"""
+
+    __slots__ = ("key", "data", "media_type", "etag", "created_at")
+
+    def __init__(self, key: str, data: bytes, media_type: str, etag: str, created_at: float):
+        self.key = key
+        self.data = data
+        self.media_type = media_type
+        self.etag = etag
+        self.created_at = created_at
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+
+class _SpilledAudio:
+    """已溢出到磁碟的音訊索引項 (內容不在記憶體中)"""
+
+    __slots__ = ("key", "path", "size", "media_type", "etag", "created_at")
+
+    def __init__(self, blob: AudioBlob, path: str):
+        self.key = blob.key
+        self.path = path
+        self.size = blob.size
+        self.media_type = blob.media_type
+        self.etag = blob.etag
+        self.created_at = blob.created_at
+
+
+def compute_etag(data: bytes) -> str:
+    """以內容雜湊產生強 ETag (含雙引號)"""
+    return '"' + hashlib.blake2b(data, digest_size=16).hexdigest() + '"'
+
+
+def _write_file(path: str, data: bytes) -> None:
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _read_file(path: str) -> Optional[bytes]:
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class AudioStore:
+    """記憶體 LRU + 可選磁碟溢出的音訊儲存"""
+
+    def __init__(
+        self,
+        max_bytes: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        spill_dir: Optional[str] = None,
+        spill_max_bytes: Optional[int] = None
+    ):
+        """
+        初始化音訊儲存
+
+        Args:
+            max_bytes: 記憶體層總位元組預算 (預設讀取配置)
+            ttl_seconds: 音訊保存時間，超過後兩層都會移除 (預設讀取配置)
+            spill_dir: 磁碟溢出目錄，None 表示停用溢出 (預設讀取配置)
+            spill_max_bytes: 磁碟溢出層總位元組預算 (預設讀取配置)
+        """
+        self.max_bytes = max_bytes if max_bytes is not None else settings.AUDIO_STORE_MAX_BYTES
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.AUDIO_STORE_TTL_SECONDS
+        self.spill_dir = spill_dir if spill_dir is not None else settings.AUDIO_STORE_SPILL_DIR
+        self.spill_max_bytes = spill_max_bytes if spill_max_bytes is not None else settings.AUDIO_STORE_SPILL_MAX_BYTES
+
+        self._memory: "OrderedDict[str, AudioBlob]" = OrderedDict()
+        self._memory_bytes = 0
+        # 正在寫入磁碟的音訊，寫入完成前仍可從這裡讀取
+        self._spilling: Dict[str, AudioBlob] = {}
+        # 已寫入磁碟的音訊，依寫入順序排列 (最舊的在前)
+        self._spilled: "OrderedDict[str, _SpilledAudio]" = OrderedDict()
+        self._spilled_bytes = 0
+        self._last_sweep = time.monotonic()
+
+        self.memory_hits = 0
+        self.spill_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        if self.spill_dir:
+            self._prepare_spill_dir()
+
+    def _prepare_spill_dir(self) -> None:
+        """建立溢出目錄並清除上次運行留下的檔案 (它們不在索引中，無法被提供)"""
+        os.makedirs(self.spill_dir, exist_ok=True)
+        removed = 0
+        for name in os.listdir(self.spill_dir):
+            if name.endswith(SPILL_FILE_SUFFIX) or name.endswith(SPILL_FILE_SUFFIX + ".tmp"):
+                _remove_file(os.path.join(self.spill_dir, name))
+                removed += 1
+        if removed:
+            logger.info(f"已清除 {removed} 個舊的音訊溢出檔案: {self.spill_dir}")
+
+    def put(self, audio_bytes: bytes, filename: str, media_type: str = "audio/mpeg") -> str:
+        """
+        保存一段音訊
+
+        Args:
+            audio_bytes: 原始音訊
+            filename: 客戶端用來取回音訊的檔名 (需唯一)
+            media_type: 音訊 MIME 類型
+
+        Returns:
+            可供客戶端訪問的 /audio-file/ URL
+        """
+        now = time.monotonic()
+        self._discard(filename)
+        blob = AudioBlob(filename, audio_bytes, media_type, compute_etag(audio_bytes), now)
+        self._memory[filename] = blob
+        self._memory_bytes += blob.size
+
+        if now - self._last_sweep >= SWEEP_INTERVAL_SECONDS:
+            self._sweep_expired(now)
+        self._enforce_memory_budget()
+        return f"/audio-file/{filename}"
+
+    async def get(self, filename: str) -> Optional[AudioBlob]:
+        """
+        取回音訊，依序查找記憶體、寫入中與磁碟溢出層
+
+        Returns:
+            AudioBlob，不存在或已過期時返回 None
+        """
+        now = time.monotonic()
+        blob = self._memory.get(filename)
+        if blob is not None:
+            if self._is_expired(blob.created_at, now):
+                self._discard(filename)
+                self.expirations += 1
+            else:
+                self._memory.move_to_end(filename)
+                self.memory_hits += 1
+                return blob
+
+        blob = self._spilling.get(filename)
+        if blob is not None and not self._is_expired(blob.created_at, now):
+            self.spill_hits += 1
+            return blob
+
+        spilled = self._spilled.get(filename)
+        if spilled is not None:
+            if self._is_expired(spilled.created_at, now):
+                self._discard(filename)
+                self.expirations += 1
+            else:
+                data = await asyncio.to_thread(_read_file, spilled.path)
+                if data is not None:
+                    self.spill_hits += 1
+                    return AudioBlob(spilled.key, data, spilled.media_type, spilled.etag, spilled.created_at)
+                logger.warning(f"音訊溢出檔案遺失: {spilled.path}")
+                self._discard(filename)
+
+        self.misses += 1
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        """返回儲存的統計資訊"""
+        return {
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "memory_max_bytes": self.max_bytes,
+            "spill_enabled": bool(self.spill_dir),
+            "spill_entries": len(self._spilled) + len(self._spilling),
+            "spill_bytes": self._spilled_bytes,
+            "spill_max_bytes": self.spill_max_bytes,
+            "memory_hits": self.memory_hits,
+            "spill_hits": self.spill_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def _is_expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - created_at > self.ttl_seconds
+
+    def _discard(self, filename: str) -> None:
+        """從所有層移除一段音訊"""
+        blob = self._memory.pop(filename, None)
+        if blob is not None:
+            self._memory_bytes -= blob.size
+        self._spilling.pop(filename, None)
+        spilled = self._spilled.pop(filename, None)
+        if spilled is not None:
+            self._spilled_bytes -= spilled.size
+            self._schedule(asyncio.to_thread(_remove_file, spilled.path))
+
+    def _sweep_expired(self, now: float) -> None:
+        """移除所有已過期的音訊"""
+        self._last_sweep = now
+        expired = [key for key, blob in self._memory.items() if self._is_expired(blob.created_at, now)]
+        expired.extend(key for key, spilled in self._spilled.items() if self._is_expired(spilled.created_at, now))
+        for key in expired:
+            self._discard(key)
+        if expired:
+            self.expirations += len(expired)
+            logger.debug(f"已清除 {len(expired)} 段過期音訊")
+
+    def _enforce_memory_budget(self) -> None:
+        """淘汰最久未使用的音訊直到記憶體層回到預算內，可溢出時寫入磁碟"""
+        while self._memory_bytes > self.max_bytes and len(self._memory) > 1:
+            key, blob = self._memory.popitem(last=False)
+            self._memory_bytes -= blob.size
+            self.evictions += 1
+            if self.spill_dir and blob.size <= self.spill_max_bytes:
+                self._spilling[key] = blob
+                self._schedule(self._spill(blob))
+
+    async def _spill(self, blob: AudioBlob) -> None:
+        """在背景執行緒把被淘汰的音訊寫入磁碟，並維持溢出層預算"""
+        path = os.path.join(self.spill_dir, hashlib.sha1(blob.key.encode("utf-8")).hexdigest() + SPILL_FILE_SUFFIX)
+        try:
+            await asyncio.to_thread(_write_file, path, blob.data)
+        except Exception as e:
+            logger.error(f"寫入音訊溢出檔案失敗 ({blob.key}): {e}", exc_info=True)
+            self._spilling.pop(blob.key, None)
+            return
+
+        if self._spilling.get(blob.key) is not blob:
+            # 寫入期間已被移除或覆蓋
+            await asyncio.to_thread(_remove_file, path)
+            return
+        del self._spilling[blob.key]
+        self._spilled[blob.key] = _SpilledAudio(blob, path)
+        self._spilled_bytes += blob.size
+
+        while self._spilled_bytes > self.spill_max_bytes and self._spilled:
+            _, oldest = self._spilled.popitem(last=False)
+            self._spilled_bytes -= oldest.size
+            self.evictions += 1
+            await asyncio.to_thread(_remove_file, oldest.path)
+
+    def _schedule(self, coro) -> None:
+        """在事件循環中執行背景 I/O；沒有運行中的事件循環時直接放棄"""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            coro.close()
+            return
+        task_registry.spawn(coro, "audio_store_io")
+
+
+# 全域共享的音訊儲存
+audio_store = AudioStore()
@@ -0,0 +1,222 @@
+"""
+上游客戶端註冊表 - 整個應用共用一組 OpenAI / Google 客戶端。
+
+過去 AIService、TextToSpeechService、SpeechToTextService 在每個端點模組各建一份，
+工具節點甚至每次調用都重新建立 Gemini 客戶端，導致行程中存在多個連線池，
+每個都要各自完成 DNS 查詢與 TLS 握手。現在：
+
+  - OpenAI (TTS / Whisper) 共用一個 AsyncOpenAI 與其 httpx 連線池，
+    連線數、keep-alive 依配置調整，安裝 h2 時啟用 HTTP/2
+  - Gemini 聊天模型以參數為鍵快取，每組參數建立一個經過驗證的實例
+  - 嵌入模型依模型名稱快取
+  - 啟動時 prewarm() 預先建立連線 (DNS + TLS)，第一輪對話不必負擔冷啟動；
+    OpenAI 預設只預先完成 DNS 查詢，帶金鑰的 GET /models 需以 UPSTREAM_PREWARM_OPENAI_REQUEST 開啟
+"""
+
+import asyncio
+import importlib.util
+import logging
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+import openai
+
+from core.config import settings
+
+logger = logging.getLogger("upstream_clients")
+
+# Gemini API 主機，gRPC 通道無法取得時至少預先完成 DNS 查詢
+GOOGLE_API_HOST = "generativelanguage.googleapis.com"
+DEFAULT_EMBEDDING_MODEL = "models/embedding-001"
+
+
+def _http2_available() -> bool:
+    """httpx 的 HTTP/2 支援需要額外安裝 h2 套件"""
+    return importlib.util.find_spec("h2") is not None
+
+
+def _grpc_channel(client: Any) -> Any:
+    """取得 GAPIC 客戶端底層的 gRPC 通道 (REST 傳輸時返回 None)"""
+    transport = getattr(client, "transport", None)
+    return getattr(transport, "grpc_channel", None)
+
+
+class UpstreamClientRegistry:
+    """應用範圍的上游客戶端註冊表，所有客戶端延遲建立並重複使用"""
+
+    def __init__(self):
+        self.http2 = settings.UPSTREAM_HTTP2 and _http2_available()
+        if settings.UPSTREAM_HTTP2 and not self.http2:
+            logger.info("未安裝 h2 套件，上游連線使用 HTTP/1.1 keep-alive")
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self._openai_client: Optional[openai.AsyncOpenAI] = None
+        self._chat_models: Dict[Tuple, Any] = {}
+        self._embeddings: Dict[str, Any] = {}
+        self.prewarm_results: Dict[str, Any] = {}
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=settings.UPSTREAM_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.UPSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.UPSTREAM_KEEPALIVE_EXPIRY
+        )
+
+    def _timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(settings.UPSTREAM_READ_TIMEOUT, connect=settings.UPSTREAM_CONNECT_TIMEOUT)
+
+    def http_client(self) -> httpx.AsyncClient:
+        """共用的 httpx 連線池 (沿用 OpenAI SDK 的預設行為，只調整連線限制與逾時)"""
+        if self._http_client is None:
+            self._http_client = openai.DefaultAsyncHttpxClient(
+                http2=self.http2,
+                limits=self._limits(),
+                timeout=self._timeout()
+            )
+        return self._http_client
+
+    def openai_client(self) -> Optional[openai.AsyncOpenAI]:
+        """共用的 AsyncOpenAI 客戶端，沒有 API 金鑰時返回 None"""
+        if self._openai_client is None and settings.OPENAI_API_KEY:
+            self._openai_client = openai.AsyncOpenAI(
+                api_key=settings.OPENAI_API_KEY,
+                http_client=self.http_client()
+            )
+            logger.info(f"已建立共用 OpenAI 客戶端 (HTTP/2: {self.http2})")
+        return self._openai_client
+
+    def chat_model(
+        self,
+        model: str,
+        temperature: float,
+        top_p: Optional[float] = None,
+        top_k: Optional[int] = None,
+        max_output_tokens: Optional[int] = None
+    ):
+        """
+        取得 Gemini 聊天模型，相同參數返回同一個實例
+
+        每組參數都以建構子建立 (經過參數驗證)，共用同一份基礎設定 (API 金鑰)。
+        """
+        # 延遲匯入：只使用語音服務時不需要載入 Google SDK
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        if "/" not in model:
+            model = f"models/{model}"
+        key = (model, temperature, top_p, top_k, max_output_tokens)
+        llm = self._chat_models.get(key)
+        if llm is not None:
+            return llm
+
+        params = {
+            "model": model,
+            "temperature": temperature,
+            "top_p": top_p,
+            "top_k": top_k,
+            "max_output_tokens": max_output_tokens,
+        }
+        base_kwargs = {"google_api_key": settings.GOOGLE_API_KEY}
+        llm = ChatGoogleGenerativeAI(**{**base_kwargs, **params})
+        logger.info(f"已建立 Gemini 聊天模型 ({model}, temperature={temperature})")
+        self._chat_models[key] = llm
+        return llm
+
+    def embeddings(self, model: str = DEFAULT_EMBEDDING_MODEL):
+        """取得 Gemini 嵌入模型，相同模型返回同一個實例"""
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+        embeddings = self._embeddings.get(model)
+        if embeddings is None:
+            embeddings = GoogleGenerativeAIEmbeddings(model=model, google_api_key=settings.GOOGLE_API_KEY)
+            self._embeddings[model] = embeddings
+        return embeddings
+
+    async def prewarm(self, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        為已建立的客戶端預先完成 DNS 查詢與 TLS 握手
+
+        只預熱已經被服務取用的客戶端 (例如使用本地語音替身時不會連線 OpenAI)。
+        任何失敗只記錄警告，不影響服務啟動。
+
+        Returns:
+            目標名稱 -> 耗時 (秒) 或錯誤訊息
+        """
+        targets = {}
+        if self._openai_client is not None:
+            targets["openai"] = self._prewarm_openai()
+        grpc_clients = [llm.client for llm in self._chat_models.values()] + [e.client for e in self._embeddings.values()]
+        for index, client in enumerate(grpc_clients):
+            targets[f"google-{index}"] = self._prewarm_grpc(client)
+        if not targets:
+            return {}
+
+        async def timed(name, coro):
+            started = time.perf_counter()
+            try:
+                await coro
+                return name, round(time.perf_counter() - started, 3)
+            except Exception as e:
+                logger.warning(f"預熱上游連線失敗 ({name}): {e}")
+                return name, f"error: {e}"
+
+        names = list(targets)
+        try:
+            results = await asyncio.wait_for(
+                asyncio.gather(*(timed(name, coro) for name, coro in targets.items())),
+                timeout or settings.UPSTREAM_PREWARM_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"預熱上游連線逾時: {', '.join(names)}")
+            results = [(name, "timeout") for name in names]
+        self.prewarm_results = dict(results)
+        logger.info(f"上游連線預熱完成: {self.prewarm_results}")
+        return self.prewarm_results
+
+    async def _prewarm_openai(self) -> None:
+        base_url = str(self._openai_client.base_url)
+        if not settings.UPSTREAM_PREWARM_OPENAI_REQUEST:
+            # 不對外發出帶金鑰的請求，只預先完成 DNS 查詢
+            loop = asyncio.get_running_loop()
+            await loop.getaddrinfo(httpx.URL(base_url).host, 443)
+            return
+        # 對 API 主機發出不計費的請求；回應狀態不重要，重點是留下一條已完成 TLS 的 keep-alive 連線
+        await self.http_client().get(
+            base_url.rstrip("/") + "/models",
+            headers={"Authorization": f"Bearer {settings.OPENAI_API_KEY}"}
+        )
+
+    async def _prewarm_grpc(self, client: Any) -> None:
+        channel = _grpc_channel(client)
+        if channel is None:
+            loop = asyncio.get_running_loop()
+            await loop.getaddrinfo(GOOGLE_API_HOST, 443)
+            return
+        import grpc
+        # 同步通道：等待連線就緒 (包含 DNS 與 TLS 握手)
+        await asyncio.to_thread(grpc.channel_ready_future(channel).result, settings.UPSTREAM_PREWARM_TIMEOUT)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回已建立的客戶端數量與預熱結果"""
+        pool = None
+        if self._http_client is not None:
+            pool = getattr(self._http_client, "_transport", None)
+            pool = getattr(pool, "_pool", None)
+        return {
+            "http2": self.http2,
+            "openai_client": self._openai_client is not None,
+            "http_connections": len(pool.connections) if pool is not None else 0,
+            "chat_models": len(self._chat_models),
+            "embeddings": len(self._embeddings),
+            "prewarm": self.prewarm_results,
+        }
+
+    async def aclose(self) -> None:
+        """關閉共用的 HTTP 連線池"""
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+            self._openai_client = None
+
+
+# 全域共享的上游客戶端註冊表
+upstream_clients = UpstreamClientRegistry()
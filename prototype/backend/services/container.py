@@ -0,0 +1,97 @@
+"""
+服務容器 - 重量級服務在整個應用中只建立一次
+
+過去 websocket.py 與 speech.py 各自在匯入時建立 AIService，行程中因此有兩個 MemorySystem、
+兩組指向相同目錄的 Chroma 向量庫、兩個嵌入模型客戶端與兩份編譯好的 LangGraph。
+現在所有端點都從這個容器取得服務：第一次取用時建立 (或在啟動時由 startup() 預先建立)，
+之後一律返回同一個實例。每個會話的 AI 狀態不放在服務上，見 services/ai/session_state.py。
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger("service_container")
+
+
+class ServiceContainer:
+    """延遲建立並快取應用範圍的服務實例"""
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._instances: Dict[str, Any] = {}
+        self._build_seconds: Dict[str, float] = {}
+        self._lock = threading.RLock()  # 匯入時與執行緒中的取用都可能觸發建立
+
+    def register(self, name: str, factory: Callable[[], Any]) -> None:
+        """登記服務的建立函數 (已建立的實例不受影響)"""
+        self._factories[name] = factory
+
+    def get(self, name: str) -> Any:
+        """取得服務，第一次取用時建立"""
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        with self._lock:
+            instance = self._instances.get(name)
+            if instance is None:
+                if name not in self._factories:
+                    raise KeyError(f"未登記的服務: {name}")
+                started = time.perf_counter()
+                instance = self._factories[name]()
+                self._build_seconds[name] = round(time.perf_counter() - started, 3)
+                self._instances[name] = instance
+                logger.info(f"已建立服務 {name} ({self._build_seconds[name]}s)")
+        return instance
+
+    def startup(self) -> None:
+        """預先建立所有已登記的服務，避免第一個請求負擔初始化時間"""
+        for name in self._factories:
+            self.get(name)
+
+    @property
+    def ai_service(self):
+        return self.get("ai_service")
+
+    @property
+    def tts_service(self):
+        return self.get("tts_service")
+
+    @property
+    def stt_service(self):
+        return self.get("stt_service")
+
+    def stats(self) -> Dict[str, Any]:
+        """返回已建立的服務與其建立耗時"""
+        return {
+            "registered": list(self._factories),
+            "built": dict(self._build_seconds),
+        }
+
+
+def _build_ai_service():
+    from services.ai import AIService
+    from services.murmur_batcher import murmur_batcher
+
+    ai_service = AIService()
+    # 跨會話批次生成 murmur 使用同一個 AIService
+    murmur_batcher.generate_batch = ai_service.generate_murmur_batch
+    return ai_service
+
+
+def _build_tts_service():
+    from services.text_to_speech import TextToSpeechService
+    return TextToSpeechService()
+
+
+def _build_stt_service():
+    from services.speech_to_text import SpeechToTextService
+    return SpeechToTextService()
+
+
+# 全域共享的服務容器
+container = ServiceContainer()
+container.register("ai_service", _build_ai_service)
+container.register("tts_service", _build_tts_service)
+container.register("stt_service", _build_stt_service)
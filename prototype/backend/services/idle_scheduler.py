@@ -0,0 +1,133 @@
+"""
+全域截止時間排程器 - 取代每個連線各自輪詢的 idle_checker。
+
+每個連線只登記「下一次可以 murmur 的時間」，排程器以最小堆保存所有截止時間，
+並只在事件迴圈上掛一個計時器指向最早的截止時間。沒有到期的連線完全不會被喚醒，
+因此閒置時的 CPU 使用與連線數無關。
+
+到期時排程器以獨立任務執行該連線的回調；回調自行檢查條件，
+需要時再登記下一次截止時間。同一個鍵重新登記會取代舊的截止時間 (舊項目惰性刪除)。
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from services.task_supervisor import task_registry
+
+logger = logging.getLogger("idle_scheduler")
+
+# 事件迴圈的計時器可能略早觸發，容許的誤差 (秒)
+_FIRE_TOLERANCE = 0.001
+
+
+class DeadlineScheduler:
+    """以最小堆實作的截止時間排程器，所有時間皆為 time.monotonic() 秒數"""
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        # 鍵 -> (截止時間, 序號, 回調)；堆中序號不符的項目視為已失效
+        self._entries: Dict[Hashable, Tuple[float, int, Callable[[], Awaitable[None]]]] = {}
+        self._running: Dict[Hashable, asyncio.Task] = {}
+        self._counter = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_deadline: Optional[float] = None
+        self.fired = 0
+        self.wakeups = 0
+
+    def schedule(self, key: Hashable, deadline: float, callback: Callable[[], Awaitable[None]]) -> None:
+        """
+        登記 (或取代) 某個鍵的截止時間
+
+        Args:
+            key: 連線識別
+            deadline: time.monotonic() 時間點
+            callback: 到期時以獨立任務執行的協程函數
+        """
+        seq = next(self._counter)
+        self._entries[key] = (deadline, seq, callback)
+        heapq.heappush(self._heap, (deadline, seq, key))
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._compact()
+        self._arm()
+
+    def cancel(self, key: Hashable) -> None:
+        """移除某個鍵的截止時間，並取消其正在執行的回調"""
+        self._entries.pop(key, None)
+        task = self._running.pop(key, None)
+        if task is not None and not task.done():
+            task.cancel()
+
+    def _compact(self) -> None:
+        """重建堆，丟棄被取代或取消的項目"""
+        self._heap = [(deadline, seq, key) for key, (deadline, seq, _) in self._entries.items()]
+        heapq.heapify(self._heap)
+
+    def _drop_stale(self) -> None:
+        while self._heap:
+            _, seq, key = self._heap[0]
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] == seq:
+                return
+            heapq.heappop(self._heap)
+
+    def _arm(self) -> None:
+        """讓事件迴圈計時器指向最早的有效截止時間"""
+        self._drop_stale()
+        if not self._heap:
+            return
+        deadline = self._heap[0][0]
+        if self._timer is not None:
+            if self._timer_deadline <= deadline:
+                # 現有計時器不晚於最早的截止時間；即使它對應的項目已失效，觸發後也會重新設定
+                return
+            self._timer.cancel()
+        loop = asyncio.get_running_loop()
+        self._timer = loop.call_at(loop.time() + max(0.0, deadline - time.monotonic()), self._fire)
+        self._timer_deadline = deadline
+
+    def _fire(self) -> None:
+        self._timer = None
+        self._timer_deadline = None
+        self.wakeups += 1
+        now = time.monotonic() + _FIRE_TOLERANCE
+        while self._heap and self._heap[0][0] <= now:
+            _, seq, key = heapq.heappop(self._heap)
+            entry = self._entries.get(key)
+            if entry is None or entry[1] != seq:
+                continue
+            del self._entries[key]
+            self.fired += 1
+            self._running[key] = task_registry.spawn(self._run(key, entry[2]), "murmur_timer")
+        self._arm()
+
+    async def _run(self, key: Hashable, callback: Callable[[], Awaitable[None]]) -> None:
+        try:
+            await callback()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"截止時間回調執行失敗 ({key}): {e}", exc_info=True)
+        finally:
+            if self._running.get(key) is asyncio.current_task():
+                del self._running[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """返回已登記的截止時間數量與觸發統計"""
+        self._drop_stale()
+        next_deadline = self._heap[0][0] if self._heap else None
+        return {
+            "scheduled": len(self._entries),
+            "heap_size": len(self._heap),
+            "running": len(self._running),
+            "fired": self.fired,
+            "wakeups": self.wakeups,
+            "next_due_in": round(next_deadline - time.monotonic(), 3) if next_deadline is not None else None,
+        }
+
+
+# 全域共享的 murmur 排程器
+murmur_scheduler = DeadlineScheduler()
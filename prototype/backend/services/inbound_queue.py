@@ -0,0 +1,111 @@
+"""
+每個會話的入站訊息佇列與合併策略
+
+接收迴圈只負責讀取 WebSocket 並把用戶訊息放入佇列；分派任務從佇列取出訊息，
+在短暫的合併視窗內把連續到達的同類訊息合併為一個回合，再交給 AI 流程。
+打字很快的用戶或前端分段送出的訊息因此只觸發一次 LLM / TTS，而不是每段各跑一次。
+"""
+
+import asyncio
+from typing import Any, Dict, Optional
+
+from core.config import settings
+
+# 各回合訊息類型存放用戶文字的鍵
+TURN_TEXT_KEYS = {
+    "message": "content",
+    "chat-message": "message",
+}
+
+
+class InboundQueue:
+    """有上限的入站佇列，取出時合併視窗內的同類訊息"""
+
+    def __init__(
+        self,
+        maxsize: Optional[int] = None,
+        window: Optional[float] = None,
+        max_wait: Optional[float] = None,
+        max_messages: Optional[int] = None
+    ):
+        """
+        Args:
+            maxsize: 佇列上限，滿時接收迴圈等待 (對客戶端形成背壓)
+            window: 合併視窗 (秒)，每收到一則可合併的訊息就延長一次；0 表示只合併已在佇列中的訊息
+            max_wait: 從第一則訊息起最多等待的時間 (秒)
+            max_messages: 一個回合最多合併的訊息數
+        """
+        self.window = settings.WS_INBOUND_COALESCE_WINDOW if window is None else window
+        self.max_wait = settings.WS_INBOUND_COALESCE_MAX_WAIT if max_wait is None else max_wait
+        self.max_messages = max_messages or settings.WS_INBOUND_COALESCE_MAX_MESSAGES
+        self._queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(maxsize or settings.WS_INBOUND_QUEUE_MAX)
+        self._pending: Optional[Dict[str, Any]] = None  # 取出後無法合併、留給下一個回合的訊息
+
+        self.received = 0
+        self.turns = 0
+        self.coalesced = 0
+        self.max_depth = 0
+
+    def depth(self) -> int:
+        """尚未處理的訊息數"""
+        return self._queue.qsize() + (1 if self._pending is not None else 0)
+
+    async def put(self, message: Dict[str, Any]) -> None:
+        """放入一則用戶訊息 (佇列滿時等待)"""
+        await self._queue.put(message)
+        self.received += 1
+        self.max_depth = max(self.max_depth, self.depth())
+
+    async def next_turn(self) -> Dict[str, Any]:
+        """
+        取出下一個回合的訊息
+
+        合併視窗內連續到達的同類訊息，文字以換行連接；其他欄位沿用最後一則訊息。
+        遇到不同類型的訊息時停止合併，該訊息留給下一個回合。
+        """
+        if self._pending is not None:
+            first, self._pending = self._pending, None
+        else:
+            first = await self._queue.get()
+
+        message_type = first.get("type")
+        text_key = TURN_TEXT_KEYS.get(message_type)
+        merged = dict(first)
+        texts = [first.get(text_key)] if text_key else []
+        count = 1
+
+        loop = asyncio.get_running_loop()
+        hard_deadline = loop.time() + self.max_wait
+        while text_key and count < self.max_messages:
+            if not self._queue.empty():
+                following = self._queue.get_nowait()
+            else:
+                timeout = min(self.window, hard_deadline - loop.time())
+                if timeout <= 0:
+                    break
+                try:
+                    following = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            if following.get("type") != message_type:
+                self._pending = following
+                break
+            merged.update(following)
+            texts.append(following.get(text_key))
+            count += 1
+
+        if count > 1:
+            merged[text_key] = "\n".join(text for text in texts if text)
+            merged["coalesced"] = count
+            self.coalesced += count - 1
+        self.turns += 1
+        return merged
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "depth": self.depth(),
+            "max_depth": self.max_depth,
+            "received": self.received,
+            "turns": self.turns,
+            "coalesced": self.coalesced,
+        }
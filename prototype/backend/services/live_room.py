@@ -0,0 +1,149 @@
+"""
+直播房間：一個虛擬主播，多個觀眾
+
+一般連線各自執行完整的 AI / TTS 流程與 murmur；直播房間則只有一個會話 (房間會話)，
+擁有唯一的對話流程與角色狀態。每則機器人訊息、音訊與情緒軌跡只生成一次、每種編碼只序列化一次，
+再放入所有觀眾的出站佇列，由各連線的寫入任務同時送出；上游調用與 CPU 成本隨房間數而非觀眾數增長。
+
+觀眾的聊天訊息轉交房間會話，在回合之間聚合後一次回應 (不觸發 barge-in，見 services/audience_aggregator.py)；
+後加入的觀眾先收到房間狀態快照與最近一則機器人訊息和情緒軌跡 (沿用已序列化的結果)；
+二進位音訊幀不保留，進行中回覆的音訊不會補送給後加入的觀眾。
+"""
+
+import asyncio
+import logging
+from typing import TYPE_CHECKING, Any, Dict, Optional, Union
+
+from fastapi import WebSocketDisconnect
+
+from core.config import settings
+from utils.ws_codec import PreparedMessage
+
+if TYPE_CHECKING:
+    from services.session_manager import ConversationSession
+
+logger = logging.getLogger("live_room")
+
+# 後加入的觀眾會補收的訊息類型 (保留每種類型最近一則)
+SNAPSHOT_MESSAGE_TYPES = ("chat-message", "emotionalTrajectory")
+
+
+def room_session_id(room_id: str) -> str:
+    """房間會話的 id (用於會話狀態儲存與排程器)"""
+    return f"room-{room_id}"
+
+
+class RoomFanout:
+    """房間會話的出站介面 (與 OutboundQueue 相同的 send / send_bytes)，扇出到所有觀眾"""
+
+    def __init__(self, room: "LiveRoom"):
+        self.room = room
+        self.messages = 0
+        self.deliveries = 0
+
+    async def send(self, message: Union[Dict[str, Any], PreparedMessage]) -> None:
+        prepared = message if isinstance(message, PreparedMessage) else PreparedMessage(message)
+        message_type = prepared.message.get("type")
+        if message_type in SNAPSHOT_MESSAGE_TYPES:
+            self.room.recent[message_type] = prepared
+        self.messages += 1
+        for spectator in list(self.room.spectators.values()):
+            try:
+                await spectator.outbound.send(prepared)
+                self.deliveries += 1
+            except WebSocketDisconnect:
+                continue
+
+    async def send_bytes(self, frame: bytes) -> None:
+        self.messages += 1
+        for spectator in list(self.room.spectators.values()):
+            try:
+                await spectator.outbound.send_bytes(frame)
+                self.deliveries += 1
+            except WebSocketDisconnect:
+                continue
+
+    async def close(self) -> None:
+        """觀眾的出站佇列由各自的連線關閉"""
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "messages": self.messages,
+            "deliveries": self.deliveries,
+        }
+
+
+class LiveRoom:
+    """一個直播房間：房間會話、觀眾與待處理的觀眾訊息"""
+
+    def __init__(self, room_id: str, session: "ConversationSession"):
+        """
+        Args:
+            room_id: 房間 id
+            session: 房間會話 (其 outbound 已設為扇出)
+        """
+        self.room_id = room_id
+        self.session = session
+        self.spectators: Dict[str, "ConversationSession"] = {}
+        self.recent: Dict[str, PreparedMessage] = {}  # 最近一則機器人訊息與情緒軌跡
+        self._messages: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(settings.LIVE_ROOM_MAX_PENDING_MESSAGES)
+        self.task: Optional[asyncio.Task] = None  # 房間的對話流程
+
+        self.received = 0
+        self.dropped = 0
+        self.peak_spectators = 0
+
+    def add_spectator(self, session: "ConversationSession") -> None:
+        self.spectators[session.session_id] = session
+        self.peak_spectators = max(self.peak_spectators, len(self.spectators))
+
+    def remove_spectator(self, session_id: str) -> None:
+        self.spectators.pop(session_id, None)
+
+    def submit(self, message: Dict[str, Any]) -> None:
+        """轉交觀眾的聊天訊息，待處理的訊息已滿時捨棄"""
+        self.received += 1
+        try:
+            self._messages.put_nowait(message)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def next_message(self) -> Dict[str, Any]:
+        """房間對話流程的 receive()"""
+        return await self._messages.get()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """後加入的觀眾收到的房間狀態"""
+        session = self.session
+        return {
+            "type": "room-snapshot",
+            "roomId": self.room_id,
+            "viewers": len(self.spectators),
+            "history": list(session.history)[-settings.LIVE_ROOM_SNAPSHOT_HISTORY:],
+            "emotion": session.current_emotion,
+            "characterState": dict(session.ai_state.character_state),
+            "isSpeaking": session.is_speaking,
+            "options": session.options,
+        }
+
+    async def close(self) -> None:
+        """停止房間的對話流程 (流程結束時會保存房間會話狀態)"""
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "room_id": self.room_id,
+            "spectators": len(self.spectators),
+            "peak_spectators": self.peak_spectators,
+            "pending_messages": self._messages.qsize(),
+            "received": self.received,
+            "dropped": self.dropped,
+            "history_length": len(self.session.history),
+            "fanout": self.session.outbound.stats(),
+            "aggregator": self.session.inbound.stats(),
+        }
@@ -0,0 +1,136 @@
+"""
+跨會話批次生成 murmur
+
+每個閒置會話原本各自跑一次完整的 DialogueGraph (記憶檢索、工具意圖 LLM、主 LLM、關鍵幀 LLM)，
+閒置觀眾越多上游調用就越多。批次器在短暫的視窗內收集各會話的 murmur 請求，
+以一次 LLM 調用生成 N 句 murmur (各自附帶情境摘要與該會話的角色狀態)，再分發回各會話。
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from core.config import settings
+from services.task_supervisor import task_registry
+
+logger = logging.getLogger("murmur_batcher")
+
+# 情境摘要中保留的最近對話與 murmur 數量
+DIGEST_HISTORY_ENTRIES = 6
+DIGEST_RECENT_MURMURS = 3
+DIGEST_ENTRY_MAX_CHARS = 80
+
+
+def build_context_digest(history: Iterable[Dict[str, Any]], recent_murmurs: Iterable[str], emotion: str) -> str:
+    """把會話狀態壓縮成一段簡短的情境摘要 (批次提示中每個會話一段)"""
+    lines = [f"目前情緒: {emotion}"]
+    entries = list(history)[-DIGEST_HISTORY_ENTRIES:]
+    if entries:
+        lines.append("最近的互動:")
+        for entry in entries:
+            speaker = "觀眾" if entry["role"] == "user" else ("自言自語" if entry.get("is_murmur") else "角色")
+            lines.append(f"- {speaker}: {entry['content'][:DIGEST_ENTRY_MAX_CHARS]}")
+    murmurs = list(recent_murmurs)[-DIGEST_RECENT_MURMURS:]
+    if murmurs:
+        lines.append(f"最近的自言自語 (避免重複): {', '.join(murmurs)}")
+    return "\n".join(lines)
+
+
+class MurmurBatcher:
+    """收集各會話的 murmur 請求，合併為批次 LLM 調用"""
+
+    def __init__(
+        self,
+        generate_batch: Optional[Callable[[List[str], List[Any]], Awaitable[List[Optional[Dict[str, Any]]]]]] = None,
+        window: Optional[float] = None,
+        max_size: Optional[int] = None
+    ):
+        """
+        Args:
+            generate_batch: 接收情境摘要列表與等長的會話狀態列表、返回等長結果列表的協程函數
+                (例如 AIService.generate_murmur_batch)
+            window: 收集請求的視窗 (秒)
+            max_size: 每批最多的請求數，達到時立即送出
+        """
+        self.generate_batch = generate_batch
+        self.window = settings.MURMUR_BATCH_WINDOW_SECONDS if window is None else window
+        self.max_size = max_size or settings.MURMUR_BATCH_MAX_SIZE
+        self._pending: List[Tuple[str, Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._batches: Set[asyncio.Task] = set()
+
+        self.requests = 0
+        self.batches = 0
+        self.batched = 0  # 實際送出的請求數 (不含等待期間被取消的)
+        self.failures = 0
+        self.max_batch_size = 0
+
+    async def request(self, context: str, state: Any = None) -> Optional[Dict[str, Any]]:
+        """
+        請求一句 murmur，等待所在批次完成
+
+        Args:
+            context: build_context_digest 產生的情境摘要
+            state: 該會話的狀態 (AISessionState)，批次提示中使用它的角色狀態
+
+        Returns:
+            格式同 AIService.generate_response 的結果，生成失敗時返回 None
+        """
+        if self.generate_batch is None:
+            raise RuntimeError("MurmurBatcher 尚未設定 generate_batch")
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((context, state, future))
+        self.requests += 1
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        # 等待期間被取消的請求 (例如用戶開始說話) 不送出
+        pending = [entry for entry in self._pending if not entry[2].done()]
+        self._pending = []
+        while pending:
+            batch, pending = pending[:self.max_size], pending[self.max_size:]
+            task = task_registry.spawn(self._run_batch(batch), "murmur_batch")
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _run_batch(self, batch: List[Tuple[str, Any, asyncio.Future]]) -> None:
+        self.batches += 1
+        self.batched += len(batch)
+        self.max_batch_size = max(self.max_batch_size, len(batch))
+        try:
+            results = await self.generate_batch([context for context, _, _ in batch], [state for _, state, _ in batch])
+        except Exception as e:
+            logger.error(f"批次生成 murmur 失敗 ({len(batch)} 個請求): {e}", exc_info=True)
+            results = []
+        if len(results) != len(batch):
+            results = list(results)[:len(batch)] + [None] * max(0, len(batch) - len(results))
+        for (_, _, future), result in zip(batch, results):
+            if result is None:
+                self.failures += 1
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回請求數、LLM 調用數與平均批次大小"""
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "llm_calls_saved": self.batched - self.batches,
+            "avg_batch_size": round(self.batched / self.batches, 2) if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "failures": self.failures,
+            "pending": len(self._pending),
+            "inflight_batches": len(self._batches),
+        }
+
+
+# 全域共享的 murmur 批次器 (generate_batch 由 WebSocket 端點在建立 AIService 後設定)
+murmur_batcher = MurmurBatcher()
@@ -0,0 +1,123 @@
+"""
+每個會話預先生成的 murmur 池
+
+過去閒置達到閾值後才開始調用 LLM 與 TTS，murmur 要晚好幾秒才送出，期間一直持有會話鎖。
+現在會話安靜下來後由背景任務預先生成少量 murmur (文字、情緒、關鍵幀、音訊)，
+閒置閾值一到就直接從池中取出送出。
+
+池中的 murmur 綁定生成時的對話情境：用戶送出新訊息等情境明顯改變時整個池失效，
+超過最大保存時間的 murmur 也會被丟棄。
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from core.config import settings
+from services.task_supervisor import task_registry
+
+logger = logging.getLogger("murmur_pool")
+
+
+class MurmurPool:
+    """單一會話的預生成 murmur 池"""
+
+    def __init__(self, size: Optional[int] = None, max_age: Optional[float] = None):
+        """
+        Args:
+            size: 池中保留的 murmur 數量
+            max_age: murmur 的最大保存時間 (秒)
+        """
+        self.size = size or settings.MURMUR_POOL_SIZE
+        self.max_age = max_age or settings.MURMUR_POOL_MAX_AGE_SECONDS
+        # 每個元素: {"murmur": dict, "created_at": float, "generation": int}
+        self._entries: Deque[Dict[str, Any]] = deque()
+        self._fill_task: Optional[asyncio.Task] = None
+        self.generation = 0  # 情境版本，invalidate() 時遞增
+
+        self.produced = 0
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def filling(self) -> bool:
+        return self._fill_task is not None and not self._fill_task.done()
+
+    def take(self, accept: Optional[Callable[[Dict[str, Any]], bool]] = None) -> Optional[Dict[str, Any]]:
+        """
+        取出最早生成且仍有效的 murmur
+
+        Args:
+            accept: 額外的檢查 (例如與最近的 murmur 太相似時拒絕)，被拒絕的 murmur 直接丟棄
+
+        Returns:
+            murmur，池中沒有可用項目時返回 None
+        """
+        now = time.monotonic()
+        while self._entries:
+            entry = self._entries.popleft()
+            if now - entry["created_at"] > self.max_age:
+                self.expired += 1
+                continue
+            if accept is not None and not accept(entry["murmur"]):
+                continue
+            self.hits += 1
+            return entry["murmur"]
+        self.misses += 1
+        return None
+
+    def fill(self, generate: Callable[[], Awaitable[Optional[Dict[str, Any]]]]) -> None:
+        """在背景補滿池子 (已在補充或已滿時不做任何事)"""
+        if self.filling or len(self._entries) >= self.size:
+            return
+        self._fill_task = task_registry.spawn(self._fill(generate), "murmur_pool_fill")
+
+    async def _fill(self, generate: Callable[[], Awaitable[Optional[Dict[str, Any]]]]) -> None:
+        while len(self._entries) < self.size:
+            generation = self.generation
+            try:
+                murmur = await generate()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"預生成 murmur 失敗: {e}", exc_info=True)
+                return
+            if murmur is None:
+                # 生成失敗或與最近的 murmur 重複，等下一次安靜時段再補
+                return
+            if generation != self.generation:
+                return
+            self._entries.append({"murmur": murmur, "created_at": time.monotonic(), "generation": generation})
+            self.produced += 1
+
+    def invalidate(self) -> None:
+        """對話情境改變：丟棄池中所有 murmur 並停止進行中的生成"""
+        self.generation += 1
+        if self._entries or self.filling:
+            self.invalidations += 1
+        self._entries.clear()
+        self.cancel()
+
+    def cancel(self) -> None:
+        """停止進行中的生成"""
+        if self._fill_task is not None and not self._fill_task.done():
+            self._fill_task.cancel()
+        self._fill_task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": len(self._entries),
+            "filling": self.filling,
+            "produced": self.produced,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,296 @@
+"""
+每個會話的出站訊息佇列與寫入任務
+
+回合流程與 murmur 只把訊息放入佇列 (不等待網路)，由每個連線自己的寫入任務依序送出；
+慢速或行動網路的客戶端因此不會拖住自己的回合流程或佔住會話鎖，廣播也不會被單一連線卡住。
+
+- 優先級：控制訊息 > 對話內容 (文字、音訊) > 動畫軌跡，同優先級內保持先進先出
+- 取代：尚未送出的 emotionalTrajectory 與 configured 被同類的新訊息就地取代
+- 佇列滿時只捨棄可捨棄的訊息 (動畫軌跡與可被取代的狀態訊息)，從最舊的開始；
+  對話內容與音訊幀絕不捨棄 (遺失會讓回覆消失或串流的 MP3 損壞)，放不下時視為過慢的客戶端
+- 佇列位元組數持續高於高水位 (或單次送出逾時) 的客戶端被斷線
+- 每則訊息標上放入時的回合編號；barge-in 時 purge_turn() 捨棄被取代回合尚未送出的文字、音訊幀與動畫軌跡
+  (控制訊息不屬於任何回合，不受影響)，之後該回合才放入的訊息也直接捨棄
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Union
+
+from fastapi import WebSocketDisconnect
+
+from core.config import settings
+from services.task_supervisor import task_registry
+from services.turn_controller import TurnController
+from utils.ws_codec import MessageChannel, PreparedMessage
+
+logger = logging.getLogger("outbound_queue")
+
+# 優先級 (數字越小越先送出)
+PRIORITY_CONTROL = 0
+PRIORITY_CONTENT = 1
+PRIORITY_ANIMATION = 2
+
+# 訊息類型 -> 優先級 (未列出的為 PRIORITY_CONTENT)
+MESSAGE_PRIORITIES = {
+    "session": PRIORITY_CONTROL,
+    "configured": PRIORITY_CONTROL,
+    "error": PRIORITY_CONTROL,
+    "emotionalTrajectory": PRIORITY_ANIMATION,
+}
+
+# 新訊息會取代尚未送出的同類舊訊息的類型
+SUPERSEDING_TYPES = ("emotionalTrajectory", "configured")
+
+# 斷線時使用的 WebSocket 關閉碼 (1013: Try Again Later)
+SLOW_CLIENT_CLOSE_CODE = 1013
+
+
+class _Outgoing:
+    __slots__ = ("payload", "raw", "size", "key", "turn")
+
+    def __init__(self, payload: bytes, raw: bool, key: Optional[str], turn: Optional[int]):
+        self.payload = payload
+        self.raw = raw  # 原始二進位幀 (音訊)，不經編解碼器
+        self.size = len(payload)
+        self.key = key
+        self.turn = turn  # 放入時的回合編號，控制訊息為 None
+
+
+class OutboundQueue:
+    """有上限、分優先級的出站佇列，由單一寫入任務送出"""
+
+    def __init__(
+        self,
+        channel: MessageChannel,
+        maxsize: Optional[int] = None,
+        high_water_bytes: Optional[int] = None,
+        slow_client_seconds: Optional[float] = None,
+        turns: Optional[TurnController] = None
+    ):
+        """
+        Args:
+            channel: 此連線的訊息通道
+            maxsize: 佇列中的訊息上限，滿時捨棄最低優先級的舊訊息
+            high_water_bytes: 高水位 (位元組)
+            slow_client_seconds: 持續高於高水位 (或單次送出卡住) 多久後斷線
+            turns: 會話的回合控制器，訊息以其目前的回合編號標記 (省略時不標記，purge_turn 無作用)
+        """
+        self.channel = channel
+        self.turns = turns
+        self.maxsize = maxsize or settings.WS_OUTBOUND_QUEUE_MAX
+        self.high_water_bytes = high_water_bytes or settings.WS_OUTBOUND_HIGH_WATER_BYTES
+        self.slow_client_seconds = settings.WS_OUTBOUND_SLOW_CLIENT_SECONDS if slow_client_seconds is None else slow_client_seconds
+        self._queues: List[Deque[_Outgoing]] = [deque() for _ in range(PRIORITY_ANIMATION + 1)]
+        self._keyed: Dict[str, _Outgoing] = {}  # 可被取代、尚未送出的訊息
+        self._ready = asyncio.Event()
+        self._writer: Optional[asyncio.Task] = None
+        self._over_since: Optional[float] = None
+        self._purged_through = -1  # 此編號 (含) 之前的回合已被取代
+        self.closed = False
+        self.bytes = 0
+
+        self.sent = 0
+        self.sent_bytes = 0
+        self.dropped = 0
+        self.superseded = 0
+        self.purged = 0
+        self.max_depth = 0
+        self.slow_disconnect = False
+
+    def depth(self) -> int:
+        """尚未送出的訊息數"""
+        return sum(len(queue) for queue in self._queues)
+
+    async def send(self, message: Union[Dict[str, Any], PreparedMessage]) -> None:
+        """
+        序列化訊息並放入佇列 (不等待送出)
+
+        Raises:
+            WebSocketDisconnect: 連線已關閉或因過慢被斷線
+        """
+        body = message.message if isinstance(message, PreparedMessage) else message
+        message_type = body.get("type")
+        priority = MESSAGE_PRIORITIES.get(message_type, PRIORITY_CONTENT)
+        self.put(
+            self.channel.encode(message),
+            priority,
+            key=message_type if message_type in SUPERSEDING_TYPES else None,
+            turn=self._current_turn() if priority != PRIORITY_CONTROL else None
+        )
+
+    async def send_bytes(self, frame: bytes) -> None:
+        """放入原始二進位幀 (音訊幀)"""
+        self.put(frame, PRIORITY_CONTENT, raw=True, turn=self._current_turn())
+
+    def _current_turn(self) -> Optional[int]:
+        return self.turns.turn_id if self.turns is not None else None
+
+    def put(self, payload: bytes, priority: int, key: Optional[str] = None, raw: bool = False, turn: Optional[int] = None) -> None:
+        """
+        放入已序列化的訊息
+
+        Args:
+            turn: 訊息所屬的回合編號，None 表示不屬於任何回合 (不會被 purge_turn 捨棄)
+
+        Raises:
+            WebSocketDisconnect: 連線已關閉，或佇列已滿且無法捨棄其他訊息 (客戶端被視為過慢而斷線)
+        """
+        if self.closed:
+            raise WebSocketDisconnect(SLOW_CLIENT_CLOSE_CODE if self.slow_disconnect else 1006)
+
+        if turn is not None and turn <= self._purged_through:
+            # 已被取代的回合在取消生效前才送出的訊息
+            self.purged += 1
+            return
+
+        if key is not None and key in self._keyed:
+            # 就地取代尚未送出的舊訊息 (保留其位置)
+            item = self._keyed[key]
+            self.bytes += len(payload) - item.size
+            item.payload, item.size = payload, len(payload)
+            self.superseded += 1
+            self._check_high_water()
+            return
+
+        if self.depth() >= self.maxsize and not self._drop_queued():
+            if priority == PRIORITY_ANIMATION or key is not None:
+                # 新訊息本身可捨棄 (之後的同類訊息會帶來更新的狀態)
+                self.dropped += 1
+                return
+            self._disconnect_slow(f"佇列已滿 ({self.maxsize} 則) 且沒有可捨棄的訊息")
+            raise WebSocketDisconnect(SLOW_CLIENT_CLOSE_CODE)
+
+        item = _Outgoing(payload, raw, key, turn)
+        self._queues[priority].append(item)
+        if key is not None:
+            self._keyed[key] = item
+        self.bytes += item.size
+        self.max_depth = max(self.max_depth, self.depth())
+        self._check_high_water()
+        if self._writer is None:
+            self._writer = task_registry.spawn(self._run(), "outbound_writer")
+        self._ready.set()
+
+    def purge_turn(self, turn_id: int) -> int:
+        """
+        捨棄回合 turn_id (含) 之前尚未送出的訊息，之後再放入的這些回合的訊息也一併捨棄
+
+        Returns:
+            捨棄的訊息數
+        """
+        self._purged_through = max(self._purged_through, turn_id)
+        purged = 0
+        for queue in self._queues:
+            stale = [item for item in queue if item.turn is not None and item.turn <= turn_id]
+            for item in stale:
+                queue.remove(item)
+                self._forget(item)
+            purged += len(stale)
+        self.purged += purged
+        return purged
+
+    def _drop_queued(self) -> bool:
+        """佇列已滿：捨棄最舊的可捨棄訊息 (先動畫軌跡，再可被取代的狀態訊息)，沒有時返回 False"""
+        for level in range(len(self._queues) - 1, -1, -1):
+            queue = self._queues[level]
+            for item in queue:
+                if not item.raw and (level == PRIORITY_ANIMATION or item.key is not None):
+                    queue.remove(item)
+                    self._forget(item)
+                    self.dropped += 1
+                    return True
+        return False
+
+    def _forget(self, item: _Outgoing) -> None:
+        self.bytes -= item.size
+        if item.key is not None and self._keyed.get(item.key) is item:
+            del self._keyed[item.key]
+
+    def _pop(self) -> Optional[_Outgoing]:
+        for queue in self._queues:
+            if queue:
+                item = queue.popleft()
+                self._forget(item)
+                return item
+        return None
+
+    def _check_high_water(self) -> None:
+        if self.bytes <= self.high_water_bytes:
+            self._over_since = None
+            return
+        now = time.monotonic()
+        if self._over_since is None:
+            self._over_since = now
+        elif now - self._over_since > self.slow_client_seconds:
+            self._disconnect_slow(f"佇列 {self.bytes} bytes 持續高於高水位 {self.slow_client_seconds:.1f}s")
+
+    def _disconnect_slow(self, reason: str) -> None:
+        if self.closed:
+            return
+        logger.warning(f"客戶端 {self.channel.websocket.client} 接收過慢，斷開連線: {reason}")
+        self.slow_disconnect = True
+        self._shutdown()
+        task_registry.spawn(self._close_socket(), "outbound_close")
+
+    async def _close_socket(self) -> None:
+        try:
+            await self.channel.websocket.close(code=SLOW_CLIENT_CLOSE_CODE)
+        except Exception as e:
+            logger.debug(f"關閉過慢的連線時發生錯誤: {e}")
+
+    def _shutdown(self) -> None:
+        self.closed = True
+        for queue in self._queues:
+            queue.clear()
+        self._keyed.clear()
+        self.bytes = 0
+        if self._writer is not None and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+
+    async def _run(self) -> None:
+        """寫入任務：依優先級逐一送出"""
+        while not self.closed:
+            item = self._pop()
+            if item is None:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            write = self.channel.send_bytes(item.payload) if item.raw else self.channel.send_payload(item.payload)
+            try:
+                await asyncio.wait_for(write, self.slow_client_seconds)
+            except asyncio.TimeoutError:
+                self._disconnect_slow(f"單次送出超過 {self.slow_client_seconds:.1f}s")
+                return
+            except Exception as e:
+                # 連線已關閉，之後的 put 會拋出 WebSocketDisconnect
+                logger.info(f"出站寫入結束 ({self.channel.websocket.client}): {e!r}")
+                self._shutdown()
+                return
+            self.sent += 1
+            self.sent_bytes += item.size
+            self._check_high_water()
+
+    async def close(self) -> None:
+        """連線結束：捨棄未送出的訊息並停止寫入任務"""
+        self._shutdown()
+        if self._writer is not None and self._writer is not asyncio.current_task():
+            try:
+                await self._writer
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "depth": self.depth(),
+            "bytes": self.bytes,
+            "max_depth": self.max_depth,
+            "sent": self.sent,
+            "sent_bytes": self.sent_bytes,
+            "dropped": self.dropped,
+            "superseded": self.superseded,
+            "purged": self.purged,
+            "slow_disconnect": self.slow_disconnect,
+        }
@@ -0,0 +1,378 @@
+"""
+WebSocket 對話會話與連線管理器
+
+每個連線的狀態 (對話歷史、時間戳、最近的 murmur、播放狀態、連線選項等)
+集中在一個使用 __slots__ 的 ConversationSession 物件中；ConnectionManager
+以 session id 為鍵保存會話，新增、移除與查詢都是 O(1)。
+
+可持久化的狀態 (對話歷史、最近的 murmur、情緒、角色狀態與任務記錄) 透過會話狀態儲存保存 (見 services/session_store)，
+客戶端帶著 session id 重新連線時從儲存恢復。
+"""
+
+import asyncio
+import logging
+import sys
+import time
+import uuid
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from services.ai.session_state import AISessionState
+from services.audience_aggregator import AudienceAggregator
+from services.inbound_queue import InboundQueue
+from services.live_room import LiveRoom, RoomFanout, room_session_id
+from services.murmur_pool import MurmurPool
+from services.outbound_queue import OutboundQueue
+from services.session_store import SessionStateStore, create_session_store
+from services.task_supervisor import TaskSupervisor
+from services.turn_controller import TurnController
+from utils.ws_codec import CODECS, MessageChannel, PreparedMessage, WebSocketCodec
+
+MAX_HISTORY_LENGTH = 20  # 保存的最大對話歷史輪數（用戶+機器人算一輪）
+MAX_RECENT_MURMURS = 10  # 用於避免重複的最近 murmur 數量
+
+logger = logging.getLogger("session_manager")
+
+
+class ConversationSession:
+    """單一 WebSocket 連線的對話狀態"""
+
+    __slots__ = (
+        "session_id",
+        "websocket",
+        "channel",
+        "client",
+        "created_at",
+        "history",
+        "recent_murmurs",
+        "current_emotion",
+        "is_speaking",
+        "user_responded",
+        "last_activity",
+        "last_murmur",
+        "last_speaking_reset",
+        "options",
+        "lock",
+        "closed",
+        "tasks",
+        "turns",
+        "inbound",
+        "outbound",
+        "murmur_pool",
+        "ai_state",
+    )
+
+    def __init__(
+        self,
+        websocket: Optional[WebSocket],
+        options: Dict[str, Any],
+        session_id: Optional[str] = None,
+        codec: Optional[WebSocketCodec] = None
+    ):
+        """
+        初始化會話
+
+        Args:
+            websocket: 此會話的連線 (直播房間會話沒有自己的連線，為 None)
+            options: 此連線的可切換選項 (例如串流模式)
+            session_id: 會話 id (預設隨機產生)
+            codec: 連線時協商的訊息編解碼器 (預設 JSON)
+        """
+        now = time.monotonic()
+        self.session_id = session_id or uuid.uuid4().hex
+        self.websocket = websocket
+        self.channel = MessageChannel(websocket, codec or CODECS["json"])  # 此連線的所有訊息收發
+        self.client = websocket.client if websocket is not None else None
+        self.created_at = now
+        # 對話歷史，每個元素是 {'role': str, 'content': str, 'is_murmur': Optional[bool]}；
+        # 超過上限時自動丟棄最舊的訊息 (約 MAX_HISTORY_LENGTH 輪對話)
+        self.history: Deque[Dict[str, Any]] = deque(maxlen=MAX_HISTORY_LENGTH * 2)
+        self.recent_murmurs: Set[str] = set()  # 使用集合以避免重複
+        self.current_emotion = "neutral"
+        self.is_speaking = False  # 指示當前是否有語音在播放
+        self.user_responded = False
+        # 時間戳皆為 time.monotonic() 秒數
+        self.last_activity = now
+        self.last_murmur: Optional[float] = None
+        self.last_speaking_reset: Optional[float] = None  # 最後一次重置說話狀態的時間
+        self.options = options
+        self.lock = asyncio.Lock()  # 用戶訊息與 murmur 的處理互斥
+        self.closed = False  # 連線結束後不再向排程器登記 (例如延遲的語音重置任務)
+        self.tasks = TaskSupervisor(self.session_id)  # 此會話擁有的背景任務，連線結束時全部取消
+        self.turns = TurnController(self.tasks)  # 用戶回合 (barge-in 時取消上一回合)
+        self.inbound = InboundQueue()  # 接收迴圈放入、回合分派任務取出的用戶訊息
+        self.outbound = OutboundQueue(self.channel, turns=self.turns)  # 送往客戶端的訊息，由寫入任務送出 (以回合編號標記)
+        self.murmur_pool = MurmurPool()  # 預生成的 murmur (MURMUR_POOL_ENABLED 時使用)
+        self.ai_state = AISessionState()  # 此會話的角色狀態與任務記錄 (傳入 AIService)
+
+    def add_to_history(self, role: str, content: str, is_murmur: bool = False) -> None:
+        """添加記錄到對話歷史 (deque 會自動丟棄超出上限的舊訊息)"""
+        history_entry = {"role": role, "content": content}
+        if role == "bot":
+            history_entry["is_murmur"] = is_murmur
+        self.history.append(history_entry)
+        if not is_murmur:
+            # 對話情境改變，預生成的 murmur 不再適用
+            self.murmur_pool.invalidate()
+
+    def remember_murmur(self, text: str) -> None:
+        """記錄最近的 murmur，超過上限時任意移除一句"""
+        self.recent_murmurs.add(text)
+        if len(self.recent_murmurs) > MAX_RECENT_MURMURS:
+            self.recent_murmurs.pop()
+
+    def to_state(self) -> Dict[str, Any]:
+        """可持久化的會話狀態 (可序列化為 JSON)"""
+        return {
+            "history": list(self.history),
+            "recent_murmurs": list(self.recent_murmurs),
+            "current_emotion": self.current_emotion,
+            "ai_state": self.ai_state.to_dict(),
+        }
+
+    def restore_state(self, state: Dict[str, Any]) -> None:
+        """從儲存的狀態恢復 (計時相關的時間戳不恢復，重新連線後重新計算)"""
+        self.history.extend(state.get("history", []))
+        self.recent_murmurs.update(state.get("recent_murmurs", []))
+        self.current_emotion = state.get("current_emotion", self.current_emotion)
+        if "ai_state" in state:
+            self.ai_state = AISessionState.from_dict(state["ai_state"])
+
+    def memory_footprint(self) -> int:
+        """估算此會話持有的記憶體 (bytes)，不含 websocket 物件本身"""
+        size = sys.getsizeof(self) + sys.getsizeof(self.history) + sys.getsizeof(self.recent_murmurs) + sys.getsizeof(self.options)
+        for entry in self.history:
+            size += sys.getsizeof(entry) + sum(sys.getsizeof(value) for value in entry.values())
+        size += sum(sys.getsizeof(text) for text in self.recent_murmurs)
+        return size
+
+    def describe(self) -> Dict[str, Any]:
+        """返回此會話的摘要 (供監控端點使用)"""
+        now = time.monotonic()
+        return {
+            "session_id": self.session_id,
+            "client": f"{self.client.host}:{self.client.port}" if self.client else None,
+            "age_seconds": round(now - self.created_at, 1),
+            "idle_seconds": round(now - self.last_activity, 1),
+            "history_length": len(self.history),
+            "is_speaking": self.is_speaking,
+            "turn": self.turns.stats(),
+            "tasks": self.tasks.stats(),
+            "inbound": self.inbound.stats(),
+            "outbound": self.outbound.stats(),
+            "murmur_pool": self.murmur_pool.stats(),
+            "memory_bytes": self.memory_footprint(),
+        }
+
+
+class ConnectionManager:
+    """以 session id 為鍵管理所有 WebSocket 會話"""
+
+    def __init__(self, store: Optional[SessionStateStore] = None):
+        self.sessions: Dict[str, ConversationSession] = {}
+        self.store = store or create_session_store()
+        # 直播房間 (房間 id -> 房間)，建立與關閉互斥，避免新房間讀到舊房間尚未寫入的狀態
+        self.rooms: Dict[str, LiveRoom] = {}
+        self._rooms_lock = asyncio.Lock()
+        self.closed_room_turns = 0
+        self.closed_room_answered = 0
+        self.total_connections = 0
+        self.restored_sessions = 0
+        # 已結束會話的回合統計
+        self.closed_turns_started = 0
+        self.closed_turns_cancelled = 0
+        self.closed_inbound_received = 0
+        self.closed_inbound_coalesced = 0
+        self.closed_murmur_pool_hits = 0
+        self.closed_murmur_pool_misses = 0
+        self.closed_outbound_dropped = 0
+        self.closed_outbound_superseded = 0
+        self.closed_outbound_purged = 0
+        self.slow_client_disconnects = 0
+
+    async def connect(
+        self,
+        websocket: WebSocket,
+        options: Dict[str, Any],
+        session_id: Optional[str] = None,
+        codec: Optional[WebSocketCodec] = None,
+        subprotocol: Optional[str] = None
+    ) -> ConversationSession:
+        """
+        接受連線並建立會話
+
+        Args:
+            session_id: 客戶端重新連線時帶回的會話 id，儲存中有此會話時恢復其狀態
+            codec: 協商好的訊息編解碼器
+            subprotocol: 回應給客戶端的 WebSocket 子協定 (以子協定協商編碼時)
+        """
+        await websocket.accept(subprotocol=subprotocol)
+        state = None
+        if session_id and session_id in self.sessions:
+            # 舊連線仍在此 worker 上，不共用同一個會話
+            logger.warning(f"會話 {session_id} 仍在使用中，建立新的會話")
+            session_id = None
+        elif session_id:
+            state = await self.store.load(session_id)
+            if state is None:
+                session_id = None
+        session = ConversationSession(websocket, options, session_id=session_id, codec=codec)
+        if state is not None:
+            session.restore_state(state)
+            self.restored_sessions += 1
+            logger.info(f"已恢復會話 {session.session_id} (歷史 {len(session.history)} 則)")
+        self.sessions[session.session_id] = session
+        self.total_connections += 1
+        return session
+
+    def persist(self, session: ConversationSession) -> None:
+        """登記會話狀態待寫入 (合併寫入)"""
+        self.store.schedule_save(session.session_id, session.to_state)
+
+    async def save(self, session: ConversationSession) -> None:
+        """立即寫入會話狀態 (連線結束時使用)"""
+        self.persist(session)
+        await self.store.flush(session.session_id)
+
+    def disconnect(self, session_id: str) -> Optional[ConversationSession]:
+        """移除會話，返回被移除的會話 (不存在時返回 None)"""
+        session = self.sessions.pop(session_id, None)
+        if session is not None:
+            self.store.forget(session_id)
+            self.closed_turns_started += session.turns.started
+            self.closed_turns_cancelled += session.turns.cancelled
+            self.closed_inbound_received += session.inbound.received
+            self.closed_inbound_coalesced += session.inbound.coalesced
+            self.closed_murmur_pool_hits += session.murmur_pool.hits
+            self.closed_murmur_pool_misses += session.murmur_pool.misses
+            self.closed_outbound_dropped += session.outbound.dropped
+            self.closed_outbound_superseded += session.outbound.superseded
+            self.closed_outbound_purged += session.outbound.purged
+            self.slow_client_disconnects += session.outbound.slow_disconnect
+        return session
+
+    async def join_room(self, room_id: str, spectator: ConversationSession, options: Dict[str, Any]) -> Tuple[LiveRoom, bool]:
+        """
+        觀眾加入直播房間，房間不存在時建立 (從會話狀態儲存恢復房間的對話歷史與角色狀態)
+
+        Args:
+            spectator: 觀眾的連線會話 (已由 connect() 建立)
+            options: 建立房間時使用的選項
+
+        Returns:
+            (房間, 是否為新建立的房間；新房間需由呼叫者啟動對話流程)
+        """
+        async with self._rooms_lock:
+            room = self.rooms.get(room_id)
+            created = room is None
+            if created:
+                session = ConversationSession(None, options, session_id=room_session_id(room_id))
+                state = await self.store.load(session.session_id)
+                if state is not None:
+                    session.restore_state(state)
+                    logger.info(f"已恢復直播房間 {room_id} (歷史 {len(session.history)} 則)")
+                room = LiveRoom(room_id, session)
+                session.outbound = RoomFanout(room)
+                # 觀眾留言在回合之間聚合為一則 (取代一般的入站合併)
+                session.inbound = AudienceAggregator(lambda session=session: session.history)
+                self.rooms[room_id] = room
+            room.add_spectator(spectator)
+        return room, created
+
+    async def leave_room(self, room_id: str, session_id: str) -> None:
+        """觀眾離開直播房間，最後一位觀眾離開時關閉房間 (狀態已保存，再次加入時恢復)"""
+        async with self._rooms_lock:
+            room = self.rooms.get(room_id)
+            if room is None:
+                return
+            room.remove_spectator(session_id)
+            if room.spectators:
+                return
+            del self.rooms[room_id]
+            await room.close()
+            self.closed_room_turns += room.session.inbound.turns
+            self.closed_room_answered += room.session.inbound.answered
+            self.store.forget(room.session.session_id)
+            logger.info(f"直播房間 {room_id} 已無觀眾，已關閉")
+
+    def get(self, session_id: str) -> Optional[ConversationSession]:
+        return self.sessions.get(session_id)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self.sessions
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    async def send_message(self, message: Dict[str, Any], session_id: str):
+        session = self.sessions.get(session_id)
+        if session is not None:
+            await session.outbound.send(message)
+
+    async def broadcast(self, message: Dict[str, Any]):
+        # 每種編碼只序列化一次；只放入各連線的出站佇列，慢速連線不會拖住其他連線
+        prepared = PreparedMessage(message)
+        for session in list(self.sessions.values()):
+            try:
+                await session.outbound.send(prepared)
+            except WebSocketDisconnect:
+                continue
+
+    def stats(self) -> Dict[str, Any]:
+        """返回會話數量與記憶體用量"""
+        footprints = [session.memory_footprint() for session in self.sessions.values()]
+        depths = [session.inbound.depth() for session in self.sessions.values()]
+        outbound_depths = [session.outbound.depth() for session in self.sessions.values()]
+        room_turns = self.closed_room_turns + sum(room.session.inbound.turns for room in self.rooms.values())
+        room_answered = self.closed_room_answered + sum(room.session.inbound.answered for room in self.rooms.values())
+        return {
+            "active_sessions": len(self.sessions),
+            "total_connections": self.total_connections,
+            "restored_sessions": self.restored_sessions,
+            "speaking_sessions": sum(1 for session in self.sessions.values() if session.is_speaking),
+            "sessions_by_codec": {
+                name: sum(1 for session in self.sessions.values() if session.channel.codec.name == name) for name in CODECS
+            },
+            "active_turns": sum(1 for session in self.sessions.values() if session.turns.active),
+            "turns_started": self.closed_turns_started + sum(session.turns.started for session in self.sessions.values()),
+            "turns_cancelled": self.closed_turns_cancelled + sum(session.turns.cancelled for session in self.sessions.values()),
+            # 與 /metrics 的 background_tasks.live 比較：差額為不屬於任何現存會話的任務
+            "session_tasks": sum(session.tasks.live() for session in self.sessions.values()),
+            "room_tasks": sum(room.session.tasks.live() for room in self.rooms.values()),
+            "inbound_queue_depth": sum(depths),
+            "max_inbound_queue_depth": max(depths, default=0),
+            "inbound_messages": self.closed_inbound_received + sum(session.inbound.received for session in self.sessions.values()),
+            "coalesced_messages": self.closed_inbound_coalesced + sum(session.inbound.coalesced for session in self.sessions.values()),
+            "outbound_queue_depth": sum(outbound_depths),
+            "max_outbound_queue_depth": max(outbound_depths, default=0),
+            "outbound_queue_bytes": sum(session.outbound.bytes for session in self.sessions.values()),
+            "outbound_dropped": self.closed_outbound_dropped + sum(session.outbound.dropped for session in self.sessions.values()),
+            "outbound_superseded": self.closed_outbound_superseded + sum(session.outbound.superseded for session in self.sessions.values()),
+            "outbound_purged": self.closed_outbound_purged + sum(session.outbound.purged for session in self.sessions.values()),
+            "slow_client_disconnects": self.slow_client_disconnects,
+            "live_rooms": len(self.rooms),
+            "room_spectators": sum(len(room.spectators) for room in self.rooms.values()),
+            "room_turns": room_turns,
+            "room_answered_messages": room_answered,
+            "room_answered_per_llm_call": round(room_answered / room_turns, 2) if room_turns else 0.0,
+            "pooled_murmurs": sum(len(session.murmur_pool) for session in self.sessions.values()),
+            "murmur_pool_hits": self.closed_murmur_pool_hits + sum(session.murmur_pool.hits for session in self.sessions.values()),
+            "murmur_pool_misses": self.closed_murmur_pool_misses + sum(session.murmur_pool.misses for session in self.sessions.values()),
+            "memory_bytes": sum(footprints),
+            "avg_session_bytes": sum(footprints) // len(footprints) if footprints else 0,
+            "max_session_bytes": max(footprints, default=0),
+        }
+
+    def describe_sessions(self) -> List[Dict[str, Any]]:
+        """返回每個會話的摘要"""
+        return [session.describe() for session in self.sessions.values()]
+
+    def describe_rooms(self) -> List[Dict[str, Any]]:
+        """返回每個直播房間的摘要"""
+        return [room.stats() for room in self.rooms.values()]
+
+
+# 全域共享的連線管理器
+manager = ConnectionManager()
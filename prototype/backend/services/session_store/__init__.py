@@ -0,0 +1,32 @@
+"""
+會話狀態儲存 - 依配置 (SESSION_STORE) 選擇實作
+"""
+
+from typing import Optional
+
+from core.config import settings
+from .base import SessionStateStore, SessionVersionConflict
+from .memory_store import InMemorySessionStore
+from .sqlite_store import SQLiteSessionStore
+
+SESSION_STORES = {
+    "memory": InMemorySessionStore,
+    "sqlite": SQLiteSessionStore,
+}
+
+
+def create_session_store(name: Optional[str] = None) -> SessionStateStore:
+    """依名稱 (預設讀取配置) 建立會話狀態儲存"""
+    name = (name or settings.SESSION_STORE).lower()
+    if name not in SESSION_STORES:
+        raise ValueError(f"未知的會話狀態儲存: {name}，可用: {', '.join(SESSION_STORES)}")
+    return SESSION_STORES[name]()
+
+
+__all__ = [
+    'SessionStateStore',
+    'SessionVersionConflict',
+    'InMemorySessionStore',
+    'SQLiteSessionStore',
+    'create_session_store'
+]
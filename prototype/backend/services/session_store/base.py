@@ -0,0 +1,161 @@
+"""
+會話狀態儲存介面
+
+會話的對話歷史、最近的 murmur 與情緒等狀態透過儲存保存，而不是只存在行程記憶體中；
+使用共享的儲存 (例如 SQLite 檔案) 時可以啟動多個 worker，重新連線的客戶端
+落在任何一個 worker 都能取回自己的會話。
+
+寫入會合併：短時間內多次 schedule_save() 只寫入一次最新的狀態。
+每筆狀態帶有版本號，寫入時比對版本 (樂觀並行控制)，
+舊連線遲到的寫入不會覆蓋已被其他 worker 接手的會話。
+"""
+
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from core.config import settings
+from services.task_supervisor import task_registry
+
+logger = logging.getLogger("session_store")
+
+
+class SessionVersionConflict(Exception):
+    """寫入時的版本與儲存中的版本不符 (會話已被其他連線或 worker 更新)"""
+
+    def __init__(self, session_id: str, expected: int, actual: Optional[int]):
+        self.session_id = session_id
+        self.expected = expected
+        self.actual = actual
+        super().__init__(f"會話 {session_id} 版本衝突: 預期 {expected}，實際 {actual}")
+
+
+class SessionStateStore(ABC):
+    """會話狀態儲存基類，子類只需實作 _read / _write / _delete"""
+
+    # 儲存名稱 (顯示於監控指標)
+    name = "base"
+
+    def __init__(self, flush_interval: Optional[float] = None, ttl: Optional[float] = None):
+        """
+        Args:
+            flush_interval: 合併寫入的間隔 (秒)
+            ttl: 狀態保存時間 (秒)，0 表示不過期
+        """
+        self.flush_interval = settings.SESSION_STORE_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self.ttl = settings.SESSION_STORE_TTL_SECONDS if ttl is None else ttl
+        # 待寫入的會話 -> 產生最新狀態的函數 (寫入時才調用，合併期間的更新都會包含在內)
+        self._dirty: Dict[str, Callable[[], Dict[str, Any]]] = {}
+        # 此 worker 最後一次讀到或寫入的版本
+        self._versions: Dict[str, int] = {}
+        self._flush_timer: Optional[asyncio.TimerHandle] = None
+
+        self.loads = 0
+        self.restored = 0
+        self.save_requests = 0
+        self.writes = 0
+        self.coalesced = 0
+        self.conflicts = 0
+        self.failures = 0
+
+    @abstractmethod
+    async def _read(self, session_id: str) -> Optional[Tuple[int, Dict[str, Any]]]:
+        """讀取 (版本, 狀態)，不存在或已過期時返回 None"""
+        pass
+
+    @abstractmethod
+    async def _write(self, session_id: str, state: Dict[str, Any], expected_version: int) -> int:
+        """
+        寫入狀態
+
+        Args:
+            expected_version: 預期的現有版本 (0 表示尚未存在)
+
+        Returns:
+            新版本號
+
+        Raises:
+            SessionVersionConflict: 現有版本與預期不符
+        """
+        pass
+
+    @abstractmethod
+    async def _delete(self, session_id: str) -> None:
+        """刪除已保存的狀態 (不存在時不做任何事)"""
+        pass
+
+    async def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """讀取會話狀態並記錄其版本，之後的寫入以此版本為基準"""
+        self.loads += 1
+        record = await self._read(session_id)
+        if record is None:
+            self._versions.pop(session_id, None)
+            return None
+        version, state = record
+        self._versions[session_id] = version
+        self.restored += 1
+        return state
+
+    def schedule_save(self, session_id: str, snapshot: Callable[[], Dict[str, Any]]) -> None:
+        """登記待寫入的會話，於下一次合併寫入時保存 snapshot() 的結果"""
+        if session_id in self._dirty:
+            self.coalesced += 1
+        self._dirty[session_id] = snapshot
+        self.save_requests += 1
+        if self._flush_timer is None:
+            loop = asyncio.get_running_loop()
+            self._flush_timer = loop.call_later(self.flush_interval, lambda: task_registry.spawn(self.flush(), "session_store_flush"))
+
+    async def flush(self, session_id: Optional[str] = None) -> None:
+        """立即寫入待寫入的狀態 (指定 session_id 時只寫入該會話)"""
+        if session_id is not None:
+            snapshot = self._dirty.pop(session_id, None)
+            if snapshot is not None:
+                await self._save(session_id, snapshot())
+            return
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        dirty, self._dirty = self._dirty, {}
+        for dirty_id, snapshot in dirty.items():
+            await self._save(dirty_id, snapshot())
+
+    async def _save(self, session_id: str, state: Dict[str, Any]) -> None:
+        expected_version = self._versions.get(session_id, 0)
+        try:
+            self._versions[session_id] = await self._write(session_id, state, expected_version)
+            self.writes += 1
+        except SessionVersionConflict as e:
+            # 會話已由其他連線接手，放棄這次寫入
+            self.conflicts += 1
+            logger.warning(f"{e}，放棄寫入")
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"保存會話 {session_id} 失敗: {e}", exc_info=True)
+
+    def forget(self, session_id: str) -> None:
+        """連線結束：丟棄此 worker 對該會話的記錄 (不刪除已保存的狀態)"""
+        self._dirty.pop(session_id, None)
+        self._versions.pop(session_id, None)
+
+    async def delete(self, session_id: str) -> None:
+        self.forget(session_id)
+        await self._delete(session_id)
+
+    async def close(self) -> None:
+        """寫入所有待寫入的狀態"""
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "pending_writes": len(self._dirty),
+            "loads": self.loads,
+            "restored": self.restored,
+            "save_requests": self.save_requests,
+            "writes": self.writes,
+            "coalesced_writes": self.coalesced,
+            "conflicts": self.conflicts,
+            "failures": self.failures,
+        }
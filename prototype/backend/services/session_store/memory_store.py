@@ -0,0 +1,45 @@
+"""
+記憶體會話狀態儲存 - 單一 worker 使用 (預設)，斷線重連可在同一行程內恢復會話
+"""
+
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from .base import SessionStateStore, SessionVersionConflict
+
+
+class InMemorySessionStore(SessionStateStore):
+    """以字典保存會話狀態"""
+
+    name = "memory"
+
+    def __init__(self, flush_interval: Optional[float] = None, ttl: Optional[float] = None):
+        super().__init__(flush_interval, ttl)
+        # 會話 id -> (版本, 更新時間, 狀態)
+        self._records: Dict[str, Tuple[int, float, Dict[str, Any]]] = {}
+
+    async def _read(self, session_id: str) -> Optional[Tuple[int, Dict[str, Any]]]:
+        record = self._records.get(session_id)
+        if record is None:
+            return None
+        version, updated_at, state = record
+        if self.ttl and time.time() - updated_at > self.ttl:
+            del self._records[session_id]
+            return None
+        return version, state
+
+    async def _write(self, session_id: str, state: Dict[str, Any], expected_version: int) -> int:
+        record = self._records.get(session_id)
+        current_version = record[0] if record is not None else 0
+        if current_version != expected_version:
+            raise SessionVersionConflict(session_id, expected_version, current_version)
+        self._records[session_id] = (current_version + 1, time.time(), state)
+        return current_version + 1
+
+    async def _delete(self, session_id: str) -> None:
+        self._records.pop(session_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats["stored_sessions"] = len(self._records)
+        return stats
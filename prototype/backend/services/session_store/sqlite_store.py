@@ -0,0 +1,112 @@
+"""
+SQLite 會話狀態儲存 - 同一台機器上的多個 worker 共用一個資料庫檔案
+
+資料庫使用 WAL 模式，讀寫在執行緒中進行，不阻塞事件迴圈；
+版本比對在單一 UPDATE 語句中完成，多個行程同時寫入也不會互相覆蓋。
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from core.config import settings
+from .base import SessionStateStore, SessionVersionConflict
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS session_state (
+    session_id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    state TEXT NOT NULL
+)
+"""
+
+
+class SQLiteSessionStore(SessionStateStore):
+    """以 SQLite 檔案保存會話狀態 (JSON)"""
+
+    name = "sqlite"
+
+    def __init__(self, path: Optional[str] = None, flush_interval: Optional[float] = None, ttl: Optional[float] = None):
+        super().__init__(flush_interval, ttl)
+        self.path = path or settings.SESSION_STORE_PATH
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(_SCHEMA)
+        self._db_lock = threading.Lock()  # 同一連線只允許一個執行緒使用
+        self._purge_expired()
+
+    def _purge_expired(self) -> None:
+        if self.ttl:
+            with self._db_lock:
+                self._connection.execute("DELETE FROM session_state WHERE updated_at < ?", (time.time() - self.ttl,))
+
+    def _read_sync(self, session_id: str) -> Optional[Tuple[int, Dict[str, Any]]]:
+        with self._db_lock:
+            row = self._connection.execute(
+                "SELECT version, updated_at, state FROM session_state WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        version, updated_at, state = row
+        if self.ttl and time.time() - updated_at > self.ttl:
+            return None
+        return version, json.loads(state)
+
+    def _write_sync(self, session_id: str, state: Dict[str, Any], expected_version: int) -> int:
+        payload = json.dumps(state, ensure_ascii=False)
+        now = time.time()
+        with self._db_lock:
+            if expected_version == 0:
+                try:
+                    self._connection.execute(
+                        "INSERT INTO session_state (session_id, version, updated_at, state) VALUES (?, 1, ?, ?)",
+                        (session_id, now, payload)
+                    )
+                    return 1
+                except sqlite3.IntegrityError:
+                    actual = self._connection.execute(
+                        "SELECT version FROM session_state WHERE session_id = ?", (session_id,)
+                    ).fetchone()
+                    raise SessionVersionConflict(session_id, expected_version, actual[0] if actual else None)
+            cursor = self._connection.execute(
+                "UPDATE session_state SET version = version + 1, updated_at = ?, state = ? WHERE session_id = ? AND version = ?",
+                (now, payload, session_id, expected_version)
+            )
+            if cursor.rowcount == 0:
+                actual = self._connection.execute(
+                    "SELECT version FROM session_state WHERE session_id = ?", (session_id,)
+                ).fetchone()
+                raise SessionVersionConflict(session_id, expected_version, actual[0] if actual else None)
+            return expected_version + 1
+
+    def _delete_sync(self, session_id: str) -> None:
+        with self._db_lock:
+            self._connection.execute("DELETE FROM session_state WHERE session_id = ?", (session_id,))
+
+    async def _read(self, session_id: str) -> Optional[Tuple[int, Dict[str, Any]]]:
+        return await asyncio.to_thread(self._read_sync, session_id)
+
+    async def _write(self, session_id: str, state: Dict[str, Any], expected_version: int) -> int:
+        return await asyncio.to_thread(self._write_sync, session_id, state, expected_version)
+
+    async def _delete(self, session_id: str) -> None:
+        await asyncio.to_thread(self._delete_sync, session_id)
+
+    async def close(self) -> None:
+        await super().close()
+        with self._db_lock:
+            self._connection.close()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats["path"] = self.path
+        return stats
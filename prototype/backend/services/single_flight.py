@@ -0,0 +1,123 @@
+"""
+相同上游請求的合併 (single-flight)
+
+熱門直播間裡很多用戶常在同一時間送出相同的招呼或問題，各自觸發一模一樣的工具意圖判斷、
+參數提取，有時連主回應的提示都完全相同。鍵相同的請求在第一個請求進行中 (以及完成後的短暫停留期)
+共用同一次上游調用，結果分送給所有等待者：
+
+- 由獨立任務執行上游調用，個別等待者被取消 (例如 barge-in) 不影響其他等待者；
+  所有等待者都取消時才取消上游調用
+- 失敗的調用不會停留，下一個請求 (包含重試) 重新發出
+- 依名稱統計請求數、實際上游調用數與合併比例
+"""
+
+import asyncio
+import hashlib
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import orjson
+
+from core.config import settings
+from services.task_supervisor import task_registry
+
+logger = logging.getLogger("single_flight")
+
+
+def request_key(*parts: Any) -> str:
+    """把請求的各部分 (渲染後的提示、模型參數等) 雜湊為合併鍵"""
+    return hashlib.sha256(orjson.dumps(parts, default=str)).hexdigest()
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Future):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """合併鍵相同、同時進行的請求"""
+
+    def __init__(self, enabled: Optional[bool] = None, linger: Optional[float] = None):
+        """
+        Args:
+            enabled: 是否啟用合併
+            linger: 成功完成後結果保留多久 (秒) 供稍晚到達的相同請求共用，0 表示只合併進行中的請求
+        """
+        self.enabled = settings.LLM_SINGLE_FLIGHT_ENABLED if enabled is None else enabled
+        self.linger = settings.LLM_SINGLE_FLIGHT_LINGER_SECONDS if linger is None else linger
+        self._flights: Dict[str, _Flight] = {}
+        self.requests: Dict[str, int] = {}
+        self.upstream: Dict[str, int] = {}
+        self.cancelled = 0  # 所有等待者都取消而中止的上游調用
+
+    async def run(self, name: str, key: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        執行 call()，鍵相同的請求進行中時改為等待其結果
+
+        Args:
+            name: 統計用的名稱 (例如 "tool_intent")
+            key: 合併鍵
+            call: 發出上游調用的函數
+        """
+        self.requests[name] = self.requests.get(name, 0) + 1
+        if not self.enabled:
+            self.upstream[name] = self.upstream.get(name, 0) + 1
+            return await call()
+
+        flight = self._flights.get(key)
+        if flight is None:
+            self.upstream[name] = self.upstream.get(name, 0) + 1
+            # 錯誤交給所有等待者處理
+            flight = _Flight(task_registry.spawn(call(), "llm_single_flight", log_errors=False))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda task: self._finish(key, flight))
+        else:
+            logger.debug(f"合併相同的上游請求 ({name})")
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if not flight.task.done() and flight.waiters == 1:
+                # 最後一個等待者也離開了，不再需要這次調用
+                self._forget(key, flight)
+                flight.task.cancel()
+                self.cancelled += 1
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _finish(self, key: str, flight: _Flight) -> None:
+        task = flight.task
+        if self.linger > 0 and not task.cancelled() and task.exception() is None:
+            asyncio.get_running_loop().call_later(self.linger, self._forget, key, flight)
+        else:
+            self._forget(key, flight)
+
+    def _forget(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def stats(self) -> Dict[str, Any]:
+        requests = sum(self.requests.values())
+        upstream = sum(self.upstream.values())
+        return {
+            "enabled": self.enabled,
+            "in_flight": len(self._flights),
+            "requests": requests,
+            "upstream_calls": upstream,
+            "coalesced": requests - upstream,
+            "coalescing_ratio": round((requests - upstream) / requests, 3) if requests else 0.0,
+            "cancelled": self.cancelled,
+            "by_name": {
+                name: {"requests": count, "upstream_calls": self.upstream.get(name, 0)}
+                for name, count in self.requests.items()
+            },
+        }
+
+
+# 全域共享的 LLM 請求合併器
+llm_single_flight = SingleFlight()
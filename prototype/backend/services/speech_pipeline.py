@@ -0,0 +1,242 @@
+"""
+串流語音管線 - 將 LLM 逐字輸出的文字切成句子，邊生成邊送往 TTS，
+並按照句子順序交付音訊片段。
+"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Any
+
+from core.config import settings
+from services.task_supervisor import task_registry
+
+logger = logging.getLogger("speech_pipeline")
+
+# 一定是句尾的標點 (中文與西文)
+SENTENCE_END_CHARS = "。！？!?；;…\n"
+# 句尾標點後可能緊接的收尾符號，需要跟著前一句
+CLOSING_CHARS = "」』”’）)】》\"'"
+
+
+def _find_sentence_end(text: str, start: int, final: bool) -> int:
+    """
+    從 start 開始尋找第一個句子結尾，返回句子結束位置 (不含)，找不到則返回 -1。
+
+    西文句點只有在後面接空白時才視為句尾，以免切開 "3.14" 之類的數字；
+    串流中句尾剛好位於緩衝區末端時，要等下一個字元到達 (final=True 時除外)。
+    """
+    length = len(text)
+    i = start
+    while i < length:
+        char = text[i]
+        is_end = False
+        if char in SENTENCE_END_CHARS:
+            is_end = True
+        elif char == ".":
+            if i + 1 < length:
+                is_end = text[i + 1].isspace()
+            else:
+                is_end = final
+        if is_end:
+            end = i + 1
+            # 連續的句尾標點 (例如 "？！" 或 "...") 與收尾符號一起歸入本句
+            while end < length and (text[end] in SENTENCE_END_CHARS or text[end] in CLOSING_CHARS or text[end] == "."):
+                end += 1
+            if end == length and not final:
+                # 句尾位於緩衝區末端，後面可能還有收尾符號或句點屬於數字，等下一段文字
+                return -1
+            return end
+        i += 1
+    return -1
+
+
+def split_sentences(text: str, min_chars: int = 0) -> List[str]:
+    """
+    將完整文字依中西文句尾標點切分為句子。
+
+    Args:
+        text: 要切分的文字
+        min_chars: 短於此長度的句子會與下一句合併
+
+    Returns:
+        去除首尾空白後的非空句子列表
+    """
+    chunker = SentenceChunker(min_chars=min_chars)
+    sentences = chunker.feed(text)
+    remainder = chunker.flush()
+    if remainder:
+        sentences.append(remainder)
+    return sentences
+
+
+class SentenceChunker:
+    """把逐字到達的文字增量累積成完整句子"""
+
+    def __init__(self, min_chars: Optional[int] = None):
+        """
+        初始化句子切分器
+
+        Args:
+            min_chars: 短於此長度的句子會暫存並與下一句合併 (預設讀取配置)
+        """
+        self.min_chars = settings.STREAM_TTS_MIN_SENTENCE_CHARS if min_chars is None else min_chars
+        self._buffer = ""
+
+    def feed(self, delta: str) -> List[str]:
+        """
+        加入一段文字增量
+
+        Args:
+            delta: 新到達的文字
+
+        Returns:
+            本次已完成的句子列表 (可能為空)
+        """
+        self._buffer += delta
+        return self._drain(final=False)
+
+    def flush(self) -> Optional[str]:
+        """
+        取出緩衝區內剩餘的文字 (串流結束時調用)
+
+        Returns:
+            剩餘的文字，若沒有則返回 None
+        """
+        sentences = self._drain(final=True)
+        remainder = self._buffer.strip()
+        self._buffer = ""
+        if remainder:
+            sentences.append(remainder)
+        if not sentences:
+            return None
+        return "".join(sentences)
+
+    def _drain(self, final: bool) -> List[str]:
+        sentences = []
+        search_from = 0
+        while True:
+            end = _find_sentence_end(self._buffer, search_from, final)
+            if end == -1:
+                break
+            candidate = self._buffer[:end].strip()
+            if len(candidate) < self.min_chars:
+                # 句子太短，繼續往後找下一個句尾一起送出
+                search_from = end
+                continue
+            sentences.append(candidate)
+            self._buffer = self._buffer[end:]
+            search_from = 0
+        return sentences
+
+
+class StreamingSpeechPipeline:
+    """
+    逐句 TTS 管線
+
+    文字增量透過 feed() 餵入，每完成一句就立即發起 TTS (受並發上限限制)，
+    合成結果透過 on_segment 回調按句子順序交付，即使後面的句子先合成完成。
+    """
+
+    def __init__(
+        self,
+        tts_service,
+        on_segment: Callable[[Dict[str, Any]], Awaitable[None]],
+        max_concurrency: Optional[int] = None
+    ):
+        """
+        初始化串流語音管線
+
+        Args:
+            tts_service: 提供 synthesize_speech_bytes(text) 的 TTS 服務
+            on_segment: 每個音訊片段就緒時調用，參數為
+                {"seq", "text", "audio", "codec", "duration"} 的字典
+                (audio 為原始音訊 bytes，失敗時為 None)
+            max_concurrency: 同時進行的 TTS 請求上限 (預設讀取配置)
+        """
+        self.tts_service = tts_service
+        self.on_segment = on_segment
+        self.chunker = SentenceChunker()
+        self._semaphore = asyncio.Semaphore(max_concurrency or settings.STREAM_TTS_MAX_CONCURRENCY)
+        self._pending: asyncio.Queue = asyncio.Queue()
+        self._segments: List[Dict[str, Any]] = []
+        self._next_seq = 0
+        self._deliver_task: Optional[asyncio.Task] = None
+        self.fed_chars = 0
+
+    async def feed(self, delta: str) -> None:
+        """餵入一段文字增量，完成的句子會立即送往 TTS"""
+        if not delta:
+            return
+        self.fed_chars += len(delta)
+        for sentence in self.chunker.feed(delta):
+            self._submit(sentence)
+
+    async def finish(self) -> List[Dict[str, Any]]:
+        """
+        結束輸入：送出剩餘文字並等待所有片段交付完成
+
+        Returns:
+            按順序排列的所有片段
+        """
+        remainder = self.chunker.flush()
+        if remainder:
+            self._submit(remainder)
+        if self._deliver_task is not None:
+            await self._pending.put(None)
+            await self._deliver_task
+        return self._segments
+
+    async def cancel(self) -> None:
+        """取消所有尚未交付的片段"""
+        if self._deliver_task is not None and not self._deliver_task.done():
+            self._deliver_task.cancel()
+            try:
+                await self._deliver_task
+            except asyncio.CancelledError:
+                pass
+        while not self._pending.empty():
+            item = self._pending.get_nowait()
+            if item is not None:
+                item[2].cancel()
+
+    def _submit(self, sentence: str) -> None:
+        seq = self._next_seq
+        self._next_seq += 1
+        # 結果由遞送迴圈等待並處理錯誤
+        task = task_registry.spawn(self._synthesize(seq, sentence), "speech_synthesis", log_errors=False)
+        self._pending.put_nowait((seq, sentence, task))
+        if self._deliver_task is None:
+            self._deliver_task = task_registry.spawn(self._deliver_loop(), "speech_delivery", log_errors=False)
+
+    async def _synthesize(self, seq: int, sentence: str) -> Optional[Dict]:
+        async with self._semaphore:
+            start_time = time.monotonic()
+            try:
+                result = await self.tts_service.synthesize_speech_bytes(sentence)
+            except Exception as e:
+                logger.error(f"片段 {seq} TTS 失敗: {e}", exc_info=True)
+                return None
+            logger.info(f"[Perf] 片段 {seq} TTS 耗時: {(time.monotonic() - start_time) * 1000:.2f} ms ({len(sentence)} 字)", extra={"log_category": "PERFORMANCE"})
+            return result
+
+    async def _deliver_loop(self) -> None:
+        """依序等待每個片段的 TTS 結果並交付"""
+        while True:
+            item = await self._pending.get()
+            if item is None:
+                break
+            seq, sentence, task = item
+            tts_result = await task
+            segment = {
+                "seq": seq,
+                "text": sentence,
+                "audio": tts_result.get("audio_bytes") if tts_result else None,
+                "codec": tts_result.get("codec", "mp3") if tts_result else None,
+                "duration": tts_result.get("duration", len(sentence) * 0.15) if tts_result else 0.0
+            }
+            self._segments.append(segment)
+            try:
+                await self.on_segment(segment)
+            except Exception as e:
+                logger.error(f"交付片段 {seq} 失敗: {e}", exc_info=True)
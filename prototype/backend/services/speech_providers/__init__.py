@@ -0,0 +1,48 @@
+"""
+語音服務提供者 - 依配置 (SPEECH_PROVIDER / TTS_PROVIDER / STT_PROVIDER) 選擇實作
+"""
+
+from typing import Optional
+
+from core.config import settings
+from .base import STTProvider, TTSProvider
+from .local_provider import LocalSTTProvider, LocalTTSProvider
+from .openai_provider import OpenAISTTProvider, OpenAITTSProvider
+
+TTS_PROVIDERS = {
+    "openai": OpenAITTSProvider,
+    "local": LocalTTSProvider,
+}
+
+STT_PROVIDERS = {
+    "openai": OpenAISTTProvider,
+    "local": LocalSTTProvider,
+}
+
+
+def create_tts_provider(name: Optional[str] = None) -> TTSProvider:
+    """依名稱 (預設讀取配置) 建立文字轉語音提供者"""
+    name = (name or settings.TTS_PROVIDER).lower()
+    if name not in TTS_PROVIDERS:
+        raise ValueError(f"未知的 TTS 提供者: {name}，可用: {', '.join(TTS_PROVIDERS)}")
+    return TTS_PROVIDERS[name]()
+
+
+def create_stt_provider(name: Optional[str] = None) -> STTProvider:
+    """依名稱 (預設讀取配置) 建立語音轉文字提供者"""
+    name = (name or settings.STT_PROVIDER).lower()
+    if name not in STT_PROVIDERS:
+        raise ValueError(f"未知的 STT 提供者: {name}，可用: {', '.join(STT_PROVIDERS)}")
+    return STT_PROVIDERS[name]()
+
+
+__all__ = [
+    'TTSProvider',
+    'STTProvider',
+    'OpenAITTSProvider',
+    'OpenAISTTProvider',
+    'LocalTTSProvider',
+    'LocalSTTProvider',
+    'create_tts_provider',
+    'create_stt_provider'
+]
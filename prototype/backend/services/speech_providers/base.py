@@ -0,0 +1,88 @@
+"""
+語音服務提供者介面 - TextToSpeechService / SpeechToTextService 只透過這些介面
+與實際的語音 API 溝通，因此可以在不連網的情況下換成本地替身進行壓力測試。
+"""
+
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Optional
+
+
+class TTSProvider(ABC):
+    """文字轉語音提供者基類"""
+
+    # 提供者名稱，會納入 TTS 快取鍵，避免不同提供者的音訊互相命中
+    name = "base"
+
+    @property
+    def available(self) -> bool:
+        """提供者是否可用 (例如 API 金鑰是否存在)"""
+        return True
+
+    @abstractmethod
+    async def synthesize(
+        self,
+        text: str,
+        model: str,
+        voice: str,
+        speed: float,
+        instructions: Optional[str],
+        response_format: str
+    ) -> bytes:
+        """
+        合成整段語音
+
+        Returns:
+            原始音訊 bytes
+
+        Raises:
+            SpeechServiceException: 合成失敗
+        """
+        pass
+
+    @abstractmethod
+    def stream(
+        self,
+        text: str,
+        model: str,
+        voice: str,
+        speed: float,
+        instructions: Optional[str],
+        response_format: str,
+        chunk_size: int
+    ) -> AsyncIterator[bytes]:
+        """
+        串流合成語音，音訊 bytes 一到達就產出
+
+        Raises:
+            SpeechServiceException: 合成失敗 (可能已產出部分音訊)
+        """
+        pass
+
+
+class STTProvider(ABC):
+    """語音轉文字提供者基類"""
+
+    name = "base"
+
+    @property
+    def available(self) -> bool:
+        """提供者是否可用 (例如 API 金鑰是否存在)"""
+        return True
+
+    @abstractmethod
+    async def transcribe(self, audio_data: bytes, filename: str, language: str) -> str:
+        """
+        將音訊轉換為文字
+
+        Args:
+            audio_data: 音訊數據
+            filename: 帶副檔名的檔名，用於告知格式
+            language: 語言代碼，例如 "zh"
+
+        Returns:
+            識別出的文字 (可能為空字串)
+
+        Raises:
+            SpeechServiceException: 識別失敗
+        """
+        pass
@@ -0,0 +1,188 @@
+"""
+本地語音替身 - 不連網、不花費的 TTS / STT 提供者，用於壓力測試與效能量測。
+
+  - TTS 返回有效的 MP3 (靜音 MPEG-2 Layer III 幀，24 kHz 單聲道) 或 WAV，
+    時長與文字長度成正比，相同輸入永遠得到相同輸出
+  - STT 依音訊內容的雜湊從預設的轉錄列表中挑選一句
+  - 延遲依配置的分佈抽樣 (fixed / uniform / normal / lognormal / exponential)
+  - 可依比例注入錯誤，模擬上游故障
+"""
+
+import asyncio
+import hashlib
+import logging
+import math
+import random
+import struct
+from typing import AsyncIterator, Callable, Optional
+
+from core.config import settings
+from core.exceptions import SpeechServiceException
+from .base import STTProvider, TTSProvider
+
+logger = logging.getLogger("speech_providers.local")
+
+# 靜音 MP3 幀：MPEG-2 Layer III、無 CRC、32 kbps、24000 Hz、單聲道
+# side info 與主資料全為 0，解碼結果為靜音
+MP3_FRAME_HEADER = bytes([0xFF, 0xF3, 0x44, 0xC0])
+MP3_SAMPLE_RATE = 24000
+MP3_SAMPLES_PER_FRAME = 576
+MP3_FRAME_SIZE = 72 * 32000 // MP3_SAMPLE_RATE  # 96 bytes
+SILENT_MP3_FRAME = MP3_FRAME_HEADER + bytes(MP3_FRAME_SIZE - len(MP3_FRAME_HEADER))
+
+WAV_SAMPLE_RATE = 24000
+
+
+def parse_latency_spec(spec: str) -> Callable[[random.Random], float]:
+    """
+    解析延遲分佈描述，返回抽樣函數 (單位: 秒)
+
+    格式為 "分佈:參數1,參數2"，例如：
+        fixed:0.5             固定 0.5 秒
+        uniform:0.2,1.0       0.2 到 1.0 秒均勻分佈
+        normal:0.8,0.2        平均 0.8、標準差 0.2 (小於 0 取 0)
+        lognormal:0.8,0.3     中位數 0.8、對數標準差 0.3 (長尾，最接近真實 API)
+        exponential:0.5       平均 0.5 秒
+    """
+    name, _, params_text = spec.strip().partition(":")
+    name = name.strip().lower()
+    try:
+        params = [float(p) for p in params_text.split(",") if p.strip()]
+    except ValueError:
+        raise ValueError(f"無效的延遲分佈參數: {spec}")
+
+    if name in ("fixed", "constant", "none", "") and len(params) <= 1:
+        value = params[0] if params else 0.0
+        return lambda rng: value
+    if name == "uniform" and len(params) == 2:
+        low, high = params
+        return lambda rng: rng.uniform(low, high)
+    if name == "normal" and len(params) == 2:
+        mean, stddev = params
+        return lambda rng: max(0.0, rng.gauss(mean, stddev))
+    if name == "lognormal" and len(params) == 2:
+        median, sigma = params
+        return lambda rng: median * math.exp(rng.gauss(0.0, sigma))
+    if name == "exponential" and len(params) == 1:
+        mean = params[0]
+        return lambda rng: rng.expovariate(1.0 / mean) if mean > 0 else 0.0
+    raise ValueError(f"無效的延遲分佈: {spec}")
+
+
+def build_silent_mp3(duration: float) -> bytes:
+    """產生指定時長 (向上取整到幀) 的靜音 MP3"""
+    frame_count = max(1, math.ceil(duration * MP3_SAMPLE_RATE / MP3_SAMPLES_PER_FRAME))
+    return SILENT_MP3_FRAME * frame_count
+
+
+def build_silent_wav(duration: float) -> bytes:
+    """產生指定時長的 16-bit 單聲道靜音 WAV"""
+    sample_count = max(1, int(duration * WAV_SAMPLE_RATE))
+    data_size = sample_count * 2
+    header = struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_size, b"WAVE",
+        b"fmt ", 16, 1, 1, WAV_SAMPLE_RATE, WAV_SAMPLE_RATE * 2, 2, 16,
+        b"data", data_size
+    )
+    return header + bytes(data_size)
+
+
+class _SimulatedUpstream:
+    """延遲抽樣與錯誤注入的共用邏輯"""
+
+    def __init__(self, latency_spec: str, error_rate: float, seed: Optional[int]):
+        self._sample_latency = parse_latency_spec(latency_spec)
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+
+    def sample_latency(self) -> float:
+        return self._sample_latency(self._rng)
+
+    def maybe_fail(self, operation: str) -> None:
+        if self.error_rate > 0 and self._rng.random() < self.error_rate:
+            logger.warning(f"本地語音替身注入錯誤 ({operation})")
+            raise SpeechServiceException(f"本地語音替身模擬的 {operation} 錯誤", status_code=503)
+
+
+class LocalTTSProvider(TTSProvider):
+    """本地 TTS 替身，返回與文字長度成正比的靜音音訊"""
+
+    name = "local"
+
+    def __init__(
+        self,
+        latency_spec: Optional[str] = None,
+        error_rate: Optional[float] = None,
+        seconds_per_char: Optional[float] = None,
+        seed: Optional[int] = None
+    ):
+        """
+        初始化本地 TTS 替身
+
+        Args:
+            latency_spec: 整段合成延遲的分佈 (預設讀取配置)
+            error_rate: 注入錯誤的比例 0-1 (預設讀取配置)
+            seconds_per_char: 每個字元對應的音訊秒數 (預設讀取配置)
+            seed: 隨機種子，固定後延遲與錯誤序列可重現 (預設讀取配置)
+        """
+        self._upstream = _SimulatedUpstream(
+            latency_spec or settings.LOCAL_TTS_LATENCY,
+            settings.LOCAL_SPEECH_ERROR_RATE if error_rate is None else error_rate,
+            settings.LOCAL_SPEECH_SEED if seed is None else seed
+        )
+        self.seconds_per_char = seconds_per_char or settings.LOCAL_TTS_SECONDS_PER_CHAR
+
+    def _render(self, text: str, speed: float, response_format: str) -> bytes:
+        duration = len(text) * self.seconds_per_char / (speed or 1.0)
+        if response_format == "wav":
+            return build_silent_wav(duration)
+        if response_format != "mp3":
+            raise SpeechServiceException(f"本地語音替身不支援的格式: {response_format}", status_code=400)
+        return build_silent_mp3(duration)
+
+    async def synthesize(self, text, model, voice, speed, instructions, response_format) -> bytes:
+        await asyncio.sleep(self._upstream.sample_latency())
+        self._upstream.maybe_fail("TTS")
+        return self._render(text, speed, response_format)
+
+    async def stream(self, text, model, voice, speed, instructions, response_format, chunk_size) -> AsyncIterator[bytes]:
+        total_latency = self._upstream.sample_latency()
+        self._upstream.maybe_fail("TTS")
+        audio = self._render(text, speed, response_format)
+        chunk_count = max(1, math.ceil(len(audio) / chunk_size))
+        # 首塊延遲佔整體的 LOCAL_TTS_STREAM_FIRST_CHUNK_RATIO，其餘平均分攤到後續各塊
+        await asyncio.sleep(total_latency * settings.LOCAL_TTS_STREAM_FIRST_CHUNK_RATIO)
+        per_chunk_delay = total_latency * (1 - settings.LOCAL_TTS_STREAM_FIRST_CHUNK_RATIO) / chunk_count
+        for index in range(chunk_count):
+            if index:
+                await asyncio.sleep(per_chunk_delay)
+            yield audio[index * chunk_size:(index + 1) * chunk_size]
+
+
+class LocalSTTProvider(STTProvider):
+    """本地 STT 替身，依音訊雜湊返回預設轉錄"""
+
+    name = "local"
+
+    def __init__(
+        self,
+        latency_spec: Optional[str] = None,
+        error_rate: Optional[float] = None,
+        transcripts: Optional[list] = None,
+        seed: Optional[int] = None
+    ):
+        self._upstream = _SimulatedUpstream(
+            latency_spec or settings.LOCAL_STT_LATENCY,
+            settings.LOCAL_SPEECH_ERROR_RATE if error_rate is None else error_rate,
+            settings.LOCAL_SPEECH_SEED if seed is None else seed
+        )
+        self.transcripts = transcripts or settings.LOCAL_STT_TRANSCRIPTS
+
+    async def transcribe(self, audio_data: bytes, filename: str, language: str) -> str:
+        await asyncio.sleep(self._upstream.sample_latency())
+        self._upstream.maybe_fail("STT")
+        if not audio_data or not self.transcripts:
+            return ""
+        digest = hashlib.blake2b(audio_data, digest_size=8).digest()
+        return self.transcripts[int.from_bytes(digest, "big") % len(self.transcripts)]
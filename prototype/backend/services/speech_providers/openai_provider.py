@@ -0,0 +1,108 @@
+"""
+OpenAI 語音提供者 - gpt-4o-mini-tts 文字轉語音與 Whisper 語音轉文字
+"""
+
+import logging
+from typing import AsyncIterator, Optional
+
+import openai
+
+from core.exceptions import SpeechServiceException
+from services.clients import upstream_clients
+from services.upstream_scheduler import upstream_scheduler
+from .base import STTProvider, TTSProvider
+
+logger = logging.getLogger("speech_providers.openai")
+
+
+def _api_error_detail(e: "openai.APIError") -> str:
+    """從 OpenAI API 錯誤中提取最詳細的錯誤訊息"""
+    error_detail = e.message
+    if hasattr(e, 'body') and e.body and 'error' in e.body and 'message' in e.body['error']:
+        error_detail = e.body['error']['message']
+    return error_detail
+
+
+def _to_service_exception(e: "openai.APIError", model: str) -> SpeechServiceException:
+    """將 OpenAI API 錯誤轉為 SpeechServiceException，並記錄可能的模型或參數問題"""
+    status_code = getattr(e, "status_code", None) or 502
+    logger.error(f"OpenAI API 錯誤: {status_code} - {e.message}", exc_info=True)
+    error_detail = _api_error_detail(e)
+    # 檢查是否為模型或參數相關錯誤
+    if "instruct" in error_detail.lower() or "model not found" in error_detail.lower() or model in error_detail.lower():
+        logger.error(f"調用 OpenAI 失敗，請檢查模型名稱 '{model}' 或 'instructions' 參數是否有效: {error_detail}")
+    return SpeechServiceException(f"OpenAI API 錯誤: {error_detail}", status_code=status_code)
+
+
+class OpenAITTSProvider(TTSProvider):
+    """使用 OpenAI TTS API 的文字轉語音提供者"""
+
+    name = "openai"
+
+    def __init__(self, client: Optional["openai.AsyncOpenAI"] = None):
+        # 預設使用全域共用的非同步客戶端 (與 STT 共用連線池)
+        self.client = client or upstream_clients.openai_client()
+
+    @property
+    def available(self) -> bool:
+        return self.client is not None
+
+    async def synthesize(self, text, model, voice, speed, instructions, response_format) -> bytes:
+        try:
+            async with upstream_scheduler.slot("openai"):
+                response = await self.client.audio.speech.create(
+                    model=model,
+                    voice=voice,
+                    input=text,
+                    response_format=response_format,
+                    speed=speed,
+                    instructions=instructions
+                )
+        except openai.APIError as e:
+            raise _to_service_exception(e, model) from e
+        return response.content
+
+    async def stream(self, text, model, voice, speed, instructions, response_format, chunk_size) -> AsyncIterator[bytes]:
+        try:
+            # 名額佔用到串流結束
+            async with upstream_scheduler.slot("openai"), self.client.audio.speech.with_streaming_response.create(
+                model=model,
+                voice=voice,
+                input=text,
+                response_format=response_format,
+                speed=speed,
+                instructions=instructions
+            ) as response:
+                async for chunk in response.iter_bytes(chunk_size):
+                    if chunk:
+                        yield chunk
+        except openai.APIError as e:
+            raise _to_service_exception(e, model) from e
+
+
+class OpenAISTTProvider(STTProvider):
+    """使用 OpenAI Whisper API 的語音轉文字提供者"""
+
+    name = "openai"
+    model = "whisper-1"
+
+    def __init__(self, client: Optional["openai.AsyncOpenAI"] = None):
+        self.client = client or upstream_clients.openai_client()
+
+    @property
+    def available(self) -> bool:
+        return self.client is not None
+
+    async def transcribe(self, audio_data: bytes, filename: str, language: str) -> str:
+        try:
+            async with upstream_scheduler.slot("openai"):
+                response = await self.client.audio.transcriptions.create(
+                    model=self.model,
+                    file=(filename, audio_data),
+                    language=language,
+                    response_format="json" # 或 verbose_json
+                )
+        except openai.APIError as e:
+            raise _to_service_exception(e, self.model) from e
+        # 提取文字 (確保 response 和 response.text 存在)
+        return response.text if response and hasattr(response, 'text') else ""
@@ -3,32 +3,35 @@ import os
 import logging
 from typing import Optional, Dict, Any
 # from google.cloud import speech # 移除 Google
-import openai # 匯入 OpenAI
 from core.config import settings
 from core.exceptions import SpeechServiceException
+from services.speech_providers import STTProvider, create_stt_provider
 
 # 設置日誌
 logger = logging.getLogger("speech_service")
 logger.setLevel(logging.DEBUG)
 
 class SpeechToTextService:
-    """語音轉文字服務 (使用 OpenAI Whisper)"""
+    """語音轉文字服務 (提供者依配置選擇，預設為 OpenAI Whisper)"""
 
-    def __init__(self):
+    def __init__(self, provider: Optional[STTProvider] = None):
+        """
+        初始化語音轉文字服務
+
+        Args:
+            provider: 語音提供者 (預設依 STT_PROVIDER 配置建立)
+        """
         # self.credentials_path = settings.GOOGLE_APPLICATION_CREDENTIALS # 移除 Google 憑證
-        self.api_key = settings.OPENAI_API_KEY # 讀取 OpenAI Key
-        if self.api_key:
-            # 使用非同步客戶端
-            self.openai_client = openai.AsyncOpenAI(api_key=self.api_key)
-            logger.info("已初始化 OpenAI Whisper 客戶端")
+        self.provider = provider or create_stt_provider()
+        if self.provider.available:
+            logger.info(f"已初始化 STT 提供者: {self.provider.name}")
         else:
-            self.openai_client = None
-            logger.error("警告: 找不到 OpenAI API 金鑰，語音轉文字功能將不可用")
-            print("警告: 找不到 OpenAI API 金鑰，語音轉文字功能將不可用")
+            logger.error(f"警告: STT 提供者 {self.provider.name} 不可用 (例如找不到 OpenAI API 金鑰)，語音轉文字功能將不可用")
+            print(f"警告: STT 提供者 {self.provider.name} 不可用，語音轉文字功能將不可用")
 
     async def transcribe_audio(self, audio_data: bytes, mime_type: str = "audio/webm;codecs=opus") -> Dict[str, Any]:
         """
-        將音訊轉換為文字 (使用 OpenAI Whisper)
+        將音訊轉換為文字 (使用配置的 STT 提供者)
 
         Args:
             audio_data: 音訊數據 (bytes)
@@ -37,12 +40,12 @@ class SpeechToTextService:
         Returns:
             包含文字和狀態的字典
         """
-        if not self.openai_client:
-            logger.error("語音轉文字服務未初始化 (OpenAI)")
+        if not self.provider.available:
+            logger.error(f"語音轉文字服務未初始化 ({self.provider.name})")
             return {"text": "", "success": False, "error": "語音服務未初始化"}
 
         try:
-            logger.info(f"開始處理音頻 (OpenAI)，大小: {len(audio_data)} 字節，MIME類型: {mime_type}")
+            logger.info(f"開始處理音頻 ({self.provider.name})，大小: {len(audio_data)} 字節，MIME類型: {mime_type}")
 
             # 從 mime_type 推斷檔名後綴，預設為 webm
             extension = "webm"
@@ -56,44 +59,31 @@ class SpeechToTextService:
                 extension = "m4a"
             # 可以根據需要添加更多格式
 
-            file_tuple = (f"audio.{extension}", audio_data)
-            logger.info(f"準備上傳檔案: {file_tuple[0]}")
+            filename = f"audio.{extension}"
+            logger.info(f"準備上傳檔案: {filename}")
 
-            # 呼叫 OpenAI Whisper API
-            response = await self.openai_client.audio.transcriptions.create(
-                model="whisper-1",
-                file=file_tuple,
-                language="zh", # 指定語言為中文
-                response_format="json" # 或 verbose_json
+            transcript = await self.provider.transcribe(
+                audio_data,
+                filename=filename,
+                language="zh" # 指定語言為中文
             )
 
-            # 提取文字 (確保 response 和 response.text 存在)
-            transcript = response.text if response and hasattr(response, 'text') else ""
-
             if transcript:
-                logger.info(f"最終識別文字 (OpenAI): '{transcript}'")
+                logger.info(f"最終識別文字 ({self.provider.name}): '{transcript}'")
                 return {
                     "text": transcript,
                     "success": True,
                     "confidence": None # Whisper 標準回應不提供置信度
                 }
             else:
-                # 檢查是否有 API 返回的錯誤信息 (雖然通常會拋出異常)
                 error_msg = "未能識別語音內容"
-                if response and hasattr(response, 'error') and response.error:
-                   error_msg = response.error.get('message', error_msg)
-
-                logger.warning(f"未能識別語音內容 (OpenAI): {error_msg}")
+                logger.warning(f"未能識別語音內容 ({self.provider.name}): {error_msg}")
                 return {"text": "", "success": False, "error": error_msg}
 
-        except openai.APIError as e:
-            # 處理 OpenAI 特定錯誤
-            logger.error(f"OpenAI API 錯誤: {e.status_code} - {e.message}", exc_info=True)
-            # 嘗試提取更詳細的錯誤信息
-            error_detail = e.message
-            if hasattr(e, 'body') and e.body and 'error' in e.body and 'message' in e.body['error']:
-                error_detail = e.body['error']['message']
-            return {"text": "", "success": False, "error": f"OpenAI API 錯誤: {error_detail}"}
+        except SpeechServiceException as e:
+            # 提供者已整理好錯誤信息 (例如 OpenAI API 錯誤的詳細訊息)
+            logger.error(f"語音轉文字失敗 ({self.provider.name}): {e.message}")
+            return {"text": "", "success": False, "error": e.message}
         except Exception as e:
-            logger.error(f"語音轉文字失敗 (OpenAI): {str(e)}", exc_info=True)
+            logger.error(f"語音轉文字失敗 ({self.provider.name}): {str(e)}", exc_info=True)
             return {"text": "", "success": False, "error": str(e)} 
\ No newline at end of file
@@ -0,0 +1,182 @@
+"""
+背景任務的擁有者與登記
+
+過去回覆與 murmur 的語音重置計時器、記憶整合等以 asyncio.create_task 發出後不保留參考：
+連線中斷後計時器仍會觸發，新的計時器也不會取代舊的，任務的例外只在垃圾回收時印出。
+現在每個背景任務都有擁有者：
+
+- TaskSupervisor：單一會話的任務 (TaskGroup 式)，同鍵的新任務取代舊任務 (例如語音重置計時器)，
+  連線結束時取消全部並等待結束，之後不再接受新任務
+- TaskRegistry：應用範圍的登記，供 /metrics 觀察洩漏。後端建立的每個背景任務都經此建立並標上種類：
+  會話任務、記憶整合、直播房間流程、出站寫入、murmur 計時器/預生成/批次、TTS 快取讀寫、
+  LLM 請求合併、語音管線與音訊儲存/會話儲存的背景 I/O；未處理的例外在任務結束時記錄
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Coroutine, Dict, Optional, Set
+
+from core.config import settings
+
+logger = logging.getLogger("task_supervisor")
+
+
+class TaskRegistry:
+    """應用範圍的背景任務登記"""
+
+    def __init__(self):
+        self._tasks: Dict[asyncio.Future, str] = {}  # 進行中的任務 -> 種類
+        self._quiet: Set[asyncio.Future] = set()  # 錯誤由等待者處理、不需記錄的任務
+        self.created: Dict[str, int] = {}
+        self.completed = 0
+        self.cancelled = 0
+        self.failed = 0
+
+    def spawn(self, coro: Awaitable[Any], kind: str, log_errors: bool = True) -> asyncio.Future:
+        """
+        建立並登記任務
+
+        Args:
+            coro: 任務的協程
+            kind: 任務種類 (統計用)
+            log_errors: 是否記錄未處理的錯誤 (結果由其他協程等待、錯誤已在那裡處理時設為 False)
+        """
+        task = asyncio.ensure_future(coro)
+        self._tasks[task] = kind
+        if not log_errors:
+            self._quiet.add(task)
+        self.created[kind] = self.created.get(kind, 0) + 1
+        task.add_done_callback(self._finished)
+        return task
+
+    def _finished(self, task: asyncio.Future) -> None:
+        kind = self._tasks.pop(task, "unknown")
+        quiet = task in self._quiet
+        self._quiet.discard(task)
+        if task.cancelled():
+            self.cancelled += 1
+            return
+        error = task.exception()
+        if error is None:
+            self.completed += 1
+            return
+        self.failed += 1
+        if quiet:
+            return
+        logger.error(f"背景任務 ({kind}) 發生未處理的錯誤: {error!r}", exc_info=error)
+
+    def live(self, kind: Optional[str] = None) -> int:
+        """進行中的任務數"""
+        if kind is None:
+            return len(self._tasks)
+        return sum(1 for task_kind in self._tasks.values() if task_kind == kind)
+
+    async def shutdown(self, timeout: Optional[float] = None) -> None:
+        """應用關閉：取消所有仍在進行的任務並等待結束"""
+        tasks = list(self._tasks)
+        if not tasks:
+            return
+        for task in tasks:
+            task.cancel()
+        _, pending = await asyncio.wait(tasks, timeout=timeout or settings.TASK_SHUTDOWN_TIMEOUT)
+        if pending:
+            logger.warning(f"應用關閉時仍有 {len(pending)} 個背景任務未結束")
+
+    def stats(self) -> Dict[str, Any]:
+        live_by_kind: Dict[str, int] = {}
+        for kind in self._tasks.values():
+            live_by_kind[kind] = live_by_kind.get(kind, 0) + 1
+        return {
+            "live": len(self._tasks),
+            "live_by_kind": live_by_kind,
+            "created_by_kind": dict(self.created),
+            "completed": self.completed,
+            "cancelled": self.cancelled,
+            "failed": self.failed,
+        }
+
+
+# 全域共享的背景任務登記
+task_registry = TaskRegistry()
+
+
+class TaskSupervisor:
+    """單一會話擁有的背景任務，連線結束時全部取消"""
+
+    def __init__(self, owner: str = "", registry: Optional[TaskRegistry] = None):
+        """
+        Args:
+            owner: 擁有者 (會話 id)，用於日誌
+            registry: 登記任務的應用範圍登記，預設為全域共享的 task_registry
+        """
+        self.owner = owner
+        self.registry = registry or task_registry
+        self._tasks: Dict[asyncio.Task, str] = {}  # 進行中的任務 -> 種類
+        self._keyed: Dict[str, asyncio.Task] = {}
+        self.closed = False
+        self.superseded = 0
+
+    def spawn(self, coro: Coroutine[Any, Any, Any], kind: str, key: Optional[str] = None) -> asyncio.Task:
+        """
+        建立屬於此會話的任務
+
+        Args:
+            coro: 任務的協程
+            kind: 任務種類 (統計用)
+            key: 同鍵的舊任務尚未結束時先取消 (例如語音重置計時器)
+
+        Raises:
+            RuntimeError: 會話已關閉
+        """
+        if self.closed:
+            coro.close()
+            raise RuntimeError(f"會話 {self.owner} 已關閉，不再建立背景任務 ({kind})")
+        if key is not None:
+            previous = self._keyed.get(key)
+            if previous is not None and not previous.done():
+                previous.cancel()
+                self.superseded += 1
+        task = self.registry.spawn(coro, kind)
+        self._tasks[task] = kind
+        if key is not None:
+            self._keyed[key] = task
+        task.add_done_callback(lambda task, key=key: self._finished(task, key))
+        return task
+
+    def _finished(self, task: asyncio.Task, key: Optional[str]) -> None:
+        self._tasks.pop(task, None)
+        if key is not None and self._keyed.get(key) is task:
+            del self._keyed[key]
+
+    def cancel(self, key: str) -> bool:
+        """取消指定鍵的任務，返回是否真的取消了進行中的任務"""
+        task = self._keyed.get(key)
+        if task is None or task.done():
+            return False
+        task.cancel()
+        return True
+
+    def live(self) -> int:
+        return len(self._tasks)
+
+    async def aclose(self, timeout: Optional[float] = None) -> None:
+        """連線結束：取消所有任務並等待結束 (不再接受新任務)"""
+        self.closed = True
+        tasks = [task for task in self._tasks if task is not asyncio.current_task()]
+        if not tasks:
+            return
+        for task in tasks:
+            task.cancel()
+        _, pending = await asyncio.wait(tasks, timeout=timeout or settings.TASK_SHUTDOWN_TIMEOUT)
+        if pending:
+            logger.warning(f"會話 {self.owner} 關閉時仍有 {len(pending)} 個背景任務未結束: {sorted(self._tasks[task] for task in pending if task in self._tasks)}")
+
+    def stats(self) -> Dict[str, Any]:
+        live_by_kind: Dict[str, int] = {}
+        for kind in self._tasks.values():
+            live_by_kind[kind] = live_by_kind.get(kind, 0) + 1
+        return {
+            "live": len(self._tasks),
+            "live_by_kind": live_by_kind,
+            "superseded": self.superseded,
+        }
@@ -1,91 +1,247 @@
 import os
+import asyncio
 import base64
-from typing import Optional, Dict
+from typing import AsyncIterator, Optional, Dict, List
 # from google.cloud import texttospeech # 移除 Google
-import openai # 匯入 OpenAI
 from core.config import settings
 from core.exceptions import SpeechServiceException
+from services.speech_providers import TTSProvider, create_tts_provider
+from services.tts_cache import tts_cache, make_cache_key
+from services.speech_pipeline import split_sentences
+from utils.audio_timing import get_audio_duration, concat_audio_frames
 import logging # 建議加入日誌
 
 logger = logging.getLogger("tts_service")
 logger.setLevel(logging.DEBUG)
 
 # 將 instructions 定義為常數或從配置讀取
+TTS_MODEL = "gpt-4o-mini-tts"  # 使用指定的模型
+TTS_VOICE = "nova"  # 選擇聲音 (可調整，例如 fable, shimmer)
+TTS_SPEED = 1.1  # 設定語速
+TTS_RESPONSE_FORMAT = "mp3"
 TTS_INSTRUCTIONS = "歡迎加入這場為期一年的業餘太空生活探險！每天都會有新的挑戰與事件，可能是來自真實太空環境的威脅，也可能只是些日常小事。你可以隨時觀察並透過語音參與，提供想法或建議。你的每個決定與回應，都將影響這次旅程的發展，以及我的生存狀態與情緒波動。讓我們看看最後能否順利完成這段冒險吧！"
 
 class TextToSpeechService:
-    """文字轉語音服務 (使用 OpenAI TTS)"""
+    """文字轉語音服務 (提供者依配置選擇，預設為 OpenAI TTS)"""
 
-    def __init__(self):
+    def __init__(self, provider: Optional[TTSProvider] = None):
+        """
+        初始化文字轉語音服務
+
+        Args:
+            provider: 語音提供者 (預設依 TTS_PROVIDER 配置建立)
+        """
         # self.credentials_path = settings.GOOGLE_APPLICATION_CREDENTIALS # 移除 Google 憑證
-        self.api_key = settings.OPENAI_API_KEY # 讀取 OpenAI Key
-        if self.api_key:
-            # 使用非同步客戶端
-            self.openai_client = openai.AsyncOpenAI(api_key=self.api_key)
-            logger.info("已初始化 OpenAI TTS 客戶端")
+        self.provider = provider or create_tts_provider()
+        if self.provider.available:
+            logger.info(f"已初始化 TTS 提供者: {self.provider.name}")
         else:
-            self.openai_client = None
-            logger.error("警告: 找不到 OpenAI API 金鑰，文字轉語音功能將不可用")
-            print("警告: 找不到 OpenAI API 金鑰，文字轉語音功能將不可用")
+            logger.error(f"警告: TTS 提供者 {self.provider.name} 不可用 (例如找不到 OpenAI API 金鑰)，文字轉語音功能將不可用")
+            print(f"警告: TTS 提供者 {self.provider.name} 不可用，文字轉語音功能將不可用")
+
+    def _cache_key(self, text: str) -> str:
+        """TTS 快取鍵，包含提供者名稱，避免本地替身的音訊與真實音訊互相命中"""
+        return make_cache_key(text, f"{self.provider.name}:{TTS_MODEL}", TTS_VOICE, TTS_SPEED, TTS_INSTRUCTIONS, TTS_RESPONSE_FORMAT)
 
     async def synthesize_speech(self, text: str) -> Optional[Dict]:
         """
-        將文字轉換為語音 (使用 OpenAI TTS)
+        將文字轉換為語音 (使用配置的 TTS 提供者)
 
         Args:
             text: 要轉換的文字
 
         Returns:
-            包含 Base64 音訊數據和估算時長的字典，或 None（如果失敗）
+            包含 Base64 音訊數據和時長 (可解析時) 的字典，或 None（如果失敗）
         """
-        if not self.openai_client:
-            logger.error("文字轉語音服務未初始化 (OpenAI)")
+        result = await self.synthesize_speech_bytes(text)
+        if not result:
+            return None
+
+        # 將原始音訊 bytes 轉為 Base64
+        audio_base64 = base64.b64encode(result["audio_bytes"]).decode('utf-8')
+        logger.info(f"成功生成語音 ({self.provider.name})，Base64 長度: {len(audio_base64)}")
+
+        tts_result = {"audio": audio_base64}
+        if "duration" in result:
+            tts_result["duration"] = result["duration"]
+        return tts_result
+
+    async def synthesize_speech_bytes(self, text: str) -> Optional[Dict]:
+        """
+        將文字轉換為語音，直接返回原始音訊 bytes (不經過 Base64)
+
+        Args:
+            text: 要轉換的文字
+
+        Returns:
+            {"audio_bytes": bytes, "codec": "mp3", "duration": 秒數} 字典，或 None（如果失敗）；
+            duration 由 MP3 幀標頭精確計算，無法解析時不包含此鍵。
+            啟用 TTS_PARALLEL_ENABLED 且文字夠長時，會逐句並行合成後拼接 (見 synthesize_speech_segments)
+        """
+        if not self.provider.available:
+            logger.error(f"文字轉語音服務未初始化 ({self.provider.name})")
             return None
 
         if not text:
              logger.warning("輸入文字為空，無法生成語音")
              return None
 
+        if settings.TTS_PARALLEL_ENABLED and len(text) >= settings.TTS_PARALLEL_MIN_CHARS:
+            # 長文字逐句並行合成，再以幀對齊方式按順序拼接
+            segments = await self.synthesize_speech_segments(text)
+            if segments and len(segments) > 1:
+                audio_bytes, duration = concat_audio_frames([segment["audio_bytes"] for segment in segments])
+                if audio_bytes:
+                    logger.info(f"並行合成 {len(segments)} 個片段並拼接完成，總時長: {duration:.3f} 秒")
+                    return {
+                        "audio_bytes": audio_bytes,
+                        "codec": TTS_RESPONSE_FORMAT,
+                        "duration": duration,
+                        "segment_count": len(segments)
+                    }
+            elif segments:
+                return segments[0]
+            logger.warning("並行合成失敗，改為整段合成")
+
+        return await self._synthesize_single(text)
+
+    async def synthesize_speech_segments(self, text: str, max_concurrency: Optional[int] = None) -> Optional[List[Dict]]:
+        """
+        依中西文句尾標點切分文字，以有上限的並發數同時合成各句
+
+        Args:
+            text: 要轉換的文字
+            max_concurrency: 同時進行的合成請求上限 (預設讀取配置)
+
+        Returns:
+            按句子順序排列的片段列表，每項為
+            {"seq", "text", "audio_bytes", "codec", "duration"}；任一句失敗時返回 None
+        """
+        if not self.provider.available or not text:
+            return None
+
+        sentences = split_sentences(text, min_chars=settings.TTS_PARALLEL_MIN_SEGMENT_CHARS)
+        if not sentences:
+            return None
+        semaphore = asyncio.Semaphore(max_concurrency or settings.TTS_PARALLEL_MAX_CONCURRENCY)
+
+        async def synthesize_sentence(sentence: str) -> Optional[Dict]:
+            async with semaphore:
+                return await self._synthesize_single(sentence)
+
+        results = await asyncio.gather(*(synthesize_sentence(sentence) for sentence in sentences))
+        if any(result is None for result in results):
+            logger.error(f"並行合成中有 {sum(result is None for result in results)}/{len(results)} 個片段失敗")
+            return None
+        return [
+            dict(result, seq=seq, text=sentence)
+            for seq, (sentence, result) in enumerate(zip(sentences, results))
+        ]
+
+    async def _synthesize_single(self, text: str) -> Optional[Dict]:
+        """以單次 TTS 請求合成整段文字 (經過快取)"""
+        if settings.TTS_CACHE_ENABLED and len(text) <= settings.TTS_CACHE_MAX_TEXT_CHARS:
+            # 重複的語句 (錯誤回退訊息、重複的 murmur) 直接使用快取，相同請求並發時只合成一次
+            cache_key = self._cache_key(text)
+            audio_bytes = await tts_cache.get_or_synthesize(cache_key, lambda: self._create_speech(text))
+        else:
+            audio_bytes = await self._create_speech(text)
+
+        if not audio_bytes:
+            return None
+        result = {
+            "audio_bytes": audio_bytes,
+            "codec": TTS_RESPONSE_FORMAT
+        }
+        duration = get_audio_duration(audio_bytes)
+        if duration is not None:
+            result["duration"] = duration
+            logger.info(f"語音時長 (MP3 幀標頭): {duration:.3f} 秒")
+        else:
+            logger.warning("無法從音訊幀標頭解析時長")
+        return result
+
+    async def _create_speech(self, text: str) -> Optional[bytes]:
+        """調用 TTS 提供者合成語音，失敗時返回 None"""
         try:
-            logger.info(f"開始生成語音 (OpenAI TTS - gpt-4o-mini-tts): '{text[:50]}...' 使用 instruction") # 記錄部分文字
-
-            response = await self.openai_client.audio.speech.create(
-                model="gpt-4o-mini-tts", # 使用指定的模型
-                voice="nova",          # 選擇聲音 (可調整，例如 fable, shimmer)
-                input=text,
-                response_format="mp3",
-                speed=1.1,             # 設定語速
-                instructions=TTS_INSTRUCTIONS # 加入 instructions 參數
+            logger.info(f"開始生成語音 ({self.provider.name} - {TTS_MODEL}): '{text[:50]}...' 使用 instruction") # 記錄部分文字
+
+            audio_bytes = await self.provider.synthesize(
+                text,
+                model=TTS_MODEL,
+                voice=TTS_VOICE,
+                speed=TTS_SPEED,
+                instructions=TTS_INSTRUCTIONS, # 加入 instructions 參數
+                response_format=TTS_RESPONSE_FORMAT
             )
 
-            # 將原始音訊 bytes 轉為 Base64
-            audio_base64 = base64.b64encode(response.content).decode('utf-8')
-
-            # --- 時長估算 (非常不準確，建議後續改進) ---
-            # estimated_duration = len(text) * 0.24 / 1.1 # 沿用舊邏輯
-            # logger.info(f"估算的音訊時長: {estimated_duration:.2f} 秒 (基於文字長度，可能不準確)")
-            # --- 估算結束 ---
-
-            logger.info(f"成功生成語音 (OpenAI TTS)，Base64 長度: {len(audio_base64)}")
-
-            return {
-                "audio": audio_base64,
-                # "duration": estimated_duration # 移除 duration
-            }
-
-        except openai.APIError as e:
-            logger.error(f"OpenAI TTS API 錯誤: {e.status_code} - {e.message}", exc_info=True)
-            error_detail = e.message
-            if hasattr(e, 'body') and e.body and 'error' in e.body and 'message' in e.body['error']:
-                error_detail = e.body['error']['message']
-            # 檢查是否為模型或參數相關錯誤
-            if "instruct" in error_detail.lower() or "model not found" in error_detail.lower() or "gpt-4o-mini-tts" in error_detail.lower():
-                 logger.error(f"調用 OpenAI TTS 失敗，請檢查模型名稱 'gpt-4o-mini-tts' 或 'instructions' 參數是否有效: {error_detail}")
-                 print(f"調用 OpenAI TTS 失敗，請檢查模型名稱 'gpt-4o-mini-tts' 或 'instructions' 參數是否有效: {error_detail}")
-            else:
-                 print(f"文字轉語音失敗 (OpenAI API): {error_detail}")
+            logger.info(f"成功生成語音 ({self.provider.name})，音訊大小: {len(audio_bytes)} bytes")
+
+            return audio_bytes
+
+        except SpeechServiceException as e:
+            logger.error(f"文字轉語音失敗 ({self.provider.name}): {e.message}")
+            print(f"文字轉語音失敗 ({self.provider.name}): {e.message}")
             return None
         except Exception as e:
-            logger.error(f"文字轉語音失敗 (OpenAI): {str(e)}", exc_info=True)
-            print(f"文字轉語音失敗 (OpenAI): {e}")
-            return None 
\ No newline at end of file
+            logger.error(f"文字轉語音失敗 ({self.provider.name}): {str(e)}", exc_info=True)
+            print(f"文字轉語音失敗 ({self.provider.name}): {e}")
+            return None
+
+    async def synthesize_speech_stream(self, text: str, chunk_size: Optional[int] = None) -> AsyncIterator[bytes]:
+        """
+        以串流方式合成語音，音訊 bytes 一到達就產出，不等待整段合成完成
+
+        快取命中時直接分塊產出快取內容；未命中時邊接收邊產出，完成後把完整音訊寫入快取。
+        失敗時停止產出 (可能已產出部分音訊)，不拋出異常。
+
+        Args:
+            text: 要轉換的文字
+            chunk_size: 每塊的位元組數 (預設讀取配置)
+
+        Yields:
+            原始音訊 bytes 片段
+        """
+        if not self.provider.available:
+            logger.error(f"文字轉語音服務未初始化 ({self.provider.name})")
+            return
+
+        if not text:
+             logger.warning("輸入文字為空，無法生成語音")
+             return
+
+        chunk_size = chunk_size or settings.TTS_STREAM_CHUNK_BYTES
+        cache_key = None
+        if settings.TTS_CACHE_ENABLED and len(text) <= settings.TTS_CACHE_MAX_TEXT_CHARS:
+            cache_key = self._cache_key(text)
+            cached = await tts_cache.lookup(cache_key)
+            if cached:
+                for offset in range(0, len(cached), chunk_size):
+                    yield cached[offset:offset + chunk_size]
+                return
+
+        chunks = []
+        try:
+            logger.info(f"開始串流生成語音 ({self.provider.name} - {TTS_MODEL}): '{text[:50]}...'")
+            async for chunk in self.provider.stream(
+                text,
+                model=TTS_MODEL,
+                voice=TTS_VOICE,
+                speed=TTS_SPEED,
+                instructions=TTS_INSTRUCTIONS,
+                response_format=TTS_RESPONSE_FORMAT,
+                chunk_size=chunk_size
+            ):
+                chunks.append(chunk)
+                yield chunk
+        except SpeechServiceException as e:
+            logger.error(f"串流文字轉語音失敗 ({self.provider.name}): {e.message}")
+            return
+        except Exception as e:
+            logger.error(f"串流文字轉語音失敗 ({self.provider.name}): {str(e)}", exc_info=True)
+            return
+
+        audio_size = sum(len(chunk) for chunk in chunks)
+        logger.info(f"成功串流生成語音 ({self.provider.name})，共 {len(chunks)} 塊 {audio_size} bytes")
+        if cache_key and chunks:
+            tts_cache.store(cache_key, b"".join(chunks))
@@ -0,0 +1,354 @@
+"""
+TTS 快取 - 以 (文字, 模型, 聲音, 語速, instructions, 格式) 的雜湊為鍵保存合成結果。
+
+兩層結構：
+  1. 記憶體 LRU：有總位元組預算
+  2. 磁碟層：持久保存於 TTS_CACHE_DIR，重啟後仍可命中，同樣有位元組預算
+
+同一個鍵的並發請求只會觸發一次實際合成 (single-flight)，其餘請求等待同一個結果。
+
+啟動時預熱的語句：各模組的固定回退回應、最常重複出現的 murmur (出現次數保存在磁碟層目錄)，
+以及配置中的額外語句。
+
+匯入模組時不碰檔案系統：磁碟層在應用啟動時由 open() 建立目錄並掃描索引，之前只使用記憶體層。
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from collections import Counter, OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+from core.config import settings
+from services.task_supervisor import task_registry
+
+logger = logging.getLogger("tts_cache")
+
+CACHE_FILE_SUFFIX = ".audio"
+MURMUR_COUNTS_FILE = "murmurs.json"  # murmur 文字 -> 出現次數
+MURMUR_COUNTS_MAX = 500  # 保存的 murmur 種類上限 (超過時只留最常出現的)
+
+
+def make_cache_key(text: str, model: str, voice: str, speed: float, instructions: str, response_format: str) -> str:
+    """以所有影響合成結果的參數產生內容位址鍵"""
+    payload = json.dumps([text, model, voice, speed, instructions, response_format], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _write_file(path: str, data: bytes) -> None:
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _read_file(path: str) -> Optional[bytes]:
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class TTSCache:
+    """記憶體 + 磁碟兩層的 TTS 結果快取，附 single-flight 去重"""
+
+    def __init__(
+        self,
+        memory_max_bytes: Optional[int] = None,
+        cache_dir: Optional[str] = None,
+        disk_max_bytes: Optional[int] = None
+    ):
+        """
+        初始化 TTS 快取
+
+        Args:
+            memory_max_bytes: 記憶體層總位元組預算 (預設讀取配置)
+            cache_dir: 磁碟層目錄，空字串表示停用磁碟層 (預設讀取配置)
+            disk_max_bytes: 磁碟層總位元組預算 (預設讀取配置)
+        """
+        self.memory_max_bytes = memory_max_bytes if memory_max_bytes is not None else settings.TTS_CACHE_MEMORY_MAX_BYTES
+        self.cache_dir = cache_dir if cache_dir is not None else settings.TTS_CACHE_DIR
+        self.disk_max_bytes = disk_max_bytes if disk_max_bytes is not None else settings.TTS_CACHE_DISK_MAX_BYTES
+
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        # 磁碟層索引: 鍵 -> 檔案大小，依寫入時間排列 (最舊的在前)
+        self._disk_index: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+        self._disk_writing: Set[str] = set()  # 正在寫入磁碟層的鍵 (同一個鍵只寫一次、只計一次大小)
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[str, int] = {}  # 每個進行中合成的等待者數量
+        self._murmur_counts: Counter = Counter()  # murmur 文字 -> 出現次數 (預熱重複出現的 murmur)
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.failures = 0
+        self.abandoned = 0
+        self.disk_enabled = False  # open() 完成後才使用磁碟層
+
+    async def open(self) -> None:
+        """應用啟動時啟用磁碟層 (建立目錄並掃描索引)；未設定目錄或掃描失敗時只使用記憶體層"""
+        if not self.cache_dir or self.disk_enabled:
+            return
+        try:
+            await asyncio.to_thread(self._load_disk_index)
+        except OSError as e:
+            logger.error(f"無法開啟 TTS 磁碟快取 ({self.cache_dir})，只使用記憶體層: {e}")
+            return
+        self.disk_enabled = True
+
+    def _load_disk_index(self) -> None:
+        """掃描磁碟層目錄，依修改時間重建索引"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith(CACHE_FILE_SUFFIX):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name[:-len(CACHE_FILE_SUFFIX)], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk_index[key] = size
+            self._disk_bytes += size
+        try:
+            with open(os.path.join(self.cache_dir, MURMUR_COUNTS_FILE), "r", encoding="utf-8") as f:
+                self._murmur_counts.update(json.load(f))
+        except FileNotFoundError:
+            pass
+        except ValueError as e:
+            logger.warning(f"忽略無法解析的 murmur 次數記錄: {e}")
+        logger.info(f"TTS 磁碟快取: {len(self._disk_index)} 筆，共 {self._disk_bytes} bytes ({self.cache_dir})")
+
+    async def close(self) -> None:
+        """應用關閉時保存 murmur 出現次數 (磁碟層未啟用時不保存)"""
+        if not self.disk_enabled or not self._murmur_counts:
+            return
+        payload = json.dumps(dict(self._murmur_counts.most_common(MURMUR_COUNTS_MAX)), ensure_ascii=False).encode("utf-8")
+        try:
+            await asyncio.to_thread(_write_file, os.path.join(self.cache_dir, MURMUR_COUNTS_FILE), payload)
+        except OSError as e:
+            logger.error(f"保存 murmur 次數記錄失敗: {e}")
+
+    def record_murmur(self, text: str) -> None:
+        """記錄送出的 murmur，重複出現的會在下次啟動時預熱"""
+        if not text:
+            return
+        self._murmur_counts[text] += 1
+        if len(self._murmur_counts) > 2 * MURMUR_COUNTS_MAX:
+            self._murmur_counts = Counter(dict(self._murmur_counts.most_common(MURMUR_COUNTS_MAX)))
+
+    def recurring_murmurs(self, limit: int) -> List[str]:
+        """出現過不只一次的 murmur，最常出現的在前"""
+        return [text for text, count in self._murmur_counts.most_common(limit) if count > 1]
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + CACHE_FILE_SUFFIX)
+
+    async def get_or_synthesize(self, key: str, synthesize: Callable[[], Awaitable[Optional[bytes]]]) -> Optional[bytes]:
+        """
+        取得快取的音訊，未命中時調用 synthesize 合成並寫入快取
+
+        Args:
+            key: make_cache_key 產生的鍵
+            synthesize: 實際合成音訊的協程函數，失敗時返回 None (不會被快取)
+
+        Returns:
+            音訊 bytes，合成失敗時返回 None
+        """
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return data
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            # 以獨立任務執行，發起者被取消時不會連帶取消其他等待者
+            task = task_registry.spawn(self._load(key, synthesize), "tts_cache_load", log_errors=False)
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._on_load_done(k, t))
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            # 最後一個等待者也被取消 (例如回合被新的訊息取代)：不再需要這段音訊，停止上游合成
+            if self._waiters.get(key) == 1 and not task.done():
+                task.cancel()
+                self.abandoned += 1
+            raise
+        finally:
+            remaining = self._waiters.get(key, 1) - 1
+            if remaining > 0:
+                self._waiters[key] = remaining
+            else:
+                self._waiters.pop(key, None)
+
+    async def lookup(self, key: str) -> Optional[bytes]:
+        """只查詢快取 (記憶體與磁碟層)，不觸發合成；未命中返回 None 且不計入統計"""
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return data
+        data = await self._read_disk(key)
+        if data is not None:
+            self.disk_hits += 1
+        return data
+
+    def store(self, key: str, data: bytes) -> None:
+        """寫入由外部合成的結果 (例如串流合成完成後的完整音訊)"""
+        if not data:
+            return
+        self.misses += 1
+        self._memory_put(key, data)
+        if self.disk_enabled:
+            task_registry.spawn(self._disk_put(key, data), "tts_cache_write")
+
+    def _on_load_done(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"TTS 快取載入失敗 ({key[:12]}): {task.exception()}")
+
+    async def _read_disk(self, key: str) -> Optional[bytes]:
+        """從磁碟層讀取並放回記憶體層，檔案遺失時移除索引"""
+        if key not in self._disk_index:
+            return None
+        data = await asyncio.to_thread(_read_file, self._disk_path(key))
+        if data is None:
+            self._disk_bytes -= self._disk_index.pop(key, 0)
+            return None
+        self._memory_put(key, data)
+        return data
+
+    async def _load(self, key: str, synthesize: Callable[[], Awaitable[Optional[bytes]]]) -> Optional[bytes]:
+        data = await self._read_disk(key)
+        if data is not None:
+            self.disk_hits += 1
+            return data
+
+        self.misses += 1
+        data = await synthesize()
+        if not data:
+            self.failures += 1
+            return None
+        self._memory_put(key, data)
+        if self.disk_enabled:
+            task_registry.spawn(self._disk_put(key, data), "tts_cache_write")
+        return data
+
+    def _memory_put(self, key: str, data: bytes) -> None:
+        if key in self._memory:
+            self._memory_bytes -= len(self._memory.pop(key))
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.memory_max_bytes and len(self._memory) > 1:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    async def _disk_put(self, key: str, data: bytes) -> None:
+        if key in self._disk_index or key in self._disk_writing or len(data) > self.disk_max_bytes:
+            return
+        self._disk_writing.add(key)
+        try:
+            await asyncio.to_thread(_write_file, self._disk_path(key), data)
+        except Exception as e:
+            logger.error(f"寫入 TTS 磁碟快取失敗 ({key[:12]}): {e}", exc_info=True)
+            return
+        finally:
+            self._disk_writing.discard(key)
+        self._disk_index[key] = len(data)
+        self._disk_bytes += len(data)
+        while self._disk_bytes > self.disk_max_bytes and self._disk_index:
+            oldest_key, size = self._disk_index.popitem(last=False)
+            self._disk_bytes -= size
+            await asyncio.to_thread(_remove_file, self._disk_path(oldest_key))
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中/未命中計數與各層用量"""
+        lookups = self.memory_hits + self.disk_hits + self.misses + self.coalesced
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "failures": self.failures,
+            "abandoned": self.abandoned,
+            "hit_ratio": round((lookups - self.misses) / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "disk_enabled": self.disk_enabled,
+            "disk_entries": len(self._disk_index),
+            "disk_bytes": self._disk_bytes,
+            "inflight": len(self._inflight),
+        }
+
+
+def load_warmup_phrases() -> List[str]:
+    """
+    收集預熱語句：各處的固定回退回應、最常重複出現的 murmur、
+    配置中的額外語句，以及 TTS_WARMUP_PHRASES_FILE 中的語句 (每行一句)
+    """
+    # 函數內匯入：websocket 端點匯入本模組 (循環匯入)，AI 模組只在預熱時才需要
+    from api.endpoints.websocket import FALLBACK_RESPONSES
+    from services.ai import AI_ERROR_RESPONSE, NO_INPUT_RESPONSE
+    from services.ai.graph_nodes.llm_interaction import LLM_ERROR_RESPONSES, LLM_NOT_FOUND_RESPONSE
+
+    phrases = [*FALLBACK_RESPONSES, NO_INPUT_RESPONSE, AI_ERROR_RESPONSE, *LLM_ERROR_RESPONSES, LLM_NOT_FOUND_RESPONSE]
+    if settings.TTS_WARMUP_MURMURS > 0:
+        phrases.extend(tts_cache.recurring_murmurs(settings.TTS_WARMUP_MURMURS))
+    phrases.extend(settings.TTS_WARMUP_PHRASES)
+    if settings.TTS_WARMUP_PHRASES_FILE:
+        try:
+            with open(settings.TTS_WARMUP_PHRASES_FILE, "r", encoding="utf-8") as f:
+                phrases.extend(line.strip() for line in f if line.strip())
+        except OSError as e:
+            logger.warning(f"無法讀取預熱語句檔案 {settings.TTS_WARMUP_PHRASES_FILE}: {e}")
+    return phrases
+
+
+async def warm_up_tts_cache(tts_service, phrases: Optional[Iterable[str]] = None, concurrency: Optional[int] = None) -> int:
+    """
+    預先合成固定語句 (錯誤回退訊息、重複出現的 murmur 等)，已在磁碟層的語句只會載入記憶體
+
+    Args:
+        tts_service: 提供 synthesize_speech_bytes(text) 的 TTS 服務
+        phrases: 要預熱的語句 (預設為 load_warmup_phrases())
+        concurrency: 同時進行的合成數量 (預設讀取配置)
+
+    Returns:
+        成功預熱的語句數量
+    """
+    phrases = [p for p in dict.fromkeys(phrases if phrases is not None else load_warmup_phrases()) if p]
+    if not phrases:
+        return 0
+    semaphore = asyncio.Semaphore(concurrency or settings.TTS_WARMUP_CONCURRENCY)
+
+    async def warm(phrase: str) -> bool:
+        async with semaphore:
+            try:
+                return bool(await tts_service.synthesize_speech_bytes(phrase))
+            except Exception as e:
+                logger.warning(f"預熱語句失敗 '{phrase[:20]}': {e}")
+                return False
+
+    results = await asyncio.gather(*(warm(phrase) for phrase in phrases))
+    warmed = sum(results)
+    logger.info(f"TTS 快取預熱完成: {warmed}/{len(phrases)} 句")
+    return warmed
+
+
+# 全域共享的 TTS 快取
+tts_cache = TTSCache()
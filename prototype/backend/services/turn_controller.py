@@ -0,0 +1,97 @@
+"""
+回合控制器 (barge-in) - 每個會話同時只有一個進行中的回合。
+
+用戶送出新訊息時，上一回合的任務會被取消：進行中的 DialogueGraph (LLM、工具調用)、
+TTS 請求，以及該回合衍生但尚未送出的後續訊息 (延遲的動畫資料等) 全部隨之取消，
+新回合立即開始，不必等上一回合跑完。已放入出站佇列但尚未送出的訊息以 turn_id 標記，
+由接收迴圈在 barge-in 時以 OutboundQueue.purge_turn() 捨棄。
+語音結束計時器屬於會話而非回合 (回合結束後仍需觸發)，同樣由接收迴圈在 barge-in 時處理。
+
+回合與其衍生的任務都由會話的 TaskSupervisor 建立，連線結束時一併取消。
+"""
+
+import asyncio
+import logging
+from typing import Any, Callable, Coroutine, Dict, Optional, Set
+
+from services.task_supervisor import TaskSupervisor
+
+logger = logging.getLogger("turn_controller")
+
+
+class TurnController:
+    """管理單一會話的回合任務與其衍生的背景任務"""
+
+    def __init__(self, supervisor: Optional[TaskSupervisor] = None):
+        """
+        Args:
+            supervisor: 建立任務的會話任務監管者 (預設自行建立一個)
+        """
+        self.supervisor = supervisor or TaskSupervisor()
+        self.turn_id = 0
+        self._task: Optional[asyncio.Task] = None
+        self._tasks: Set[asyncio.Task] = set()  # 目前回合衍生的背景任務
+        self.started = 0
+        self.cancelled = 0
+
+    @property
+    def active(self) -> bool:
+        """是否有回合正在進行"""
+        return self._task is not None and not self._task.done()
+
+    def start(self, handler: Callable[[int], Coroutine[Any, Any, None]]) -> asyncio.Task:
+        """
+        取消上一回合並開始新回合
+
+        Args:
+            handler: 接收回合編號的協程函數，負責處理整個回合
+
+        Returns:
+            新回合的任務
+        """
+        self.cancel_current()
+        self.turn_id += 1
+        self.started += 1
+        self._task = self.supervisor.spawn(handler(self.turn_id), "turn")
+        return self._task
+
+    def spawn(self, coro: Coroutine[Any, Any, Any], kind: str = "turn_background", key: Optional[str] = None) -> asyncio.Task:
+        """建立屬於目前回合的背景任務，回合被取代時一併取消 (kind 與 key 見 TaskSupervisor.spawn)"""
+        task = self.supervisor.spawn(coro, kind, key=key)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def wait_current(self) -> None:
+        """等待進行中的回合結束 (不取消；回合的錯誤由回合本身處理)"""
+        task = self._task
+        if task is not None and not task.done():
+            await asyncio.wait({task})
+
+    def cancel_current(self) -> bool:
+        """
+        取消進行中的回合與其衍生的背景任務
+
+        Returns:
+            是否真的中斷了一個仍在進行的回合
+        """
+        interrupted = False
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            interrupted = True
+            self.cancelled += 1
+            logger.info(f"回合 {self.turn_id} 被新的訊息取代，已取消")
+        for task in list(self._tasks):
+            task.cancel()
+        self._tasks.clear()
+        self._task = None
+        return interrupted
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "turn_id": self.turn_id,
+            "active": self.active,
+            "background_tasks": len(self._tasks),
+            "started": self.started,
+            "cancelled": self.cancelled,
+        }
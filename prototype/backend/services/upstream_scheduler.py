@@ -0,0 +1,263 @@
+"""
+上游調用的准入控制與優先級排程
+
+所有 Gemini 與 OpenAI 調用 (LLM、嵌入、語音) 在發出前各自向這裡取得一個名額：每個提供者有並行上限與令牌桶速率限制，
+超出時在有上限的等待佇列中依優先級排隊 (用戶回合 > murmur > 摘要等背景工作)。
+等待超過期限的請求被捨棄，佇列已滿時低優先級的等待者讓位給高優先級的新請求，
+避免流量高峰時觸發提供者的速率限制、讓所有請求一起變慢。
+
+優先級以 contextvar 傳遞：murmur 等背景流程在入口設定一次，其下的所有上游調用都沿用。
+一次對話圖執行通常包含多次上游調用 (工具意圖、參數提取、記憶檢索的嵌入、主回應)，
+速率設定因此以實際的上游調用計算，而不是以回合計算。
+"""
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from core.config import settings
+from core.exceptions import UpstreamOverloadedException
+
+logger = logging.getLogger("upstream_scheduler")
+
+# 優先級 (數字越小越優先)
+PRIORITY_USER = 0
+PRIORITY_MURMUR = 1
+PRIORITY_BACKGROUND = 2
+PRIORITY_NAMES = {
+    PRIORITY_USER: "user",
+    PRIORITY_MURMUR: "murmur",
+    PRIORITY_BACKGROUND: "background",
+}
+
+# 目前流程的優先級，未設定時視為用戶回合
+upstream_priority: contextvars.ContextVar[int] = contextvars.ContextVar("upstream_priority", default=PRIORITY_USER)
+
+
+class _Waiter:
+    __slots__ = ("priority", "enqueued_at", "deadline", "future", "active")
+
+    def __init__(self, priority: int, deadline: float, future: asyncio.Future):
+        self.priority = priority
+        self.enqueued_at = time.monotonic()
+        self.deadline = deadline
+        self.future = future
+        self.active = True  # 被捨棄或取消後設為 False，堆中的項目惰性刪除
+
+
+class ProviderGate:
+    """單一提供者的並行上限、令牌桶與優先級等待佇列"""
+
+    def __init__(self, name: str, concurrency: int, rate: float, burst: int, max_queue: int):
+        """
+        Args:
+            name: 提供者名稱
+            concurrency: 同時進行的調用上限
+            rate: 令牌補充速率 (每秒調用數)，0 表示不限速
+            burst: 令牌桶容量
+            max_queue: 等待佇列上限
+        """
+        self.name = name
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_queue = max_queue
+        self.tokens = float(self.burst)
+        self._refilled_at = time.monotonic()
+        self._heap: List[Any] = []  # (優先級, 序號, _Waiter)
+        self._counter = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.active = 0
+        self.waiting = 0
+
+        self.admitted = 0
+        self.rejected = 0  # 佇列已滿且沒有更低優先級的等待者可以讓位
+        self.evicted = 0  # 佇列已滿時讓位給高優先級請求
+        self.shed = 0  # 等待超過期限
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.admitted_by_priority: Dict[str, int] = {name: 0 for name in PRIORITY_NAMES.values()}
+
+    def _refill(self, now: float) -> None:
+        if self.rate > 0:
+            self.tokens = min(float(self.burst), self.tokens + (now - self._refilled_at) * self.rate)
+        else:
+            self.tokens = float(self.burst)
+        self._refilled_at = now
+
+    def _grant(self, priority: int, waited: float) -> None:
+        self.active += 1
+        self.tokens -= 1
+        self.admitted += 1
+        name = PRIORITY_NAMES.get(priority, str(priority))
+        self.admitted_by_priority[name] = self.admitted_by_priority.get(name, 0) + 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+
+    async def acquire(self, priority: int, max_wait: float) -> None:
+        """
+        取得一個調用名額
+
+        Raises:
+            UpstreamOverloadedException: 佇列已滿或等待逾時
+        """
+        now = time.monotonic()
+        self._refill(now)
+        if self.waiting == 0 and self.active < self.concurrency and self.tokens >= 1:
+            self._grant(priority, 0.0)
+            return
+
+        if self.waiting >= self.max_queue:
+            lowest = self._lowest_waiter()
+            if lowest is None or lowest.priority <= priority:
+                self.rejected += 1
+                raise UpstreamOverloadedException(f"{self.name} 上游等待佇列已滿", self.name)
+            # 讓位：捨棄最低優先級中最晚加入的等待者
+            self._drop(lowest, UpstreamOverloadedException(f"{self.name} 上游繁忙，已讓位給較高優先級的請求", self.name))
+            self.evicted += 1
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = _Waiter(priority, now + max_wait, future)
+        heapq.heappush(self._heap, (priority, next(self._counter), waiter))
+        self.waiting += 1
+        self._dispatch()
+        try:
+            await asyncio.wait_for(future, max_wait)
+        except asyncio.TimeoutError:
+            if waiter.active:
+                self._drop(waiter, None)
+            self.shed += 1
+            raise UpstreamOverloadedException(f"{self.name} 上游等待逾時 ({max_wait:.1f}s)", self.name)
+        except asyncio.CancelledError:
+            if waiter.active:
+                self._drop(waiter, None)
+            elif future.done() and not future.cancelled() and future.exception() is None:
+                # 名額已分配但呼叫者被取消 (例如 barge-in)，歸還名額
+                self.release()
+            raise
+
+    def _lowest_waiter(self) -> Optional[_Waiter]:
+        lowest = None
+        for priority, seq, waiter in self._heap:
+            if waiter.active and (lowest is None or (priority, seq) > (lowest[0], lowest[1])):
+                lowest = (priority, seq, waiter)
+        return lowest[2] if lowest else None
+
+    def _drop(self, waiter: _Waiter, error: Optional[Exception]) -> None:
+        waiter.active = False
+        self.waiting -= 1
+        if error is not None and not waiter.future.done():
+            waiter.future.set_exception(error)
+
+    def release(self) -> None:
+        """歸還名額並喚醒下一個等待者"""
+        self.active -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        now = time.monotonic()
+        self._refill(now)
+        while self._heap and self.active < self.concurrency:
+            priority, _, waiter = self._heap[0]
+            if not waiter.active or waiter.future.done():
+                heapq.heappop(self._heap)
+                continue
+            if now > waiter.deadline:
+                # 已過期限的等待者由其 wait_for 逾時處理
+                heapq.heappop(self._heap)
+                continue
+            if self.tokens < 1:
+                self._arm((1 - self.tokens) / self.rate)
+                return
+            heapq.heappop(self._heap)
+            waiter.active = False
+            self.waiting -= 1
+            self._grant(priority, now - waiter.enqueued_at)
+            waiter.future.set_result(None)
+
+    def _arm(self, delay: float) -> None:
+        """令牌不足：在補充一個令牌後再分派"""
+        if self._timer is not None:
+            return
+        def fire():
+            self._timer = None
+            self._dispatch()
+        self._timer = asyncio.get_running_loop().call_later(delay, fire)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "concurrency": self.concurrency,
+            "rate": self.rate,
+            "active": self.active,
+            "queue_depth": self.waiting,
+            "admitted": self.admitted,
+            "admitted_by_priority": dict(self.admitted_by_priority),
+            "rejected": self.rejected,
+            "evicted": self.evicted,
+            "shed": self.shed,
+            "avg_wait_ms": round(self.total_wait / self.admitted * 1000, 2) if self.admitted else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 2),
+        }
+
+
+class UpstreamScheduler:
+    """依提供者分組的准入控制"""
+
+    def __init__(self, limits: Optional[Dict[str, Dict[str, Any]]] = None, enabled: Optional[bool] = None):
+        """
+        Args:
+            limits: 提供者名稱 -> {"concurrency", "rate", "burst"}
+            enabled: 停用時 slot() 不做任何限制
+        """
+        self.enabled = settings.UPSTREAM_SCHEDULER_ENABLED if enabled is None else enabled
+        self.max_wait = {
+            PRIORITY_USER: settings.UPSTREAM_MAX_WAIT_USER_SECONDS,
+            PRIORITY_MURMUR: settings.UPSTREAM_MAX_WAIT_MURMUR_SECONDS,
+            PRIORITY_BACKGROUND: settings.UPSTREAM_MAX_WAIT_BACKGROUND_SECONDS,
+        }
+        self.gates: Dict[str, ProviderGate] = {
+            name: ProviderGate(
+                name,
+                concurrency=limit["concurrency"],
+                rate=limit.get("rate", 0),
+                burst=limit.get("burst", limit["concurrency"]),
+                max_queue=settings.UPSTREAM_QUEUE_MAX
+            )
+            for name, limit in (limits or settings.UPSTREAM_PROVIDER_LIMITS).items()
+        }
+
+    @asynccontextmanager
+    async def slot(self, provider: str, priority: Optional[int] = None) -> AsyncIterator[None]:
+        """
+        在名額內執行一次上游調用
+
+        Args:
+            provider: 提供者名稱 (未設定限制的提供者不受控制)
+            priority: 優先級，預設取自目前流程的 upstream_priority
+        """
+        gate = self.gates.get(provider) if self.enabled else None
+        if gate is None:
+            yield
+            return
+        if priority is None:
+            priority = upstream_priority.get()
+        await gate.acquire(priority, self.max_wait.get(priority, self.max_wait[PRIORITY_BACKGROUND]))
+        try:
+            yield
+        finally:
+            gate.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "providers": {name: gate.stats() for name, gate in self.gates.items()},
+        }
+
+
+# 全域共享的上游排程器
+upstream_scheduler = UpstreamScheduler()
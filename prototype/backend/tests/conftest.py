@@ -0,0 +1,10 @@
+"""
+測試設定：以 prototype/backend 為匯入根目錄 (與 main.py 相同)
+
+測試中的協程以 asyncio.run 執行，不需要額外的 pytest 外掛。
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,101 @@
+"""services/audience_aggregator.py：重複留言合併、排序的觀眾多樣性與綜合留言"""
+
+import asyncio
+
+import pytest
+
+from services.audience_aggregator import AudienceAggregator, normalize_text, text_similarity
+
+
+def aggregator(mode="composite", top_n=3, history=(), **kwargs):
+    return AudienceAggregator(lambda: list(history), window=0, max_pending=100, mode=mode, top_n=top_n, **kwargs)
+
+
+def pending(*messages, received_at=100.0):
+    return [{"text": text, "sender": sender, "received_at": received_at} for sender, text in messages]
+
+
+def comment(text, sender):
+    return {"type": "chat-message", "message": text, "sender": sender}
+
+
+def test_text_similarity():
+    assert normalize_text("火星 有多遠？!") == "火星有多遠"
+    assert text_similarity("火星有多遠", "火星有多遠") == 1.0
+    # 互相包含視為相同
+    assert text_similarity("火星有多遠", "請問火星有多遠呢") == 1.0
+    assert text_similarity("火星有多遠", "今天吃什麼") == 0.0
+    assert text_similarity("", "火星") == 0.0
+    assert 0.0 < text_similarity("火星離地球多遠", "月球離地球多遠") < 1.0
+
+
+@pytest.mark.parametrize("threshold, clusters", [(0.3, 1), (0.99, 2)])
+def test_duplicate_threshold_decides_merging(threshold, clusters):
+    merged = aggregator(duplicate_threshold=threshold)._cluster(pending(("a", "火星離地球多遠"), ("b", "月球離地球多遠")))
+    assert len(merged) == clusters
+
+
+def test_duplicates_merge_and_count_distinct_senders():
+    source = aggregator(duplicate_threshold=0.8)
+    clusters = source._cluster(pending(
+        ("a", "好可愛！"), ("b", "好可愛"), ("a", "好 可 愛"), ("c", "好可愛~"), ("d", "你住在哪裡？"),
+    ))
+
+    assert [cluster.text for cluster in clusters] == ["好可愛！", "你住在哪裡？"]
+    assert clusters[0].count == 4 and clusters[0].senders == {"a", "b", "c"}
+    assert source.duplicates == 3
+
+
+def test_one_sender_does_not_monopolize_top_n():
+    source = aggregator(mode="top_n")
+    clusters = source._cluster(pending(
+        ("spam", "第一個問題是什麼"), ("spam", "第二題換個話題"), ("spam", "再來一個完全不同的"),
+        ("a", "太空站今天在哪裡"), ("b", "月亮為什麼會變形狀"),
+    ))
+    selected = source._rank(clusters, 3)
+    assert sorted(cluster.first_sender for cluster in selected) == ["a", "b", "spam"]
+
+
+def test_novelty_prefers_topics_not_recently_answered():
+    source = aggregator(mode="top_n", history=[{"content": "太空站今天在台灣上空"}])
+    clusters = source._cluster(pending(("a", "太空站今天在台灣上空嗎"), ("b", "月亮為什麼會變形狀")))
+    assert source._rank(clusters, 1)[0].first_sender == "b"
+
+
+def test_single_message_is_passed_through():
+    async def scenario():
+        source = aggregator()
+        await source.put(comment("  火星有多遠？  ", "a"))
+        return await source.next_turn(), source.stats()
+
+    turn, stats = asyncio.run(scenario())
+    assert turn["message"] == "火星有多遠？"
+    assert turn["aggregated"] == 1 and turn["audience"] == [{"text": "火星有多遠？", "count": 1, "senders": 1}]
+    assert stats["answered_per_llm_call"] == 1.0
+
+
+def test_composite_turn_lists_merged_comments():
+    async def scenario():
+        source = aggregator()
+        for sender, text in [("a", "好可愛"), ("b", "好可愛！"), ("c", "你住在哪裡？")]:
+            await source.put(comment(text, sender))
+        await source.put(comment("   ", "d"))  # 空白留言被忽略
+        return await source.next_turn(), source.stats()
+
+    turn, stats = asyncio.run(scenario())
+    assert turn["aggregated"] == 3
+    assert "(共 3 則)" in turn["message"] and "- 好可愛 (×2)" in turn["message"] and "- 你住在哪裡？" in turn["message"]
+    assert stats["received"] == 3 and stats["answered"] == 3 and stats["skipped"] == 0
+
+
+def test_top_n_turn_numbers_the_questions_and_counts_skipped():
+    async def scenario():
+        source = aggregator(mode="top_n", top_n=2)
+        for sender, text in [("a", "太空站今天在哪裡"), ("b", "月亮為什麼會變形狀"), ("c", "火星上有水嗎")]:
+            await source.put(comment(text, sender))
+        return await source.next_turn(), source.stats()
+
+    turn, stats = asyncio.run(scenario())
+    assert turn["message"].startswith("直播間觀眾的提問：\n1. ")
+    assert len(turn["audience"]) == 2
+    assert stats["answered"] == 2 and stats["skipped"] == 1
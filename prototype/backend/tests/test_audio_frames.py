@@ -0,0 +1,41 @@
+"""utils/audio_frames.py：二進位音訊幀的標頭編碼與解碼"""
+
+import struct
+
+import pytest
+
+from utils.audio_frames import build_audio_frame_header, decode_audio_frame, encode_audio_frame
+
+
+def test_round_trip_keeps_header_and_audio():
+    header = build_audio_frame_header("bot-1", 2, "mp3", 1.23456, text="你好。", final=False, chunk=3)
+    frame = encode_audio_frame(header, b"\xff\xfb\x90\x00audio")
+
+    decoded_header, audio = decode_audio_frame(frame)
+
+    assert decoded_header == {
+        "type": "audio",
+        "messageId": "bot-1",
+        "seq": 2,
+        "codec": "mp3",
+        "duration": 1.235,
+        "final": False,
+        "text": "你好。",
+        "chunk": 3,
+    }
+    assert audio == b"\xff\xfb\x90\x00audio"
+
+
+def test_optional_header_fields_are_omitted():
+    header = build_audio_frame_header("bot-1", 0, "mp3", 2.0)
+    assert "text" not in header and "chunk" not in header
+    assert header["final"] is True
+
+
+@pytest.mark.parametrize("frame", [
+    b"\x00\x00",
+    struct.pack(">I", 100) + b"{}",
+])
+def test_truncated_frames_raise_value_error(frame):
+    with pytest.raises(ValueError):
+        decode_audio_frame(frame)
@@ -0,0 +1,165 @@
+"""services/audio_store.py 與 api/endpoints/audio.py：兩層音訊儲存、Range 與 ETag 條件請求"""
+
+import asyncio
+
+import pytest
+from starlette.requests import Request
+
+from api.endpoints import audio as audio_api
+from api.endpoints.audio import RangeNotSatisfiable, parse_range_header
+from services.audio_store import AudioStore, compute_etag
+
+AUDIO = bytes(range(100))
+
+
+def memory_store(**kwargs) -> AudioStore:
+    options = {"max_bytes": 1024, "ttl_seconds": 60, "spill_dir": "", "spill_max_bytes": 0}
+    options.update(kwargs)
+    return AudioStore(**options)
+
+
+@pytest.fixture
+def get(monkeypatch):
+    """以指定的請求標頭調用 serve_audio，返回回應"""
+    store = memory_store()
+    store.put(AUDIO, "a.mp3")
+    monkeypatch.setattr(audio_api, "audio_store", store)
+
+    def get(filename, headers=None):
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "path": f"/audio-file/{filename}",
+            "headers": [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()],
+        }
+        return asyncio.run(audio_api.serve_audio(filename, Request(scope)))
+
+    return get
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-9", (0, 9)),
+    ("bytes=90-", (90, 99)),
+    ("bytes=95-200", (95, 99)),
+    ("bytes=-10", (90, 99)),
+    ("bytes=-500", (0, 99)),
+    (None, None),
+    ("bytes=abc-def", None),
+    ("items=0-9", None),
+    ("bytes=0-1,5-6", None),
+])
+def test_parse_range_header(header, expected):
+    assert parse_range_header(header, len(AUDIO)) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=100-", "bytes=150-200", "bytes=9-5", "bytes=-0"])
+def test_unsatisfiable_ranges_raise(header):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range_header(header, len(AUDIO))
+
+
+def test_full_response_carries_etag_and_accept_ranges(get):
+    response = get("a.mp3")
+    assert response.status_code == 200
+    assert response.body == AUDIO
+    assert response.headers["etag"] == compute_etag(AUDIO)
+    assert response.headers["accept-ranges"] == "bytes"
+
+
+def test_range_request_returns_partial_content(get):
+    response = get("a.mp3", headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response.body == AUDIO[10:20]
+    assert response.headers["content-range"] == "bytes 10-19/100"
+
+
+def test_suffix_range_returns_the_tail(get):
+    response = get("a.mp3", headers={"Range": "bytes=-5"})
+    assert response.status_code == 206
+    assert response.body == AUDIO[-5:]
+    assert response.headers["content-range"] == "bytes 95-99/100"
+
+
+def test_range_beyond_eof_is_not_satisfiable(get):
+    response = get("a.mp3", headers={"Range": "bytes=100-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */100"
+
+
+def test_malformed_range_is_ignored(get):
+    response = get("a.mp3", headers={"Range": "bytes=x-y"})
+    assert response.status_code == 200
+    assert response.body == AUDIO
+
+
+def test_matching_if_none_match_returns_not_modified(get):
+    etag = compute_etag(AUDIO)
+    response = get("a.mp3", headers={"If-None-Match": f'"other", {etag}'})
+    assert response.status_code == 304
+    assert response.body == b""
+    assert response.headers["etag"] == etag
+    assert get("a.mp3", headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_stale_if_range_returns_the_full_content(get):
+    response = get("a.mp3", headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert response.status_code == 200
+    assert response.body == AUDIO
+
+
+def test_missing_audio_returns_404(get):
+    assert get("missing.mp3").status_code == 404
+
+
+def test_memory_layer_evicts_least_recently_used():
+    async def scenario():
+        store = memory_store(max_bytes=250)
+        store.put(AUDIO, "a")
+        store.put(AUDIO, "b")
+        assert await store.get("a") is not None  # a 變為最近使用
+        store.put(AUDIO, "c")
+        return [await store.get(key) is not None for key in "abc"], store.stats()
+
+    present, stats = asyncio.run(scenario())
+    assert present == [True, False, True]
+    assert stats["evictions"] == 1 and stats["memory_bytes"] == 200
+
+
+def test_expired_audio_is_not_served():
+    async def scenario():
+        store = memory_store(ttl_seconds=0.05)
+        store.put(AUDIO, "a")
+        fresh = await store.get("a")
+        await asyncio.sleep(0.08)
+        return fresh, await store.get("a"), store.stats()
+
+    fresh, expired, stats = asyncio.run(scenario())
+    assert fresh is not None and expired is None
+    assert stats["expirations"] == 1 and stats["memory_entries"] == 0
+
+
+def test_evicted_audio_spills_to_disk_within_budget(tmp_path):
+    async def scenario():
+        store = AudioStore(max_bytes=150, ttl_seconds=60, spill_dir=str(tmp_path), spill_max_bytes=150)
+        store.put(AUDIO, "a")
+        store.put(AUDIO, "b")  # a 被淘汰並寫入磁碟
+        while store.stats()["spill_bytes"] == 0:
+            await asyncio.sleep(0.01)
+        spilled = await store.get("a")
+        store.put(AUDIO, "c")  # b 溢出，超出溢出層預算時最舊的 a 被刪除
+        while store.stats()["spill_bytes"] != 100 or store.stats()["spill_entries"] != 1:
+            await asyncio.sleep(0.01)
+        return spilled, await store.get("a"), await store.get("b"), store.stats()
+
+    spilled, dropped, b, stats = asyncio.run(scenario())
+    assert spilled.data == AUDIO and spilled.etag == compute_etag(AUDIO)
+    assert dropped is None and b.data == AUDIO
+    assert stats["spill_hits"] == 2 and stats["spill_bytes"] == 100
+    assert len(list(tmp_path.iterdir())) == 1
+
+
+def test_leftover_spill_files_are_removed_at_startup(tmp_path):
+    (tmp_path / "old.spill").write_bytes(b"x")
+    (tmp_path / "keep.txt").write_bytes(b"x")
+    AudioStore(max_bytes=150, ttl_seconds=60, spill_dir=str(tmp_path), spill_max_bytes=150)
+    assert [path.name for path in tmp_path.iterdir()] == ["keep.txt"]
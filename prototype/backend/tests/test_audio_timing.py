@@ -0,0 +1,84 @@
+"""utils/audio_timing.py：以幀標頭計算 MP3/ADTS 時長與按幀拼接"""
+
+import pytest
+
+from utils.audio_timing import AudioFrameScanner, concat_audio_frames, get_audio_duration, scan_audio_frames
+
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz, joint stereo：每幀 417 bytes、1152 個樣本
+MP3_HEADER = b"\xff\xfb\x90\x44"
+MP3_FRAME_SIZE = 417
+MP3_FRAME_DURATION = 1152 / 44100
+ADTS_FRAME_SIZE = 200
+ADTS_FRAME_DURATION = 1024 / 44100
+
+
+def mp3_frame(fill: int = 0x11) -> bytes:
+    return MP3_HEADER + bytes([fill]) * (MP3_FRAME_SIZE - len(MP3_HEADER))
+
+
+def xing_frame() -> bytes:
+    # 資訊幀：side info (32 bytes) 之後是 "Xing"
+    body = bytearray(MP3_FRAME_SIZE - len(MP3_HEADER))
+    body[32:36] = b"Xing"
+    return MP3_HEADER + bytes(body)
+
+
+def id3_tag(size: int = 20) -> bytes:
+    return b"ID3\x04\x00\x00" + bytes([0, 0, 0, size]) + b"\x00" * size
+
+
+def adts_frame() -> bytes:
+    # AAC LC, 44.1 kHz, 雙聲道，一個 raw data block
+    length = ADTS_FRAME_SIZE
+    header = bytes([
+        0xFF, 0xF1, 0x50, 0x80 | ((length >> 11) & 0x03),
+        (length >> 3) & 0xFF, ((length & 0x07) << 5) | 0x1F, 0xFC,
+    ])
+    return header + b"\x22" * (length - len(header))
+
+
+def test_mp3_duration_skips_id3_tag_and_info_frame():
+    audio = id3_tag() + xing_frame() + mp3_frame() * 10 + b"TAG" + b"\x00" * 125
+    scanner = scan_audio_frames(audio)
+
+    assert scanner.format == "mp3" and scanner.sample_rate == 44100
+    assert len(scanner.frames) == 10
+    assert scanner.duration == pytest.approx(10 * MP3_FRAME_DURATION)
+    assert scanner.frames[1].start_time == pytest.approx(MP3_FRAME_DURATION)
+
+
+def test_adts_duration():
+    assert get_audio_duration(adts_frame() * 5) == pytest.approx(5 * ADTS_FRAME_DURATION)
+
+
+def test_unparseable_audio_returns_fallback():
+    assert get_audio_duration(b"not audio at all", fallback=1.5) == 1.5
+    assert get_audio_duration(None, fallback=2.0) == 2.0
+
+
+def test_incremental_feed_matches_whole_scan():
+    audio = id3_tag() + mp3_frame() * 6
+    scanner = AudioFrameScanner()
+    for start in range(0, len(audio), 100):
+        scanner.feed(audio[start:start + 100])
+    scanner.finish()
+
+    whole = scan_audio_frames(audio)
+    assert [frame.offset for frame in scanner.frames] == [frame.offset for frame in whole.frames]
+    assert scanner.duration == pytest.approx(whole.duration)
+
+
+def test_truncated_last_frame_is_not_counted():
+    audio = mp3_frame() * 3 + mp3_frame()[:100]
+    assert len(scan_audio_frames(audio).frames) == 3
+
+
+def test_concat_keeps_only_audio_frames_in_order():
+    first = id3_tag() + xing_frame() + mp3_frame(0x11) * 2
+    second = id3_tag() + mp3_frame(0x22) * 3
+
+    audio, duration = concat_audio_frames([first, b"", second])
+
+    assert audio == mp3_frame(0x11) * 2 + mp3_frame(0x22) * 3
+    assert duration == pytest.approx(5 * MP3_FRAME_DURATION)
+    assert get_audio_duration(audio) == pytest.approx(duration)
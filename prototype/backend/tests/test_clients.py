@@ -0,0 +1,73 @@
+"""services/clients.py：共用上游客戶端的重複使用、預熱結果與關閉"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from core.config import settings
+from services.clients import UpstreamClientRegistry
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(settings, "GOOGLE_API_KEY", "test-google-key")
+    monkeypatch.setattr(settings, "OPENAI_API_KEY", "test-openai-key")
+    return UpstreamClientRegistry()
+
+
+def test_same_parameters_share_one_chat_model(registry):
+    first = registry.chat_model("gemini-2.0-flash", temperature=0.7, top_p=0.9)
+    assert registry.chat_model("models/gemini-2.0-flash", temperature=0.7, top_p=0.9) is first
+    assert registry.chat_model("gemini-2.0-flash", temperature=0.2, top_p=0.9) is not first
+    assert registry.embeddings() is registry.embeddings()
+    stats = registry.stats()
+    assert stats["chat_models"] == 2 and stats["embeddings"] == 1
+
+
+def test_openai_client_shares_the_http_pool(registry, monkeypatch):
+    client = registry.openai_client()
+    assert registry.openai_client() is client
+    assert client._client is registry.http_client()
+
+    monkeypatch.setattr(settings, "OPENAI_API_KEY", None)
+    assert UpstreamClientRegistry().openai_client() is None
+
+
+def test_prewarm_without_clients_does_nothing(registry):
+    assert asyncio.run(registry.prewarm()) == {}
+
+
+def test_prewarm_failures_are_recorded_not_raised(registry, monkeypatch):
+    registry._chat_models = {"ok": SimpleNamespace(client="ok"), "down": SimpleNamespace(client="down")}
+
+    async def prewarm_grpc(client):
+        if client == "down":
+            raise OSError("unreachable")
+
+    monkeypatch.setattr(registry, "_prewarm_grpc", prewarm_grpc)
+    results = asyncio.run(registry.prewarm())
+    assert isinstance(results["google-0"], float)
+    assert results["google-1"] == "error: unreachable"
+    assert registry.stats()["prewarm"] == results
+
+
+def test_prewarm_timeout_marks_every_target(registry, monkeypatch):
+    registry._embeddings = {"slow": SimpleNamespace(client="slow")}
+
+    async def prewarm_grpc(client):
+        await asyncio.sleep(1)
+
+    monkeypatch.setattr(registry, "_prewarm_grpc", prewarm_grpc)
+    assert asyncio.run(registry.prewarm(timeout=0.01)) == {"google-0": "timeout"}
+
+
+def test_aclose_releases_the_pool(registry):
+    async def scenario():
+        client = registry.openai_client()
+        await registry.aclose()
+        return client, registry.openai_client()
+
+    before, after = asyncio.run(scenario())
+    assert after is not None and after is not before
+    assert registry.stats()["openai_client"] is True
@@ -0,0 +1,88 @@
+"""services/container.py 與 services/ai/session_state.py：服務只建立一次，AI 狀態屬於各會話"""
+
+import threading
+import time
+
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from services.ai import AIService
+from services.ai.dialogue_graph import DialogueGraph
+from services.ai.session_state import INITIAL_CHARACTER_STATE, AISessionState
+from services.container import ServiceContainer
+
+
+def test_service_is_built_once_on_first_use():
+    builds = []
+    container = ServiceContainer()
+    container.register("tts_service", lambda: builds.append(1) or object())
+
+    assert container.stats() == {"registered": ["tts_service"], "built": {}}
+    service = container.tts_service
+    assert container.get("tts_service") is service and len(builds) == 1
+    assert list(container.stats()["built"]) == ["tts_service"]
+
+
+def test_concurrent_first_use_builds_once():
+    builds = []
+    container = ServiceContainer()
+
+    def build():
+        builds.append(1)
+        time.sleep(0.05)  # 讓其他執行緒在建立期間取用
+        return object()
+
+    container.register("ai_service", build)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(container.ai_service)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(builds) == 1 and len({id(result) for result in results}) == 1
+
+
+def test_startup_builds_every_registered_service():
+    container = ServiceContainer()
+    container.register("ai_service", object)
+    container.register("stt_service", object)
+    container.startup()
+    assert sorted(container.stats()["built"]) == ["ai_service", "stt_service"]
+    with pytest.raises(KeyError):
+        container.get("unknown")
+
+
+def test_session_states_are_independent():
+    first, second = AISessionState(), AISessionState()
+    first.character_state["mood"] = 10
+    first.tasks_history.append({"task": "修理天線", "status": "success", "day": 1})
+
+    assert second.character_state == INITIAL_CHARACTER_STATE and second.tasks_history == []
+    assert INITIAL_CHARACTER_STATE["mood"] != 10
+
+
+def test_session_state_round_trip_fills_missing_fields():
+    state = AISessionState(current_task="觀測月相")
+    state.character_state["energy"] = 30
+    restored = AISessionState.from_dict(state.to_dict())
+    assert restored.to_dict() == state.to_dict()
+
+    partial = AISessionState.from_dict({"character_state": {"mood": 5}})
+    assert partial.character_state == {**INITIAL_CHARACTER_STATE, "mood": 5}
+    assert partial.current_task is None and partial.tasks_history == []
+
+
+def test_shared_service_updates_only_the_given_session():
+    ai = AIService.__new__(AIService)
+    ai.dialogue_graph = DialogueGraph(memory_system=None, llm=FakeListChatModel(responses=[]))
+    ai.default_state = AISessionState()
+    first, second = AISessionState(), AISessionState()
+
+    ai.update_character_state({"mood": "+10"}, state=first)
+    ai.set_current_task("修理天線", state=second)
+
+    assert first.character_state["mood"] == INITIAL_CHARACTER_STATE["mood"] + 10
+    assert second.character_state["mood"] == INITIAL_CHARACTER_STATE["mood"]
+    assert second.current_task == "修理天線" and first.current_task is None
+    assert ai.default_state.to_dict() == AISessionState().to_dict()
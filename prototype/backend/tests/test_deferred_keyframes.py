@@ -0,0 +1,79 @@
+"""services/ai：延遲關鍵幀模式跳過圖中的關鍵幀分析，之後由 analyze_keyframes() 單獨取得"""
+
+import asyncio
+import json
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from services.ai import AIService
+from services.ai.dialogue_graph import DEFAULT_ANIMATION_SEQUENCE, DEFAULT_NEUTRAL_KEYFRAMES, DialogueGraph
+from services.ai.session_state import AISessionState
+
+ANALYSIS = json.dumps({
+    "emotional_keyframes": [{"tag": "happy", "proportion": 0.0}, {"tag": "excited", "proportion": 1.0}],
+    "body_animation_sequence": [{"name": "Idle", "proportion": 0.0}],
+})
+
+
+def graph(*responses):
+    return DialogueGraph(memory_system=None, llm=FakeListChatModel(responses=list(responses)))
+
+
+def test_deferred_graph_goes_from_call_llm_to_post_process():
+    dialogue = graph()
+    full = dialogue.app.get_graph()
+    deferred = dialogue.deferred_keyframes_app.get_graph()
+
+    assert "analyze_keyframes" in full.nodes and "analyze_keyframes" not in deferred.nodes
+    assert ("call_llm", "post_process") in {(edge.source, edge.target) for edge in deferred.edges}
+    assert ("call_llm", "post_process") not in {(edge.source, edge.target) for edge in full.edges}
+
+
+def test_analyze_keyframes_runs_outside_the_graph():
+    result = asyncio.run(graph(ANALYSIS).analyze_keyframes("太好了，我們出發吧！"))
+    assert [frame["tag"] for frame in result["emotional_keyframes"]] == ["happy", "excited"]
+    assert result["body_animation_sequence"][0]["name"] == "Idle"
+
+
+def test_analyze_keyframes_without_text_returns_defaults():
+    result = asyncio.run(graph(ANALYSIS).analyze_keyframes(""))
+    assert result["emotional_keyframes"] == DEFAULT_NEUTRAL_KEYFRAMES
+    assert result["body_animation_sequence"] == DEFAULT_ANIMATION_SEQUENCE
+
+
+class RecordingGraph:
+    """記錄 generate_response 收到的參數；analyze_keyframes 一律失敗"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def generate_response(self, **kwargs):
+        self.calls.append(kwargs)
+        return {"final_response": "你好", "emotion": "happy", "emotional_keyframes": None, "body_animation_sequence": None}
+
+    async def analyze_keyframes(self, response_text):
+        raise RuntimeError("分析失敗")
+
+
+def service():
+    ai = AIService.__new__(AIService)
+    ai.dialogue_graph = RecordingGraph()
+    ai.default_state = AISessionState()
+    return ai
+
+
+def test_deferred_response_has_no_keyframes_yet():
+    ai = service()
+    result = asyncio.run(ai.generate_response(user_text="你好", defer_keyframes=True))
+
+    assert ai.dialogue_graph.calls[0]["defer_keyframes"] is True
+    assert result["final_response"] == "你好"
+    assert result["emotional_keyframes"] is None and result["body_animation_sequence"] is None
+    asyncio.run(ai.generate_response(user_text="你好"))
+    assert "defer_keyframes" not in ai.dialogue_graph.calls[1]
+
+
+def test_failed_deferred_analysis_falls_back_to_defaults():
+    result = asyncio.run(service().analyze_keyframes("你好"))
+    assert result["emotional_keyframes"] == DEFAULT_NEUTRAL_KEYFRAMES
+    assert result["body_animation_sequence"] == DEFAULT_ANIMATION_SEQUENCE
@@ -0,0 +1,88 @@
+"""services/idle_scheduler.py：以最小堆排程的截止時間"""
+
+import asyncio
+import time
+
+from services.idle_scheduler import DeadlineScheduler
+
+
+def recorder(fired, name):
+    async def callback():
+        fired.append(name)
+    return callback
+
+
+def test_fires_in_deadline_order():
+    async def scenario():
+        scheduler = DeadlineScheduler()
+        fired = []
+        now = time.monotonic()
+        scheduler.schedule("b", now + 0.04, recorder(fired, "b"))
+        scheduler.schedule("a", now + 0.02, recorder(fired, "a"))
+        scheduler.schedule("c", now + 0.06, recorder(fired, "c"))
+        await asyncio.sleep(0.1)
+        return fired, scheduler.stats()
+
+    fired, stats = asyncio.run(scenario())
+    assert fired == ["a", "b", "c"]
+    assert stats["fired"] == 3 and stats["scheduled"] == 0 and stats["heap_size"] == 0
+
+
+def test_rescheduling_replaces_the_previous_deadline():
+    async def scenario():
+        scheduler = DeadlineScheduler()
+        fired = []
+        now = time.monotonic()
+        scheduler.schedule("a", now + 0.01, recorder(fired, "old"))
+        scheduler.schedule("a", now + 0.08, recorder(fired, "new"))
+        await asyncio.sleep(0.04)
+        early = list(fired)
+        await asyncio.sleep(0.1)
+        return early, fired
+
+    early, fired = asyncio.run(scenario())
+    assert early == []
+    assert fired == ["new"]
+
+
+def test_cancel_removes_deadline_and_running_callback():
+    async def scenario():
+        scheduler = DeadlineScheduler()
+        fired = []
+        started = asyncio.Event()
+        cancelled = []
+
+        async def slow():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append("slow")
+                raise
+
+        now = time.monotonic()
+        scheduler.schedule("a", now + 0.01, recorder(fired, "a"))
+        scheduler.schedule("b", now, slow)
+        scheduler.cancel("a")
+        await started.wait()
+        scheduler.cancel("b")
+        await asyncio.sleep(0.03)
+        return fired, cancelled, scheduler.stats()
+
+    fired, cancelled, stats = asyncio.run(scenario())
+    assert fired == []
+    assert cancelled == ["slow"]
+    assert stats["running"] == 0
+
+
+def test_stale_entries_are_compacted():
+    async def scenario():
+        scheduler = DeadlineScheduler()
+        deadline = time.monotonic() + 60
+        for _ in range(500):
+            scheduler.schedule("a", deadline, recorder([], "a"))
+        return scheduler.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["scheduled"] == 1
+    assert stats["heap_size"] <= 2 * 1 + 64 + 1
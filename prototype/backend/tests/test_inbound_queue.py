@@ -0,0 +1,73 @@
+"""services/inbound_queue.py：合併視窗內的同類訊息合併為一個回合"""
+
+import asyncio
+
+from services.inbound_queue import InboundQueue
+
+
+def chat(text):
+    return {"type": "chat-message", "message": text}
+
+
+def test_merges_queued_messages_of_the_same_type():
+    async def scenario():
+        queue = InboundQueue(maxsize=8, window=0, max_wait=1.0, max_messages=8)
+        for text in ("你好", "我想問", "火星有多遠"):
+            await queue.put(chat(text))
+        return await queue.next_turn(), queue.stats()
+
+    turn, stats = asyncio.run(scenario())
+    assert turn == {"type": "chat-message", "message": "你好\n我想問\n火星有多遠", "coalesced": 3}
+    assert stats["turns"] == 1 and stats["coalesced"] == 2 and stats["depth"] == 0
+
+
+def test_different_type_ends_the_turn_and_is_kept_for_the_next():
+    async def scenario():
+        queue = InboundQueue(maxsize=8, window=0, max_wait=1.0, max_messages=8)
+        await queue.put(chat("a"))
+        await queue.put({"type": "message", "content": "b"})
+        await queue.put(chat("c"))
+        return [await queue.next_turn() for _ in range(3)]
+
+    turns = asyncio.run(scenario())
+    assert turns == [chat("a"), {"type": "message", "content": "b"}, chat("c")]
+
+
+def test_window_waits_for_messages_arriving_shortly_after():
+    async def scenario():
+        queue = InboundQueue(maxsize=8, window=0.1, max_wait=1.0, max_messages=8)
+        await queue.put(chat("a"))
+
+        async def late():
+            await asyncio.sleep(0.02)
+            await queue.put(chat("b"))
+
+        sender = asyncio.ensure_future(late())
+        turn = await queue.next_turn()
+        await sender
+        return turn
+
+    assert asyncio.run(scenario())["message"] == "a\nb"
+
+
+def test_max_messages_limits_a_turn():
+    async def scenario():
+        queue = InboundQueue(maxsize=8, window=0, max_wait=1.0, max_messages=2)
+        for text in "abc":
+            await queue.put(chat(text))
+        return await queue.next_turn(), await queue.next_turn()
+
+    first, second = asyncio.run(scenario())
+    assert first["message"] == "a\nb" and first["coalesced"] == 2
+    assert second == chat("c")
+
+
+def test_non_turn_messages_are_not_merged():
+    async def scenario():
+        queue = InboundQueue(maxsize=8, window=0, max_wait=1.0, max_messages=8)
+        await queue.put({"type": "ping"})
+        await queue.put({"type": "ping"})
+        return await queue.next_turn(), queue.depth()
+
+    turn, depth = asyncio.run(scenario())
+    assert turn == {"type": "ping"} and depth == 1
@@ -0,0 +1,120 @@
+"""services/live_room.py：一次生成的訊息扇出給所有觀眾、後加入者的快照與房間的建立和關閉"""
+
+import asyncio
+from types import SimpleNamespace
+
+from fastapi import WebSocketDisconnect
+
+from core.config import settings
+from services.audience_aggregator import AudienceAggregator
+from services.live_room import LiveRoom, RoomFanout, room_session_id
+from services.session_manager import ConnectionManager, ConversationSession
+from services.session_store import InMemorySessionStore
+
+
+class RecordingOutbound:
+    """記錄放入觀眾出站佇列的訊息；disconnected 時模擬已斷線的連線"""
+
+    def __init__(self, disconnected=False):
+        self.sent = []
+        self.disconnected = disconnected
+
+    async def send(self, message):
+        if self.disconnected:
+            raise WebSocketDisconnect()
+        self.sent.append(message)
+
+    async def send_bytes(self, frame):
+        if self.disconnected:
+            raise WebSocketDisconnect()
+        self.sent.append(frame)
+
+
+class FakeWebSocket:
+    client = SimpleNamespace(host="127.0.0.1", port=1000)
+
+    async def accept(self, subprotocol=None):
+        pass
+
+
+def spectator(disconnected=False):
+    session = ConversationSession(None, {})
+    session.outbound = RecordingOutbound(disconnected)
+    return session
+
+
+def room_with(*spectators):
+    room = LiveRoom("r", ConversationSession(None, {}, session_id=room_session_id("r")))
+    room.session.outbound = RoomFanout(room)
+    for session in spectators:
+        room.add_spectator(session)
+    return room
+
+
+def test_message_is_prepared_once_and_sent_to_every_spectator():
+    viewers = [spectator(), spectator(), spectator(disconnected=True)]
+    room = room_with(*viewers)
+
+    async def scenario():
+        await room.session.outbound.send({"type": "chat-message", "message": "大家好"})
+        await room.session.outbound.send_bytes(b"\x01audio")
+
+    asyncio.run(scenario())
+    first, second = viewers[0].outbound.sent, viewers[1].outbound.sent
+    assert first[0] is second[0] and first[0].message["message"] == "大家好"
+    assert first[1] == second[1] == b"\x01audio"
+    assert room.session.outbound.stats() == {"messages": 2, "deliveries": 4}
+
+
+def test_latest_bot_message_and_trajectory_are_kept_for_late_joiners(monkeypatch):
+    monkeypatch.setattr(settings, "LIVE_ROOM_SNAPSHOT_HISTORY", 2)
+    room = room_with(spectator())
+
+    async def scenario():
+        for n in range(2):
+            await room.session.outbound.send({"type": "chat-message", "message": f"訊息 {n}"})
+        await room.session.outbound.send({"type": "emotionalTrajectory", "payload": {}})
+        await room.session.outbound.send({"type": "audio-end"})
+
+    asyncio.run(scenario())
+    for n in range(3):
+        room.session.add_to_history("user", f"問題 {n}")
+    room.add_spectator(spectator())
+
+    assert sorted(room.recent) == ["chat-message", "emotionalTrajectory"]
+    assert room.recent["chat-message"].message["message"] == "訊息 1"
+    snapshot = room.snapshot()
+    assert snapshot["viewers"] == 2 and [entry["content"] for entry in snapshot["history"]] == ["問題 1", "問題 2"]
+
+
+def test_pending_messages_beyond_the_limit_are_dropped(monkeypatch):
+    monkeypatch.setattr(settings, "LIVE_ROOM_MAX_PENDING_MESSAGES", 2)
+    room = room_with()
+    for n in range(3):
+        room.submit({"type": "chat-message", "message": str(n)})
+
+    assert asyncio.run(room.next_message())["message"] == "0"
+    assert room.stats()["received"] == 3 and room.dropped == 1
+
+
+def test_spectators_share_one_room_until_the_last_leaves():
+    async def scenario():
+        store = InMemorySessionStore(flush_interval=0, ttl=0)
+        await store._write(room_session_id("r"), {"history": [{"role": "user", "content": "上一場的問題"}]}, 0)
+        connections = ConnectionManager(store=store)
+        first = await connections.connect(FakeWebSocket(), {})
+        second = await connections.connect(FakeWebSocket(), {})
+        room, created = await connections.join_room("r", first, {})
+        room.task = asyncio.ensure_future(asyncio.sleep(10))
+        same, created_again = await connections.join_room("r", second, {})
+        await connections.leave_room("r", first.session_id)
+        still_open = "r" in connections.rooms
+        await connections.leave_room("r", second.session_id)
+        return connections, room, created, same, created_again, still_open
+
+    connections, room, created, same, created_again, still_open = asyncio.run(scenario())
+    assert created and same is room and not created_again
+    assert isinstance(room.session.outbound, RoomFanout) and isinstance(room.session.inbound, AudienceAggregator)
+    assert [entry["content"] for entry in room.session.history] == ["上一場的問題"]
+    assert still_open and "r" not in connections.rooms
+    assert room.task.cancelled() and room.peak_spectators == 2
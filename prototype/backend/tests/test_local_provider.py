@@ -0,0 +1,107 @@
+"""services/speech_providers/local_provider.py：靜音音訊的時長、延遲分佈與可重現的錯誤注入"""
+
+import asyncio
+import math
+
+import pytest
+
+from core.exceptions import SpeechServiceException
+from services.speech_providers.base import TTSProvider
+from services.speech_providers.local_provider import (
+    MP3_SAMPLE_RATE,
+    MP3_SAMPLES_PER_FRAME,
+    LocalSTTProvider,
+    LocalTTSProvider,
+    build_silent_mp3,
+    build_silent_wav,
+    parse_latency_spec,
+)
+from utils.audio_timing import get_audio_duration, scan_audio_frames
+
+FRAME_DURATION = MP3_SAMPLES_PER_FRAME / MP3_SAMPLE_RATE
+
+
+def synthesize(provider, text, response_format="mp3", speed=1.0):
+    return asyncio.run(provider.synthesize(text, "model", "voice", speed, None, response_format))
+
+
+@pytest.mark.parametrize("duration", [0.01, 0.5, 1.0, 3.3])
+def test_silent_mp3_parses_as_mpeg2_layer3_frames(duration):
+    scanner = scan_audio_frames(build_silent_mp3(duration))
+    frame_count = math.ceil(duration / FRAME_DURATION)
+    assert scanner.format == "mp3" and scanner.sample_rate == MP3_SAMPLE_RATE
+    assert len(scanner.frames) == frame_count
+    assert scanner.duration == pytest.approx(frame_count * FRAME_DURATION)
+
+
+@pytest.mark.parametrize("duration", [0.25, 1.0, 2.5])
+def test_silent_wav_duration(duration):
+    assert get_audio_duration(build_silent_wav(duration)) == pytest.approx(duration)
+
+
+def test_synthesized_duration_follows_text_length_and_speed():
+    provider = LocalTTSProvider(latency_spec="fixed:0", error_rate=0, seconds_per_char=0.2, seed=1)
+    mp3 = get_audio_duration(synthesize(provider, "十個字的一句測試文字"))
+    fast = get_audio_duration(synthesize(provider, "十個字的一句測試文字", speed=2.0))
+    wav = get_audio_duration(synthesize(provider, "十個字的一句測試文字", response_format="wav"))
+
+    assert 2.0 <= mp3 < 2.0 + FRAME_DURATION
+    assert 1.0 <= fast < 1.0 + FRAME_DURATION
+    assert wav == pytest.approx(2.0)
+    with pytest.raises(SpeechServiceException):
+        synthesize(provider, "文字", response_format="opus")
+
+
+def test_stream_chunks_concatenate_to_the_whole_synthesis():
+    provider = LocalTTSProvider(latency_spec="fixed:0", error_rate=0, seconds_per_char=0.2, seed=1)
+
+    async def collect():
+        return [chunk async for chunk in provider.stream("串流測試", "model", "voice", 1.0, None, "mp3", 100)]
+
+    chunks = asyncio.run(collect())
+    assert all(len(chunk) <= 100 for chunk in chunks)
+    assert b"".join(chunks) == synthesize(provider, "串流測試")
+
+
+@pytest.mark.parametrize("spec", ["fixed:0.3", "uniform:0.2,1.0", "normal:0.8,0.2", "lognormal:0.8,0.3", "exponential:0.5"])
+def test_latency_is_reproducible_for_a_seed(spec):
+    def samples(seed):
+        provider = LocalTTSProvider(latency_spec=spec, error_rate=0, seed=seed)
+        return [provider._upstream.sample_latency() for _ in range(20)]
+
+    assert samples(7) == samples(7)
+    assert all(sample >= 0 for sample in samples(7))
+    if not spec.startswith("fixed"):
+        assert samples(7) != samples(8)
+
+
+@pytest.mark.parametrize("spec", ["gamma:1,2", "uniform:1", "fixed:a"])
+def test_invalid_latency_spec_is_rejected(spec):
+    with pytest.raises(ValueError):
+        parse_latency_spec(spec)
+
+
+def test_error_injection_is_reproducible_for_a_seed():
+    def outcomes(seed):
+        provider = LocalSTTProvider(latency_spec="fixed:0", error_rate=0.5, transcripts=["a", "b"], seed=seed)
+        results = []
+        for _ in range(20):
+            try:
+                results.append(asyncio.run(provider.transcribe(b"audio", "a.webm", "zh")))
+            except SpeechServiceException:
+                results.append(None)
+        return results
+
+    first = outcomes(3)
+    assert first == outcomes(3)
+    # 失敗與成功都有出現 (相同音訊永遠得到相同的轉錄)
+    assert None in first and len(set(first) - {None}) == 1
+
+
+def test_provider_without_stream_cannot_be_constructed():
+    class PartialProvider(TTSProvider):
+        async def synthesize(self, text, model, voice, speed, instructions, response_format):
+            return b""
+
+    with pytest.raises(TypeError):
+        PartialProvider()
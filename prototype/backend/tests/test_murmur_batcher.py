@@ -0,0 +1,103 @@
+"""services/murmur_batcher.py：視窗內的請求合併為一次 LLM 調用，結果依順序分發回各會話"""
+
+import asyncio
+import json
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from services.ai.dialogue_graph import DialogueGraph
+from services.murmur_batcher import DIGEST_HISTORY_ENTRIES, MurmurBatcher, build_context_digest
+
+
+class RecordingBatch:
+    """記錄每次批次調用，依情境返回對應的 murmur"""
+
+    def __init__(self, fail=False, missing=()):
+        self.calls = []
+        self.fail = fail
+        self.missing = set(missing)
+
+    async def __call__(self, contexts, states):
+        self.calls.append((list(contexts), list(states)))
+        await asyncio.sleep(0)
+        if self.fail:
+            raise RuntimeError("LLM 失敗")
+        return [None if context in self.missing else {"final_response": f"murmur for {context}"} for context in contexts]
+
+
+def test_requests_within_the_window_share_one_call():
+    async def scenario():
+        generate = RecordingBatch()
+        batcher = MurmurBatcher(generate, window=0.01, max_size=8)
+        results = await asyncio.gather(*(batcher.request(f"s{n}", state=n) for n in range(3)))
+        return generate, batcher, results
+
+    generate, batcher, results = asyncio.run(scenario())
+    assert generate.calls == [(["s0", "s1", "s2"], [0, 1, 2])]
+    assert [result["final_response"] for result in results] == ["murmur for s0", "murmur for s1", "murmur for s2"]
+    stats = batcher.stats()
+    assert stats["batches"] == 1 and stats["llm_calls_saved"] == 2 and stats["avg_batch_size"] == 3.0
+
+
+def test_full_batch_is_sent_without_waiting_for_the_window():
+    async def scenario():
+        generate = RecordingBatch()
+        batcher = MurmurBatcher(generate, window=10, max_size=2)
+        results = await asyncio.wait_for(asyncio.gather(batcher.request("a"), batcher.request("b")), 1)
+        return generate, results
+
+    generate, results = asyncio.run(scenario())
+    assert len(generate.calls) == 1 and all(results)
+
+
+def test_cancelled_request_is_not_sent():
+    async def scenario():
+        generate = RecordingBatch()
+        batcher = MurmurBatcher(generate, window=0.02, max_size=8)
+        cancelled = asyncio.ensure_future(batcher.request("speaking"))
+        kept = asyncio.ensure_future(batcher.request("idle"))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        return generate, await kept, batcher.stats()
+
+    generate, kept, stats = asyncio.run(scenario())
+    assert generate.calls[0][0] == ["idle"] and kept["final_response"] == "murmur for idle"
+    assert stats["requests"] == 2 and stats["llm_calls_saved"] == 0
+
+
+def test_failures_are_fanned_out_as_none():
+    async def scenario(generate):
+        batcher = MurmurBatcher(generate, window=0.01, max_size=8)
+        results = await asyncio.gather(batcher.request("a"), batcher.request("b"))
+        return results, batcher.stats()["failures"]
+
+    assert asyncio.run(scenario(RecordingBatch(fail=True))) == ([None, None], 2)
+    results, failures = asyncio.run(scenario(RecordingBatch(missing={"a"})))
+    assert results[0] is None and results[1]["final_response"] == "murmur for b" and failures == 1
+
+
+def test_context_digest_keeps_the_latest_entries():
+    history = [{"role": "user", "content": f"問題 {n}"} for n in range(10)]
+    history.append({"role": "bot", "content": "嗯...", "is_murmur": True})
+    digest = build_context_digest(history, ["a", "b", "c", "d"], "happy")
+
+    lines = digest.splitlines()
+    assert lines[0] == "目前情緒: happy"
+    assert sum(line.startswith("- ") for line in lines) == DIGEST_HISTORY_ENTRIES
+    assert "- 自言自語: 嗯..." in lines and "問題 4" not in digest
+    assert lines[-1] == "最近的自言自語 (避免重複): b, c, d"
+
+
+def test_batch_response_is_mapped_back_by_index():
+    response = json.dumps({"murmurs": [
+        {"index": 1, "text": "第二個情境", "emotion": "curious-ish"},
+        {"index": 0, "text": "第一個情境", "emotion": "happy"},
+        {"index": 0, "text": "重複的編號"},
+        {"index": 5, "text": "超出範圍"},
+    ]})
+    graph = DialogueGraph(memory_system=None, llm=FakeListChatModel(responses=[response]))
+    results = asyncio.run(graph.generate_murmur_batch(["a", "b", "c"]))
+
+    assert results[0]["final_response"] == "第一個情境" and results[0]["emotion"] == "happy"
+    assert results[1]["final_response"] == "第二個情境" and results[1]["emotion"] == "neutral"
+    assert results[2] is None
@@ -0,0 +1,112 @@
+"""services/murmur_pool.py：背景補滿、依序取出、過期與情境改變時失效"""
+
+import asyncio
+
+from services.murmur_pool import MurmurPool
+
+
+def generator(delay=0.0):
+    count = 0
+
+    async def generate():
+        nonlocal count
+        count += 1
+        await asyncio.sleep(delay)
+        return {"text": f"murmur {count}"}
+
+    return generate
+
+
+def test_fill_then_take_in_order():
+    async def scenario():
+        pool = MurmurPool(size=2, max_age=60)
+        pool.fill(generator())
+        await pool._fill_task
+        return pool, [pool.take(), pool.take(), pool.take()]
+
+    pool, taken = asyncio.run(scenario())
+    assert taken == [{"text": "murmur 1"}, {"text": "murmur 2"}, None]
+    assert pool.stats() == {"size": 0, "filling": False, "produced": 2, "hits": 2, "misses": 1, "expired": 0, "invalidations": 0}
+
+
+def test_fill_does_nothing_while_filling_or_full():
+    async def scenario():
+        pool = MurmurPool(size=1, max_age=60)
+        generate = generator(delay=0.01)
+        pool.fill(generate)
+        task = pool._fill_task
+        pool.fill(generate)
+        same = pool._fill_task is task
+        await task
+        pool.fill(generate)
+        return pool, same
+
+    pool, same = asyncio.run(scenario())
+    assert same and not pool.filling and pool.produced == 1
+
+
+def test_expired_and_rejected_murmurs_are_skipped():
+    async def scenario():
+        pool = MurmurPool(size=3, max_age=60)
+        pool.fill(generator())
+        await pool._fill_task
+        pool._entries[0]["created_at"] -= 120
+        return pool, pool.take(accept=lambda murmur: murmur["text"] != "murmur 2")
+
+    pool, taken = asyncio.run(scenario())
+    assert taken == {"text": "murmur 3"}
+    assert pool.expired == 1 and len(pool) == 0
+
+
+def test_invalidate_discards_the_pool_and_stops_generation():
+    async def scenario():
+        pool = MurmurPool(size=2, max_age=60)
+        pool.fill(generator())
+        await pool._fill_task
+        pool.invalidate()
+        emptied = len(pool)
+        pool.fill(generator(delay=1))
+        task = pool._fill_task
+        await asyncio.sleep(0)
+        pool.invalidate()
+        await asyncio.wait({task})
+        return pool, emptied, task
+
+    pool, emptied, task = asyncio.run(scenario())
+    assert emptied == 0 and task.cancelled()
+    assert pool.invalidations == 2 and len(pool) == 0 and not pool.filling
+
+
+def test_murmur_generated_for_an_old_context_is_dropped():
+    async def scenario():
+        pool = MurmurPool(size=1, max_age=60)
+        release = asyncio.Event()
+
+        async def generate():
+            await release.wait()
+            return {"text": "舊情境"}
+
+        task = asyncio.ensure_future(pool._fill(generate))
+        await asyncio.sleep(0)
+        pool.generation += 1  # 情境已改變 (invalidate 但未取消此次生成)
+        release.set()
+        await task
+        return pool
+
+    pool = asyncio.run(scenario())
+    assert len(pool) == 0 and pool.produced == 0
+
+
+def test_failed_generation_stops_filling():
+    async def scenario():
+        pool = MurmurPool(size=2, max_age=60)
+
+        async def generate():
+            raise RuntimeError("LLM 失敗")
+
+        pool.fill(generate)
+        await pool._fill_task
+        return pool
+
+    pool = asyncio.run(scenario())
+    assert len(pool) == 0 and not pool.filling
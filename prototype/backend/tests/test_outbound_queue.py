@@ -0,0 +1,153 @@
+"""services/outbound_queue.py：優先級、取代、佇列滿時的捨棄策略與被取代回合的清除"""
+
+import asyncio
+
+import orjson
+import pytest
+from fastapi import WebSocketDisconnect
+
+from services.outbound_queue import OutboundQueue
+from services.turn_controller import TurnController
+
+
+class FakeWebSocket:
+    client = "test-client"
+
+    def __init__(self):
+        self.close_code = None
+
+    async def close(self, code: int = 1000) -> None:
+        self.close_code = code
+
+
+class FakeChannel:
+    """記錄送出的幀；blocked 時寫入會一直等待 (模擬不讀取的客戶端)"""
+
+    def __init__(self, blocked: bool = False):
+        self.websocket = FakeWebSocket()
+        self.sent = []
+        self.unblocked = asyncio.Event()
+        if not blocked:
+            self.unblocked.set()
+
+    def encode(self, message):
+        return orjson.dumps(message)
+
+    async def send_payload(self, payload: bytes) -> None:
+        await self.unblocked.wait()
+        self.sent.append(orjson.loads(payload))
+
+    async def send_bytes(self, frame: bytes) -> None:
+        await self.unblocked.wait()
+        self.sent.append(frame)
+
+
+def test_sends_by_priority_and_supersedes_trajectory():
+    async def scenario():
+        channel = FakeChannel(blocked=True)
+        queue = OutboundQueue(channel, maxsize=16, high_water_bytes=1 << 20, slow_client_seconds=5)
+        await queue.send({"type": "emotionalTrajectory", "payload": 1})
+        await queue.send({"type": "chat-message", "message": "hi"})
+        await queue.send({"type": "emotionalTrajectory", "payload": 2})
+        await queue.send({"type": "error", "message": "x"})
+        channel.unblocked.set()
+        while queue.depth():
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.01)
+        await queue.close()
+        return channel.sent, queue
+
+    sent, queue = asyncio.run(scenario())
+    # 寫入任務在第一次讓出控制權時才開始：依優先級送出，尚未送出的軌跡被新的就地取代
+    assert [message["type"] for message in sent] == ["error", "chat-message", "emotionalTrajectory"]
+    assert sent[-1]["payload"] == 2
+    assert queue.superseded == 1
+    assert queue.dropped == 0
+
+
+def test_full_queue_never_drops_audio_frames():
+    async def scenario():
+        channel = FakeChannel(blocked=True)
+        queue = OutboundQueue(channel, maxsize=8, high_water_bytes=1 << 20, slow_client_seconds=5)
+        frames = [bytes([index]) * 32 for index in range(8)]
+        # 佇列已滿時捨棄動畫軌跡，為音訊幀騰出位置
+        await queue.send({"type": "emotionalTrajectory", "payload": 0})
+        for frame in frames[:7]:
+            await queue.send_bytes(frame)
+        await queue.send_bytes(frames[7])
+        assert queue.dropped == 1
+        # 沒有可捨棄的訊息時不捨棄音訊，而是把客戶端視為過慢並斷線
+        with pytest.raises(WebSocketDisconnect):
+            await queue.send_bytes(b"overflow")
+        await asyncio.sleep(0)
+        return channel, queue, frames
+
+    channel, queue, frames = asyncio.run(scenario())
+    assert queue.slow_disconnect
+    assert channel.websocket.close_code == 1013
+    assert queue.dropped == 1
+
+
+def test_queued_audio_frames_are_delivered_in_order():
+    async def scenario():
+        channel = FakeChannel(blocked=True)
+        queue = OutboundQueue(channel, maxsize=8, high_water_bytes=1 << 20, slow_client_seconds=5)
+        frames = [bytes([index]) * 32 for index in range(8)]
+        for frame in frames:
+            await queue.send_bytes(frame)
+        # 滿了之後新的動畫軌跡本身被捨棄，音訊不受影響
+        await queue.send({"type": "emotionalTrajectory", "payload": 0})
+        channel.unblocked.set()
+        while queue.depth():
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.01)
+        await queue.close()
+        return channel.sent, queue, frames
+
+    sent, queue, frames = asyncio.run(scenario())
+    assert sent == frames
+    assert queue.dropped == 1
+    assert queue.sent == len(frames)
+
+
+def test_superseded_turn_frames_are_never_written():
+    async def scenario():
+        channel = FakeChannel(blocked=True)
+        turns = TurnController()
+        queue = OutboundQueue(channel, maxsize=16, high_water_bytes=1 << 20, slow_client_seconds=5, turns=turns)
+        streaming = asyncio.Event()
+
+        async def old_turn(turn_id):
+            await queue.send({"type": "chat-message", "message": "old"})
+            await queue.send_bytes(b"old-audio")
+            await queue.send({"type": "emotionalTrajectory", "payload": "old"})
+            streaming.set()
+            await asyncio.sleep(10)
+
+        async def new_turn(turn_id):
+            await queue.send({"type": "chat-message", "message": "new"})
+            await queue.send_bytes(b"new-audio")
+
+        # 寫入任務卡在第一則訊息上，之後的訊息都還在佇列中
+        await queue.send({"type": "session", "id": "s"})
+        await asyncio.sleep(0)
+        turns.start(old_turn)
+        await streaming.wait()
+        await queue.send({"type": "error", "message": "control"})
+        # barge-in：取消上一回合並清除其尚未送出的訊息
+        turns.cancel_current()
+        purged = queue.purge_turn(turns.turn_id)
+        # 取消生效前上一回合才放入的訊息同樣不送出
+        await queue.send_bytes(b"late-audio")
+        await turns.start(new_turn)
+        channel.unblocked.set()
+        while queue.depth():
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.01)
+        await queue.close()
+        return channel.sent, queue, purged
+
+    sent, queue, purged = asyncio.run(scenario())
+    assert sent == [{"type": "session", "id": "s"}, {"type": "error", "message": "control"}, {"type": "chat-message", "message": "new"}, b"new-audio"]
+    assert purged == 3
+    assert queue.purged == 4 and queue.stats()["purged"] == 4
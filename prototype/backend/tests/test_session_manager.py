@@ -0,0 +1,111 @@
+"""services/session_manager.py：會話物件的有界歷史、以 session id 為鍵的連線管理與狀態恢復"""
+
+import asyncio
+from types import SimpleNamespace
+
+from services.session_manager import MAX_HISTORY_LENGTH, MAX_RECENT_MURMURS, ConnectionManager, ConversationSession
+from services.session_store import InMemorySessionStore
+
+
+class FakeWebSocket:
+    def __init__(self, port=1000):
+        self.client = SimpleNamespace(host="127.0.0.1", port=port)
+        self.accepted = None
+
+    async def accept(self, subprotocol=None):
+        self.accepted = subprotocol
+
+
+def manager():
+    return ConnectionManager(store=InMemorySessionStore(flush_interval=0, ttl=0))
+
+
+def test_history_keeps_only_the_latest_turns():
+    session = ConversationSession(None, {})
+    for n in range(MAX_HISTORY_LENGTH * 3):
+        session.add_to_history("user", f"問題 {n}")
+        session.add_to_history("bot", f"回答 {n}")
+
+    assert len(session.history) == MAX_HISTORY_LENGTH * 2
+    assert session.history[0]["content"] == f"問題 {MAX_HISTORY_LENGTH * 2}"
+    assert session.history[-1] == {"role": "bot", "content": f"回答 {MAX_HISTORY_LENGTH * 3 - 1}", "is_murmur": False}
+
+
+def test_recent_murmurs_are_bounded():
+    session = ConversationSession(None, {})
+    for n in range(MAX_RECENT_MURMURS + 5):
+        session.remember_murmur(f"自言自語 {n}")
+    assert len(session.recent_murmurs) == MAX_RECENT_MURMURS
+
+
+def test_state_round_trip():
+    session = ConversationSession(None, {})
+    session.add_to_history("user", "你好")
+    session.add_to_history("bot", "嗯...", is_murmur=True)
+    session.remember_murmur("嗯...")
+    session.current_emotion = "happy"
+    session.ai_state.current_task = "修理天線"
+
+    restored = ConversationSession(None, {})
+    restored.restore_state(session.to_state())
+    assert restored.to_state() == session.to_state()
+    assert restored.ai_state.current_task == "修理天線"
+
+
+def test_sessions_are_keyed_by_id():
+    async def scenario():
+        connections = manager()
+        first = await connections.connect(FakeWebSocket(1), {})
+        second = await connections.connect(FakeWebSocket(2), {}, subprotocol="msgpack")
+        return connections, first, second
+
+    connections, first, second = asyncio.run(scenario())
+    assert len(connections) == 2 and first.session_id in connections
+    assert connections.get(second.session_id) is second and second.websocket.accepted == "msgpack"
+    assert connections.disconnect(first.session_id) is first
+    assert connections.disconnect(first.session_id) is None
+    assert first.session_id not in connections
+    stats = connections.stats()
+    assert stats["active_sessions"] == 1 and stats["total_connections"] == 2
+    assert [entry["session_id"] for entry in connections.describe_sessions()] == [second.session_id]
+
+
+def test_reconnect_restores_the_saved_state():
+    async def scenario():
+        connections = manager()
+        session = await connections.connect(FakeWebSocket(), {})
+        session.add_to_history("user", "記得我嗎")
+        await connections.save(session)
+        connections.disconnect(session.session_id)
+        again = await connections.connect(FakeWebSocket(), {}, session_id=session.session_id)
+        unknown = await connections.connect(FakeWebSocket(), {}, session_id="unknown")
+        return connections, session, again, unknown
+
+    connections, session, again, unknown = asyncio.run(scenario())
+    assert again.session_id == session.session_id
+    assert list(again.history) == [{"role": "user", "content": "記得我嗎"}]
+    assert unknown.session_id != "unknown" and not unknown.history
+    assert connections.restored_sessions == 1
+
+
+def test_an_id_still_in_use_gets_a_new_session():
+    async def scenario():
+        connections = manager()
+        session = await connections.connect(FakeWebSocket(), {})
+        await connections.save(session)
+        return session, await connections.connect(FakeWebSocket(), {}, session_id=session.session_id)
+
+    session, duplicate = asyncio.run(scenario())
+    assert duplicate.session_id != session.session_id
+
+
+def test_counters_of_closed_sessions_are_kept():
+    async def scenario():
+        connections = manager()
+        session = await connections.connect(FakeWebSocket(), {})
+        session.murmur_pool.take()
+        connections.disconnect(session.session_id)
+        return connections.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["active_sessions"] == 0 and stats["murmur_pool_misses"] == 1
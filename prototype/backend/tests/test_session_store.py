@@ -0,0 +1,95 @@
+"""services/session_store：合併寫入、版本衝突 (樂觀並行控制) 與過期狀態"""
+
+import asyncio
+
+import pytest
+
+from services.session_store import InMemorySessionStore, SessionStateStore, SessionVersionConflict, SQLiteSessionStore
+
+
+def sqlite_store(tmp_path, **kwargs):
+    options = {"flush_interval": 0.02, "ttl": 0}
+    options.update(kwargs)
+    return SQLiteSessionStore(path=str(tmp_path / "sessions.db"), **options)
+
+
+def test_stale_version_write_raises_conflict(tmp_path):
+    store = sqlite_store(tmp_path)
+    assert store._write_sync("s", {"n": 1}, 0) == 1
+    assert store._write_sync("s", {"n": 2}, 1) == 2
+    with pytest.raises(SessionVersionConflict) as conflict:
+        store._write_sync("s", {"n": "stale"}, 1)
+    assert conflict.value.expected == 1 and conflict.value.actual == 2
+    with pytest.raises(SessionVersionConflict):
+        store._write_sync("s", {"n": "stale"}, 0)
+    assert store._read_sync("s") == (2, {"n": 2})
+
+
+def test_late_write_from_another_worker_is_counted_and_discarded(tmp_path):
+    async def scenario():
+        first, second = sqlite_store(tmp_path), sqlite_store(tmp_path)
+        await first.load("s")
+        first.schedule_save("s", lambda: {"owner": "first"})
+        await first.flush()
+        # 第二個 worker 接手會話並寫入
+        await second.load("s")
+        second.schedule_save("s", lambda: {"owner": "second"})
+        await second.flush()
+        # 舊連線遲到的寫入
+        first.schedule_save("s", lambda: {"owner": "first-late"})
+        await first.flush()
+        return await second.load("s"), first.stats(), second.stats()
+
+    state, first_stats, second_stats = asyncio.run(scenario())
+    assert state == {"owner": "second"}
+    assert first_stats["conflicts"] == 1 and first_stats["writes"] == 1
+    assert second_stats["conflicts"] == 0
+
+
+def test_saves_within_the_flush_interval_coalesce_into_one_write(tmp_path):
+    async def scenario():
+        store = sqlite_store(tmp_path)
+        for n in range(10):
+            store.schedule_save("s", lambda n=n: {"n": n})
+        await asyncio.sleep(0.1)
+        return await store.load("s"), store.stats()
+
+    state, stats = asyncio.run(scenario())
+    assert state == {"n": 9}
+    assert stats["save_requests"] == 10 and stats["coalesced_writes"] == 9 and stats["writes"] == 1
+
+
+def test_expired_state_is_not_loaded(tmp_path):
+    async def scenario():
+        store = sqlite_store(tmp_path, ttl=0.05)
+        store.schedule_save("s", lambda: {"n": 1})
+        await store.flush()
+        fresh = await store.load("s")
+        await asyncio.sleep(0.1)
+        return fresh, await store.load("s")
+
+    fresh, expired = asyncio.run(scenario())
+    assert fresh == {"n": 1} and expired is None
+
+
+def test_memory_store_rejects_a_stale_version():
+    async def scenario():
+        store = InMemorySessionStore(flush_interval=0, ttl=0)
+        await store._write("s", {"n": 1}, 0)
+        with pytest.raises(SessionVersionConflict):
+            await store._write("s", {"n": 2}, 0)
+        return await store._read("s")
+
+    assert asyncio.run(scenario()) == (1, {"n": 1})
+
+
+def test_store_without_delete_cannot_be_constructed():
+    class PartialStore(SessionStateStore):
+        async def _read(self, session_id):
+            return None
+
+        async def _write(self, session_id, state, expected_version):
+            return 1
+
+    with pytest.raises(TypeError):
+        PartialStore(flush_interval=0, ttl=0)
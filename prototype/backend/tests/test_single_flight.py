@@ -0,0 +1,131 @@
+"""services/single_flight.py：相同上游請求的合併與取消"""
+
+import asyncio
+
+import pytest
+
+from services.single_flight import SingleFlight, request_key
+
+
+class Upstream:
+    """記錄調用次數；release 設定前一直等待"""
+
+    def __init__(self, result="ok"):
+        self.result = result
+        self.calls = 0
+        self.cancelled = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+def test_request_key_depends_on_every_part():
+    assert request_key("prompt", 0.7) == request_key("prompt", 0.7)
+    assert request_key("prompt", 0.7) != request_key("prompt", 0.8)
+
+
+def test_concurrent_identical_requests_share_one_call():
+    async def scenario():
+        flight = SingleFlight(enabled=True, linger=0)
+        upstream = Upstream()
+        waiters = [asyncio.ensure_future(flight.run("dialogue", "k", upstream)) for _ in range(3)]
+        await asyncio.sleep(0)
+        upstream.release.set()
+        return await asyncio.gather(*waiters), upstream.calls, flight.stats()
+
+    results, calls, stats = asyncio.run(scenario())
+    assert results == ["ok"] * 3 and calls == 1
+    assert stats["requests"] == 3 and stats["upstream_calls"] == 1 and stats["in_flight"] == 0
+
+
+def test_linger_shares_a_successful_result_with_late_requests():
+    async def scenario():
+        flight = SingleFlight(enabled=True, linger=0.05)
+        upstream = Upstream()
+        upstream.release.set()
+        first = await flight.run("dialogue", "k", upstream)
+        second = await flight.run("dialogue", "k", upstream)
+        await asyncio.sleep(0.08)
+        third = await flight.run("dialogue", "k", upstream)
+        return [first, second, third], upstream.calls
+
+    results, calls = asyncio.run(scenario())
+    assert results == ["ok"] * 3
+    assert calls == 2
+
+
+def test_failures_reach_every_waiter_and_do_not_linger():
+    async def scenario():
+        flight = SingleFlight(enabled=True, linger=10)
+        upstream = Upstream(RuntimeError("boom"))
+        waiters = [asyncio.ensure_future(flight.run("dialogue", "k", upstream)) for _ in range(2)]
+        await asyncio.sleep(0)
+        upstream.release.set()
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        upstream.result = "ok"
+        retry = await flight.run("dialogue", "k", upstream)
+        return results, retry, upstream.calls
+
+    results, retry, calls = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert retry == "ok" and calls == 2
+
+
+def test_cancelling_one_waiter_keeps_the_call_for_the_others():
+    async def scenario():
+        flight = SingleFlight(enabled=True, linger=0)
+        upstream = Upstream()
+        first = asyncio.ensure_future(flight.run("dialogue", "k", upstream))
+        second = asyncio.ensure_future(flight.run("dialogue", "k", upstream))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        upstream.release.set()
+        return await second, upstream.cancelled, flight.cancelled
+
+    result, upstream_cancelled, flight_cancelled = asyncio.run(scenario())
+    assert result == "ok"
+    assert upstream_cancelled == 0 and flight_cancelled == 0
+
+
+def test_cancelling_the_last_waiter_cancels_the_upstream_call():
+    async def scenario():
+        flight = SingleFlight(enabled=True, linger=0)
+        upstream = Upstream()
+        waiters = [asyncio.ensure_future(flight.run("dialogue", "k", upstream)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for waiter in waiters:
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+        await asyncio.sleep(0)
+        # 之後的相同請求重新發出上游調用
+        upstream.release.set()
+        retry = await flight.run("dialogue", "k", upstream)
+        return upstream.cancelled, flight.stats(), retry, upstream.calls
+
+    upstream_cancelled, stats, retry, calls = asyncio.run(scenario())
+    assert upstream_cancelled == 1 and stats["cancelled"] == 1
+    assert retry == "ok" and calls == 2
+
+
+def test_disabled_flight_calls_upstream_every_time():
+    async def scenario():
+        flight = SingleFlight(enabled=False, linger=0)
+        upstream = Upstream()
+        upstream.release.set()
+        await asyncio.gather(*(flight.run("dialogue", "k", upstream) for _ in range(3)))
+        return upstream.calls, flight.stats()
+
+    calls, stats = asyncio.run(scenario())
+    assert calls == 3 and stats["coalesced"] == 0
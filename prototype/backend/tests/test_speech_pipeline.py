@@ -0,0 +1,44 @@
+"""services/speech_pipeline.py：串流文字的句子切分"""
+
+from services.speech_pipeline import SentenceChunker, split_sentences
+
+
+def test_split_sentences_on_chinese_and_western_punctuation():
+    assert split_sentences("你好！今天天氣很好。Pi is 3.14 ok. 結束", min_chars=0) == [
+        "你好！", "今天天氣很好。", "Pi is 3.14 ok.", "結束",
+    ]
+
+
+def test_consecutive_end_marks_and_closing_quotes_stay_with_the_sentence():
+    assert split_sentences("真的嗎？！「好的。」下一句", min_chars=0) == ["真的嗎？！", "「好的。」", "下一句"]
+
+
+def test_waits_for_the_next_delta_when_the_end_mark_is_at_the_buffer_end():
+    chunker = SentenceChunker(min_chars=0)
+    assert chunker.feed("你好") == []
+    # 句尾位於緩衝區末端：後面可能還有收尾符號
+    assert chunker.feed("！") == []
+    assert chunker.feed("」然後") == ["你好！」"]
+    assert chunker.flush() == "然後"
+
+
+def test_decimal_point_split_across_deltas_is_not_a_sentence_end():
+    chunker = SentenceChunker(min_chars=0)
+    assert chunker.feed("版本 3.") == []
+    assert chunker.feed("14 發布了。") == []
+    assert chunker.feed(" ") == ["版本 3.14 發布了。"]
+    assert chunker.flush() is None
+
+
+def test_short_sentences_are_merged_with_the_next_one():
+    chunker = SentenceChunker(min_chars=4)
+    assert chunker.feed("嗨。今天很好。") == []
+    assert chunker.feed("還有") == ["嗨。今天很好。"]
+    assert chunker.flush() == "還有"
+
+
+def test_flush_returns_remaining_short_sentences_together():
+    chunker = SentenceChunker(min_chars=10)
+    assert chunker.feed("好。是。") == []
+    assert chunker.flush() == "好。是。"
+    assert chunker.flush() is None
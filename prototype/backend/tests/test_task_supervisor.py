@@ -0,0 +1,74 @@
+"""services/task_supervisor.py：同鍵任務的取代、連線結束時取消全部任務與應用範圍的任務統計"""
+
+import asyncio
+
+import pytest
+
+from services.task_supervisor import TaskRegistry, TaskSupervisor
+
+
+def test_keyed_task_supersedes_the_previous_one():
+    async def scenario():
+        supervisor = TaskSupervisor("s", registry=TaskRegistry())
+        first = supervisor.spawn(asyncio.sleep(1), "speaking_reset", key="reset")
+        second = supervisor.spawn(asyncio.sleep(0), "speaking_reset", key="reset")
+        await asyncio.wait({first, second})
+        return supervisor, first, second
+
+    supervisor, first, second = asyncio.run(scenario())
+    assert first.cancelled() and not second.cancelled()
+    assert supervisor.stats() == {"live": 0, "live_by_kind": {}, "superseded": 1}
+    assert not supervisor.cancel("reset")
+
+
+def test_cancel_by_key():
+    async def scenario():
+        supervisor = TaskSupervisor("s", registry=TaskRegistry())
+        task = supervisor.spawn(asyncio.sleep(1), "speaking_reset", key="reset")
+        cancelled = supervisor.cancel("reset")
+        await asyncio.wait({task})
+        return cancelled, task
+
+    cancelled, task = asyncio.run(scenario())
+    assert cancelled and task.cancelled()
+
+
+def test_aclose_cancels_everything_and_refuses_new_tasks():
+    async def scenario():
+        registry = TaskRegistry()
+        supervisor = TaskSupervisor("s", registry=registry)
+        tasks = [supervisor.spawn(asyncio.sleep(1), kind) for kind in ("turn", "turn", "murmur")]
+        live = supervisor.stats()["live_by_kind"]
+        await supervisor.aclose()
+        late = asyncio.sleep(1)
+        with pytest.raises(RuntimeError):
+            supervisor.spawn(late, "turn")
+        return registry, supervisor, tasks, live
+
+    registry, supervisor, tasks, live = asyncio.run(scenario())
+    assert live == {"turn": 2, "murmur": 1}
+    assert all(task.cancelled() for task in tasks) and supervisor.live() == 0
+    assert registry.stats()["cancelled"] == 3 and registry.live() == 0
+
+
+def test_registry_counts_outcomes_by_kind():
+    async def scenario():
+        registry = TaskRegistry()
+
+        async def fail():
+            raise ValueError("boom")
+
+        done = registry.spawn(asyncio.sleep(0), "memory_consolidation")
+        failed = registry.spawn(fail(), "memory_consolidation")
+        quiet = registry.spawn(fail(), "tts_cache", log_errors=False)
+        pending = registry.spawn(asyncio.sleep(1), "outbound_writer")
+        live = registry.live("outbound_writer")
+        await asyncio.wait({done, failed, quiet})
+        await registry.shutdown(timeout=1)
+        return registry, live, pending
+
+    registry, live, pending = asyncio.run(scenario())
+    assert live == 1 and pending.cancelled()
+    stats = registry.stats()
+    assert stats["created_by_kind"] == {"memory_consolidation": 2, "tts_cache": 1, "outbound_writer": 1}
+    assert (stats["completed"], stats["failed"], stats["cancelled"], stats["live"]) == (1, 2, 1, 0)
@@ -0,0 +1,57 @@
+"""services/text_to_speech.py：逐句並行合成的順序與拼接結果與逐句依序合成一致"""
+
+import asyncio
+
+import pytest
+
+from core.config import settings
+from services.speech_pipeline import split_sentences
+from services.speech_providers.local_provider import LocalTTSProvider
+from services.text_to_speech import TextToSpeechService
+from utils.audio_timing import concat_audio_frames, get_audio_duration
+
+TEXT = "今天的星空很清楚。你看得到獵戶座嗎？那三顆排成一列的星星就是腰帶！再往下一點，有一片模糊的光，那是獵戶座大星雲。"
+
+
+@pytest.fixture(autouse=True)
+def parallel_settings(monkeypatch):
+    monkeypatch.setattr(settings, "TTS_CACHE_ENABLED", False)
+    monkeypatch.setattr(settings, "TTS_PARALLEL_MIN_SEGMENT_CHARS", 0)
+    monkeypatch.setattr(settings, "TTS_PARALLEL_MIN_CHARS", 10)
+
+
+def service(seed):
+    # 每句的延遲隨機，完成順序與句子順序不同
+    return TextToSpeechService(LocalTTSProvider(latency_spec="uniform:0,0.03", error_rate=0, seconds_per_char=0.05, seed=seed))
+
+
+async def sequential(text):
+    tts = service(seed=0)
+    return [await tts._synthesize_single(sentence) for sentence in split_sentences(text)]
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_segments_keep_sentence_order_and_match_sequential_synthesis(seed):
+    segments = asyncio.run(service(seed).synthesize_speech_segments(TEXT, max_concurrency=4))
+    expected = asyncio.run(sequential(TEXT))
+
+    assert [segment["seq"] for segment in segments] == list(range(len(expected)))
+    assert [segment["text"] for segment in segments] == split_sentences(TEXT)
+    assert [segment["audio_bytes"] for segment in segments] == [result["audio_bytes"] for result in expected]
+    assert concat_audio_frames([segment["audio_bytes"] for segment in segments]) == \
+        concat_audio_frames([result["audio_bytes"] for result in expected])
+
+
+def test_parallel_synthesis_concatenates_segments(monkeypatch):
+    monkeypatch.setattr(settings, "TTS_PARALLEL_ENABLED", True)
+    result = asyncio.run(service(seed=4).synthesize_speech_bytes(TEXT))
+    expected = asyncio.run(sequential(TEXT))
+
+    assert result["segment_count"] == len(expected)
+    assert result["duration"] == pytest.approx(sum(segment["duration"] for segment in expected))
+    assert get_audio_duration(result["audio_bytes"]) == pytest.approx(result["duration"])
+
+
+def test_any_failed_segment_fails_the_whole_text():
+    tts = TextToSpeechService(LocalTTSProvider(latency_spec="fixed:0", error_rate=1.0, seed=1))
+    assert asyncio.run(tts.synthesize_speech_segments(TEXT)) is None
@@ -0,0 +1,146 @@
+"""services/tts_cache.py：記憶體 LRU、single-flight 與磁碟層"""
+
+import asyncio
+
+import pytest
+
+from services.tts_cache import TTSCache, make_cache_key
+
+
+def memory_cache(memory_max_bytes: int = 1024) -> TTSCache:
+    return TTSCache(memory_max_bytes=memory_max_bytes, cache_dir="", disk_max_bytes=0)
+
+
+def test_cache_key_depends_on_every_synthesis_parameter():
+    base = make_cache_key("你好", "tts-1", "nova", 1.0, "", "mp3")
+    assert base == make_cache_key("你好", "tts-1", "nova", 1.0, "", "mp3")
+    assert base != make_cache_key("你好", "tts-1", "alloy", 1.0, "", "mp3")
+    assert base != make_cache_key("你好", "tts-1", "nova", 1.1, "", "mp3")
+
+
+def test_concurrent_requests_share_one_synthesis():
+    calls = []
+
+    async def synthesize():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return b"audio"
+
+    async def scenario():
+        cache = memory_cache()
+        results = await asyncio.gather(*(cache.get_or_synthesize("k", synthesize) for _ in range(3)))
+        again = await cache.get_or_synthesize("k", synthesize)
+        return results, again, cache.stats()
+
+    results, again, stats = asyncio.run(scenario())
+    assert results == [b"audio"] * 3 and again == b"audio"
+    assert len(calls) == 1
+    assert (stats["misses"], stats["coalesced"], stats["memory_hits"]) == (1, 2, 1)
+
+
+def test_failed_synthesis_is_not_cached():
+    results = iter([None, b"audio"])
+
+    async def synthesize():
+        return next(results)
+
+    async def scenario():
+        cache = memory_cache()
+        return [await cache.get_or_synthesize("k", synthesize) for _ in range(2)], cache.stats()
+
+    (first, second), stats = asyncio.run(scenario())
+    assert first is None and second == b"audio"
+    assert stats["failures"] == 1
+
+
+def test_memory_layer_evicts_least_recently_used_within_budget():
+    cache = memory_cache(memory_max_bytes=10)
+    cache.store("a", b"1234")
+    cache.store("b", b"1234")
+    assert asyncio.run(cache.lookup("a")) == b"1234"  # a 變為最近使用
+    cache.store("c", b"1234")
+
+    assert asyncio.run(cache.lookup("b")) is None
+    assert asyncio.run(cache.lookup("a")) == b"1234"
+    assert cache.stats()["memory_bytes"] == 8
+
+
+def test_cancelling_the_last_waiter_abandons_the_synthesis():
+    started = asyncio.Event()
+    cancelled = []
+
+    async def synthesize():
+        started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+
+    async def scenario():
+        cache = memory_cache()
+        waiter = asyncio.ensure_future(cache.get_or_synthesize("k", synthesize))
+        await started.wait()
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        await asyncio.sleep(0)
+        return cache.stats()
+
+    stats = asyncio.run(scenario())
+    assert cancelled == [1]
+    assert stats["abandoned"] == 1 and stats["inflight"] == 0
+
+
+def test_disk_layer_is_only_used_after_open(tmp_path):
+    cache_dir = tmp_path / "tts_cache"
+
+    async def write():
+        cache = TTSCache(memory_max_bytes=1024, cache_dir=str(cache_dir), disk_max_bytes=1024)
+        cache.store("before-open", b"x")
+        assert not cache_dir.exists()
+        await cache.open()
+        cache.store("k", b"audio")
+        while cache.stats()["disk_entries"] == 0:
+            await asyncio.sleep(0.01)
+
+    async def read():
+        cache = TTSCache(memory_max_bytes=1024, cache_dir=str(cache_dir), disk_max_bytes=1024)
+        await cache.open()
+        return await cache.lookup("k"), await cache.lookup("before-open"), cache.stats()
+
+    asyncio.run(write())
+    data, missing, stats = asyncio.run(read())
+    assert data == b"audio" and missing is None
+    assert stats["disk_enabled"] and stats["disk_hits"] == 1
+
+
+def test_concurrent_disk_writes_of_one_key_are_counted_once(tmp_path):
+    async def scenario():
+        cache = TTSCache(memory_max_bytes=1024, cache_dir=str(tmp_path), disk_max_bytes=1024)
+        await cache.open()
+        await asyncio.gather(cache._disk_put("k", b"audio"), cache._disk_put("k", b"audio"))
+        return cache.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["disk_entries"] == 1 and stats["disk_bytes"] == len(b"audio")
+
+
+def test_recurring_murmurs_survive_a_restart(tmp_path):
+    async def first_run():
+        cache = TTSCache(memory_max_bytes=1024, cache_dir=str(tmp_path), disk_max_bytes=1024)
+        await cache.open()
+        for text in ("好無聊喔", "星星好亮", "好無聊喔", "今天的月亮", "好無聊喔", "星星好亮"):
+            cache.record_murmur(text)
+        await cache.close()
+
+    async def second_run():
+        cache = TTSCache(memory_max_bytes=1024, cache_dir=str(tmp_path), disk_max_bytes=1024)
+        await cache.open()
+        return cache.recurring_murmurs(10), cache.recurring_murmurs(1)
+
+    asyncio.run(first_run())
+    recurring, top = asyncio.run(second_run())
+    # 只出現一次的不預熱
+    assert recurring == ["好無聊喔", "星星好亮"]
+    assert top == ["好無聊喔"]
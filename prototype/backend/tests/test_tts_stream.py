@@ -0,0 +1,62 @@
+"""services/text_to_speech.py：串流合成的分塊產出、完成後寫入快取與快取命中時的分塊回放"""
+
+import asyncio
+
+import pytest
+
+from core.config import settings
+from services import text_to_speech
+from services.speech_providers.local_provider import LocalTTSProvider
+from services.text_to_speech import TextToSpeechService
+from services.tts_cache import TTSCache
+
+TEXT = "今天的星空很清楚。"
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = TTSCache(memory_max_bytes=1 << 20, cache_dir="", disk_max_bytes=0)
+    monkeypatch.setattr(text_to_speech, "tts_cache", cache)
+    monkeypatch.setattr(settings, "TTS_CACHE_ENABLED", True)
+    return cache
+
+
+def service(error_rate=0.0):
+    return TextToSpeechService(LocalTTSProvider(latency_spec="fixed:0", error_rate=error_rate, seconds_per_char=0.1, seed=1))
+
+
+async def collect(tts, text=TEXT, chunk_size=256):
+    return [chunk async for chunk in tts.synthesize_speech_stream(text, chunk_size=chunk_size)]
+
+
+def test_stream_yields_chunks_and_stores_the_whole_audio(cache):
+    async def scenario():
+        tts = service()
+        chunks = await collect(tts)
+        return tts, chunks, await cache.lookup(tts._cache_key(TEXT))
+
+    tts, chunks, cached = asyncio.run(scenario())
+    assert len(chunks) > 1 and all(len(chunk) <= 256 for chunk in chunks)
+    assert cached == b"".join(chunks)
+    assert b"".join(chunks) == asyncio.run(tts._create_speech(TEXT))
+
+
+def test_cache_hit_is_replayed_in_chunks_without_synthesis(cache):
+    async def scenario():
+        tts = service(error_rate=1.0)  # 任何實際合成都會失敗
+        cache.store(tts._cache_key(TEXT), bytes(1000))
+        return await collect(tts, chunk_size=300)
+
+    assert [len(chunk) for chunk in asyncio.run(scenario())] == [300, 300, 300, 100]
+
+
+def test_failed_stream_yields_nothing_and_is_not_cached(cache):
+    async def scenario():
+        tts = service(error_rate=1.0)
+        return await collect(tts), await cache.lookup(tts._cache_key(TEXT))
+
+    assert asyncio.run(scenario()) == ([], None)
+
+
+def test_empty_text_yields_nothing(cache):
+    assert asyncio.run(collect(service(), text="")) == []
@@ -0,0 +1,72 @@
+"""services/turn_controller.py：新回合取消上一回合與其衍生的背景任務 (barge-in)"""
+
+import asyncio
+
+from services.task_supervisor import TaskRegistry, TaskSupervisor
+from services.turn_controller import TurnController
+
+
+def controller():
+    return TurnController(TaskSupervisor("s", registry=TaskRegistry()))
+
+
+def test_new_turn_cancels_the_running_one():
+    async def scenario():
+        turns = controller()
+        events = []
+
+        async def handler(turn_id):
+            try:
+                await asyncio.sleep(1)
+                events.append(("done", turn_id))
+            except asyncio.CancelledError:
+                events.append(("cancelled", turn_id))
+                raise
+
+        first = turns.start(handler)
+        await asyncio.sleep(0)
+        second = turns.start(handler)
+        await asyncio.sleep(0)
+        second.cancel()
+        await asyncio.wait({first, second})
+        return turns, events
+
+    turns, events = asyncio.run(scenario())
+    assert events[0] == ("cancelled", 1)
+    assert turns.turn_id == 2 and turns.started == 2 and turns.cancelled == 1
+
+
+def test_background_tasks_of_the_turn_are_cancelled_with_it():
+    async def scenario():
+        turns = controller()
+        turns.start(lambda turn_id: asyncio.sleep(1))
+        background = turns.spawn(asyncio.sleep(1), key="trajectory")
+        busy = turns.stats()["background_tasks"]
+        interrupted = turns.cancel_current()
+        await asyncio.wait({background})
+        return turns, background, busy, interrupted
+
+    turns, background, busy, interrupted = asyncio.run(scenario())
+    assert busy == 1 and interrupted and background.cancelled()
+    assert turns.stats() == {"turn_id": 1, "active": False, "background_tasks": 0, "started": 1, "cancelled": 1}
+
+
+def test_finished_turn_is_not_counted_as_cancelled():
+    async def scenario():
+        turns = controller()
+        results = []
+
+        async def handler(turn_id):
+            results.append(turn_id)
+
+        turns.start(handler)
+        await turns.wait_current()
+        active = turns.active
+        interrupted = turns.cancel_current()
+        turns.start(handler)
+        await turns.wait_current()
+        return turns, results, active, interrupted
+
+    turns, results, active, interrupted = asyncio.run(scenario())
+    assert results == [1, 2]
+    assert not active and not interrupted and turns.cancelled == 0
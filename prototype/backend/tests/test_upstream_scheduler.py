@@ -0,0 +1,128 @@
+"""services/upstream_scheduler.py：並行上限、令牌桶與優先級等待佇列"""
+
+import asyncio
+import time
+
+import pytest
+
+from core.exceptions import UpstreamOverloadedException
+from services.upstream_scheduler import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_MURMUR,
+    PRIORITY_USER,
+    ProviderGate,
+    UpstreamScheduler,
+    upstream_priority,
+)
+
+
+def gate(concurrency=1, rate=0.0, burst=None, max_queue=16):
+    return ProviderGate("test", concurrency=concurrency, rate=rate, burst=burst or concurrency, max_queue=max_queue)
+
+
+def test_waiters_are_admitted_by_priority_then_arrival():
+    async def scenario():
+        provider = gate()
+        await provider.acquire(PRIORITY_USER, 1.0)
+        admitted = []
+
+        async def call(name, priority):
+            await provider.acquire(priority, 1.0)
+            admitted.append(name)
+            provider.release()
+
+        waiters = []
+        for name, priority in [("background", PRIORITY_BACKGROUND), ("murmur", PRIORITY_MURMUR),
+                               ("user-1", PRIORITY_USER), ("user-2", PRIORITY_USER)]:
+            waiters.append(asyncio.ensure_future(call(name, priority)))
+            await asyncio.sleep(0)
+        provider.release()
+        await asyncio.gather(*waiters)
+        return admitted, provider.stats()
+
+    admitted, stats = asyncio.run(scenario())
+    assert admitted == ["user-1", "user-2", "murmur", "background"]
+    assert stats["active"] == 0 and stats["queue_depth"] == 0 and stats["admitted"] == 5
+
+
+def test_token_bucket_delays_calls_beyond_the_burst():
+    async def scenario():
+        provider = gate(concurrency=10, rate=20.0, burst=2)
+        started = time.monotonic()
+        admitted_at = []
+        for _ in range(3):
+            await provider.acquire(PRIORITY_USER, 1.0)
+            admitted_at.append(time.monotonic() - started)
+        return admitted_at
+
+    admitted_at = asyncio.run(scenario())
+    assert admitted_at[1] < 0.02
+    # 第三個調用要等一個令牌補充 (1 / 20 秒)
+    assert admitted_at[2] >= 0.04
+
+
+def test_full_queue_evicts_a_lower_priority_waiter():
+    async def scenario():
+        provider = gate(max_queue=1)
+        await provider.acquire(PRIORITY_USER, 1.0)
+        background = asyncio.ensure_future(provider.acquire(PRIORITY_BACKGROUND, 1.0))
+        await asyncio.sleep(0)
+        user = asyncio.ensure_future(provider.acquire(PRIORITY_USER, 1.0))
+        await asyncio.sleep(0)
+        with pytest.raises(UpstreamOverloadedException):
+            await background
+        # 佇列中只剩同優先級的等待者：新請求被拒絕
+        with pytest.raises(UpstreamOverloadedException):
+            await provider.acquire(PRIORITY_USER, 1.0)
+        provider.release()
+        await user
+        provider.release()
+        return provider.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["evicted"] == 1 and stats["rejected"] == 1 and stats["active"] == 0
+
+
+def test_waiting_past_max_wait_is_shed():
+    async def scenario():
+        provider = gate()
+        await provider.acquire(PRIORITY_USER, 1.0)
+        with pytest.raises(UpstreamOverloadedException):
+            await provider.acquire(PRIORITY_MURMUR, 0.02)
+        provider.release()
+        await provider.acquire(PRIORITY_USER, 1.0)
+        return provider.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["shed"] == 1 and stats["queue_depth"] == 0 and stats["active"] == 1
+
+
+def test_cancelled_waiter_does_not_leak_its_slot():
+    async def scenario():
+        provider = gate()
+        await provider.acquire(PRIORITY_USER, 1.0)
+        waiter = asyncio.ensure_future(provider.acquire(PRIORITY_USER, 1.0))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        provider.release()
+        return provider.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["active"] == 0 and stats["queue_depth"] == 0
+
+
+def test_slot_takes_priority_from_the_context():
+    async def scenario():
+        scheduler = UpstreamScheduler({"gemini": {"concurrency": 4, "rate": 0, "burst": 4}}, enabled=True)
+        upstream_priority.set(PRIORITY_MURMUR)
+        async with scheduler.slot("gemini"):
+            active = scheduler.gates["gemini"].active
+        async with scheduler.slot("unknown-provider"):
+            pass
+        return active, scheduler.stats()["providers"]["gemini"]
+
+    active, stats = asyncio.run(scenario())
+    assert active == 1 and stats["active"] == 0
+    assert stats["admitted_by_priority"]["murmur"] == 1
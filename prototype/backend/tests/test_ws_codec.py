@@ -0,0 +1,69 @@
+"""utils/ws_codec.py：收到的訊息必須解碼為物件，否則以 ValueError 交給解碼錯誤的處理路徑"""
+
+import asyncio
+
+import orjson
+import ormsgpack
+import pytest
+from fastapi import WebSocketDisconnect
+
+from utils.ws_codec import CODECS, MessageChannel, WebSocketCodec
+
+
+class FakeWebSocket:
+    def __init__(self, *frames):
+        self.frames = list(frames)
+
+    async def receive(self):
+        return self.frames.pop(0)
+
+
+def receive_all(*frames):
+    channel = MessageChannel(FakeWebSocket(*frames), CODECS["json"])
+
+    async def scenario():
+        results = []
+        for _ in frames:
+            try:
+                results.append(await channel.receive())
+            except ValueError as e:
+                results.append(e)
+        return results
+
+    return asyncio.run(scenario())
+
+
+def test_decodes_json_and_msgpack_objects():
+    results = receive_all(
+        {"type": "websocket.receive", "text": orjson.dumps({"type": "ping"}).decode()},
+        {"type": "websocket.receive", "bytes": ormsgpack.packb({"type": "message", "text": "hi"})},
+    )
+    assert results == [{"type": "ping"}, {"type": "message", "text": "hi"}]
+
+
+@pytest.mark.parametrize("frame", [
+    {"type": "websocket.receive", "text": "[1, 2]"},
+    {"type": "websocket.receive", "text": '"ping"'},
+    {"type": "websocket.receive", "text": "null"},
+    {"type": "websocket.receive", "text": "{not json"},
+    {"type": "websocket.receive", "bytes": ormsgpack.packb([1, 2])},
+    {"type": "websocket.receive", "bytes": b""},
+])
+def test_non_object_messages_raise_value_error(frame):
+    [result] = receive_all(frame)
+    assert isinstance(result, ValueError)
+
+
+def test_disconnect_frame_raises_websocket_disconnect():
+    channel = MessageChannel(FakeWebSocket({"type": "websocket.disconnect", "code": 1001}), CODECS["json"])
+    with pytest.raises(WebSocketDisconnect):
+        asyncio.run(channel.receive())
+
+
+def test_codec_without_decode_cannot_be_constructed():
+    class EncodeOnlyCodec(WebSocketCodec):
+        def encode(self, message):
+            return orjson.dumps(message)
+
+    with pytest.raises(TypeError):
+        EncodeOnlyCodec()
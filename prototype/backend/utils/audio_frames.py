@@ -0,0 +1,108 @@
+"""
+WebSocket 二進位音訊幀的編碼與解碼
+
+幀格式 (全部位於單一 WebSocket binary message 中)：
+
+    +----------------------+------------------------+------------------+
+    | 4 bytes 大端序長度 N | N bytes UTF-8 JSON 標頭 | 原始音訊 bytes   |
+    +----------------------+------------------------+------------------+
+
+標頭至少包含 messageId、seq、codec、duration，讓客戶端可以把音訊
+對應到先前 (或稍後) 收到的 chat-message / chat-audio-segment。
+
+串流傳輸時同一片段會拆成多個幀 (標頭帶 chunk 序號，duration 為 0)，
+片段結束後另以 JSON 的 audio-stream-end 訊息告知總時長。
+"""
+
+import struct
+from typing import Any, Dict, Optional, Tuple
+
+import orjson
+
+# 標頭長度欄位: 4 bytes 無號大端序整數
+HEADER_LENGTH_FORMAT = ">I"
+HEADER_LENGTH_SIZE = struct.calcsize(HEADER_LENGTH_FORMAT)
+
+# 編解碼器對應的 MIME 類型，供客戶端建立 Blob 使用
+CODEC_MIME_TYPES = {
+    "mp3": "audio/mpeg",
+    "wav": "audio/wav",
+    "opus": "audio/ogg",
+}
+
+
+def build_audio_frame_header(
+    message_id: str,
+    seq: int,
+    codec: str,
+    duration: float,
+    text: Optional[str] = None,
+    final: bool = True,
+    chunk: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    建立音訊幀標頭
+
+    Args:
+        message_id: 所屬訊息的 id
+        seq: 片段序號 (一次性回應為 0)
+        codec: 音訊編碼，例如 "mp3"
+        duration: 音訊時長 (秒)
+        text: 此片段對應的文字 (串流模式下用於字幕，可省略)
+        final: 是否為此訊息的最後一個片段
+        chunk: 串流傳輸時此塊在片段內的序號 (整段傳輸時省略)
+
+    Returns:
+        標頭字典
+    """
+    header = {
+        "type": "audio",
+        "messageId": message_id,
+        "seq": seq,
+        "codec": codec,
+        "duration": round(duration, 3),
+        "final": final,
+    }
+    if text is not None:
+        header["text"] = text
+    if chunk is not None:
+        header["chunk"] = chunk
+    return header
+
+
+def encode_audio_frame(header: Dict[str, Any], audio_bytes: bytes) -> bytes:
+    """
+    將標頭與原始音訊打包為單一二進位幀
+
+    Args:
+        header: JSON 可序列化的標頭
+        audio_bytes: 原始音訊
+
+    Returns:
+        可直接用 websocket.send_bytes 送出的 bytes
+    """
+    header_bytes = orjson.dumps(header)
+    return struct.pack(HEADER_LENGTH_FORMAT, len(header_bytes)) + header_bytes + audio_bytes
+
+
+def decode_audio_frame(frame: bytes) -> Tuple[Dict[str, Any], bytes]:
+    """
+    解析二進位幀 (供測試工具與 Python 客戶端使用)
+
+    Args:
+        frame: encode_audio_frame 產生的 bytes
+
+    Returns:
+        (標頭字典, 原始音訊 bytes)
+
+    Raises:
+        ValueError: 幀格式不正確
+    """
+    if len(frame) < HEADER_LENGTH_SIZE:
+        raise ValueError("音訊幀長度不足，缺少標頭長度欄位")
+    (header_length,) = struct.unpack_from(HEADER_LENGTH_FORMAT, frame, 0)
+    header_end = HEADER_LENGTH_SIZE + header_length
+    if header_end > len(frame):
+        raise ValueError(f"音訊幀標頭長度 {header_length} 超出幀大小 {len(frame)}")
+    header = orjson.loads(frame[HEADER_LENGTH_SIZE:header_end])
+    return header, frame[header_end:]
@@ -0,0 +1,317 @@
+"""
+MP3 / ADTS (AAC) 幀標頭掃描 - 不解碼音訊，只讀取每個幀的標頭，
+計算精確的音訊時長與每個幀的時間偏移。
+
+TTS 回傳的 MP3 每幀約 24-26 ms，一段 10 秒的語音約 400 個幀，
+純 Python 掃描的成本可以忽略。支援：
+  - MPEG-1 / 2 / 2.5 Layer I / II / III
+  - ADTS 封裝的 AAC
+  - 開頭的 ID3v2 標籤 (跳過)，結尾的 ID3v1 等非音訊資料 (重新同步時略過)
+  - LAME/Xing/Info/VBRI 資訊幀 (不含音訊，不計入時長)
+
+PCM WAV (RIFF) 沒有幀結構，get_audio_duration 直接以 fmt / data 區塊計算時長。
+"""
+
+import struct
+from typing import List, Optional, Tuple
+
+# MPEG 版本 (標頭中的 2 bits) -> 版本代號，1 為保留值
+_MPEG_VERSIONS = {0: 2.5, 2: 2, 3: 1}
+
+# 位元率表 (kbps)，索引 1-14；索引 0 為自由格式 (不支援)，15 無效
+_BITRATES = {
+    (1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (2, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+
+_SAMPLE_RATES = {
+    1: (44100, 48000, 32000),
+    2: (22050, 24000, 16000),
+    2.5: (11025, 12000, 8000),
+}
+
+_ADTS_SAMPLE_RATES = (96000, 88200, 64000, 48000, 44100, 32000, 24000, 22050, 16000, 12000, 11025, 8000, 7350)
+
+# 解析單一幀標頭所需的最少位元組 (ADTS 標頭為 7 bytes)
+_MAX_HEADER_SIZE = 7
+# ID3v2 標籤標頭長度
+_ID3_HEADER_SIZE = 10
+
+
+class AudioFrame:
+    """一個音訊幀的位置與時間資訊"""
+
+    __slots__ = ("offset", "size", "start_time", "duration")
+
+    def __init__(self, offset: int, size: int, start_time: float, duration: float):
+        self.offset = offset
+        self.size = size
+        self.start_time = start_time
+        self.duration = duration
+
+    def __repr__(self) -> str:
+        return f"AudioFrame(offset={self.offset}, size={self.size}, start_time={self.start_time:.4f}, duration={self.duration:.4f})"
+
+
+def _parse_mpeg_header(data, pos: int) -> Optional[Tuple[int, int, int, int]]:
+    """
+    解析 MPEG 音訊幀標頭
+
+    Returns:
+        (幀長度, 樣本數, 取樣率, side info 長度)，無效標頭返回 None
+    """
+    b1, b2, b3 = data[pos + 1], data[pos + 2], data[pos + 3]
+    version = _MPEG_VERSIONS.get((b1 >> 3) & 0x03)
+    layer = 4 - ((b1 >> 1) & 0x03)
+    if version is None or layer == 4:
+        return None
+    bitrate_index = b2 >> 4
+    sample_rate_index = (b2 >> 2) & 0x03
+    if bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    table_version = 1 if version == 1 else 2
+    bitrate = _BITRATES[(table_version, layer)][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][sample_rate_index]
+    padding = (b2 >> 1) & 0x01
+    mono = (b3 >> 6) == 3
+
+    if layer == 1:
+        frame_length = (12 * bitrate // sample_rate + padding) * 4
+        samples = 384
+    elif layer == 2 or version == 1:
+        frame_length = 144 * bitrate // sample_rate + padding
+        samples = 1152
+    else:
+        frame_length = 72 * bitrate // sample_rate + padding
+        samples = 576
+
+    if version == 1:
+        side_info = 17 if mono else 32
+    else:
+        side_info = 9 if mono else 17
+    return frame_length, samples, sample_rate, side_info
+
+
+def _parse_adts_header(data, pos: int) -> Optional[Tuple[int, int, int]]:
+    """
+    解析 ADTS 幀標頭
+
+    Returns:
+        (幀長度, 樣本數, 取樣率)，無效標頭返回 None
+    """
+    sample_rate_index = (data[pos + 2] >> 2) & 0x0F
+    if sample_rate_index >= len(_ADTS_SAMPLE_RATES):
+        return None
+    frame_length = ((data[pos + 3] & 0x03) << 11) | (data[pos + 4] << 3) | (data[pos + 5] >> 5)
+    if frame_length < _MAX_HEADER_SIZE:
+        return None
+    raw_blocks = data[pos + 6] & 0x03
+    return frame_length, 1024 * (raw_blocks + 1), _ADTS_SAMPLE_RATES[sample_rate_index]
+
+
+def _parse_frame_header(data, pos: int) -> Optional[Tuple[str, int, int, int, int]]:
+    """
+    解析 pos 位置的幀標頭 (呼叫者需確保至少有 _MAX_HEADER_SIZE 個位元組，或已到資料末端)
+
+    Returns:
+        (格式, 幀長度, 樣本數, 取樣率, side info 長度)，不是幀標頭返回 None
+    """
+    if len(data) - pos < 4 or data[pos] != 0xFF or (data[pos + 1] & 0xE0) != 0xE0:
+        return None
+    if (data[pos + 1] & 0xF6) == 0xF0:
+        if len(data) - pos < _MAX_HEADER_SIZE:
+            return None
+        adts = _parse_adts_header(data, pos)
+        if adts is None:
+            return None
+        return ("adts",) + adts + (0,)
+    mpeg = _parse_mpeg_header(data, pos)
+    if mpeg is None:
+        return None
+    return ("mp3",) + mpeg
+
+
+def _is_info_frame(data, pos: int, frame_length: int, side_info: int) -> bool:
+    """判斷 MP3 幀是否為 Xing/Info/VBRI 資訊幀 (編碼器寫入的元數據，不含音訊)"""
+    xing_pos = pos + 4 + side_info
+    if data[xing_pos:xing_pos + 4] in (b"Xing", b"Info"):
+        return True
+    return bytes(data[pos + 36:pos + 40]) == b"VBRI" and frame_length > 40
+
+
+class AudioFrameScanner:
+    """
+    逐步掃描音訊幀，可一次餵入完整音訊，也可在串流時逐塊餵入
+
+    屬性:
+        frames: 已確認的音訊幀列表
+        duration: 已確認幀的總時長 (秒)
+        format: "mp3" 或 "adts"，尚未找到幀時為 None
+        sample_rate: 第一個幀的取樣率
+    """
+
+    def __init__(self):
+        self.frames: List[AudioFrame] = []
+        self.duration = 0.0
+        self.format: Optional[str] = None
+        self.sample_rate: Optional[int] = None
+        self._buffer = bytearray()
+        self._buffer_offset = 0  # 緩衝區開頭在整段音訊中的位置
+        self._skip = 0  # 尚待跳過的位元組 (跨塊的 ID3 標籤)
+        self._synced = False  # 上一個幀是否接續有效，重新同步時需要驗證下一個標頭
+        self._seen_first_frame = False
+
+    def feed(self, chunk: bytes) -> "AudioFrameScanner":
+        """餵入一段音訊"""
+        self._buffer += chunk
+        self._scan(final=False)
+        return self
+
+    def finish(self) -> "AudioFrameScanner":
+        """音訊已全部餵入，處理緩衝區中剩餘的完整幀"""
+        self._scan(final=True)
+        return self
+
+    def _scan(self, final: bool) -> None:
+        data = self._buffer
+        pos = 0
+        end = len(data)
+        while pos < end:
+            if self._skip:
+                step = min(self._skip, end - pos)
+                pos += step
+                self._skip -= step
+                continue
+
+            if end - pos < _ID3_HEADER_SIZE and not final:
+                break
+
+            if data[pos:pos + 3] == b"ID3" and end - pos >= _ID3_HEADER_SIZE:
+                size = (data[pos + 6] << 21) | (data[pos + 7] << 14) | (data[pos + 8] << 7) | data[pos + 9]
+                footer = _ID3_HEADER_SIZE if data[pos + 5] & 0x10 else 0
+                self._skip = _ID3_HEADER_SIZE + size + footer
+                self._synced = False
+                continue
+
+            header = _parse_frame_header(data, pos)
+            if header is None:
+                # 非幀資料，尋找下一個同步字
+                self._synced = False
+                next_sync = data.find(b"\xff", pos + 1)
+                pos = next_sync if next_sync != -1 else end
+                continue
+
+            frame_format, frame_length, samples, sample_rate, side_info = header
+            frame_end = pos + frame_length
+            if frame_end > end:
+                # 幀還沒收完 (結束時則為被截斷的最後一幀，不計入)
+                break
+
+            if not self._synced:
+                # 重新同步時，要求下一個幀標頭也有效，避免把音訊資料中的 0xFF 誤認為標頭
+                if end - frame_end >= _MAX_HEADER_SIZE or (final and end - frame_end >= 4):
+                    if _parse_frame_header(data, frame_end) is None and data[frame_end:frame_end + 3] not in (b"TAG", b"ID3"):
+                        pos += 1
+                        continue
+                elif not final and frame_end != end:
+                    break
+                self._synced = True
+
+            if not self._seen_first_frame:
+                self._seen_first_frame = True
+                self.format = frame_format
+                self.sample_rate = sample_rate
+                if frame_format == "mp3" and _is_info_frame(data, pos, frame_length, side_info):
+                    pos = frame_end
+                    continue
+
+            frame_duration = samples / sample_rate
+            self.frames.append(AudioFrame(self._buffer_offset + pos, frame_length, self.duration, frame_duration))
+            self.duration += frame_duration
+            pos = frame_end
+
+        del data[:pos]
+        self._buffer_offset += pos
+
+
+def scan_audio_frames(audio_bytes: bytes) -> AudioFrameScanner:
+    """掃描一段完整的 MP3/ADTS 音訊，返回包含 frames 與 duration 的掃描結果"""
+    return AudioFrameScanner().feed(audio_bytes).finish()
+
+
+def _wav_duration(data: bytes) -> Optional[float]:
+    """以 RIFF 的 fmt 區塊 (每秒位元組數) 與 data 區塊大小計算 WAV 時長，無法解析返回 None"""
+    pos = 12
+    byte_rate = None
+    while pos + 8 <= len(data):
+        chunk_id, chunk_size = struct.unpack_from("<4sI", data, pos)
+        body = pos + 8
+        if chunk_id == b"fmt " and chunk_size >= 16 and body + 16 <= len(data):
+            byte_rate = struct.unpack_from("<I", data, body + 8)[0]
+        elif chunk_id == b"data":
+            if not byte_rate:
+                return None
+            # 串流寫出的 WAV 可能未填入正確的 data 大小，以實際收到的位元組為上限
+            return min(chunk_size, len(data) - body) / byte_rate
+        pos = body + chunk_size + (chunk_size & 1)
+    return None
+
+
+def get_audio_duration(audio_bytes: Optional[bytes], fallback: Optional[float] = None) -> Optional[float]:
+    """
+    計算 MP3/ADTS/WAV 音訊的精確時長
+
+    Args:
+        audio_bytes: 完整音訊
+        fallback: 無法解析 (沒有任何有效幀) 時的返回值
+
+    Returns:
+        時長 (秒)
+    """
+    if not audio_bytes:
+        return fallback
+    if audio_bytes[:4] == b"RIFF" and audio_bytes[8:12] == b"WAVE":
+        duration = _wav_duration(audio_bytes)
+        return fallback if duration is None else duration
+    scanner = scan_audio_frames(audio_bytes)
+    if not scanner.frames:
+        return fallback
+    return scanner.duration
+
+
+def concat_audio_frames(parts: List[bytes]) -> Tuple[bytes, float]:
+    """
+    以幀為單位按順序拼接多段 MP3/ADTS 音訊
+
+    只保留每段中的音訊幀，捨棄 ID3 標籤、Xing/Info 資訊幀與幀之間的雜訊，
+    避免播放器把中間段落的標籤或資訊幀當成音訊解碼。
+
+    Args:
+        parts: 按播放順序排列的音訊
+
+    Returns:
+        (拼接後的音訊, 總時長)
+    """
+    output = bytearray()
+    total_duration = 0.0
+    for part in parts:
+        if not part:
+            continue
+        scanner = scan_audio_frames(part)
+        run_start = run_end = None
+        for frame in scanner.frames:
+            if frame.offset != run_end:
+                # 不相鄰的幀：先寫出目前累積的連續區段
+                if run_start is not None:
+                    output += part[run_start:run_end]
+                run_start = frame.offset
+            run_end = frame.offset + frame.size
+        if run_start is not None:
+            output += part[run_start:run_end]
+        total_duration += scanner.duration
+    return bytes(output), total_duration
@@ -0,0 +1,190 @@
+"""
+WebSocket 訊息編解碼
+
+連線建立時協商編碼方式，之後此連線的所有收發都經過同一個編解碼器：
+
+    json    - 文字幀，以 orjson 編解碼 (與 Starlette send_json 的輸出相容，但快得多)
+    msgpack - 二進位幀，以 ormsgpack 編解碼，體積較小
+
+協商順序：WebSocket 子協定 (Sec-WebSocket-Protocol，依客戶端提供的順序) >
+查詢參數 ?codec= > 配置 WS_CODEC_DEFAULT。
+
+msgpack 訊息與音訊幀 (utils/audio_frames.py) 都是二進位幀，客戶端以第一個位元組區分：
+音訊幀以 4 bytes 大端序標頭長度開頭，第一個位元組必為 0x00；
+訊息一律是 map，第一個位元組為 0x80-0x8f、0xde 或 0xdf。
+客戶端送來的文字幀一律以 JSON 解碼，二進位幀以 msgpack 解碼，與協商結果無關。
+"""
+
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional, Tuple, Union
+
+import orjson
+import ormsgpack
+from fastapi import WebSocket, WebSocketDisconnect
+
+
+class WebSocketCodec(ABC):
+    """編解碼器基類"""
+
+    # 編碼名稱 (同時作為子協定名稱與查詢參數值)
+    name = "base"
+    # 是否以二進位幀傳送
+    binary = False
+
+    def __init__(self):
+        self.messages_out = 0
+        self.bytes_out = 0
+        self.messages_in = 0
+        self.bytes_in = 0
+
+    @abstractmethod
+    def encode(self, message: Dict[str, Any]) -> bytes:
+        pass
+
+    @abstractmethod
+    def decode(self, data: Union[str, bytes]) -> Any:
+        pass
+
+    def receive(self, data: Union[str, bytes]) -> Dict[str, Any]:
+        """
+        解碼一則收到的訊息並計入統計
+
+        Raises:
+            ValueError: 無法解碼或不是物件 (例如陣列、字串、數字)
+        """
+        message = self.decode(data)
+        self.messages_in += 1
+        self.bytes_in += len(data)
+        if not isinstance(message, dict):
+            raise ValueError(f"訊息必須是物件，收到 {type(message).__name__}")
+        return message
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "messages_out": self.messages_out,
+            "bytes_out": self.bytes_out,
+            "avg_bytes_out": round(self.bytes_out / self.messages_out, 1) if self.messages_out else 0.0,
+            "messages_in": self.messages_in,
+            "bytes_in": self.bytes_in,
+        }
+
+
+class JSONCodec(WebSocketCodec):
+    name = "json"
+    binary = False
+
+    def encode(self, message: Dict[str, Any]) -> bytes:
+        return orjson.dumps(message)
+
+    def decode(self, data: Union[str, bytes]) -> Any:
+        return orjson.loads(data)
+
+
+class MsgPackCodec(WebSocketCodec):
+    name = "msgpack"
+    binary = True
+
+    def encode(self, message: Dict[str, Any]) -> bytes:
+        return ormsgpack.packb(message)
+
+    def decode(self, data: Union[str, bytes]) -> Any:
+        return ormsgpack.unpackb(data)
+
+
+# 可協商的編解碼器 (全域共用，統計所有連線)
+CODECS: Dict[str, WebSocketCodec] = {
+    "json": JSONCodec(),
+    "msgpack": MsgPackCodec(),
+}
+
+
+def negotiate_codec(websocket: WebSocket, default: str = "json") -> Tuple[WebSocketCodec, Optional[str]]:
+    """
+    依子協定、查詢參數與預設值選擇編解碼器
+
+    Returns:
+        (編解碼器, 要在 accept 時回應的子協定；客戶端未提供子協定時為 None)
+    """
+    for subprotocol in websocket.scope.get("subprotocols") or []:
+        codec = CODECS.get(subprotocol.strip().lower())
+        if codec is not None:
+            return codec, subprotocol
+    requested = (websocket.query_params.get("codec") or "").strip().lower()
+    codec = CODECS.get(requested) or CODECS.get(default.lower()) or CODECS["json"]
+    return codec, None
+
+
+class PreparedMessage:
+    """
+    預先序列化的訊息
+
+    靜態訊息 (或要送給多個連線的同一則訊息) 只在每種編碼第一次送出時序列化一次，
+    之後直接送出快取的 bytes。
+    """
+
+    __slots__ = ("message", "_payloads")
+
+    def __init__(self, message: Dict[str, Any]):
+        self.message = message
+        self._payloads: Dict[str, bytes] = {}
+
+    def payload(self, codec: WebSocketCodec) -> bytes:
+        payload = self._payloads.get(codec.name)
+        if payload is None:
+            payload = self._payloads[codec.name] = codec.encode(self.message)
+        return payload
+
+
+class MessageChannel:
+    """以協商好的編解碼器收發單一連線的訊息"""
+
+    __slots__ = ("websocket", "codec")
+
+    def __init__(self, websocket: WebSocket, codec: WebSocketCodec):
+        self.websocket = websocket
+        self.codec = codec
+
+    def encode(self, message: Union[Dict[str, Any], PreparedMessage]) -> bytes:
+        """序列化訊息 (PreparedMessage 使用快取)"""
+        if isinstance(message, PreparedMessage):
+            return message.payload(self.codec)
+        return self.codec.encode(message)
+
+    async def send(self, message: Union[Dict[str, Any], PreparedMessage]) -> None:
+        """送出一則訊息"""
+        await self.send_payload(self.encode(message))
+
+    async def send_payload(self, payload: bytes) -> None:
+        """送出已序列化的訊息"""
+        self.codec.messages_out += 1
+        self.codec.bytes_out += len(payload)
+        if self.codec.binary:
+            await self.websocket.send({"type": "websocket.send", "bytes": payload})
+        else:
+            await self.websocket.send({"type": "websocket.send", "text": payload.decode("utf-8")})
+
+    async def send_bytes(self, frame: bytes) -> None:
+        """送出原始二進位幀 (音訊幀)"""
+        await self.websocket.send_bytes(frame)
+
+    async def receive(self) -> Dict[str, Any]:
+        """
+        接收並解碼一則訊息
+
+        Raises:
+            WebSocketDisconnect: 連線已關閉
+            ValueError: 無法解碼或不是物件
+        """
+        frame = await self.websocket.receive()
+        if frame["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(frame.get("code", 1000), frame.get("reason"))
+        if frame.get("text") is not None:
+            codec, data = CODECS["json"], frame["text"]
+        else:
+            codec, data = CODECS["msgpack"], frame.get("bytes") or b""
+        return codec.receive(data)
+
+
+def codec_stats() -> Dict[str, Any]:
+    """各編碼的收發統計"""
+    return {name: codec.stats() for name, codec in CODECS.items()}